@@ -1,3 +1,17 @@
 from django.contrib import admin
 
-# Register your models here.
+from .models import MediaBlob
+
+
+@admin.register(MediaBlob)
+class MediaBlobAdmin(admin.ModelAdmin):
+    """Админка файлов медиа с адресацией по содержимому (только просмотр)."""
+    list_display = ['name', 'size', 'refcount', 'touched_at']
+    search_fields = ['name', 'sha256']
+    list_filter = ['refcount']
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
@@ -0,0 +1,273 @@
+"""
+Асинхронный путь чтения для горячих эндпоинтов под ASGI.
+
+Список и карточка рецепта, список ингредиентов и карточка пользователя
+отдаются корутинами на async ORM Django: соединение с БД занимает поток
+только на время самого запроса, а ожидание БД не держит воркер. Данные
+готовятся заранее (аннотации Exists, select_related, prefetch), поэтому
+сериализаторы DRF — те же RecipeGetSerializer, IngredientSerializer и
+UserSerializer — работают без обращений к БД, и JSON совпадает с
+синхронным путём байт в байт. Кэш ответов и условные ответы (ETag,
+Last-Modified, 304) — те же, что у ViewSet'ов.
+
+Всё, что быстрый путь не покрывает — методы записи, курсорная пагинация,
+невалидные параметры и токены, несуществующие объекты, браузерный API —
+уходит в синхронный ViewSet через sync_to_async, так что ошибки и
+редкие случаи выглядят так же, как под WSGI.
+
+Маршруты подключаются при ASYNC_READ_PATH (его включает backend/asgi.py):
+под WSGI асинхронный view выполнялся бы в отдельном цикле событий на
+каждый запрос и только добавил бы накладных расходов.
+"""
+from asgiref.sync import sync_to_async
+from django.contrib.auth.models import AnonymousUser
+from django.core.paginator import InvalidPage
+from django.db.models import BooleanField, Count, Exists, Max, OuterRef, Value
+from django.http import HttpResponse
+from django.utils.cache import patch_vary_headers
+from rest_framework.authentication import get_authorization_header
+from rest_framework.authtoken.models import Token
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+
+from api.utils import metrics, response_cache
+from api.utils.conditional import aconditional_response, viewer_parts
+from api.utils.filters import RecipeFilter
+from api.utils.pagination import (
+    LimitPageNumberPagination, RecipeKeysetPagination,
+)
+from api.utils.params import get_positive_int
+from api.views import annotate_for_reading, _latest
+from recipes import ingredient_index
+from recipes.ingredient_search import search_ingredients
+from recipes.models import Recipe
+from recipes.serializers import RecipeGetSerializer
+from users.models import CustomUser, Follow
+from users.serializers import UserSerializer
+
+JSON = 'application/json'
+# DjangoFilterBackend применяет фильтр и к карточке рецепта
+FILTER_PARAMS = frozenset(RecipeFilter.base_filters)
+
+
+def _wants_json(request):
+    """
+    Клиенту подходит JSON и он не просит браузерный API или другой формат.
+    """
+    if 'format' in request.GET:
+        return False
+    accept = request.headers.get('Accept', '')
+    if 'text/html' in accept:
+        return False
+    return not accept or JSON in accept or '*/*' in accept
+
+
+async def _authenticate(request):
+    """
+    Пользователь по заголовку Authorization: Token <ключ>, как у
+    TokenAuthentication. None — токен некорректен: пусть ошибку сформирует
+    синхронный путь.
+    """
+    auth = get_authorization_header(request).split()
+    if not auth or auth[0].lower() != b'token':
+        return AnonymousUser()
+    if len(auth) != 2:
+        return None
+    try:
+        key = auth[1].decode()
+    except UnicodeError:
+        return None
+    token = await Token.objects.select_related('user').filter(key=key).afirst()
+    if token is None or not token.user.is_active:
+        return None
+    return token.user
+
+
+def respond(data):
+    """Тело и тип ответа — как у Response DRF, отрендеренного JSONRenderer."""
+    return HttpResponse(JSONRenderer().render(data), content_type=JSON)
+
+
+async def _fetch(queryset):
+    # Выборка вместе с prefetch_related — одним переходом в поток БД
+    return [obj async for obj in queryset]
+
+
+async def recipe_list(request):
+    params = request.GET
+    keyset = RecipeKeysetPagination
+    if (keyset.cursor_query_param in params
+            or params.get(keyset.mode_query_param) == keyset.mode):
+        return None
+    drf_request = Request(request)
+    filterset = RecipeFilter(
+        params, queryset=Recipe.objects.all(), request=request
+    )
+    # Проверка ?author= ходит в БД
+    if not await sync_to_async(filterset.is_valid)():
+        return None
+    filtered = filterset.qs
+    queryset = annotate_for_reading(filtered, request.user)
+
+    async def build():
+        # Валидаторы — агрегатом по выборке без аннотаций, как в RecipeViewSet
+        stats = await filtered.order_by().aaggregate(
+            total=Count('pk'),
+            updated=Max('updated_at'),
+            authors_updated=Max('author__updated_at'),
+        )
+        viewer, _ = viewer_parts(request.user)
+        parts = [
+            'recipes', sorted(params.lists()),
+            stats['total'], stats['updated'], stats['authors_updated'],
+            *viewer,
+        ]
+        # Без Last-Modified, как в RecipeViewSet: по датам удаление не видно
+        return await aconditional_response(
+            request, parts, None, lambda: page(stats['total'])
+        )
+
+    async def page(total):
+        pagination = LimitPageNumberPagination()
+        paginator = pagination.django_paginator_class(
+            queryset, pagination.get_page_size(drf_request)
+        )
+        # Число строк уже посчитано агрегатом валидаторов — без второго
+        # COUNT(*)
+        paginator.count = total
+        try:
+            current = paginator.page(
+                pagination.get_page_number(drf_request, paginator)
+            )
+        except InvalidPage:
+            return None
+        current.object_list = await _fetch(current.object_list)
+        pagination.page, pagination.request = current, drf_request
+        data = RecipeGetSerializer(
+            current.object_list, many=True, context={'request': drf_request}
+        ).data
+        return respond(pagination.get_paginated_response(data).data)
+
+    return await response_cache.aserve(request, ['recipes'], build)
+
+
+async def recipe_detail(request, pk):
+    if FILTER_PARAMS & request.GET.keys():
+        return None
+    recipe_id = int(pk)
+
+    async def build():
+        row = await (
+            Recipe.objects.filter(pk=recipe_id).values_list(
+                'author_id', 'updated_at', 'author__updated_at'
+            ).afirst()
+        )
+        if row is None:
+            return None
+        author_id, *stamps = row
+        await sync_to_async(response_cache.add_tags)(
+            request,
+            lambda: response_cache.recipe_tags(recipe_id, author_id),
+        )
+        viewer, viewer_modified = viewer_parts(request.user)
+        return await aconditional_response(
+            request, ['recipe', pk, *stamps, *viewer],
+            _latest(*stamps, viewer_modified), serialize
+        )
+
+    async def serialize():
+        recipes = await _fetch(annotate_for_reading(
+            Recipe.objects.filter(pk=recipe_id), request.user
+        ))
+        if not recipes:
+            return None
+        context = {'request': Request(request)}
+        return respond(RecipeGetSerializer(recipes[0], context=context).data)
+
+    return await response_cache.aserve(request, [f'recipe:{recipe_id}'], build)
+
+
+async def ingredient_list(request):
+    drf_request = Request(request)
+    limit = get_positive_int(drf_request, 'limit')
+    search = request.GET.get('search', '').strip()
+    if search:
+        # Ранжирование собрано на синхронных запросах — выполняется в потоке БД
+        return respond(await sync_to_async(search_ingredients)(search, limit))
+    # Индекс в памяти; перестройка при смене версии каталога ходит в БД
+    query = request.GET.get('name', '').strip()
+    return respond(await sync_to_async(ingredient_index.search)(query, limit))
+
+
+async def user_detail(request, id):
+    user_id = int(id)
+    updated_at = await (
+        CustomUser.objects.filter(pk=user_id)
+        .values_list('updated_at', flat=True).afirst()
+    )
+    if updated_at is None:
+        return None
+    viewer = request.user
+
+    async def serialize():
+        if viewer.is_authenticated:
+            subscribed = Exists(Follow.objects.filter(
+                subscriber=viewer, author=OuterRef('pk')
+            ))
+        else:
+            subscribed = Value(False, output_field=BooleanField())
+        user = await (
+            CustomUser.objects.filter(pk=user_id)
+            .annotate(is_subscribed=subscribed).afirst()
+        )
+        if user is None:
+            return None
+        context = {'request': Request(request)}
+        return respond(UserSerializer(user, context=context).data)
+
+    parts, viewer_modified = viewer_parts(viewer)
+    return await aconditional_response(
+        request, ['user', id, updated_at, *parts],
+        _latest(updated_at, viewer_modified), serialize
+    )
+
+
+def async_read(handler, viewset, actions, **initkwargs):
+    """
+    View маршрута: GET с JSON обслуживает корутина handler, остальное —
+    синхронный viewset.as_view(actions). handler возвращает None, когда
+    ответ должен сформировать синхронный путь.
+    """
+    sync_view = sync_to_async(viewset.as_view(actions, **initkwargs))
+    # Заголовки, которые DRF ставит этому маршруту
+    # (APIView.default_response_headers)
+    methods = {*actions, 'options'} | ({'head'} if 'get' in actions else set())
+    allow = ', '.join(
+        method.upper() for method in viewset.http_method_names
+        if method in methods
+    )
+    vary_accept = len(viewset.renderer_classes) > 1
+
+    async def view(request, **kwargs):
+        if request.method == 'GET' and _wants_json(request):
+            timer = metrics.current()
+            if timer is not None:
+                timer.start('auth')
+            user = await _authenticate(request)
+            if timer is not None:
+                timer.stop('auth')
+            if user is not None:
+                request.user = user
+                response = await handler(request, **kwargs)
+                if response is not None:
+                    # Как APIView.finalize_response: Vary дополняется после
+                    # view
+                    if vary_accept:
+                        patch_vary_headers(response, ['Accept'])
+                    response['Allow'] = allow
+                    return response
+        return await sync_view(request, **kwargs)
+
+    # Как у APIView.as_view: аутентификация по токену, CSRF не нужен
+    view.csrf_exempt = True
+    return view
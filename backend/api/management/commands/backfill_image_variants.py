@@ -0,0 +1,41 @@
+from django.apps import apps
+from django.core.management.base import BaseCommand
+
+from api.utils import images
+
+
+class Command(BaseCommand):
+    help = (
+        'Строит уменьшенные копии и WebP для уже загруженных изображений '
+        'рецептов и аватаров, у которых их нет или они от прежнего файла.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--model', choices=sorted(images.IMAGE_FIELDS), action='append',
+            dest='models', help='Ограничиться моделью (можно несколько раз)'
+        )
+        parser.add_argument('--force', action='store_true',
+                            help='Перестроить и уже готовые варианты')
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        for label in options['models'] or sorted(images.IMAGE_FIELDS):
+            model = apps.get_model(label)
+            image_field, variants_field = images.IMAGE_FIELDS[label]
+            default = model._meta.get_field(image_field).default
+            rows = (
+                model.objects.exclude(**{image_field: ''})
+                .exclude(**{f'{image_field}__isnull': True})
+                .exclude(**{image_field: default})
+                .order_by('pk').values_list('pk', flat=True)
+            )
+            processed = skipped = 0
+            for pk in rows.iterator(chunk_size=options['batch_size']):
+                if images.process(label, pk, force=options['force']):
+                    processed += 1
+                else:
+                    skipped += 1
+            self.stdout.write(self.style.SUCCESS(
+                f'✅ {label}: обработано {processed}, пропущено {skipped}'
+            ))
@@ -0,0 +1,384 @@
+import json
+import statistics
+import time
+from datetime import datetime, timezone as dt_timezone
+from pathlib import Path
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.db.models import Count
+from django.test import Client
+from django.urls import reverse
+from rest_framework.authtoken.models import Token
+
+from api.urlss.urls_recipes import router_recipes
+from api.urlss.urls_users import router_users, urlpatterns as user_urls
+from api.utils import response_cache
+from api.utils.bulk import reset_sequences
+from recipes import ingredient_index
+from recipes.models import (
+    FeedEntry, Favorite, Ingredient, Recipe, RecipeIngredient,
+    RecipeMinHashBand, ShoppingCart, SimilarRecipe,
+)
+from users.models import CustomUser, Follow
+
+DEFAULT_BASELINE = Path(settings.BASE_DIR) / 'benchmarks' / 'baseline.json'
+DEFAULT_THRESHOLDS = {
+    # Допустимый рост числа SQL-запросов (абсолютный)
+    'queries': 0,
+    # Во сколько раз может вырасти p95 и время SQL...
+    'time_ratio': 1.5,
+    # ...если при этом прирост больше этого числа миллисекунд
+    # (отсекает шум на быстрых ответах)
+    'min_delta_ms': 5,
+}
+# Маршруты api/urlss, которые сценарии не покрывают намеренно. Запись рецептов
+# (POST/PATCH/DELETE) тоже не меряется: в ней доминирует обработка изображения.
+NOT_BENCHMARKED = {
+    'api-root': 'служебный корень DRF',
+    'user-avatar': 'загрузка аватара меряет bench_image_upload',
+    'uploads-list': 'загрузка по частям меряет bench_image_upload',
+    'uploads-detail': 'загрузка по частям меряет bench_image_upload',
+    'users-activation': 'djoser, в проекте не используется',
+    'users-resend-activation': 'djoser, в проекте не используется',
+    'users-reset-password': 'djoser, в проекте не используется',
+    'users-reset-password-confirm': 'djoser, в проекте не используется',
+    'users-reset-username': 'djoser, в проекте не используется',
+    'users-reset-username-confirm': 'djoser, в проекте не используется',
+    'users-set-username': 'djoser, в проекте не используется',
+    'users-set-password': 'хэширование пароля — CPU, а не запросы',
+}
+
+
+class _Rollback(Exception):
+    pass
+
+
+class QueryRecorder:
+    """Считает SQL-запросы и их время через connection.execute_wrapper."""
+
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.seconds += time.perf_counter() - started
+            self.count += 1
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def route_names():
+    """Имена маршрутов из api/urlss (без суффиксов формата)."""
+    patterns = [*router_users.urls, *router_recipes.urls, *user_urls]
+    return {pattern.name for pattern in patterns if pattern.name}
+
+
+class Command(BaseCommand):
+    help = (
+        'Меряет каждый маршрут api/urlss тестовым клиентом: p50/p95 '
+        'задержки, число SQL-запросов и их суммарное время. Результат '
+        'сравнивается с JSON-базой (benchmarks/baseline.json); рост '
+        'запросов или времени сверх порогов — ошибка. С --recipes данные '
+        'генерируются generate_dataset во временной транзакции.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--recipes', type=int,
+            help='Сгенерировать столько рецептов (откатываются после замера)'
+        )
+        parser.add_argument('--seed', type=int, default=1)
+        parser.add_argument('--repeat', type=int, default=20)
+        parser.add_argument('--warmup', type=int, default=2)
+        parser.add_argument('--only', action='append', default=[],
+                            help='Только эти сценарии')
+        parser.add_argument('--baseline', default=str(DEFAULT_BASELINE))
+        parser.add_argument('--save', action='store_true',
+                            help='Записать результаты как новую базу')
+        parser.add_argument(
+            '--queries-only', action='store_true',
+            help='Сравнивать только число запросов (время зависит от машины)'
+        )
+
+    def handle(self, *args, **options):
+        self.options = options
+        baseline_path = Path(options['baseline'])
+        baseline = None
+        if baseline_path.exists():
+            baseline = json.loads(baseline_path.read_text())
+        seeded = options['recipes'] is not None
+        try:
+            with transaction.atomic():
+                if seeded:
+                    self._seed()
+                results = self._run(self._scenarios())
+                raise _Rollback
+        except _Rollback:
+            pass
+        finally:
+            # Ответы и индексы в кэше построены по откатанным данным
+            cache.clear()
+            ingredient_index.invalidate()
+            if seeded:
+                # setval в PostgreSQL не откатывается — возвращаем
+                # последовательности к живым данным
+                reset_sequences([
+                    CustomUser, Follow, Recipe, RecipeIngredient, Favorite,
+                    ShoppingCart, SimilarRecipe, RecipeMinHashBand, FeedEntry,
+                ])
+
+        created = datetime.now(dt_timezone.utc).isoformat(timespec='seconds')
+        report = {
+            'meta': {
+                'vendor': connection.vendor,
+                'recipes': (
+                    options['recipes'] if seeded
+                    else Recipe.objects.count()
+                ),
+                'seed': options['seed'] if seeded else None,
+                'repeat': options['repeat'],
+                'created': created,
+            },
+            'thresholds': (baseline or {}).get(
+                'thresholds', DEFAULT_THRESHOLDS
+            ),
+            'results': results,
+        }
+        if options['save']:
+            baseline_path.parent.mkdir(parents=True, exist_ok=True)
+            baseline_path.write_text(
+                json.dumps(report, ensure_ascii=False, indent=2) + '\n'
+            )
+            self.stdout.write(self.style.SUCCESS(
+                f'💾 База сохранена в {baseline_path}'
+            ))
+        elif baseline is not None:
+            self._compare(baseline, report)
+        else:
+            self.stdout.write(self.style.WARNING(
+                f'⚠️  Базы {baseline_path} нет: запустите с --save'
+            ))
+
+    def _seed(self):
+        if not Ingredient.objects.exists():
+            call_command('load_ingredients', stdout=self.stdout)
+        call_command(
+            'generate_dataset', '--recipes', str(self.options['recipes']),
+            '--seed', str(self.options['seed']), '--flush', stdout=self.stdout,
+        )
+
+    def _fixtures(self):
+        """
+        Зритель с подписками и корзиной, популярный рецепт и свободные цели
+        для переключателей.
+        """
+        viewer = (
+            CustomUser.objects.annotate(
+                subscriptions_total=Count('subscriptions', distinct=True),
+                cart_total=Count('cart_items', distinct=True),
+            )
+            .filter(subscriptions_total__gt=0, cart_total__gt=0)
+            .order_by('pk').first()
+        )
+        if viewer is None:
+            raise CommandError(
+                '❌ Нет пользователя с подписками и корзиной: '
+                'запустите с --recipes N'
+            )
+        recipe = Recipe.objects.order_by('-favorites_count', 'pk').first()
+        free_recipe = (
+            Recipe.objects.exclude(favorited_by__user=viewer)
+            .exclude(in_carts__user=viewer)
+            .order_by('pk').first()
+        )
+        free_author = (
+            CustomUser.objects.exclude(pk=viewer.pk)
+            .exclude(subscribers__subscriber=viewer)
+            .order_by('pk').first()
+        )
+        token, _ = Token.objects.get_or_create(user=viewer)
+        return viewer, recipe, free_recipe, free_author, token
+
+    def _scenarios(self):
+        """
+        (название, имя маршрута, авторизация, [(метод, url), ...],
+        подготовка без замера).
+        """
+        viewer, recipe, free_recipe, free_author, token = self._fixtures()
+        self.auth = {'HTTP_AUTHORIZATION': f'Token {token.key}'}
+        ingredient = Ingredient.objects.order_by('pk').first()
+        word = ingredient.name.split()[0]
+
+        def url(name, *args, query=''):
+            path = reverse(f'api:{name}', args=args)
+            return path + (f'?{query}' if query else '')
+
+        def get(name, *args, query=''):
+            return [('get', url(name, *args, query=query))]
+
+        def toggle(name, *args):
+            return [('post', url(name, *args)), ('delete', url(name, *args))]
+
+        def invalidate_lists():
+            response_cache.invalidate('recipes')
+
+        return [
+            ('recipes_list', 'recipes-list', False,
+             get('recipes-list', query='limit=6'), None),
+            ('recipes_list_uncached', 'recipes-list', False,
+             get('recipes-list', query='limit=6'), invalidate_lists),
+            ('recipes_list_auth', 'recipes-list', True,
+             get('recipes-list', query='limit=6'), None),
+            ('recipes_list_cursor', 'recipes-list', True,
+             get('recipes-list', query='limit=6&pagination=cursor'), None),
+            ('recipes_filter_author', 'recipes-list', True,
+             get('recipes-list', query=f'limit=6&author={recipe.author_id}'),
+             None),
+            ('recipes_filter_favorited', 'recipes-list', True,
+             get('recipes-list', query='limit=6&is_favorited=1'), None),
+            ('recipes_filter_cart', 'recipes-list', True,
+             get('recipes-list', query='limit=6&is_in_shopping_cart=1'),
+             None),
+            ('recipes_search', 'recipes-list', True,
+             get('recipes-list', query=f'limit=6&search={word}'), None),
+            ('recipes_filter_ingredients', 'recipes-list', True,
+             get('recipes-list', query=f'limit=6&ingredients={ingredient.pk}'),
+             None),
+            ('recipes_feed', 'recipes-feed', True,
+             get('recipes-feed', query='limit=6'), None),
+            ('recipe_detail', 'recipes-detail', False,
+             get('recipes-detail', recipe.pk), None),
+            ('recipe_detail_auth', 'recipes-detail', True,
+             get('recipes-detail', recipe.pk), None),
+            ('recipe_get_link', 'recipes-get-link', False,
+             get('recipes-get-link', recipe.pk), None),
+            ('recipe_similar', 'recipes-similar', False,
+             get('recipes-similar', recipe.pk), None),
+            ('ingredients_prefix', 'ingredients-list', False,
+             get('ingredients-list', query=f'name={ingredient.name[:2]}'),
+             None),
+            ('ingredients_search', 'ingredients-list', False,
+             get('ingredients-list',
+                 query=f'search={ingredient.name[:5]}&limit=10'), None),
+            ('ingredient_detail', 'ingredients-detail', False,
+             get('ingredients-detail', ingredient.pk), None),
+            ('users_list', 'users-list', True,
+             get('users-list', query='limit=6'), None),
+            ('user_detail', 'users-detail', True,
+             get('users-detail', recipe.author_id), None),
+            ('users_me', 'users-me', True, get('users-me'), None),
+            ('subscriptions', 'users-subscriptions', True,
+             get('users-subscriptions', query='limit=6&recipes_limit=3'),
+             None),
+            ('subscribe_toggle', 'users-subscribe', True,
+             toggle('users-subscribe', free_author.pk), None),
+            ('favorite_toggle', 'recipes-favorite', True,
+             toggle('recipes-favorite', free_recipe.pk), None),
+            ('cart_toggle', 'recipes-shopping-cart', True,
+             toggle('recipes-shopping-cart', free_recipe.pk), None),
+            ('download_shopping_cart', 'recipes-download-shopping-cart', True,
+             get('recipes-download-shopping-cart'), None),
+        ]
+
+    def _run(self, scenarios):
+        covered = {route for _, route, *_ in scenarios}
+        uncovered = route_names() - covered - NOT_BENCHMARKED.keys()
+        for name in sorted(uncovered):
+            self.stderr.write(self.style.WARNING(
+                f'⚠️  Маршрут {name} не покрыт сценариями'
+            ))
+
+        only = set(self.options['only'])
+        rounds = self.options['warmup'] + self.options['repeat']
+        results = {}
+        for name, _, authorized, requests, prepare in scenarios:
+            if only and name not in only:
+                continue
+            client = Client(
+                SERVER_NAME='localhost', **(self.auth if authorized else {})
+            )
+            samples = []
+            for iteration in range(rounds):
+                if prepare is not None:
+                    prepare()
+                sample = self._measure(client, requests)
+                if iteration >= self.options['warmup']:
+                    samples.append(sample)
+            latencies = [latency for latency, _, _ in samples]
+            result = results[name] = {
+                'p50_ms': round(statistics.median(latencies), 2),
+                'p95_ms': round(percentile(latencies, 0.95), 2),
+                'queries': max(queries for _, queries, _ in samples),
+                'sql_ms': round(
+                    statistics.median(sql for _, _, sql in samples), 2
+                ),
+            }
+            self.stdout.write(
+                f"📊 {name:26} p50 {result['p50_ms']:8.2f} мс  "
+                f"p95 {result['p95_ms']:8.2f} мс  "
+                f"SQL {result['queries']:3} запр. / "
+                f"{result['sql_ms']:7.2f} мс"
+            )
+        return results
+
+    @staticmethod
+    def _measure(client, requests):
+        recorder = QueryRecorder()
+        started = time.perf_counter()
+        with connection.execute_wrapper(recorder):
+            for method, url in requests:
+                response = getattr(client, method)(url)
+                if response.status_code >= 400:
+                    raise CommandError(
+                        f'❌ {method.upper()} {url}: {response.status_code}'
+                    )
+                # Потоковые ответы (список покупок) делают запросы
+                # при чтении тела
+                if response.streaming:
+                    b''.join(response.streaming_content)
+        elapsed = (time.perf_counter() - started) * 1000
+        return elapsed, recorder.count, recorder.seconds * 1000
+
+    def _compare(self, baseline, report):
+        thresholds = report['thresholds']
+        regressions = []
+        for name, current in report['results'].items():
+            base = baseline['results'].get(name)
+            if base is None:
+                self.stdout.write(self.style.WARNING(f'🆕 {name}: нет в базе'))
+                continue
+            if current['queries'] > base['queries'] + thresholds['queries']:
+                regressions.append(
+                    f"{name}: запросов {base['queries']} → "
+                    f"{current['queries']}"
+                )
+            if self.options['queries_only']:
+                continue
+            for metric in ('p95_ms', 'sql_ms'):
+                limit = max(
+                    base[metric] * thresholds['time_ratio'],
+                    base[metric] + thresholds['min_delta_ms'],
+                )
+                if current[metric] > limit:
+                    regressions.append(
+                        f'{name}: {metric} {base[metric]} → '
+                        f'{current[metric]} (порог {limit:.2f})'
+                    )
+        if regressions:
+            raise CommandError(
+                '❌ Регрессии относительно базы:\n' + '\n'.join(regressions)
+            )
+        self.stdout.write(self.style.SUCCESS(
+            '✅ Регрессий относительно базы нет'
+        ))
@@ -0,0 +1,173 @@
+import base64
+import io
+import json
+import os
+import resource
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.test import Client, override_settings
+from django.test.client import BOUNDARY, MULTIPART_CONTENT, encode_multipart
+from PIL import Image
+from rest_framework.authtoken.models import Token
+
+from users.models import CustomUser
+
+MODES = ('base64', 'multipart', 'chunked')
+
+
+class _Rollback(Exception):
+    pass
+
+
+def make_png(size_mb):
+    """PNG из шума почти не сжимается: размер файла ≈ ширина × высота × 3."""
+    side = int((size_mb * 1024 * 1024 / 3) ** 0.5)
+    image = Image.frombytes('RGB', (side, side), os.urandom(side * side * 3))
+    buffer = io.BytesIO()
+    image.save(buffer, 'PNG', compress_level=1)
+    return buffer.getvalue()
+
+
+def peak_rss_mb():
+    # ru_maxrss в Linux — в килобайтах
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+class Command(BaseCommand):
+    help = (
+        'Сравнивает загрузку аватара base64 в JSON, multipart/form-data и по '
+        'частям: задержку и пиковый RSS процесса. Каждый способ меряется в '
+        'отдельном процессе, данные откатываются, файлы пишутся во временный '
+        'каталог.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--size-mb', type=float, default=5)
+        parser.add_argument('--repeat', type=int, default=3)
+        parser.add_argument('--chunk-mb', type=float, default=1)
+        parser.add_argument(
+            '--mode', choices=MODES,
+            help='Замер одного способа (запускается самой командой)'
+        )
+
+    def handle(self, *args, **options):
+        if options['mode']:
+            result = self._measure(options)
+            self.stdout.write(json.dumps(result))
+            return
+
+        self.stdout.write(self.style.WARNING(
+            f"⏳ Изображение {options['size_mb']} МБ, "
+            f"повторов {options['repeat']}"
+        ))
+        for mode in MODES:
+            output = subprocess.run(
+                [
+                    sys.executable, '-m', 'django', 'bench_image_upload',
+                    '--mode', mode,
+                    '--size-mb', str(options['size_mb']),
+                    '--repeat', str(options['repeat']),
+                    '--chunk-mb', str(options['chunk_mb']),
+                ],
+                cwd=settings.BASE_DIR, capture_output=True, text=True,
+            )
+            if output.returncode:
+                raise CommandError(f'❌ {mode}: {output.stderr.strip()}')
+            result = json.loads(output.stdout.strip().splitlines()[-1])
+            self.stdout.write(self.style.SUCCESS(
+                f"📦 {mode:9} {result['latency_ms']:8.1f} мс, "
+                f"пиковый RSS +{result['rss_delta_mb']:.1f} МБ "
+                f"(всего {result['peak_rss_mb']:.1f} МБ)"
+            ))
+
+    def _measure(self, options):
+        image = make_png(options['size_mb'])
+        with tempfile.TemporaryDirectory() as media_root, override_settings(
+            MEDIA_ROOT=media_root,
+            CHUNKED_UPLOAD_DIR=os.path.join(media_root, 'uploads'),
+        ):
+            try:
+                with transaction.atomic():
+                    user = CustomUser.objects.create_user(
+                        email='bench-upload@example.com',
+                        username='bench-upload',
+                        first_name='Bench', last_name='Upload',
+                        password='StrongPass123!',
+                    )
+                    token = Token.objects.create(user=user)
+                    client = Client(
+                        SERVER_NAME='localhost',
+                        HTTP_AUTHORIZATION=f'Token {token.key}',
+                    )
+                    send = getattr(self, f'_send_{options["mode"]}')
+                    payload = self._prepare(options['mode'], image)
+                    baseline = peak_rss_mb()
+                    timings = []
+                    for _ in range(options['repeat']):
+                        started = time.perf_counter()
+                        send(client, payload, options)
+                        timings.append((time.perf_counter() - started) * 1000)
+                    peak = peak_rss_mb()
+                    raise _Rollback
+            except _Rollback:
+                pass
+        return {
+            'latency_ms': statistics.median(timings),
+            'rss_delta_mb': peak - baseline,
+            'peak_rss_mb': peak,
+        }
+
+    @staticmethod
+    def _prepare(mode, image):
+        # Тело запроса клиент готовит до замера: считаем только работу сервера
+        if mode == 'base64':
+            encoded = base64.b64encode(image).decode()
+            return json.dumps({'avatar': f'data:image/png;base64,{encoded}'})
+        if mode == 'multipart':
+            upload = io.BytesIO(image)
+            upload.name = 'avatar.png'
+            return encode_multipart(BOUNDARY, {'avatar': upload})
+        return image
+
+    @staticmethod
+    def _check(response, expected=200):
+        if response.status_code != expected:
+            raise CommandError(
+                f'❌ {response.status_code}: {response.content[:200]!r}'
+            )
+        return response
+
+    def _send_base64(self, client, payload, options):
+        self._check(client.put(
+            '/api/users/me/avatar/', payload, content_type='application/json'
+        ))
+
+    def _send_multipart(self, client, payload, options):
+        self._check(client.put(
+            '/api/users/me/avatar/', payload, content_type=MULTIPART_CONTENT
+        ))
+
+    def _send_chunked(self, client, payload, options):
+        upload = self._check(client.post(
+            '/api/uploads/', {'filename': 'avatar.png', 'size': len(payload)},
+            content_type='application/json',
+        ), 201).json()
+        chunk_size = int(options['chunk_mb'] * 1024 * 1024)
+        for offset in range(0, len(payload), chunk_size):
+            self._check(client.patch(
+                f"/api/uploads/{upload['id']}/",
+                payload[offset:offset + chunk_size],
+                content_type='application/offset+octet-stream',
+                HTTP_UPLOAD_OFFSET=str(offset),
+            ))
+        self._check(client.put(
+            '/api/users/me/avatar/', {'avatar': f"upload:{upload['id']}"},
+            content_type='application/json',
+        ))
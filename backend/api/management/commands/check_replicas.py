@@ -0,0 +1,35 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from api.utils import replicas
+
+
+class Command(BaseCommand):
+    help = (
+        'Доступность и отставание реплик чтения (READ_REPLICAS) — та же '
+        'проверка, по которой маршрутизатор исключает реплики. Ошибка, если '
+        'здоровых реплик нет.'
+    )
+
+    def handle(self, *args, **options):
+        if not settings.READ_REPLICAS:
+            self.stdout.write(self.style.WARNING(
+                '⚠️  Реплики не настроены (DB_REPLICA_HOSTS): всё читается '
+                'с default'
+            ))
+            return
+        lags = replicas.HEALTH.check()
+        for alias, lag in lags.items():
+            if lag is None:
+                self.stdout.write(self.style.ERROR(f'❌ {alias}: недоступна'))
+            elif alias in replicas.HEALTH.healthy:
+                self.stdout.write(self.style.SUCCESS(
+                    f'✅ {alias}: отставание {lag:.2f} с'
+                ))
+            else:
+                self.stdout.write(self.style.WARNING(
+                    f'⚠️  {alias}: отставание {lag:.2f} с больше '
+                    f'REPLICA_MAX_LAG={settings.REPLICA_MAX_LAG}'
+                ))
+        if not replicas.HEALTH.healthy:
+            raise CommandError('❌ Нет здоровых реплик: чтения идут в default')
@@ -0,0 +1,107 @@
+import os
+import time
+from datetime import timedelta
+
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+
+from api.models import ChunkedUpload, MediaBlob
+from api.utils import storage
+
+
+class Command(BaseCommand):
+    help = (
+        'Удаляет файлы медиа, на которые больше нет ссылок. '
+        'С --recount сначала пересчитывает ссылки по базе.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--recount', action='store_true',
+            help='Пересчитать счётчики ссылок по полям моделей'
+        )
+        parser.add_argument(
+            '--grace-minutes', type=int, default=60,
+            help='Не трогать файлы, загруженные позже этого срока'
+        )
+        parser.add_argument(
+            '--uploads-max-age-hours', type=int, default=24,
+            help='Удалять незавершённые и неиспользованные загрузки по частям '
+                 'старше этого срока'
+        )
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Только показать, что будет удалено')
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        if not isinstance(default_storage, storage.ContentAddressedStorage):
+            raise CommandError(
+                '❌ Хранилище по умолчанию не ContentAddressedStorage'
+            )
+        if options['recount']:
+            fixed = storage.recount_references(
+                options['batch_size'], dry_run=options['dry_run']
+            )
+            self.stdout.write(f'   счётчиков исправлено: {fixed}')
+
+        cutoff = timezone.now() - timedelta(minutes=options['grace_minutes'])
+        orphans = MediaBlob.objects.filter(
+            refcount__lte=0, touched_at__lt=cutoff
+        )
+        removed = freed = 0
+        for blob in orphans.iterator(chunk_size=options['batch_size']):
+            if not options['dry_run'] and not self._collect(blob, cutoff):
+                continue
+            removed += 1
+            freed += blob.size
+        removed_tmp = self._clean_tmp(cutoff, options['dry_run'])
+        max_age = timedelta(hours=options['uploads_max_age_hours'])
+        expired = ChunkedUpload.objects.filter(
+            created_at__lt=timezone.now() - max_age
+        )
+        expired_uploads = expired.count()
+        if not options['dry_run']:
+            # Файлы частей удаляет сигнал post_delete
+            expired.delete()
+
+        verb = 'Будет удалено' if options['dry_run'] else 'Удалено'
+        self.stdout.write(self.style.SUCCESS(
+            f'✅ {verb} файлов: {removed} ({freed / 1024 / 1024:.1f} МБ), '
+            f'недописанных: {removed_tmp}, '
+            f'загрузок по частям: {expired_uploads}'
+        ))
+
+    @staticmethod
+    def _collect(blob, cutoff):
+        """
+        Удаляет строку файла, только если ссылок по-прежнему нет и его никто
+        не загрузил заново после выборки, и лишь тогда сам файл. Строка
+        остаётся заблокированной до конца транзакции: параллельная загрузка
+        того же содержимого ждёт её и создаёт строку и файл заново
+        (ContentAddressedStorage._save).
+        """
+        with transaction.atomic():
+            deleted, _ = MediaBlob.objects.filter(
+                pk=blob.pk, refcount__lte=0, touched_at__lt=cutoff
+            ).delete()
+            if deleted:
+                default_storage.purge(blob.name)
+        return bool(deleted)
+
+    @staticmethod
+    def _clean_tmp(cutoff, dry_run):
+        # Временные файлы прерванных загрузок (см.
+        # ContentAddressedStorage._save)
+        directory = default_storage.path(storage.TMP_DIR)
+        if not os.path.isdir(directory):
+            return 0
+        removed = 0
+        threshold = time.time() - (timezone.now() - cutoff).total_seconds()
+        for entry in os.scandir(directory):
+            if entry.is_file() and entry.stat().st_mtime < threshold:
+                if not dry_run:
+                    os.remove(entry.path)
+                removed += 1
+        return removed
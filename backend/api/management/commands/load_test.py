@@ -0,0 +1,297 @@
+import asyncio
+import json
+import os
+import random
+import signal
+import subprocess
+import sys
+import time
+from collections import Counter
+from pathlib import Path
+from urllib.parse import quote, urlsplit
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from rest_framework.authtoken.models import Token
+
+from api.management.commands.bench_endpoints import percentile
+from recipes.models import Recipe
+from users.models import CustomUser
+
+READY_TIMEOUT = 30
+ID_SAMPLE = 1000
+# Горячие эндпоинты асинхронного пути чтения (api.async_views)
+SCENARIOS = (
+    ('recipes-list',
+     lambda ids, rng: f'/api/recipes/?page={rng.randint(1, 20)}'),
+    ('recipes-detail',
+     lambda ids, rng: f'/api/recipes/{rng.choice(ids["recipes"])}/'),
+    ('ingredients',
+     lambda ids, rng: f'/api/ingredients/?name={rng.choice("абвгдекмпс")}'),
+    ('users-detail',
+     lambda ids, rng: f'/api/users/{rng.choice(ids["users"])}/'),
+)
+
+
+class HttpClient:
+    """
+    Минимальный клиент HTTP/1.1 с keep-alive: одно соединение на конкурентного
+    клиента.
+    """
+
+    def __init__(self, url):
+        parts = urlsplit(url)
+        self.host, self.port = parts.hostname, parts.port or 80
+        self.reader = self.writer = None
+
+    async def request(self, path, headers):
+        if self.writer is None:
+            self.reader, self.writer = await asyncio.open_connection(
+                self.host, self.port
+            )
+        lines = [
+            f'GET {quote(path, safe="/?=&")} HTTP/1.1',
+            f'Host: {self.host}:{self.port}',
+            'Accept: application/json',
+        ]
+        lines += [f'{name}: {value}' for name, value in headers.items()]
+        self.writer.write(('\r\n'.join(lines) + '\r\n\r\n').encode())
+        await self.writer.drain()
+
+        head = await self.reader.readuntil(b'\r\n\r\n')
+        head = head.decode('latin-1').split('\r\n')
+        status = int(head[0].split()[1])
+        fields = {}
+        for line in head[1:]:
+            if ':' in line:
+                name, value = line.split(':', 1)
+                fields[name.strip().lower()] = value.strip()
+        if fields.get('transfer-encoding') == 'chunked':
+            while size := int(await self.reader.readuntil(b'\r\n'), 16):
+                await self.reader.readexactly(size + 2)
+            await self.reader.readuntil(b'\r\n')
+        else:
+            await self.reader.readexactly(int(fields.get('content-length', 0)))
+        if fields.get('connection') == 'close':
+            self.close()
+        return status
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+        self.reader = self.writer = None
+
+
+class Command(BaseCommand):
+    help = (
+        'Нагрузочный тест горячих GET-эндпоинтов: одинаковая смесь запросов '
+        'с высокой конкурентностью по нескольким серверам (WSGI и ASGI) — '
+        'пропускная способность и хвосты задержки. --start сам поднимает '
+        'gunicorn (WSGI) и uvicorn (ASGI).'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--target', action='append', default=[], metavar='ИМЯ=URL',
+            help='Сервер для замера, можно несколько: '
+                 'wsgi=http://127.0.0.1:8000'
+        )
+        parser.add_argument(
+            '--start', action='store_true',
+            help='Поднять wsgi (gunicorn) и asgi (uvicorn) на свободных портах'
+        )
+        parser.add_argument(
+            '--workers', type=int, default=1,
+            help='Процессов на сервер при --start (поровну для честного '
+                 'сравнения)'
+        )
+        parser.add_argument('--concurrency', type=int, default=200)
+        parser.add_argument('--duration', type=float, default=20,
+                            help='Секунд замера на сервер')
+        parser.add_argument('--warmup', type=float, default=3,
+                            help='Секунд прогрева перед замером')
+        parser.add_argument(
+            '--user',
+            help='Ходить с токеном этого пользователя (мимо кэша анонимных '
+                 'ответов)'
+        )
+        parser.add_argument('--seed', type=int, default=1)
+        parser.add_argument('--output', help='Сохранить результаты в JSON')
+
+    def handle(self, *args, **options):
+        targets = dict(
+            target.split('=', 1) for target in options['target']
+            if '=' in target
+        )
+        if len(targets) != len(options['target']):
+            raise CommandError(
+                '❌ --target ожидается в виде имя=http://хост:порт'
+            )
+        recipes = Recipe.objects.order_by('-pub_date')
+        users = CustomUser.objects.order_by('pk')
+        ids = {
+            'recipes': list(recipes.values_list('pk', flat=True)[:ID_SAMPLE]),
+            'users': list(users.values_list('pk', flat=True)[:ID_SAMPLE]),
+        }
+        if not ids['recipes'] or not ids['users']:
+            raise CommandError(
+                '❌ В базе нет рецептов или пользователей: '
+                'manage.py generate_dataset'
+            )
+        headers = {}
+        if options['user']:
+            user = CustomUser.objects.filter(username=options['user']).first()
+            if user is None:
+                raise CommandError(
+                    f'❌ Пользователь {options["user"]} не найден'
+                )
+            token, _ = Token.objects.get_or_create(user=user)
+            headers['Authorization'] = f'Token {token.key}'
+
+        servers = []
+        try:
+            if options['start']:
+                servers = self._start_servers(options['workers'])
+                targets.update({name: url for name, url, _ in servers})
+            if not targets:
+                raise CommandError('❌ Нужен хотя бы один --target или --start')
+            results = {}
+            for name, url in targets.items():
+                self.stdout.write(self.style.WARNING(
+                    f'⏳ {name} ({url}): {options["concurrency"]} клиентов, '
+                    f'{options["duration"]:g} с'
+                ))
+                results[name] = asyncio.run(
+                    self._run(url, ids, headers, options)
+                )
+                self._report(name, results[name])
+        finally:
+            for _, _, process in servers:
+                process.send_signal(signal.SIGTERM)
+                process.wait(timeout=10)
+
+        self._compare(results)
+        if options['output']:
+            Path(options['output']).write_text(
+                json.dumps(results, ensure_ascii=False, indent=2)
+            )
+
+    def _start_servers(self, workers):
+        base = Path(settings.BASE_DIR)
+        commands = {
+            'wsgi': [
+                sys.executable, '-m', 'gunicorn', 'backend.wsgi:application',
+                '--workers', str(workers), '--bind', '127.0.0.1:{port}',
+                '--log-level', 'warning',
+            ],
+            'asgi': [
+                sys.executable, '-m', 'uvicorn', 'backend.asgi:application',
+                '--workers', str(workers), '--port', '{port}',
+                '--log-level', 'warning', '--no-access-log',
+            ],
+        }
+        servers = []
+        for port, (name, command) in enumerate(commands.items(), start=18_000):
+            process = subprocess.Popen(
+                [part.format(port=port) for part in command],
+                cwd=base, env=os.environ.copy(),
+            )
+            servers.append((name, f'http://127.0.0.1:{port}', process))
+        for name, url, process in servers:
+            asyncio.run(self._wait_ready(name, url, process))
+        return servers
+
+    async def _wait_ready(self, name, url, process):
+        deadline = time.monotonic() + READY_TIMEOUT
+        while time.monotonic() < deadline:
+            if process.poll() is not None:
+                raise CommandError(
+                    f'❌ {name} завершился с кодом {process.returncode}'
+                )
+            client = HttpClient(url)
+            try:
+                await client.request('/api/ingredients/?name=а', {})
+                return
+            except OSError:
+                await asyncio.sleep(0.2)
+            finally:
+                client.close()
+        raise CommandError(f'❌ {name} не ответил за {READY_TIMEOUT} с')
+
+    async def _run(self, url, ids, headers, options):
+        latencies, statuses, errors = [], Counter(), Counter()
+        started = time.monotonic()
+        measure_from = started + options['warmup']
+        deadline = measure_from + options['duration']
+
+        async def client(number):
+            # Свой генератор на клиента: смесь запросов одинакова для всех
+            # серверов
+            rng = random.Random(f'{options["seed"]}:{number}')
+            http = HttpClient(url)
+            while (now := time.monotonic()) < deadline:
+                _, make_path = rng.choice(SCENARIOS)
+                begin = time.perf_counter()
+                try:
+                    status = await http.request(make_path(ids, rng), headers)
+                except (OSError, asyncio.IncompleteReadError,
+                        ValueError) as error:
+                    http.close()
+                    if now >= measure_from:
+                        errors[type(error).__name__] += 1
+                    await asyncio.sleep(0.01)
+                    continue
+                if now >= measure_from:
+                    latencies.append(time.perf_counter() - begin)
+                    statuses[status] += 1
+            http.close()
+
+        await asyncio.gather(
+            *(client(number) for number in range(options['concurrency']))
+        )
+        if not latencies:
+            return {'requests': 0, 'errors': dict(errors)}
+        return {
+            'requests': len(latencies),
+            'rps': round(len(latencies) / options['duration'], 1),
+            'p50_ms': round(percentile(latencies, 0.50) * 1000, 2),
+            'p95_ms': round(percentile(latencies, 0.95) * 1000, 2),
+            'p99_ms': round(percentile(latencies, 0.99) * 1000, 2),
+            'max_ms': round(max(latencies) * 1000, 2),
+            'statuses': {
+                str(status): count
+                for status, count in sorted(statuses.items())
+            },
+            'errors': dict(errors),
+        }
+
+    def _report(self, name, result):
+        if not result['requests']:
+            self.stdout.write(self.style.ERROR(
+                f'❌ {name}: ни одного ответа, ошибки {result["errors"]}'
+            ))
+            return
+        self.stdout.write(
+            f'   {result["rps"]:8.1f} rps  p50 {result["p50_ms"]:8.2f}  '
+            f'p95 {result["p95_ms"]:8.2f}  '
+            f'p99 {result["p99_ms"]:8.2f}  max {result["max_ms"]:8.2f} мс  '
+            f'статусы {result["statuses"]}  ошибки {result["errors"] or 0}'
+        )
+
+    def _compare(self, results):
+        measured = {
+            name: result for name, result in results.items()
+            if result['requests']
+        }
+        if len(measured) < 2:
+            return
+        (base_name, base), *others = measured.items()
+        self.stdout.write(self.style.SUCCESS(f'\n📊 Относительно {base_name}'))
+        for name, result in others:
+            rps = result['rps'] / base['rps']
+            p95 = result['p95_ms'] / base['p95_ms']
+            p99 = result['p99_ms'] / base['p99_ms']
+            self.stdout.write(
+                f'   {name}: пропускная способность ×{rps:.2f}, '
+                f'p95 ×{p95:.2f}, p99 ×{p99:.2f}'
+            )
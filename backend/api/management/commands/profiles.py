@@ -0,0 +1,201 @@
+import re
+from collections import Counter, defaultdict
+
+from django.core.management.base import BaseCommand, CommandError
+
+from api.utils import profiling
+
+# IN (%s, %s, ...) с разным числом параметров — один и тот же запрос
+IN_LIST = re.compile(r'IN \((?:%s, )*%s\)')
+
+
+def normalize(sql):
+    return IN_LIST.sub('IN (...)', sql)
+
+
+def sql_groups(profile):
+    """Нормализованный SQL → [число выполнений, суммарные мс, первый стек]."""
+    groups = defaultdict(lambda: [0, 0.0, None])
+    for query in profile['queries']:
+        group = groups[normalize(query['sql'])]
+        group[0] += 1
+        group[1] += query['ms']
+        group[2] = group[2] or query['stack']
+    return groups
+
+
+def shorten(text, width=140):
+    text = ' '.join(text.split())
+    return text if len(text) <= width else text[:width - 1] + '…'
+
+
+class Command(BaseCommand):
+    help = (
+        'Сохранённые профили запросов (api.utils.profiling): list — список, '
+        'show <id> — разбор одного профиля, diff <id> <id> — сравнение двух.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dir', help='Каталог профилей (по умолчанию PROFILE_DIR)'
+        )
+        actions = parser.add_subparsers(dest='action', required=True)
+        listing = actions.add_parser('list', help='Профили от новых к старым')
+        listing.add_argument('--limit', type=int, default=30)
+        listing.add_argument(
+            '--route', help='Только этот маршрут (api:recipes-list)'
+        )
+        show = actions.add_parser('show', help='Разбор профиля')
+        show.add_argument('id', help='id профиля или его начало')
+        show.add_argument('--top', type=int, default=20)
+        diff = actions.add_parser(
+            'diff', help='Что изменилось между двумя профилями'
+        )
+        diff.add_argument('before')
+        diff.add_argument('after')
+        diff.add_argument('--top', type=int, default=15)
+
+    def handle(self, *args, **options):
+        self.directory = options['dir'] and profiling.Path(options['dir'])
+        getattr(self, '_' + options['action'])(options)
+
+    def _load(self, profile_id):
+        profile = profiling.load(profile_id, self.directory)
+        if profile is None:
+            raise CommandError(
+                f'❌ Профиль {profile_id} не найден или id неоднозначен'
+            )
+        return profile
+
+    def _list(self, options):
+        shown = 0
+        for path in reversed(profiling.stored(self.directory)):
+            if shown >= options['limit']:
+                break
+            profile = profiling.json.loads(path.read_text())
+            if options['route'] and profile['route'] != options['route']:
+                continue
+            shown += 1
+            self.stdout.write(
+                f"{profile['id']}  {profile['created'][:19]}  "
+                f"{profile['mode']:8} "
+                f"{profile['status']} {profile['duration_ms']:9.1f} мс  "
+                f"SQL {len(profile['queries']):4} / "
+                f"{profile['sql_ms']:8.1f} мс  "
+                f"{profile['method']} {profile['path']}"
+            )
+        if not shown:
+            self.stdout.write(self.style.WARNING('⚠️  Профилей нет'))
+
+    def _show(self, options):
+        profile = self._load(options['id'])
+        top = options['top']
+        self.stdout.write(self.style.SUCCESS(
+            f"🔎 {profile['method']} {profile['path']} → {profile['status']} "
+            f"({profile['route']}, пользователь {profile['user']}, "
+            f"{profile['mode']})"
+        ))
+        self.stdout.write(
+            f"   {profile['duration_ms']:.1f} мс всего, "
+            f"SQL: {len(profile['queries'])} запросов "
+            f"за {profile['sql_ms']:.1f} мс"
+        )
+
+        repeated = sorted(
+            (
+                (sql, group) for sql, group in sql_groups(profile).items()
+                if group[0] > 1
+            ),
+            key=lambda item: item[1][0], reverse=True,
+        )
+        if repeated:
+            self.stdout.write(
+                self.style.WARNING('\n🔁 Повторяющиеся запросы (N+1?)')
+            )
+            for sql, (count, ms, stack) in repeated[:top]:
+                self.stdout.write(
+                    f'   ×{count:<4} {ms:8.2f} мс  {shorten(sql)}'
+                )
+                for frame in stack[-3:]:
+                    self.stdout.write(f'         ↳ {frame}')
+
+        self.stdout.write(self.style.WARNING('\n🐢 Самые медленные запросы'))
+        slowest = sorted(
+            profile['queries'], key=lambda query: query['ms'], reverse=True
+        )
+        for query in slowest[:5]:
+            self.stdout.write(
+                f"   {query['ms']:8.2f} мс  {shorten(query['sql'])}"
+            )
+            for frame in query['stack']:
+                self.stdout.write(f'         ↳ {frame}')
+
+        if 'functions' in profile:
+            self.stdout.write(self.style.WARNING(
+                '\n⏱️  Функции по накопленному времени (cProfile)'
+            ))
+            self.stdout.write('   cumtime   tottime     calls  функция')
+            for row in profile['functions'][:top]:
+                self.stdout.write(
+                    f"   {row['cumtime']:7.4f}  {row['tottime']:7.4f}  "
+                    f"{row['calls']:8}  {row['function']}"
+                )
+        else:
+            total = sum(profile['samples'].values())
+            self.stdout.write(self.style.WARNING(
+                f'\n🔥 Горячие стеки ({total} семплов)'
+            ))
+            for stack, count in list(profile['samples'].items())[:top]:
+                self.stdout.write(f'   {count:5}  {shorten(stack, 200)}')
+
+    def _diff(self, options):
+        before = self._load(options['before'])
+        after = self._load(options['after'])
+        self.stdout.write(self.style.SUCCESS(
+            f"🔀 {before['id']} ({before['path']}) → "
+            f"{after['id']} ({after['path']})"
+        ))
+        for label, key in (
+            ('Время, мс', 'duration_ms'), ('SQL, мс', 'sql_ms'),
+        ):
+            self.stdout.write(
+                f'   {label:12} {before[key]:10.1f} → {after[key]:10.1f}'
+            )
+        self.stdout.write(
+            f"   {'Запросов':12} {len(before['queries']):10} → "
+            f"{len(after['queries']):10}"
+        )
+
+        old, new = sql_groups(before), sql_groups(after)
+        changes = sorted(
+            (
+                (new.get(sql, [0])[0] - old.get(sql, [0])[0], sql)
+                for sql in old.keys() | new.keys()
+            ),
+            key=lambda item: abs(item[0]), reverse=True,
+        )
+        changes = [(delta, sql) for delta, sql in changes if delta]
+        if changes:
+            self.stdout.write(
+                self.style.WARNING('\n🧮 Изменилось число выполнений')
+            )
+            for delta, sql in changes[:options['top']]:
+                self.stdout.write(f'   {delta:+5}  {shorten(sql)}')
+
+        if 'functions' in before and 'functions' in after:
+            old_time = {
+                row['function']: row['cumtime'] for row in before['functions']
+            }
+            new_time = {
+                row['function']: row['cumtime'] for row in after['functions']
+            }
+            deltas = Counter({
+                function: new_time.get(function, 0) - old_time.get(function, 0)
+                for function in old_time.keys() | new_time.keys()
+            })
+            self.stdout.write(self.style.WARNING('\n⏱️  Изменение cumtime, с'))
+            largest = sorted(
+                deltas.items(), key=lambda item: abs(item[1]), reverse=True
+            )
+            for function, delta in largest[:options['top']]:
+                self.stdout.write(f'   {delta:+8.4f}  {function}')
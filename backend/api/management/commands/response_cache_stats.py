@@ -0,0 +1,33 @@
+from django.core.management.base import BaseCommand
+
+from api.utils import response_cache
+
+
+class Command(BaseCommand):
+    help = 'Показывает попадания и промахи кэша анонимных ответов рецептов.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--reset', action='store_true',
+                            help='Обнулить счётчики после вывода')
+        parser.add_argument(
+            '--invalidate', action='store_true',
+            help='Сделать устаревшими все закэшированные списки рецептов'
+        )
+
+    def handle(self, *args, **options):
+        stats = response_cache.stats()
+        lookups = stats['hits'] + stats['misses']
+        ratio = stats['hits'] / lookups * 100 if lookups else 0
+        self.stdout.write(
+            f"📊 попаданий {stats['hits']}, промахов {stats['misses']} "
+            f"({ratio:.1f}% попаданий), устаревших {stats['stale']}, "
+            f"ожиданий сборки {stats['waits']}"
+        )
+        if options['invalidate']:
+            response_cache.invalidate('recipes')
+            self.stdout.write(
+                self.style.WARNING('↩️  Списки рецептов сброшены')
+            )
+        if options['reset']:
+            response_cache.reset_stats()
+            self.stdout.write(self.style.SUCCESS('✅ Счётчики обнулены'))
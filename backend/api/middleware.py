@@ -0,0 +1,208 @@
+import logging
+from contextlib import ExitStack
+
+from asgiref.sync import (
+    iscoroutinefunction, markcoroutinefunction, sync_to_async,
+)
+from django.conf import settings
+from django.db import connections
+
+from api.utils import metrics, profiling, replicas
+
+logger = logging.getLogger(__name__)
+
+
+def _wrap_connections(wrapper):
+    """
+    Вешает execute_wrapper на соединения текущего потока; снимается close().
+    Обёртка вешается на объект соединения, а не на открытое подключение.
+    """
+    stack = ExitStack()
+    for connection in connections.all():
+        stack.enter_context(connection.execute_wrapper(wrapper))
+    return stack
+
+
+class HybridMiddleware:
+    """
+    Основа middleware для WSGI и ASGI. В асинхронном стеке Django не
+    гоняет такой middleware через поток: __call__ возвращает корутину
+    __acall__. SQL асинхронных view выполняется в потоке запроса
+    (sync_to_async), поэтому обёртки соединений ставятся там же.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        return self.handle(request)
+
+
+class RequestMetricsMiddleware(HybridMiddleware):
+    """
+    Замеряет фазы запроса (api.utils.metrics): отдаёт их в заголовке
+    Server-Timing и, при METRICS_ENABLED, копит агрегаты для /api/_metrics.
+    Должен стоять первым в MIDDLEWARE, чтобы total включал остальные.
+    """
+
+    def _enabled(self):
+        return (
+            getattr(settings, 'SERVER_TIMING', True),
+            getattr(settings, 'METRICS_ENABLED', False),
+        )
+
+    def handle(self, request):
+        server_timing, collect = self._enabled()
+        if not server_timing and not collect:
+            return self.get_response(request)
+
+        timer = metrics.RequestTimer()
+        with metrics.track(timer), _wrap_connections(timer):
+            response = self.get_response(request)
+        return self._report(request, response, timer, server_timing, collect)
+
+    async def __acall__(self, request):
+        server_timing, collect = self._enabled()
+        if not server_timing and not collect:
+            return await self.get_response(request)
+
+        timer = metrics.RequestTimer()
+        with metrics.track(timer):
+            stack = await sync_to_async(_wrap_connections)(timer)
+            try:
+                response = await self.get_response(request)
+            finally:
+                await sync_to_async(stack.close)()
+        if collect:
+            # observe() раз в интервал пишет файл — не в цикле событий
+            return await sync_to_async(self._report)(
+                request, response, timer, server_timing, collect
+            )
+        return self._report(request, response, timer, server_timing, collect)
+
+    def _report(self, request, response, timer, server_timing, collect):
+        timer.finish()
+        if server_timing:
+            response['Server-Timing'] = timer.server_timing()
+        if collect:
+            match = request.resolver_match
+            route = match.view_name if match else 'unmatched'
+            try:
+                metrics.REGISTRY.observe(
+                    route, request.method, response.status_code, timer
+                )
+            except Exception:
+                # Метрики не должны ронять запрос (нет места на диске, прав на
+                # METRICS_DIR и т. п.)
+                logger.exception('Не удалось записать метрики')
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        timer = metrics.current()
+        if timer is not None:
+            timer.start('view')
+
+    def process_template_response(self, request, response):
+        # Вызывается после view, прямо перед рендером (middleware первый — его
+        # хук последний)
+        timer = metrics.current()
+        if timer is not None:
+            timer.stop('view')
+            timer.start('render')
+            response.add_post_render_callback(
+                lambda rendered: timer.stop('render')
+            )
+        return response
+
+
+class ReplicaRoutingMiddleware(HybridMiddleware):
+    """
+    Чтение с реплик (api.utils.replicas): безопасные запросы читают с
+    реплики, запрос с записью закрепляет клиента за основной базой.
+    Без READ_REPLICAS ничего не делает.
+    """
+
+    def handle(self, request):
+        state = replicas.begin(request)
+        if state is None:
+            return self.get_response(request)
+        with replicas.routing(state):
+            response = self.get_response(request)
+        replicas.finish(request, state)
+        return response
+
+    async def __acall__(self, request):
+        if not settings.READ_REPLICAS:
+            return await self.get_response(request)
+        # Проверка закрепления — обращение к кэшу, в потоке запроса
+        state = await sync_to_async(replicas.begin)(request)
+        with replicas.routing(state):
+            response = await self.get_response(request)
+        await sync_to_async(replicas.finish)(request, state)
+        return response
+
+    def process_exception(self, request, exception):
+        state = replicas.current()
+        if state is not None:
+            replicas.replica_failed(state, exception)
+
+
+class RequestProfilerMiddleware(HybridMiddleware):
+    """
+    Профилирует запрос (api.utils.profiling): cProfile — по флагу сотрудника,
+    семплирование — для автоматического захвата запросов медленнее
+    PROFILE_SLOW_MS. Стоит после AuthenticationMiddleware, чтобы видеть
+    пользователя сессии.
+
+    Под ASGI профилируется поток запроса — ORM и синхронные view; код
+    корутин в цикле событий общий для всех запросов и в профиль не попадает.
+    """
+
+    def handle(self, request):
+        if profiling.is_requested(request) and profiling.is_staff(request):
+            mode = 'cprofile'
+        elif profiling.should_sample():
+            mode = 'sampling'
+        else:
+            return self.get_response(request)
+
+        profile = profiling.RequestProfile(request, mode)
+        with _wrap_connections(profile), profile:
+            response = self.get_response(request)
+        return self._save(profile, response)
+
+    async def __acall__(self, request):
+        if (
+            profiling.is_requested(request)
+            and await sync_to_async(profiling.is_staff)(request)
+        ):
+            mode = 'cprofile'
+        elif profiling.should_sample():
+            mode = 'sampling'
+        else:
+            return await self.get_response(request)
+
+        profile = profiling.RequestProfile(request, mode)
+        stack = await sync_to_async(_wrap_connections)(profile)
+        await sync_to_async(profile.__enter__)()
+        try:
+            response = await self.get_response(request)
+        finally:
+            await sync_to_async(profile.__exit__)(None, None, None)
+            await sync_to_async(stack.close)()
+        return await sync_to_async(self._save)(profile, response)
+
+    def _save(self, profile, response):
+        if profile.mode == 'cprofile':
+            profile.save(response)
+            response['X-Profile-Id'] = profile.id
+        elif profile.duration * 1000 >= settings.PROFILE_SLOW_MS:
+            profile.save(response)
+        return response
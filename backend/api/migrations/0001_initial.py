@@ -0,0 +1,31 @@
+# Generated by Django 4.2.21 on 2026-10-18 01:36
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MediaBlob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=255, unique=True, verbose_name='Путь в хранилище')),
+                ('sha256', models.CharField(db_index=True, max_length=64, verbose_name='SHA-256')),
+                ('size', models.PositiveBigIntegerField(verbose_name='Размер, байт')),
+                ('refcount', models.IntegerField(default=0, verbose_name='Ссылок')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Создан')),
+                ('touched_at', models.DateTimeField(auto_now=True, verbose_name='Последняя загрузка')),
+            ],
+            options={
+                'verbose_name': 'Файл медиа',
+                'verbose_name_plural': 'Файлы медиа',
+                'indexes': [models.Index(fields=['refcount', 'touched_at'], name='mediablob_gc_idx')],
+            },
+        ),
+    ]
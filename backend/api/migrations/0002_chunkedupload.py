@@ -0,0 +1,32 @@
+# Generated by Django 4.2.21 on 2026-10-18 01:39
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+import uuid
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('api', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ChunkedUpload',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('filename', models.CharField(max_length=255, verbose_name='Имя файла')),
+                ('size', models.PositiveBigIntegerField(verbose_name='Размер, байт')),
+                ('offset', models.PositiveBigIntegerField(default=0, verbose_name='Получено, байт')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Начата')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='chunked_uploads', to=settings.AUTH_USER_MODEL, verbose_name='Пользователь')),
+            ],
+            options={
+                'verbose_name': 'Загрузка по частям',
+                'verbose_name_plural': 'Загрузки по частям',
+            },
+        ),
+    ]
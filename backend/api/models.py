@@ -1,3 +1,64 @@
+import uuid
+
+from django.conf import settings
 from django.db import models
 
-# Create your models here.
+
+class MediaBlob(models.Model):
+    """
+    Файл в хранилище с адресацией по содержимому (api.utils.storage).
+
+    Одинаковые загрузки делят один файл; refcount — число ссылок на него
+    из полей моделей (изображение и его варианты). Файлы без ссылок
+    удаляет команда gc_media.
+    """
+    name = models.CharField('Путь в хранилище', max_length=255, unique=True)
+    sha256 = models.CharField('SHA-256', max_length=64, db_index=True)
+    size = models.PositiveBigIntegerField('Размер, байт')
+    refcount = models.IntegerField('Ссылок', default=0)
+    created_at = models.DateTimeField('Создан', auto_now_add=True)
+    # Последняя загрузка с таким содержимым: свежий файл ещё может
+    # ждать коммита ссылающейся строки, сборщик мусора его не трогает
+    touched_at = models.DateTimeField('Последняя загрузка', auto_now=True)
+
+    class Meta:
+        verbose_name = 'Файл медиа'
+        verbose_name_plural = 'Файлы медиа'
+        indexes = [
+            models.Index(
+                fields=['refcount', 'touched_at'], name='mediablob_gc_idx'
+            ),
+        ]
+
+    def __str__(self):
+        return f'{self.name} ({self.refcount})'
+
+
+class ChunkedUpload(models.Model):
+    """
+    Загрузка файла по частям (см. ChunkedUploadViewSet). Части дописываются
+    во временный файл вне MEDIA_ROOT; готовую загрузку рецепт или аватар
+    получают строкой "upload:<id>" вместо base64.
+    """
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name='chunked_uploads',
+        verbose_name='Пользователь'
+    )
+    filename = models.CharField('Имя файла', max_length=255)
+    size = models.PositiveBigIntegerField('Размер, байт')
+    offset = models.PositiveBigIntegerField('Получено, байт', default=0)
+    created_at = models.DateTimeField('Начата', auto_now_add=True)
+
+    class Meta:
+        verbose_name = 'Загрузка по частям'
+        verbose_name_plural = 'Загрузки по частям'
+
+    def __str__(self):
+        return f'{self.filename} ({self.offset}/{self.size})'
+
+    @property
+    def complete(self):
+        return self.offset == self.size
@@ -0,0 +1,37 @@
+from rest_framework import serializers
+
+from api.models import ChunkedUpload
+from api.utils import uploads
+from users.serializers.base import Base64ImageField
+
+
+class ChunkedUploadSerializer(serializers.ModelSerializer):
+    complete = serializers.BooleanField(read_only=True)
+    reference = serializers.SerializerMethodField()
+
+    class Meta:
+        model = ChunkedUpload
+        fields = ('id', 'filename', 'size', 'offset', 'complete', 'reference')
+        read_only_fields = ('id', 'offset')
+
+    def get_reference(self, obj):
+        """Значение для поля image/avatar, когда загрузка завершена."""
+        if not obj.complete:
+            return None
+        return f'{uploads.UPLOAD_REFERENCE_PREFIX}{obj.pk}'
+
+    def validate_filename(self, value):
+        extension = value.rsplit('.', 1)[-1].lower() if '.' in value else ''
+        if extension not in Base64ImageField.ALLOWED_EXTENSIONS:
+            raise serializers.ValidationError(
+                f"Недопустимый формат '{extension}'. "
+                f"Разрешено: {', '.join(Base64ImageField.ALLOWED_EXTENSIONS)}"
+            )
+        return value
+
+    def validate_size(self, value):
+        if not 0 < value <= uploads.max_size():
+            raise serializers.ValidationError(
+                f'Размер должен быть от 1 до {uploads.max_size()} байт.'
+            )
+        return value
@@ -0,0 +1,95 @@
+from collections import Counter
+
+from django.db import transaction
+from django.db.models.signals import (
+    post_delete, post_save, pre_delete, pre_save,
+)
+from django.dispatch import receiver
+
+from api.models import ChunkedUpload
+from api.utils import images, response_cache, storage, uploads
+from recipes.models import Ingredient, Recipe, RecipeIngredient
+from users.models import CustomUser
+
+
+def _invalidate(*tags):
+    # Только после коммита: до него параллельная сборка видит старые данные
+    # и сохранила бы их под уже новой версией тега
+    transaction.on_commit(lambda: response_cache.invalidate('recipes', *tags))
+
+
+@receiver([post_save, post_delete], sender=Recipe)
+def invalidate_recipe(sender, instance, **kwargs):
+    _invalidate(f'recipe:{instance.pk}')
+
+
+@receiver([post_save, post_delete], sender=RecipeIngredient)
+def invalidate_recipe_ingredients(sender, instance, **kwargs):
+    _invalidate(f'recipe:{instance.recipe_id}')
+
+
+@receiver(post_save, sender=Ingredient)
+@receiver(pre_delete, sender=Ingredient)
+def invalidate_ingredient_recipes(sender, instance, **kwargs):
+    if RecipeIngredient.objects.filter(ingredient=instance).exists():
+        _invalidate(f'ingredient:{instance.pk}')
+
+
+@receiver(post_save, sender=CustomUser)
+def invalidate_author_recipes(sender, instance, update_fields=None, **kwargs):
+    # Вход обновляет только last_login — в ответы рецептов он не попадает
+    if update_fields and set(update_fields) <= {'last_login'}:
+        return
+    if Recipe.objects.filter(author=instance).exists():
+        _invalidate(f'author:{instance.pk}')
+
+
+@receiver(post_save, sender=Recipe)
+@receiver(post_save, sender=CustomUser)
+def schedule_image_variants(sender, instance, update_fields=None, **kwargs):
+    image_field, variants_field = images.IMAGE_FIELDS[sender._meta.label]
+    if update_fields and image_field not in update_fields:
+        return
+    if images.needs_processing(instance, image_field, variants_field):
+        images.schedule(instance)
+
+
+@receiver(pre_save, sender=Recipe)
+@receiver(pre_save, sender=CustomUser)
+def remember_media_references(sender, instance, update_fields=None, **kwargs):
+    fields = images.IMAGE_FIELDS[sender._meta.label]
+    if update_fields and not set(fields) & set(update_fields):
+        return
+    row = None
+    if instance.pk is not None:
+        row = (
+            sender.objects.filter(pk=instance.pk)
+            .values_list(*fields).first()
+        )
+    instance._media_references = images.references(*row) if row else Counter()
+
+
+@receiver(post_save, sender=Recipe)
+@receiver(post_save, sender=CustomUser)
+def count_media_references(sender, instance, **kwargs):
+    old = instance.__dict__.pop('_media_references', None)
+    if old is None:
+        return
+    fields = images.IMAGE_FIELDS[sender._meta.label]
+    new = images.references(*(getattr(instance, field) for field in fields))
+    storage.change_refcounts({
+        name: new[name] - old[name] for name in new.keys() | old.keys()
+    })
+
+
+@receiver(post_delete, sender=Recipe)
+@receiver(post_delete, sender=CustomUser)
+def release_media_references(sender, instance, **kwargs):
+    fields = images.IMAGE_FIELDS[sender._meta.label]
+    old = images.references(*(getattr(instance, field) for field in fields))
+    storage.change_refcounts({name: -count for name, count in old.items()})
+
+
+@receiver(post_delete, sender=ChunkedUpload)
+def remove_upload_part(sender, instance, **kwargs):
+    uploads.remove_part(instance)
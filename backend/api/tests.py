@@ -1,3 +1,1525 @@
-from django.test import TestCase
+import base64
+import io
+import json
+import os
+import shutil
+import tempfile
+import threading
+from datetime import timedelta
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import async_to_sync
+from django.core.cache import cache
+from django.core.cache.backends.filebased import FileBasedCache
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.files.base import ContentFile
+from django.core.management import CommandError, call_command
+from django.db import OperationalError, connection, connections
+from django.db.models import QuerySet
+from django.test import RequestFactory, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import include, path
+from django.utils import timezone
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.authtoken.models import Token
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework.test import APITestCase, APITransactionTestCase
+
+from PIL import Image
+
+from api.management.commands.profiles import sql_groups
+from api.models import ChunkedUpload, MediaBlob
+from api.urlss import urls as api_urls
+from api.urlss.urls_async import urlpatterns as async_urls
+from api.utils import (
+    background, images, metrics, profiling, replicas, response_cache,
+)
+from recipes.models import (
+    Favorite, Ingredient, Recipe, RecipeIngredient, ShoppingCart,
+)
+from users.models import CustomUser, Follow
+
+
+def make_user(username):
+    return CustomUser.objects.create_user(
+        email=f'{username}@example.com',
+        username=username,
+        first_name=username,
+        last_name=username,
+        password='StrongPass123!',
+    )
+
+
+def make_recipe(author, ingredients, name='Рецепт'):
+    recipe = Recipe.objects.create(
+        author=author,
+        name=name,
+        image='recipes/images/test.jpg',
+        description='Описание',
+        cooking_time=10,
+    )
+    RecipeIngredient.objects.bulk_create([
+        RecipeIngredient(
+            recipe=recipe, ingredient=ingredient, amount=index + 1
+        )
+        for index, ingredient in enumerate(ingredients)
+    ])
+    return recipe
+
+
+class RecipeListQueriesTest(APITestCase):
+    """Число SQL-запросов списка рецептов не зависит от размера страницы."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.reader = make_user('reader')
+        cls.token = Token.objects.create(user=cls.reader)
+        cls.ingredients = [
+            Ingredient.objects.create(
+                name=f'ингредиент {i}', measurement_unit='г'
+            )
+            for i in range(3)
+        ]
+        cls.authors = [make_user(f'author{i}') for i in range(4)]
+        for i in range(12):
+            recipe = make_recipe(
+                cls.authors[i % 4], cls.ingredients, name=f'Рецепт {i}'
+            )
+            if i % 2:
+                Favorite.objects.create(user=cls.reader, recipe=recipe)
+            if i % 3:
+                ShoppingCart.objects.create(user=cls.reader, recipe=recipe)
+        Follow.objects.create(subscriber=cls.reader, author=cls.authors[0])
+
+    def count_queries(self, url):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(context.captured_queries), response.json()
+
+    def assert_constant(self, authenticated):
+        if authenticated:
+            self.authenticate()
+        small, data = self.count_queries('/api/recipes/?limit=1')
+        self.assertEqual(len(data['results']), 1)
+        large, data = self.count_queries('/api/recipes/?limit=12')
+        self.assertEqual(len(data['results']), 12)
+        self.assertEqual(small, large)
+
+    def test_anonymous_queries_constant(self):
+        self.assert_constant(authenticated=False)
+
+    def test_authenticated_queries_constant(self):
+        self.assert_constant(authenticated=True)
+
+    def authenticate(self):
+        self.client.credentials(
+            HTTP_AUTHORIZATION=f'Token {self.token.key}'
+        )
+
+    def test_flags_match_relations(self):
+        self.authenticate()
+        _, data = self.count_queries('/api/recipes/?limit=12')
+        for item in data['results']:
+            recipe_id = item['id']
+            self.assertEqual(
+                item['is_favorited'],
+                Favorite.objects.filter(
+                    user=self.reader, recipe_id=recipe_id
+                ).exists()
+            )
+            self.assertEqual(
+                item['is_in_shopping_cart'],
+                ShoppingCart.objects.filter(
+                    user=self.reader, recipe_id=recipe_id
+                ).exists()
+            )
+            self.assertEqual(
+                item['author']['is_subscribed'],
+                item['author']['id'] == self.authors[0].id
+            )
+            self.assertEqual(len(item['ingredients']), 3)
+
+    def test_detail_uses_annotations(self):
+        self.authenticate()
+        recipe = Favorite.objects.filter(user=self.reader).first().recipe
+        response = self.client.get(f'/api/recipes/{recipe.id}/')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.json()['is_favorited'])
+
+
+class SubscriptionsQueriesTest(APITestCase):
+    """
+    Подписки: лимит рецептов в SQL, число запросов не зависит от страницы.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.reader = make_user('reader')
+        cls.token = Token.objects.create(user=cls.reader)
+        ingredient = Ingredient.objects.create(
+            name='соль', measurement_unit='г'
+        )
+        cls.authors = [make_user(f'author{i}') for i in range(5)]
+        for index, author in enumerate(cls.authors):
+            Follow.objects.create(subscriber=cls.reader, author=author)
+            for i in range(index + 2):
+                make_recipe(
+                    author, [ingredient], name=f'{author.username} {i}'
+                )
+
+    def setUp(self):
+        self.client.credentials(
+            HTTP_AUTHORIZATION=f'Token {self.token.key}'
+        )
+
+    def get(self, url):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(context.captured_queries), response.json()
+
+    def test_queries_constant(self):
+        url = '/api/users/subscriptions/?limit={}&recipes_limit=2'
+        small, data = self.get(url.format(1))
+        self.assertEqual(len(data['results']), 1)
+        large, data = self.get(url.format(5))
+        self.assertEqual(len(data['results']), 5)
+        self.assertEqual(small, large)
+
+    def test_recipes_limit_and_count(self):
+        _, data = self.get('/api/users/subscriptions/?limit=5&recipes_limit=2')
+        for item in data['results']:
+            author = CustomUser.objects.get(pk=item['id'])
+            self.assertTrue(item['is_subscribed'])
+            self.assertEqual(item['recipes_count'], author.recipes.count())
+            self.assertEqual(len(item['recipes']), 2)
+            expected = list(author.recipes.values_list('id', flat=True)[:2])
+            self.assertEqual([r['id'] for r in item['recipes']], expected)
+
+    def test_without_limit_returns_all(self):
+        _, data = self.get('/api/users/subscriptions/?limit=5')
+        for item in data['results']:
+            self.assertEqual(len(item['recipes']), item['recipes_count'])
+
+
+class DownloadShoppingCartTest(APITestCase):
+    """
+    Выгрузка списка покупок: форматы, суммирование и ETag по версии корзины.
+    """
+
+    url = '/api/recipes/download_shopping_cart/'
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = make_user('buyer')
+        cls.token = Token.objects.create(user=cls.user)
+        cls.salt = Ingredient.objects.create(name='соль', measurement_unit='г')
+        cls.milk = Ingredient.objects.create(
+            name='молоко', measurement_unit='мл'
+        )
+        author = make_user('cook')
+        cls.first = make_recipe(author, [cls.salt, cls.milk], name='Первый')
+        cls.second = make_recipe(author, [cls.salt], name='Второй')
+        ShoppingCart.objects.create(user=cls.user, recipe=cls.first)
+        ShoppingCart.objects.create(user=cls.user, recipe=cls.second)
+
+    def setUp(self):
+        self.client.credentials(
+            HTTP_AUTHORIZATION=f'Token {self.token.key}'
+        )
+
+    def download(self, **params):
+        response = self.client.get(self.url, params)
+        self.assertEqual(response.status_code, 200)
+        return response, b''.join(response.streaming_content).decode()
+
+    def test_txt_default(self):
+        response, body = self.download()
+        self.assertTrue(response['Content-Type'].startswith('text/plain'))
+        self.assertEqual(
+            body, 'Список покупок:\n\nмолоко (мл) - 2\nсоль (г) - 2'
+        )
+
+    def test_csv(self):
+        response, body = self.download(format='csv')
+        self.assertTrue(response['Content-Type'].startswith('text/csv'))
+        self.assertEqual(body.splitlines()[1:], ['молоко,мл,2', 'соль,г,2'])
+
+    def test_json(self):
+        _, body = self.download(format='json')
+        self.assertEqual(json.loads(body), [
+            {'name': 'молоко', 'measurement_unit': 'мл', 'amount': 2},
+            {'name': 'соль', 'measurement_unit': 'г', 'amount': 2},
+        ])
+
+    def test_pdf(self):
+        response = self.client.get(self.url, {'format': 'pdf'})
+        self.assertEqual(response['Content-Type'], 'application/pdf')
+        content = b''.join(response.streaming_content)
+        self.assertTrue(content.startswith(b'%PDF'))
+
+    def test_not_modified_skips_aggregation(self):
+        response, _ = self.download()
+        etag = response['ETag']
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertFalse(any(
+            'SUM' in q['sql'].upper() for q in context.captured_queries
+        ))
+
+    def test_etag_changes_with_cart(self):
+        etag = self.download()[0]['ETag']
+        ShoppingCart.objects.filter(
+            user=self.user, recipe=self.second
+        ).delete()
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_etag_changes_with_recipe_ingredients(self):
+        etag = self.download()[0]['ETag']
+        author_token = Token.objects.create(user=self.first.author)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {author_token.key}')
+        response = self.client.patch(
+            f'/api/recipes/{self.first.id}/',
+            {'ingredients': [{'id': self.salt.id, 'amount': 5}],
+             'text': 'Описание', 'cooking_time': 10},
+            format='json'
+        )
+        self.assertEqual(response.status_code, 200)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {self.token.key}')
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+
+
+class RecipeKeysetPaginationTest(APITestCase):
+    """Курсорная пагинация обходит ленту без пропусков и повторов."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.authors = [make_user('first'), make_user('second')]
+        for i in range(11):
+            make_recipe(cls.authors[i % 2], [], name=f'Рецепт {i}')
+        # Одинаковые pub_date проверяют разрешение ничьих по id
+        Recipe.objects.filter(
+            name__in=['Рецепт 3', 'Рецепт 4', 'Рецепт 5']
+        ).update(pub_date=Recipe.objects.get(name='Рецепт 3').pub_date)
+
+    def walk(self, url, key='next'):
+        ids = []
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            data = response.json()
+            self.assertNotIn('count', data)
+            ids.extend(item['id'] for item in data['results'])
+            url = data[key]
+        return ids, data
+
+    def test_forward_matches_ordering(self):
+        ids, _ = self.walk('/api/recipes/?pagination=cursor&limit=4')
+        expected = list(
+            Recipe.objects.order_by('-pub_date', '-id')
+            .values_list('id', flat=True)
+        )
+        self.assertEqual(ids, expected)
+
+    def test_backward_from_last_page(self):
+        url = '/api/recipes/?pagination=cursor&limit=4'
+        pages = []
+        while url:
+            data = self.client.get(url).json()
+            pages.append([item['id'] for item in data['results']])
+            previous, url = data['previous'], data['next']
+        back = []
+        while previous:
+            data = self.client.get(previous).json()
+            back.append([item['id'] for item in data['results']])
+            previous = data['previous']
+        self.assertEqual(back, pages[-2::-1])
+
+    def test_with_author_filter(self):
+        author = self.authors[0]
+        ids, _ = self.walk(
+            f'/api/recipes/?pagination=cursor&limit=2&author={author.id}'
+        )
+        expected = list(
+            Recipe.objects.filter(author=author)
+            .order_by('-pub_date', '-id').values_list('id', flat=True)
+        )
+        self.assertEqual(ids, expected)
+
+    def test_invalid_cursor(self):
+        response = self.client.get('/api/recipes/?cursor=garbage')
+        self.assertEqual(response.status_code, 404)
+
+    def test_page_number_is_default(self):
+        data = self.client.get('/api/recipes/?limit=4').json()
+        self.assertEqual(data['count'], 11)
+
+
+class ConditionalGetTest(APITestCase):
+    """
+    ETag/Last-Modified для рецептов и пользователей, 304 без сериализации.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = make_user('cook')
+        cls.reader = make_user('reader')
+        cls.recipe = make_recipe(cls.author, [], name='Рецепт')
+
+    def revalidate(self, url, **headers):
+        first = self.client.get(url)
+        self.assertEqual(first.status_code, 200)
+        # У списков только ETag (см. test_recipe_list_after_delete)
+        self.assertEqual('Last-Modified' in first, '?' not in url)
+        return first['ETag']
+
+    def assert_not_modified(self, url, etag):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        return context
+
+    def assert_modified(self, url, etag):
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+
+    def setUp(self):
+        cache.clear()
+
+    def test_recipe_detail(self):
+        # Анонимные ответы обслуживает кэш ответов — проверяем путь с
+        # пользователем
+        self.client.force_authenticate(self.reader)
+        url = f'/api/recipes/{self.recipe.id}/'
+        etag = self.revalidate(url)
+        context = self.assert_not_modified(url, etag)
+        # Ни ингредиенты, ни флаги зрителя не запрашивались
+        self.assertEqual(len(context.captured_queries), 1)
+        self.recipe.name = 'Новое название'
+        self.recipe.save()
+        self.assert_modified(url, etag)
+
+    def test_recipe_list_changes_on_new_recipe_and_author(self):
+        url = '/api/recipes/?limit=3'
+        etag = self.revalidate(url)
+        self.assert_not_modified(url, etag)
+        # Анонимный список — из кэша ответов, его сбрасывает коммит записи
+        with self.captureOnCommitCallbacks(execute=True):
+            make_recipe(self.author, [], name='Ещё один')
+        etag = self.revalidate(url)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.author.first_name = 'Иван'
+            self.author.save()
+        self.assert_modified(url, etag)
+
+    def test_recipe_list_after_delete(self):
+        self.client.force_authenticate(self.reader)
+        url = '/api/recipes/?limit=3'
+        old = make_recipe(self.author, [], name='Старый')
+        etag = self.revalidate(url)
+        old.delete()
+        # If-Modified-Since без ETag: ответ не устаревает до 304
+        response = self.client.get(
+            url, HTTP_IF_MODIFIED_SINCE='Fri, 01 Jan 2100 00:00:00 GMT'
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assert_modified(url, etag)
+
+    def test_recipe_ingredients_change_validators(self):
+        self.client.force_authenticate(self.reader)
+        url = f'/api/recipes/{self.recipe.id}/'
+        etag = self.revalidate(url)
+        salt = Ingredient.objects.create(name='соль', measurement_unit='г')
+        row = RecipeIngredient.objects.create(
+            recipe=self.recipe, ingredient=salt, amount=1
+        )
+        etag_after_add = self.revalidate(url)
+        self.assertNotEqual(etag_after_add, etag)
+        row.delete()
+        self.assert_modified(url, etag_after_add)
+
+    def test_list_etag_depends_on_query(self):
+        etag = self.revalidate('/api/recipes/?limit=3')
+        self.assert_modified('/api/recipes/?limit=2', etag)
+
+    def test_viewer_relations_change_etag(self):
+        self.client.force_authenticate(self.reader)
+        url = f'/api/recipes/{self.recipe.id}/'
+        etag = self.revalidate(url)
+        self.client.post(f'/api/recipes/{self.recipe.id}/favorite/')
+        self.reader.refresh_from_db()
+        self.client.force_authenticate(self.reader)
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.json()['is_favorited'])
+
+    def test_user_detail(self):
+        url = f'/api/users/{self.author.id}/'
+        etag = self.revalidate(url)
+        self.assert_not_modified(url, etag)
+        last_modified = self.client.get(url)['Last-Modified']
+        response = self.client.get(url, HTTP_IF_MODIFIED_SINCE=last_modified)
+        self.assertEqual(response.status_code, 304)
+        self.author.last_name = 'Петров'
+        self.author.save()
+        self.assert_modified(url, etag)
+
+    def test_missing_recipe_is_404(self):
+        for url in ('/api/recipes/999999/', '/api/recipes/abc/'):
+            self.assertEqual(self.client.get(url).status_code, 404)
+
+
+class ResponseCacheTest(APITestCase):
+    """
+    Кэш анонимных ответов: попадания без SQL, инвалидация по тегам,
+    single-flight.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = make_user('cook')
+        cls.other = make_user('other')
+        cls.ingredient = Ingredient.objects.create(
+            name='соль', measurement_unit='г'
+        )
+        cls.recipe = make_recipe(cls.author, [cls.ingredient], name='Суп')
+        cls.other_recipe = make_recipe(cls.other, [], name='Каша')
+
+    def setUp(self):
+        cache.clear()
+
+    def fetch(self, url, **headers):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(url, **headers)
+        return response, len(context.captured_queries)
+
+    def assert_hit(self, url):
+        response, queries = self.fetch(url)
+        self.assertEqual(response['X-Cache'], 'HIT')
+        self.assertEqual(queries, 0)
+        return response
+
+    def assert_miss(self, url):
+        response, _ = self.fetch(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['X-Cache'], 'MISS')
+        return response
+
+    def test_hit_serves_same_body(self):
+        url = f'/api/recipes/{self.recipe.id}/'
+        first = self.assert_miss(url)
+        second = self.assert_hit(url)
+        self.assertEqual(first.content, second.content)
+        self.assertEqual(second['ETag'], first['ETag'])
+        self.assertEqual(response_cache.stats()['hits'], 1)
+
+    def test_query_string_normalized(self):
+        self.assert_miss('/api/recipes/?limit=1&page=1')
+        self.assert_hit('/api/recipes/?page=1&limit=1')
+        self.assert_miss('/api/recipes/?page=2&limit=1')
+
+    def test_revalidation_on_hit(self):
+        url = f'/api/recipes/{self.recipe.id}/'
+        etag = self.assert_miss(url)['ETag']
+        response, queries = self.fetch(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(queries, 0)
+
+    def test_authenticated_bypasses_cache(self):
+        self.client.force_authenticate(self.other)
+        response, _ = self.fetch('/api/recipes/')
+        self.assertNotIn('X-Cache', response)
+
+    def test_recipe_write_invalidates_only_its_detail(self):
+        url = f'/api/recipes/{self.recipe.id}/'
+        other_url = f'/api/recipes/{self.other_recipe.id}/'
+        for item in (url, other_url, '/api/recipes/'):
+            self.assert_miss(item)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.recipe.name = 'Борщ'
+            self.recipe.save()
+            # До коммита сборка видит старые данные — версии не меняются
+            self.assert_hit(url)
+        self.assertEqual(self.assert_miss(url).json()['name'], 'Борщ')
+        self.assert_miss('/api/recipes/')
+        self.assert_hit(other_url)
+
+    def test_author_write_invalidates_only_its_recipes(self):
+        url = f'/api/recipes/{self.recipe.id}/'
+        other_url = f'/api/recipes/{self.other_recipe.id}/'
+        for item in (url, other_url):
+            self.assert_miss(item)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.author.first_name = 'Повар'
+            self.author.save()
+        data = self.assert_miss(url).json()
+        self.assertEqual(data['author']['first_name'], 'Повар')
+        self.assert_hit(other_url)
+
+    def test_login_does_not_invalidate(self):
+        url = f'/api/recipes/{self.recipe.id}/'
+        self.assert_miss(url)
+        self.author.save(update_fields=['last_login'])
+        self.assert_hit(url)
+
+    def test_ingredient_write_invalidates_only_its_recipes(self):
+        url = f'/api/recipes/{self.recipe.id}/'
+        other_url = f'/api/recipes/{self.other_recipe.id}/'
+        for item in (url, other_url):
+            self.assert_miss(item)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.ingredient.name = 'морская соль'
+            self.ingredient.save()
+        data = self.assert_miss(url).json()
+        self.assertEqual(data['ingredients'][0]['name'], 'морская соль')
+        self.assert_hit(other_url)
+
+    @override_settings(RESPONSE_CACHE_WAIT=0.2)
+    def test_waits_for_concurrent_build(self):
+        url = f'/api/recipes/{self.recipe.id}/'
+        self.assert_miss(url)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.recipe.save()
+        # Другой обработчик уже собирает этот ответ и держит блокировку...
+        request = mock.Mock(path=url, accepted_media_type='application/json')
+        request.query_params.lists.return_value = []
+        cache.add(response_cache.make_key(request) + ':lock', 1)
+        # ...так что мы ждём его, а не дождавшись — собираем сами
+        self.assert_miss(url)
+        self.assertEqual(response_cache.stats()['waits'], 1)
+
+    def test_file_backend(self):
+        with tempfile.TemporaryDirectory() as location:
+            backend = 'django.core.cache.backends.filebased.FileBasedCache'
+            caches_setting = {'default': {
+                'BACKEND': backend,
+                'LOCATION': location,
+            }}
+            with override_settings(CACHES=caches_setting):
+                url = f'/api/recipes/{self.recipe.id}/'
+                self.assert_miss(url)
+                self.assert_hit(url)
+                with self.captureOnCommitCallbacks(execute=True):
+                    self.recipe.save()
+                self.assert_miss(url)
+
+
+def make_image(size=(800, 600), image_format='JPEG', exif=None):
+    buffer = io.BytesIO()
+    options = {'exif': exif} if exif is not None else {}
+    image = Image.new('RGB', size, (200, 120, 40))
+    image.save(buffer, image_format, **options)
+    return buffer.getvalue()
+
+
+def as_data_uri(data, mime='image/jpeg'):
+    return f'data:{mime};base64,{base64.b64encode(data).decode()}'
+
+
+@override_settings(
+    FEED_ASYNC=False, IMAGE_VARIANTS_ASYNC=False, SIMILAR_RECIPES_ASYNC=False
+)
+class TemporaryMediaTestCase(APITestCase):
+    """MEDIA_ROOT и каталог загрузок по частям — во временном каталоге."""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.media_root = tempfile.mkdtemp()
+        cls.media_override = override_settings(
+            MEDIA_ROOT=cls.media_root,
+            CHUNKED_UPLOAD_DIR=f'{cls.media_root}/uploads',
+        )
+        cls.media_override.enable()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.media_override.disable()
+        shutil.rmtree(cls.media_root, ignore_errors=True)
+        super().tearDownClass()
+
+
+@override_settings(
+    FEED_ASYNC=False, IMAGE_VARIANTS_ASYNC=False,
+    IMAGE_VARIANT_WIDTHS=(160, 320),
+)
+class ImageVariantsTest(TemporaryMediaTestCase):
+    """Загрузка картинок: проверка, очистка метаданных, варианты и srcset."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = make_user('painter')
+        cls.ingredient = Ingredient.objects.create(
+            name='мука', measurement_unit='г'
+        )
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_authenticate(self.user)
+
+    def upload_avatar(self, data):
+        with self.captureOnCommitCallbacks(execute=True):
+            return self.client.put(
+                '/api/users/me/avatar/', {'avatar': as_data_uri(data)},
+                format='json',
+            )
+
+    def test_avatar_metadata_stripped_and_variants_built(self):
+        exif = Image.Exif()
+        exif[0x010e] = 'секретное описание'
+        response = self.upload_avatar(make_image(exif=exif.tobytes()))
+        self.assertEqual(response.status_code, 200)
+
+        self.user.refresh_from_db()
+        avatar = self.user.avatar
+        with avatar.open('rb') as stored, Image.open(stored) as image:
+            self.assertFalse(image.getexif())
+        variants = images.current_variants(
+            self.user.avatar_variants, avatar
+        )
+        self.assertEqual(
+            sorted((width, mime) for _, width, mime in variants),
+            [(160, 'image/jpeg'), (160, 'image/webp'), (320, 'image/jpeg'),
+             (320, 'image/webp'), (800, 'image/jpeg'), (800, 'image/webp')],
+        )
+        srcset = self.client.get('/api/users/me/').json()['avatar_srcset']
+        self.assertEqual(set(srcset), {'image/jpeg', 'image/webp'})
+        self.assertIn('.webp 160w', srcset['image/webp'])
+
+    def test_broken_image_rejected(self):
+        response = self.upload_avatar(b'not an image at all')
+        self.assertEqual(response.status_code, 400)
+
+    def test_replacing_image_releases_old_variants(self):
+        self.upload_avatar(make_image())
+        self.user.refresh_from_db()
+        old = [name for name, *_ in self.user.avatar_variants['variants']]
+        self.upload_avatar(make_image(size=(400, 400)))
+        self.user.refresh_from_db()
+        self.assertEqual(
+            self.user.avatar_variants['source'], self.user.avatar.name
+        )
+        # Старые файлы остаются до сборки мусора, но ссылок на них больше нет
+        refcounts = MediaBlob.objects.filter(name__in=old).values_list(
+            'refcount', flat=True
+        )
+        self.assertEqual(set(refcounts), {0})
+        call_command('gc_media', '--grace-minutes', '0', stdout=io.StringIO())
+        storage = self.user.avatar.storage
+        self.assertFalse(any(storage.exists(name) for name in old))
+        self.assertTrue(storage.exists(self.user.avatar.name))
+
+    def test_identical_uploads_share_one_file(self):
+        other = make_user('copycat')
+        data = make_image()
+        self.upload_avatar(data)
+        self.client.force_authenticate(other)
+        self.upload_avatar(data)
+        self.user.refresh_from_db()
+        other.refresh_from_db()
+        self.assertEqual(self.user.avatar.name, other.avatar.name)
+        self.assertEqual(self.user.avatar_variants, other.avatar_variants)
+        blob = MediaBlob.objects.get(name=self.user.avatar.name)
+        self.assertEqual(blob.refcount, 2)
+
+        other.delete()
+        blob.refresh_from_db()
+        self.assertEqual(blob.refcount, 1)
+        call_command('gc_media', '--grace-minutes', '0', stdout=io.StringIO())
+        self.assertTrue(self.user.avatar.storage.exists(self.user.avatar.name))
+
+    def test_gc_recount_fixes_drift(self):
+        self.upload_avatar(make_image())
+        self.user.refresh_from_db()
+        MediaBlob.objects.filter(name=self.user.avatar.name).update(refcount=0)
+        out = io.StringIO()
+        call_command(
+            'gc_media', '--recount', '--grace-minutes', '0', stdout=out
+        )
+        self.assertIn('счётчиков исправлено: 1', out.getvalue())
+        self.assertTrue(self.user.avatar.storage.exists(self.user.avatar.name))
+        blob = MediaBlob.objects.get(name=self.user.avatar.name)
+        self.assertEqual(blob.refcount, 1)
+
+    def test_gc_keeps_file_uploaded_again_during_scan(self):
+        self.upload_avatar(make_image())
+        self.user.refresh_from_db()
+        name = self.user.avatar.name
+        storage = self.user.avatar.storage
+        with storage.open(name, 'rb') as stored:
+            data = stored.read()
+        self.user.avatar = None
+        self.user.save()
+        MediaBlob.objects.filter(name=name).update(
+            touched_at=timezone.now() - timedelta(days=1)
+        )
+        iterator = QuerySet.iterator
+
+        def upload_after_scan(queryset, *args, **kwargs):
+            for blob in iterator(queryset, *args, **kwargs):
+                # Та же картинка загружена заново, пока сборщик шёл по выборке
+                saved = storage.save('again.jpg', ContentFile(data))
+                self.assertEqual(saved, blob.name)
+                yield blob
+
+        with mock.patch.object(QuerySet, 'iterator', upload_after_scan):
+            call_command(
+                'gc_media', '--grace-minutes', '60', stdout=io.StringIO()
+            )
+        self.assertTrue(storage.exists(name))
+        self.assertTrue(MediaBlob.objects.filter(name=name).exists())
+
+    def test_stale_run_does_not_overwrite_newer_variants(self):
+        self.upload_avatar(make_image())
+        build = images.build_variants
+        replaced = []
+
+        def replace_meanwhile(fieldfile):
+            value = build(fieldfile)
+            if not replaced:
+                replaced.append(fieldfile.name)
+                # Пока шла обработка, загрузили и обработали новый аватар
+                self.upload_avatar(make_image(size=(400, 400)))
+            return value
+
+        with mock.patch.object(images, 'build_variants', replace_meanwhile):
+            self.assertFalse(
+                images.process('users.CustomUser', self.user.pk, force=True)
+            )
+        self.user.refresh_from_db()
+        variants = self.user.avatar_variants
+        self.assertEqual(variants['source'], self.user.avatar.name)
+        self.assertEqual(
+            {width for _, width, _ in variants['variants']}, {160, 320, 400}
+        )
+
+    def test_recipe_srcset_and_cache_invalidation(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post('/api/recipes/', {
+                'name': 'Блины',
+                'text': 'Жарить',
+                'cooking_time': 15,
+                'image': as_data_uri(make_image(size=(300, 200))),
+                'ingredients': [{'id': self.ingredient.id, 'amount': 200}],
+            }, format='json')
+        self.assertEqual(response.status_code, 201, response.content)
+        self.client.force_authenticate(None)
+        detail = self.client.get(f"/api/recipes/{response.json()['id']}/")
+        srcset = detail.json()['image_srcset']
+        # Оригинал уже 300px: из копий остаётся только 160w
+        self.assertIn('160w', srcset['image/jpeg'])
+        self.assertNotIn('320w', srcset['image/jpeg'])
+        self.assertIn('300w', srcset['image/webp'])
+
+    def test_backfill_command(self):
+        recipe = make_recipe(self.user, [], name='Старый рецепт')
+        recipe.image.save('old.jpg', ContentFile(make_image()), save=False)
+        Recipe.objects.filter(pk=recipe.pk).update(image=recipe.image.name)
+        self.assertIn('обработано 1', self.backfill())
+        recipe.refresh_from_db()
+        self.assertEqual(recipe.image_variants['source'], recipe.image.name)
+        self.assertIn('обработано 0', self.backfill())
+
+    def backfill(self):
+        out = io.StringIO()
+        call_command(
+            'backfill_image_variants', '--model', 'recipes.Recipe', stdout=out
+        )
+        return out.getvalue()
+
+
+class BackgroundTaskTest(APITestCase):
+
+    def test_task_runs_in_named_pool_after_commit(self):
+        done = threading.Event()
+        calls = []
+
+        def task(value):
+            calls.append((threading.current_thread().name, value))
+            done.set()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            background.run_after_commit('test-pool', task, 1)
+            self.assertEqual(calls, [])
+        self.assertTrue(done.wait(5))
+        self.assertTrue(calls[0][0].startswith('test-pool'))
+        self.assertEqual(calls[0][1], 1)
+
+    @override_settings(TEST_POOL_ASYNC=False)
+    def test_setting_runs_task_inline(self):
+        calls = []
+        with self.captureOnCommitCallbacks(execute=True):
+            background.run_after_commit(
+                'test-pool', calls.append, 1, setting='TEST_POOL_ASYNC'
+            )
+        self.assertEqual(calls, [1])
+
+    def test_concurrent_first_tasks_share_one_pool(self):
+        barrier = threading.Barrier(8)
+        pools = []
+
+        def get_pool():
+            barrier.wait()
+            pools.append(background._executor('test-race', 1))
+
+        threads = [threading.Thread(target=get_pool) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len(set(map(id, pools))), 1)
+
+
+class ImageUploadTest(TemporaryMediaTestCase):
+    """
+    Загрузка без base64: multipart во временный файл и загрузка по частям.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = make_user('uploader')
+        cls.stranger = make_user('stranger')
+        cls.ingredient = Ingredient.objects.create(
+            name='яйцо', measurement_unit='шт'
+        )
+
+    def setUp(self):
+        self.client.force_authenticate(self.user)
+
+    def recipe_payload(self, image):
+        return {
+            'name': 'Омлет',
+            'text': 'Взбить',
+            'cooking_time': 5,
+            'image': image,
+        }
+
+    def test_multipart_avatar_streams_to_disk(self):
+        upload = io.BytesIO(make_image())
+        upload.name = 'photo.jpg'
+        with mock.patch.object(
+            images, 'sanitize', wraps=images.sanitize
+        ) as sanitize:
+            response = self.client.put(
+                '/api/users/me/avatar/', {'avatar': upload},
+                format='multipart',
+            )
+        self.assertEqual(response.status_code, 200, response.content)
+        # Pillow получил временный файл на диске, а не байты из памяти
+        self.assertTrue(
+            hasattr(sanitize.call_args.args[0], 'temporary_file_path')
+        )
+        self.user.refresh_from_db()
+        self.assertTrue(self.user.avatar.name.startswith('blobs/'))
+
+    def test_multipart_recipe_with_json_ingredients(self):
+        upload = io.BytesIO(make_image())
+        upload.name = 'dish.jpg'
+        payload = self.recipe_payload(upload)
+        payload['ingredients'] = json.dumps(
+            [{'id': self.ingredient.id, 'amount': 2}]
+        )
+        response = self.client.post(
+            '/api/recipes/', payload, format='multipart'
+        )
+        self.assertEqual(response.status_code, 201, response.content)
+        self.assertEqual(response.json()['ingredients'][0]['amount'], 2)
+
+    def test_base64_still_accepted(self):
+        payload = self.recipe_payload(as_data_uri(make_image()))
+        payload['ingredients'] = [{'id': self.ingredient.id, 'amount': 2}]
+        response = self.client.post('/api/recipes/', payload, format='json')
+        self.assertEqual(response.status_code, 201, response.content)
+
+    def start_upload(self, data, filename='big.jpg'):
+        response = self.client.post(
+            '/api/uploads/', {'filename': filename, 'size': len(data)},
+            format='json',
+        )
+        self.assertEqual(response.status_code, 201, response.content)
+        return response.json()
+
+    def send(self, upload_id, chunk, offset):
+        return self.client.patch(
+            f'/api/uploads/{upload_id}/', chunk,
+            content_type='application/offset+octet-stream',
+            HTTP_UPLOAD_OFFSET=str(offset),
+        )
+
+    def test_chunked_upload_referenced_by_recipe(self):
+        data = make_image()
+        upload = self.start_upload(data)
+        middle = len(data) // 2
+        first = self.send(upload['id'], data[:middle], 0)
+        self.assertEqual(first.json()['offset'], middle)
+        conflict = self.send(upload['id'], data[middle:], 0)
+        self.assertEqual(conflict.status_code, 409)
+        self.assertEqual(conflict['Upload-Offset'], str(middle))
+        status = self.client.get(f"/api/uploads/{upload['id']}/").json()
+        self.assertIsNone(status['reference'])
+
+        done = self.send(upload['id'], data[middle:], middle).json()
+        self.assertTrue(done['complete'])
+        payload = self.recipe_payload(done['reference'])
+        payload['ingredients'] = [{'id': self.ingredient.id, 'amount': 1}]
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(
+                '/api/recipes/', payload, format='json'
+            )
+        self.assertEqual(response.status_code, 201, response.content)
+        self.assertFalse(
+            ChunkedUpload.objects.filter(pk=upload['id']).exists()
+        )
+        self.assertFalse(os.path.exists(
+            f"{self.media_root}/uploads/{upload['id']}.part"
+        ))
+
+    def test_chunk_larger_than_declared_size(self):
+        upload = self.start_upload(b'x' * 10)
+        response = self.send(upload['id'], b'x' * 11, 0)
+        self.assertEqual(response.status_code, 400)
+        status = self.client.get(f"/api/uploads/{upload['id']}/").json()
+        self.assertEqual(status['offset'], 0)
+
+    def test_lost_part_restarts_upload(self):
+        data = make_image()
+        upload = self.start_upload(data)
+        middle = len(data) // 2
+        self.send(upload['id'], data[:middle], 0)
+        os.remove(f"{self.media_root}/uploads/{upload['id']}.part")
+        response = self.send(upload['id'], data[middle:], middle)
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response['Upload-Offset'], '0')
+        self.assertTrue(self.send(upload['id'], data, 0).json()['complete'])
+
+    def test_unusable_references_rejected(self):
+        data = make_image()
+        unfinished = self.start_upload(data)
+        self.send(unfinished['id'], data[:10], 0)
+        finished = self.start_upload(data)
+        self.send(finished['id'], data, 0)
+        self.client.force_authenticate(self.stranger)
+        for reference in (f"upload:{finished['id']}", 'upload:not-a-uuid'):
+            response = self.client.put(
+                '/api/users/me/avatar/', {'avatar': reference}, format='json'
+            )
+            self.assertEqual(response.status_code, 400, reference)
+        self.client.force_authenticate(self.user)
+        response = self.client.put(
+            '/api/users/me/avatar/',
+            {'avatar': f"upload:{unfinished['id']}"}, format='json'
+        )
+        self.assertEqual(response.status_code, 400)
+
+    def test_upload_rejects_bad_extension_and_size(self):
+        for filename, size in (('x.gif', 10), ('x.jpg', 10 ** 12)):
+            response = self.client.post(
+                '/api/uploads/', {'filename': filename, 'size': size},
+                format='json',
+            )
+            self.assertEqual(response.status_code, 400)
+
+
+class BenchEndpointsTest(APITestCase):
+    """bench_endpoints: база сохраняется, рост числа запросов — ошибка."""
+
+    def setUp(self):
+        Ingredient.objects.bulk_create(
+            Ingredient(name=f'ингредиент {i}', measurement_unit='г')
+            for i in range(20)
+        )
+        handle, self.baseline = tempfile.mkstemp(suffix='.json')
+        os.close(handle)
+        os.remove(self.baseline)
+        self.addCleanup(
+            lambda: os.path.exists(self.baseline) and os.remove(self.baseline)
+        )
+
+    def bench(self, *args):
+        out = io.StringIO()
+        call_command(
+            'bench_endpoints', '--recipes', '40', '--repeat', '1',
+            '--warmup', '1', '--baseline', self.baseline, *args,
+            stdout=out, stderr=io.StringIO(),
+        )
+        return out.getvalue()
+
+    def test_baseline_and_regression(self):
+        self.bench('--save')
+        with open(self.baseline) as file:
+            saved = json.load(file)
+        self.assertIn('download_shopping_cart', saved['results'])
+        self.assertGreater(saved['results']['recipes_list_auth']['queries'], 0)
+        # Сгенерированные данные откатываются
+        self.assertFalse(Recipe.objects.exists())
+
+        self.assertIn('Регрессий', self.bench('--queries-only'))
+        saved['results']['recipes_list_auth']['queries'] -= 1
+        with open(self.baseline, 'w') as file:
+            json.dump(saved, file)
+        with self.assertRaisesMessage(CommandError, 'recipes_list_auth'):
+            self.bench('--queries-only')
+
+
+class RequestMetricsTest(APITestCase):
+    """
+    Server-Timing с фазами запроса и агрегаты всех процессов на /api/_metrics.
+    """
+
+    def setUp(self):
+        self.metrics_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.metrics_dir, ignore_errors=True)
+        overrides = override_settings(
+            METRICS_DIR=self.metrics_dir, METRICS_ENABLED=True,
+            METRICS_TOKEN='',
+        )
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+        metrics.REGISTRY.reset()
+        self.addCleanup(metrics.REGISTRY.reset)
+        self.user = make_user('viewer')
+        salt = Ingredient.objects.create(name='соль', measurement_unit='г')
+        make_recipe(self.user, [salt])
+        token = Token.objects.create(user=self.user)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {token.key}')
+
+    def timing(self, response):
+        return {
+            part.split(';')[0]: part
+            for part in response['Server-Timing'].split(', ')
+        }
+
+    def test_server_timing_phases(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/api/recipes/')
+        phases = self.timing(response)
+        self.assertEqual(
+            set(phases), {'auth', 'db', 'serialize', 'render', 'total'}
+        )
+        self.assertIn(f'desc="{len(queries)} queries"', phases['db'])
+
+    @override_settings(SERVER_TIMING=False, METRICS_ENABLED=False)
+    def test_disabled(self):
+        response = self.client.get('/api/recipes/')
+        self.assertNotIn('Server-Timing', response)
+        self.assertEqual(self.client.get('/api/_metrics').status_code, 404)
+
+    def test_metrics_merge_processes(self):
+        self.client.get('/api/recipes/')
+        self.client.get('/api/recipes/')
+        # Файл воркера, который уже завершился
+        other = metrics.Registry()
+        timer = metrics.RequestTimer()
+        timer.finish()
+        other.observe('api:recipes-list', 'GET', 200, timer)
+        other.flush(force=True)
+        dead = os.path.join(self.metrics_dir, other.filename)
+        with open(dead) as file:
+            data = json.load(file)
+        data['pid'] = 2 ** 22 + 1
+        with open(dead, 'w') as file:
+            json.dump(data, file)
+
+        labels = 'route="api:recipes-list",method="GET"'
+        count = f'foodgram_request_duration_seconds_count{{{labels}}} 3'
+        body = self.client.get('/api/_metrics').content.decode()
+        self.assertIn(count, body)
+        self.assertIn(
+            f'foodgram_request_phase_seconds_total{{{labels},phase="db"}}',
+            body,
+        )
+        self.assertIn(
+            f'foodgram_requests_total{{{labels},status="2xx"}} 3', body
+        )
+        # Файл завершившегося процесса слит в архив, счётчики не пропали
+        self.assertFalse(os.path.exists(dead))
+        body = self.client.get('/api/_metrics').content.decode()
+        self.assertIn(count, body)
+
+    def test_flush_failure_does_not_fail_request(self):
+        blocker = os.path.join(self.metrics_dir, 'file')
+        open(blocker, 'w').close()
+        with override_settings(
+            METRICS_DIR=os.path.join(blocker, 'metrics'),
+            METRICS_FLUSH_INTERVAL=0,
+        ):
+            with self.assertLogs('api.middleware', 'ERROR'):
+                response = self.client.get('/api/recipes/')
+        self.assertEqual(response.status_code, 200)
+
+    @override_settings(METRICS_TOKEN='secret')
+    def test_metrics_token(self):
+        self.client.credentials()
+        self.assertEqual(self.client.get('/api/_metrics').status_code, 403)
+        response = self.client.get(
+            '/api/_metrics', HTTP_AUTHORIZATION='Bearer secret'
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(
+            response['Content-Type'].startswith('text/plain; version=0.0.4')
+        )
+
+
+class RequestProfilerTest(APITestCase):
+    """
+    Профиль по флагу сотрудника, автоматический захват медленных и команда
+    profiles.
+    """
+
+    def setUp(self):
+        self.profile_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.profile_dir, ignore_errors=True)
+        overrides = override_settings(
+            PROFILE_DIR=self.profile_dir, PROFILE_SLOW_MS=0
+        )
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+        self.staff = make_user('staff')
+        self.staff.is_staff = True
+        self.staff.save()
+        salt = Ingredient.objects.create(name='соль', measurement_unit='г')
+        make_recipe(self.staff, [salt])
+        self.token = Token.objects.create(user=self.staff)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {self.token.key}')
+
+    def command(self, *args):
+        out = io.StringIO()
+        call_command('profiles', *args, stdout=out)
+        return out.getvalue()
+
+    def test_staff_profile(self):
+        response = self.client.get('/api/recipes/', HTTP_X_PROFILE='1')
+        profile = profiling.load(response['X-Profile-Id'])
+        self.assertEqual(profile['mode'], 'cprofile')
+        self.assertEqual(profile['route'], 'api:recipes-list')
+        self.assertEqual(profile['user'], self.staff.pk)
+        self.assertTrue(profile['functions'])
+        stem = profiling.stored()[0].stem
+        self.assertTrue(os.path.exists(
+            os.path.join(self.profile_dir, f'{stem}.prof')
+        ))
+        # Место вызова — код проекта, без обвязки запроса
+        stacks = [
+            frame for query in profile['queries'] for frame in query['stack']
+        ]
+        self.assertTrue(
+            any(frame.startswith('api/views.py') for frame in stacks)
+        )
+        self.assertFalse(
+            any(frame.startswith('api/middleware.py') for frame in stacks)
+        )
+
+        second = self.client.get('/api/recipes/?_profile=1')['X-Profile-Id']
+        self.assertIn(second, self.command('list'))
+        self.assertIn('Самые медленные запросы', self.command('show', second))
+        self.assertIn(
+            'Запросов',
+            self.command('diff', response['X-Profile-Id'], second),
+        )
+
+    def test_only_staff(self):
+        self.staff.is_staff = False
+        self.staff.save()
+        response = self.client.get('/api/recipes/', HTTP_X_PROFILE='1')
+        self.assertNotIn('X-Profile-Id', response)
+        self.assertEqual(profiling.stored(), [])
+
+    def test_slow_requests_sampled_and_rotated(self):
+        with override_settings(PROFILE_SLOW_MS=0.001, PROFILE_KEEP=2):
+            for _ in range(3):
+                self.client.get('/api/recipes/')
+        with override_settings(PROFILE_SLOW_MS=60_000):
+            self.client.get('/api/recipes/')
+        stored = profiling.stored()
+        self.assertEqual(len(stored), 2)
+        profile = json.loads(stored[-1].read_text())
+        self.assertEqual(profile['mode'], 'sampling')
+        self.assertIn('samples', profile)
+
+    def test_sql_groups_collapse_in_lists(self):
+        profile = {'queries': [
+            {'sql': 'SELECT 1 WHERE id IN (%s, %s)', 'ms': 1, 'stack': []},
+            {'sql': 'SELECT 1 WHERE id IN (%s)', 'ms': 2, 'stack': []},
+        ]}
+        self.assertEqual(
+            dict(sql_groups(profile)),
+            {'SELECT 1 WHERE id IN (...)': [2, 3.0, []]},
+        )
+
+
+class AsyncReadURLConf:
+    """
+    Маршруты api/ с асинхронным путём чтения, как под ASGI (ASYNC_READ_PATH).
+    """
+    urlpatterns = [
+        path('api/', include((async_urls + api_urls.urlpatterns, 'api'))),
+    ]
+
+
+class AsyncReadPathTest(APITestCase):
+    """
+    Асинхронный путь чтения отдаёт те же байты и заголовки, что синхронный.
+    """
+
+    HEADERS = ('Content-Type', 'ETag', 'Last-Modified', 'Vary', 'Allow')
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.reader = make_user('reader')
+        cls.token = Token.objects.create(user=cls.reader)
+        cls.authors = [make_user(f'author{i}') for i in range(3)]
+        salt = Ingredient.objects.create(name='соль', measurement_unit='г')
+        sugar = Ingredient.objects.create(name='сахар', measurement_unit='г')
+        cls.recipes = [
+            make_recipe(
+                cls.authors[i % 3], [salt, sugar][:i % 2 + 1],
+                name=f'Рецепт {i}',
+            )
+            for i in range(8)
+        ]
+        Favorite.objects.create(user=cls.reader, recipe=cls.recipes[1])
+        ShoppingCart.objects.create(user=cls.reader, recipe=cls.recipes[2])
+        Follow.objects.create(subscriber=cls.reader, author=cls.authors[0])
+
+    def setUp(self):
+        cache.clear()
+
+    def async_request(self, method, url, **headers):
+        async def send():
+            send_method = getattr(self.async_client, method)
+            return await send_method(url, headers=headers)
+
+        with override_settings(ROOT_URLCONF=AsyncReadURLConf):
+            return async_to_sync(send)()
+
+    def async_get(self, url, **headers):
+        return self.async_request('get', url, **headers)
+
+    def sync_get(self, url, **headers):
+        return self.client.get(url, headers=headers)
+
+    def assert_same(self, url, **headers):
+        cache.clear()
+        expected = self.sync_get(url, **headers)
+        cache.clear()
+        actual = self.async_get(url, **headers)
+        self.assertEqual(actual.status_code, expected.status_code, url)
+        self.assertEqual(actual.content, expected.content, url)
+        for name in self.HEADERS:
+            self.assertEqual(
+                actual.get(name), expected.get(name), f'{url}: {name}'
+            )
+        return actual
+
+    def test_same_json_and_headers(self):
+        auth = {'Authorization': f'Token {self.token.key}'}
+        first = self.recipes[0].pk
+        for url in (
+            '/api/recipes/', '/api/recipes/?limit=3&page=2',
+            f'/api/recipes/?author={self.authors[1].pk}',
+            f'/api/recipes/{first}/', '/api/ingredients/?name=с',
+            '/api/ingredients/?search=сах',
+            f'/api/users/{self.authors[0].pk}/',
+        ):
+            self.assert_same(url)
+            self.assert_same(url, **auth)
+        for url in (
+            '/api/recipes/?is_favorited=1',
+            '/api/recipes/?is_in_shopping_cart=1&limit=1',
+        ):
+            self.assertEqual(self.assert_same(url, **auth).json()['count'], 1)
+
+    def test_served_without_viewset(self):
+        # Горячие GET не доходят до синхронных APIView
+        auth = {'Authorization': f'Token {self.token.key}'}
+        with mock.patch(
+            'rest_framework.views.APIView.initial', side_effect=AssertionError
+        ):
+            for url in (
+                '/api/recipes/', '/api/ingredients/?name=с',
+                f'/api/users/{self.authors[0].pk}/',
+            ):
+                response = self.async_get(url, **auth)
+                self.assertEqual(response.status_code, 200, url)
+            url = f'/api/recipes/{self.recipes[0].pk}/'
+            self.assertEqual(self.async_get(url)['X-Cache'], 'MISS')
+            self.assertEqual(self.async_get(url)['X-Cache'], 'HIT')
+            etag = self.async_get('/api/recipes/?limit=2', **auth)['ETag']
+            response = self.async_get(
+                '/api/recipes/?limit=2', If_None_Match=etag, **auth
+            )
+            self.assertEqual(response.status_code, 304)
+
+    def test_detail_entry_tagged_with_author(self):
+        url = f'/api/recipes/{self.recipes[0].pk}/'
+        self.assertEqual(self.async_get(url)['X-Cache'], 'MISS')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.authors[0].first_name = 'Повар'
+            self.authors[0].save()
+        response = self.async_get(url)
+        self.assertEqual(response['X-Cache'], 'MISS')
+        self.assertEqual(response.json()['author']['first_name'], 'Повар')
+
+    def test_falls_back_to_viewset(self):
+        for url, headers in (
+            ('/api/recipes/', {'Authorization': 'Token invalid'}),
+            ('/api/recipes/?page=100', {}),
+            ('/api/recipes/?pagination=cursor&limit=2', {}),
+            ('/api/recipes/?author=abc', {}),
+            ('/api/recipes/999999/', {}),
+            (
+                f'/api/recipes/{self.recipes[0].pk}/'
+                f'?author={self.authors[2].pk}',
+                {},
+            ),
+            ('/api/users/999999/', {}),
+            ('/api/users/me/', {'Authorization': f'Token {self.token.key}'}),
+        ):
+            response = self.assert_same(url, **headers)
+            self.assertNotEqual(response.status_code, 500, url)
+
+    def test_writes_and_middleware_under_asgi(self):
+        response = self.async_request(
+            'delete', f'/api/recipes/{self.recipes[0].pk}/',
+            Authorization=f'Token {self.token.key}',
+        )
+        self.assertEqual(response.status_code, 403)
+        response = self.async_get('/api/recipes/')
+        self.assertIn('db;dur=', response['Server-Timing'])
+        self.assertNotIn('0 queries', response['Server-Timing'])
+
+
+@override_settings(READ_REPLICAS=['replica1'], REPLICA_PIN_SECONDS=60)
+class ReplicaRoutingTest(APITransactionTestCase):
+    """
+    Чтения безопасных запросов — с реплики, после записи клиент читает с
+    основной базы.
+    """
+
+    # replica1 — зеркало default со своим соединением: данные должны быть
+    # закоммичены, иначе реплика их не увидит (как и настоящая)
+    databases = {'default', 'replica1'}
+
+    def setUp(self):
+        self.author = make_user('cook')
+        self.reader = make_user('reader')
+        self.token = Token.objects.create(user=self.reader)
+        self.recipe = make_recipe(self.author, [], name='Суп')
+        cache.clear()
+        replicas.HEALTH.reset()
+        self.addCleanup(replicas.HEALTH.reset)
+
+    def queries_by_alias(self, method, url, **headers):
+        with CaptureQueriesContext(connections['default']) as primary, \
+                CaptureQueriesContext(connections['replica1']) as replica:
+            response = getattr(self.client, method)(url, headers=headers)
+        self.assertLess(response.status_code, 500)
+        return len(primary.captured_queries), len(replica.captured_queries)
+
+    def test_safe_requests_read_replica(self):
+        primary, replica = self.queries_by_alias(
+            'get', f'/api/users/{self.author.pk}/'
+        )
+        self.assertEqual(primary, 0)
+        self.assertGreater(replica, 0)
+        # Вне запросов реплики не используются
+        with CaptureQueriesContext(connections['replica1']) as context:
+            Recipe.objects.count()
+        self.assertEqual(context.captured_queries, [])
+
+    def test_read_your_writes(self):
+        auth = {'Authorization': f'Token {self.token.key}'}
+        url = f'/api/recipes/{self.recipe.pk}/'
+        primary, replica = self.queries_by_alias(
+            'post', f'{url}favorite/', **auth
+        )
+        self.assertEqual(replica, 0)
+        # Автор записи закреплён за основной базой, остальные читают с реплики
+        primary, replica = self.queries_by_alias('get', url, **auth)
+        self.assertEqual(replica, 0)
+        primary, replica = self.queries_by_alias(
+            'get', f'/api/users/{self.author.pk}/'
+        )
+        self.assertEqual(primary, 0)
+        cache.clear()
+        primary, replica = self.queries_by_alias('get', url, **auth)
+        self.assertEqual(primary, 0)
+
+    def test_pin_needs_cache_shared_by_workers(self):
+        auth = {'HTTP_AUTHORIZATION': f'Token {self.token.key}'}
+        location = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, location, ignore_errors=True)
+        wrote = replicas.RoutingState(use_replica=False)
+        wrote.wrote = True
+        # У каждого воркера свой объект кэша: файловые видят общий каталог,
+        # в памяти — только свой процесс
+        factory = RequestFactory()
+        for writer, reader, pinned in (
+            (FileBasedCache(location, {}), FileBasedCache(location, {}), True),
+            (LocMemCache('worker-1', {}), LocMemCache('worker-2', {}), False),
+        ):
+            with mock.patch.object(replicas, 'cache', writer):
+                replicas.finish(factory.post('/api/recipes/', **auth), wrote)
+            with mock.patch.object(replicas, 'cache', reader):
+                state = replicas.begin(factory.get('/api/recipes/', **auth))
+            self.assertEqual(state.use_replica, not pinned)
+
+        self.assertEqual(
+            [error.id for error in replicas.check_pin_cache()], ['api.E001']
+        )
+        shared = {'default': {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+            'LOCATION': location,
+        }}
+        with override_settings(CACHES=shared):
+            self.assertEqual(replicas.check_pin_cache(), [])
+        with override_settings(READ_REPLICAS=[]):
+            self.assertEqual(replicas.check_pin_cache(), [])
+
+    def test_unhealthy_replica_falls_back_to_primary(self):
+        url = f'/api/users/{self.author.pk}/'
+        lag = 'api.utils.replicas.replication_lag'
+        with override_settings(REPLICA_MAX_LAG=1), \
+                self.assertLogs('api.utils.replicas', 'WARNING'), \
+                mock.patch(lag, return_value=30):
+            self.assertEqual(self.queries_by_alias('get', url)[1], 0)
+        replicas.HEALTH.reset()
+        with self.assertLogs('api.utils.replicas', 'WARNING'), \
+                mock.patch(lag, side_effect=OperationalError('down')):
+            self.assertEqual(self.queries_by_alias('get', url)[1], 0)
+        replicas.HEALTH.reset()
+        self.assertEqual(self.queries_by_alias('get', url)[0], 0)
+        self.assertEqual(replicas.HEALTH.lags, {'replica1': 0.0})
+
+    def test_connection_error_on_replica_marks_it_down(self):
+        state = replicas.RoutingState(use_replica=True)
+        state.alias = 'replica1'
+        replicas.HEALTH.healthy = ['replica1']
+        with self.assertLogs('api.utils.replicas', 'WARNING'):
+            replicas.replica_failed(state, OperationalError('connection lost'))
+        self.assertEqual(replicas.HEALTH.healthy, [])
+
+    def test_new_token_is_looked_up_on_primary(self):
+        seen = []
+        original = TokenAuthentication.authenticate_credentials
+
+        def lagging_replica(auth, key):
+            seen.append(replicas.reading_replica())
+            if replicas.reading_replica():
+                raise AuthenticationFailed('Недопустимый токен.')
+            return original(auth, key)
+
+        with mock.patch.object(
+            TokenAuthentication, 'authenticate_credentials', lagging_replica
+        ):
+            response = self.client.get(
+                '/api/users/me/',
+                headers={'Authorization': f'Token {self.token.key}'},
+            )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(seen, [True, False])
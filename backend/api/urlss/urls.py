@@ -1,4 +1,7 @@
+from django.conf import settings
 from django.urls import path, include
+from api.views import metrics_view
+from .urls_async import urlpatterns as async_urls
 from .urls_users import urlpatterns as user_urls, router_users
 from .urls_recipes import router_recipes
 from .urls_auth import urlpatterns as auth_urls
@@ -6,6 +9,9 @@ from .urls_auth import urlpatterns as auth_urls
 app_name = "api"
 
 urlpatterns = [
+    # Асинхронный путь чтения под ASGI (api.async_views) — раньше роутеров
+    *(async_urls if settings.ASYNC_READ_PATH else []),
+
     # Роутеры
     path('', include(router_users.urls)),
     path('', include(router_recipes.urls)),
@@ -15,4 +21,7 @@ urlpatterns = [
 
     # Подключение авторизации
     *auth_urls,
+
+    # Метрики для Prometheus (включаются METRICS_ENABLED)
+    path('_metrics', metrics_view, name='metrics'),
 ]
@@ -0,0 +1,50 @@
+from django.urls import re_path
+
+from api.async_views import (
+    async_read, ingredient_list, recipe_detail, recipe_list, user_detail,
+)
+from api.views import CustomUserViewSet, IngredientViewSet, RecipeViewSet
+
+# Те же действия, что DefaultRouter вешает на маршруты списка и объекта
+LIST_ACTIONS = {'get': 'list', 'post': 'create'}
+DETAIL_ACTIONS = {
+    'get': 'retrieve', 'put': 'update', 'patch': 'partial_update',
+    'delete': 'destroy',
+}
+
+# Подключаются перед роутерами при ASYNC_READ_PATH. Только числовые id:
+# иначе маршруты перехватили бы users/me/ и recipes/download_shopping_cart/
+urlpatterns = [
+    re_path(
+        r'^recipes/$',
+        async_read(
+            recipe_list, RecipeViewSet, LIST_ACTIONS,
+            basename='recipes', detail=False,
+        ),
+        name='recipes-list',
+    ),
+    re_path(
+        r'^recipes/(?P<pk>\d+)/$',
+        async_read(
+            recipe_detail, RecipeViewSet, DETAIL_ACTIONS,
+            basename='recipes', detail=True,
+        ),
+        name='recipes-detail',
+    ),
+    re_path(
+        r'^ingredients/$',
+        async_read(
+            ingredient_list, IngredientViewSet, {'get': 'list'},
+            basename='ingredients', detail=False,
+        ),
+        name='ingredients-list',
+    ),
+    re_path(
+        r'^users/(?P<id>\d+)/$',
+        async_read(
+            user_detail, CustomUserViewSet, DETAIL_ACTIONS,
+            basename='users', detail=True,
+        ),
+        name='users-detail',
+    ),
+]
@@ -1,9 +1,10 @@
 from rest_framework.routers import DefaultRouter
-from api.views import IngredientViewSet, RecipeViewSet
+from api.views import ChunkedUploadViewSet, IngredientViewSet, RecipeViewSet
 
 router_recipes = DefaultRouter()
 router_recipes.register(r"ingredients", IngredientViewSet, basename="ingredients")
 router_recipes.register(r"recipes", RecipeViewSet, basename="recipes")
+router_recipes.register(r"uploads", ChunkedUploadViewSet, basename="uploads")
 
 # Просто отдаём список маршрутов
 recipe_router_urls = router_recipes.urls
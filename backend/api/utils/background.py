@@ -0,0 +1,55 @@
+"""
+Фоновые задачи после коммита транзакции в именованных пулах потоков.
+
+Пул создаётся при первой задаче под блокировкой: иначе два одновременных
+коммита создали бы по пулу, и задачи пула из одного потока перестали бы
+выполняться по очереди. Очередь живёт в памяти процесса: при штатной
+остановке пулы её дорабатывают, задачи убитого процесса теряются.
+"""
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import connections, transaction
+
+logger = logging.getLogger(__name__)
+
+_lock = threading.Lock()
+# имя пула -> ThreadPoolExecutor
+_executors = {}
+
+
+def _executor(name, workers):
+    with _lock:
+        if name not in _executors:
+            _executors[name] = ThreadPoolExecutor(
+                max_workers=workers, thread_name_prefix=name
+            )
+        return _executors[name]
+
+
+def _run(name, function, args):
+    try:
+        function(*args)
+    except Exception:
+        logger.exception(
+            'Ошибка фоновой задачи %s: %s%s', name, function.__name__, args
+        )
+    finally:
+        connections.close_all()
+
+
+def run_after_commit(name, function, *args, workers=1, setting=None):
+    """
+    После коммита текущей транзакции выполняет function(*args) в пуле name
+    из workers потоков. Если настройка setting выключена, задача выполняется
+    сразу в потоке коммита — так тесты видят её результат.
+    """
+    def run():
+        if setting and not getattr(settings, setting, True):
+            function(*args)
+            return
+        _executor(name, workers).submit(_run, name, function, args)
+
+    transaction.on_commit(run)
@@ -0,0 +1,133 @@
+"""Помощники массовой загрузки данных (load_test_data и бенчмарки)."""
+import json
+import time
+from contextlib import contextmanager
+from itertools import islice
+
+from django.core.management.color import no_style
+from django.db import connection, transaction
+
+JSON_WHITESPACE = ' \t\r\n,'
+
+
+def iter_json_array(path, chunk_size=1 << 20):
+    """
+    Потоково читает JSON-файл вида [{...}, {...}, ...] и отдаёт объекты
+    по одному: в памяти — только текущий кусок файла, а не весь список.
+    """
+    decoder = json.JSONDecoder()
+    with open(path, encoding='utf-8') as file:
+        buffer, position, eof, started = '', 0, False, False
+        while True:
+            while True:
+                while (
+                    position < len(buffer)
+                    and buffer[position] in JSON_WHITESPACE
+                ):
+                    position += 1
+                if position < len(buffer) or eof:
+                    break
+                buffer, position = file.read(chunk_size), 0
+                eof = not buffer
+            if position >= len(buffer):
+                raise ValueError(f'{path}: файл оборвался до конца массива')
+            if not started:
+                if buffer[position] != '[':
+                    raise ValueError(f'{path}: ожидается JSON-массив')
+                started = True
+                position += 1
+                continue
+            if buffer[position] == ']':
+                return
+            try:
+                item, end = decoder.raw_decode(buffer, position)
+            except json.JSONDecodeError:
+                # Объект не поместился в текущий кусок — дочитываем
+                more = '' if eof else file.read(chunk_size)
+                if not more:
+                    raise
+                buffer, position = buffer[position:] + more, 0
+                continue
+            yield item
+            position = end
+
+
+@contextmanager
+def explicit_timestamps(*fields):
+    """
+    Отключает auto_now/auto_now_add у полей (model, name): при bulk_create
+    они иначе перезаписали бы даты из данных текущим временем.
+    """
+    saved = []
+    for model, name in fields:
+        field = model._meta.get_field(name)
+        saved.append((field, field.auto_now, field.auto_now_add))
+        field.auto_now = field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field, auto_now, auto_now_add in saved:
+            field.auto_now, field.auto_now_add = auto_now, auto_now_add
+
+
+def flush_tables(models):
+    """
+    Очищает таблицы моделей и всех ссылающихся на них (TRUNCATE ... CASCADE
+    в PostgreSQL) одним набором SQL-команд, без загрузки строк и сигналов.
+    """
+    tables = [model._meta.db_table for model in models]
+    statements = connection.ops.sql_flush(
+        no_style(), tables, reset_sequences=True, allow_cascade=True
+    )
+    # Внешние ключи проверяются при коммите: порядок DELETE в SQLite не важен
+    with transaction.atomic(), connection.cursor() as cursor:
+        for sql in statements:
+            cursor.execute(sql)
+
+
+def insert_batches(model, rows, batch_size=5000):
+    """
+    bulk_create пачками по batch_size из итератора rows: в отличие от
+    bulk_create(rows, batch_size) не собирает все объекты в список. Возвращает
+    число строк.
+    """
+    rows = iter(rows)
+    total = 0
+    for batch in iter(lambda: list(islice(rows, batch_size)), []):
+        model.objects.bulk_create(batch)
+        total += len(batch)
+    return total
+
+
+def reset_sequences(models):
+    """
+    Сдвигает автоинкремент за максимальный id после вставки строк с явными pk.
+    """
+    statements = connection.ops.sequence_reset_sql(no_style(), models)
+    with connection.cursor() as cursor:
+        for sql in statements:
+            cursor.execute(sql)
+
+
+class Progress:
+    """Счётчик вставленных строк по моделям со скоростью вставки."""
+
+    def __init__(self, stdout):
+        self.stdout = stdout
+        self.started = time.perf_counter()
+        self.counts = {}
+
+    @property
+    def total(self):
+        return sum(self.counts.values())
+
+    def elapsed(self):
+        return time.perf_counter() - self.started
+
+    def add(self, label, rows):
+        self.counts[label] = self.counts.get(label, 0) + rows
+        elapsed = self.elapsed()
+        self.stdout.write(
+            f'   {label}: {self.counts[label]} строк, '
+            f'всего {self.total} ({self.total / elapsed:.0f} строк/с)'
+        )
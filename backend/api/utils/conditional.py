@@ -0,0 +1,61 @@
+import hashlib
+
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from django.utils.http import http_date
+
+
+def viewer_parts(user):
+    """
+    Часть валидатора, зависящая от зрителя: его избранное, подписки и корзина.
+    """
+    if not user.is_authenticated:
+        return ['anonymous'], None
+    updated_at = user.relations_updated_at
+    return [user.pk, user.cart_version, updated_at.isoformat()], updated_at
+
+
+def _validators(parts, last_modified):
+    etag = '"%s"' % hashlib.md5('|'.join(map(str, parts)).encode()).hexdigest()
+    return etag, int(last_modified.timestamp()) if last_modified else None
+
+
+def _finish(response, etag, timestamp):
+    if response.status_code in (200, 304):
+        response['ETag'] = etag
+        if timestamp is not None:
+            response['Last-Modified'] = http_date(timestamp)
+    # Ответ зависит от пользователя из токена
+    patch_vary_headers(response, ['Authorization'])
+    return response
+
+
+def conditional_response(request, parts, last_modified, build_response):
+    """
+    Отвечает 304, если ETag/Last-Modified клиента совпадают с посчитанными
+    из parts и last_modified, не вызывая build_response (сериализацию).
+    Иначе строит ответ и проставляет ему валидаторы.
+    """
+    etag, timestamp = _validators(parts, last_modified)
+    response = get_conditional_response(
+        request, etag=etag, last_modified=timestamp
+    )
+    if response is None:
+        response = build_response()
+    return _finish(response, etag, timestamp)
+
+
+async def aconditional_response(request, parts, last_modified,
+                                build_response):
+    """
+    conditional_response для асинхронных view: build_response — корутина, может
+    вернуть None.
+    """
+    etag, timestamp = _validators(parts, last_modified)
+    response = get_conditional_response(
+        request, etag=etag, last_modified=timestamp
+    )
+    if response is None:
+        response = await build_response()
+        if response is None:
+            return None
+    return _finish(response, etag, timestamp)
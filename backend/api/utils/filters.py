@@ -1,7 +1,21 @@
+from django import forms
 from django_filters import rest_framework as filters
+from recipes import ingredient_sets
 from recipes.models import Recipe
+from recipes.recipe_search import search_recipes
 from users.models import CustomUser
 
+INGREDIENT_FILTERS = {
+    'ingredients': 'with_all',
+    'ingredients_any': 'with_any',
+    'ingredients_exclude': 'without',
+}
+
+
+class IdListFilter(filters.BaseInFilter, filters.NumberFilter):
+    """Список id через запятую: ?ingredients=1,5,8."""
+    field_class = forms.IntegerField
+
 
 class RecipeFilter(filters.FilterSet):
     author = filters.ModelMultipleChoiceFilter(
@@ -21,9 +35,44 @@ class RecipeFilter(filters.FilterSet):
         label='Отфильтровать по корзине'
     )
 
+    search = filters.CharFilter(
+        method='filter_search',
+        label='Поиск по названию и описанию'
+    )
+
+    ingredients = IdListFilter(
+        method='filter_ingredients',
+        label='Есть все эти ингредиенты (id через запятую)'
+    )
+
+    ingredients_any = IdListFilter(
+        method='filter_ingredients',
+        label='Есть хотя бы один из ингредиентов (id через запятую)'
+    )
+
+    ingredients_exclude = IdListFilter(
+        method='filter_ingredients',
+        label='Нет ни одного из ингредиентов (id через запятую)'
+    )
+
+    pantry = IdListFilter(
+        method='filter_pantry',
+        label='Ингредиенты в наличии (id через запятую)'
+    )
+
+    max_missing = filters.NumberFilter(
+        method='filter_max_missing',
+        min_value=0,
+        label='Сколько ингредиентов может не хватать (с pantry)'
+    )
+
     class Meta:
         model = Recipe
-        fields = ['author', 'is_favorited', 'is_in_shopping_cart']
+        fields = [
+            'author', 'is_favorited', 'is_in_shopping_cart', 'search',
+            'ingredients', 'ingredients_any', 'ingredients_exclude',
+            'pantry', 'max_missing',
+        ]
 
     def filter_favorited(self, queryset, name, value):
         user = self.request.user
@@ -36,3 +85,27 @@ class RecipeFilter(filters.FilterSet):
         if value and user.is_authenticated:
             return queryset.filter(in_carts__user=user)
         return queryset
+
+    def filter_search(self, queryset, name, value):
+        # Полнотекстовый поиск, выдача — по релевантности (см.
+        # recipes.recipe_search)
+        return search_recipes(queryset, value)
+
+    def filter_ingredients(self, queryset, name, value):
+        if not value:
+            return queryset
+        # Все, хотя бы один, ни одного (см. recipes.ingredient_sets)
+        apply = getattr(ingredient_sets.sets(), INGREDIENT_FILTERS[name])
+        return apply(queryset, sorted(set(value)))
+
+    def filter_pantry(self, queryset, name, value):
+        if not value:
+            return queryset
+        max_missing = int(self.form.cleaned_data.get('max_missing') or 0)
+        return ingredient_sets.sets().cookable(
+            queryset, sorted(set(value)), max_missing
+        )
+
+    def filter_max_missing(self, queryset, name, value):
+        # Учитывается в filter_pantry
+        return queryset
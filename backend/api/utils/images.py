@@ -0,0 +1,237 @@
+"""
+Обработка загруженных изображений (Recipe.image, CustomUser.avatar).
+
+При загрузке (Base64ImageField) картинка проверяется Pillow и
+перекодируется без метаданных (EXIF с геометкой, ICC и т. п.).
+После коммита в фоне строятся варианты рядом с оригиналом:
+уменьшенные копии фиксированной ширины в исходном формате и в WebP,
+плюс WebP исходного размера. Их список хранится в JSON-поле модели
+(image_variants / avatar_variants) вместе с именем исходного файла:
+варианты чужого (уже заменённого) оригинала не отдаются.
+"""
+import io
+import logging
+import os
+from collections import Counter
+
+from django.apps import apps
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db.models.signals import post_save
+from django.utils import timezone
+from PIL import Image, ImageOps, UnidentifiedImageError
+
+from api.utils import background
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_WIDTHS = (320, 640)
+WEBP_QUALITY = 80
+JPEG_QUALITY = 85
+# формат Pillow -> (расширение, MIME)
+FORMATS = {
+    'JPEG': ('jpg', 'image/jpeg'),
+    'PNG': ('png', 'image/png'),
+    'WEBP': ('webp', 'image/webp'),
+}
+# модель -> (поле изображения, поле с вариантами)
+IMAGE_FIELDS = {
+    'recipes.Recipe': ('image', 'image_variants'),
+    'users.CustomUser': ('avatar', 'avatar_variants'),
+}
+
+
+class InvalidImage(ValueError):
+    pass
+
+
+def _open(source):
+    """
+    Проверяет файл Pillow и открывает его заново (после verify() объект
+    непригоден). source — байты или файл: загруженный во временный файл
+    читается с диска по частям.
+    """
+    if isinstance(source, bytes):
+        source = io.BytesIO(source)
+    try:
+        source.seek(0)
+        with Image.open(source) as probe:
+            probe.verify()
+        source.seek(0)
+        image = Image.open(source)
+        image.load()
+    except (UnidentifiedImageError, Image.DecompressionBombError, OSError,
+            SyntaxError) as error:
+        raise InvalidImage(str(error))
+    if image.format not in FORMATS:
+        raise InvalidImage(f'Неподдерживаемый формат {image.format}')
+    return image
+
+
+def _encode(image, image_format):
+    buffer = io.BytesIO()
+    if image_format == 'JPEG':
+        image.convert('RGB').save(
+            buffer, 'JPEG', quality=JPEG_QUALITY, optimize=True
+        )
+    elif image_format == 'WEBP':
+        image.save(buffer, 'WEBP', quality=WEBP_QUALITY, method=4)
+    else:
+        image.save(buffer, image_format, optimize=True)
+    return buffer.getvalue()
+
+
+def sanitize(source, name):
+    """
+    Проверяет изображение (байты или файл) и перекодирует его без метаданных.
+    Ориентация из EXIF применяется к пикселям до того, как EXIF отброшен.
+    """
+    image = _open(source)
+    image_format = image.format
+    image = ImageOps.exif_transpose(image)
+    if image.mode not in ('RGB', 'RGBA', 'L', 'LA'):
+        image = image.convert('RGBA' if image_format == 'PNG' else 'RGB')
+    # Новый объект без info: ни EXIF, ни ICC-профиль в файл не попадут
+    clean = Image.new(image.mode, image.size)
+    clean.paste(image)
+    return ContentFile(_encode(clean, image_format), name=name)
+
+
+def variant_name(name, width, extension):
+    root, _ = os.path.splitext(name)
+    suffix = f'.{width}w' if width else ''
+    return f'{root}{suffix}.{extension}'
+
+
+def build_variants(fieldfile):
+    """
+    Строит и сохраняет варианты изображения, возвращает значение для JSON-поля.
+    """
+    storage = fieldfile.storage
+    with storage.open(fieldfile.name, 'rb') as source:
+        image = _open(source)
+    image_format = image.format
+    extension, mime = FORMATS[image_format]
+    widths = getattr(settings, 'IMAGE_VARIANT_WIDTHS', DEFAULT_WIDTHS)
+
+    renditions = []
+    for width in sorted(w for w in widths if w < image.width):
+        height = max(1, round(image.height * width / image.width))
+        resized = image.resize((width, height), Image.LANCZOS)
+        renditions.append((width, resized, image_format, extension, mime))
+        renditions.append((width, resized, 'WEBP', 'webp', 'image/webp'))
+    if image_format != 'WEBP':
+        renditions.append((image.width, image, 'WEBP', 'webp', 'image/webp'))
+
+    variants = []
+    for width, picture, target_format, extension, target_mime in renditions:
+        name = variant_name(
+            fieldfile.name, width if width != image.width else None, extension
+        )
+        if storage.exists(name):
+            storage.delete(name)
+        content = ContentFile(_encode(picture, target_format))
+        variants.append([storage.save(name, content), width, target_mime])
+    variants.append([fieldfile.name, image.width, mime])
+    return {'source': fieldfile.name, 'variants': variants}
+
+
+def current_variants(value, fieldfile):
+    """Варианты из JSON-поля, если они построены для текущего файла."""
+    if not value or not fieldfile or value.get('source') != fieldfile.name:
+        return []
+    return value['variants']
+
+
+def references(name, value):
+    """
+    Ссылки строки на файлы хранилища: само изображение и его варианты
+    (кроме записи об оригинале — это та же ссылка, что и поле изображения).
+    """
+    found = Counter()
+    name = getattr(name, 'name', name)
+    if name:
+        found[name] += 1
+    for file_name, *_ in (value or {}).get('variants', ()):
+        if file_name != value.get('source'):
+            found[file_name] += 1
+    return found
+
+
+def needs_processing(instance, image_field, variants_field):
+    fieldfile = getattr(instance, image_field)
+    default = instance._meta.get_field(image_field).default
+    if not fieldfile or fieldfile.name == default:
+        return False
+    variants = getattr(instance, variants_field) or {}
+    return variants.get('source') != fieldfile.name
+
+
+def process(model_label, pk, force=False):
+    """
+    Строит варианты для объекта и сохраняет их список (вызывается вне запроса).
+    """
+    model = apps.get_model(model_label)
+    image_field, variants_field = IMAGE_FIELDS[model_label]
+    instance = model.objects.filter(pk=pk).first()
+    if instance is None:
+        return False
+    if not needs_processing(instance, image_field, variants_field):
+        fieldfile = getattr(instance, image_field)
+        variants = getattr(instance, variants_field)
+        if not force or not current_variants(variants, fieldfile):
+            return False
+    fieldfile = getattr(instance, image_field)
+    if not fieldfile.storage.exists(fieldfile.name):
+        logger.info('Нет файла %s у %s %s', fieldfile.name, model_label, pk)
+        return False
+    try:
+        value = build_variants(fieldfile)
+    except InvalidImage as error:
+        logger.warning(
+            'Не удалось обработать %s %s: %s', model_label, pk, error
+        )
+        return False
+    # Варианты прежнего оригинала больше не нужны; сам прежний оригинал не
+    # трогаем
+    previous = getattr(instance, variants_field) or {}
+    stale = {name for name, *_ in previous.get('variants', ())}
+    stale.discard(previous.get('source'))
+    # Пока строились варианты, могли загрузить новый оригинал (и его
+    # варианты уже записал более быстрый запуск) — пишем, только если
+    # в строке всё ещё тот файл, с которым начинали
+    updated_at = timezone.now()
+    updated = model.objects.filter(
+        pk=pk, **{image_field: fieldfile.name}
+    ).update(**{variants_field: value, 'updated_at': updated_at})
+    if not updated:
+        logger.info(
+            'Оригинал %s %s заменён во время обработки', model_label, pk
+        )
+        for name, *_ in value['variants']:
+            if name != fieldfile.name:
+                fieldfile.storage.delete(name)
+        return False
+    # update() обходит сигналы: сами отправляем post_save, как после
+    # save(update_fields=...) — он меняет счётчики ссылок на файлы и
+    # сбрасывает кэш ответов (сигналы api)
+    instance._media_references = references(fieldfile.name, previous)
+    setattr(instance, variants_field, value)
+    instance.updated_at = updated_at
+    post_save.send(
+        sender=model, instance=instance, created=False, raw=False,
+        using=instance._state.db,
+        update_fields=frozenset((variants_field, 'updated_at')),
+    )
+    for name in stale - {name for name, *_ in value['variants']}:
+        fieldfile.storage.delete(name)
+    return True
+
+
+def schedule(instance):
+    """Ставит построение вариантов в фон после коммита транзакции."""
+    background.run_after_commit(
+        'image-variants', process, instance._meta.label, instance.pk,
+        workers=getattr(settings, 'IMAGE_WORKERS', 2),
+        setting='IMAGE_VARIANTS_ASYNC',
+    )
@@ -0,0 +1,345 @@
+"""
+Замер фаз запроса (Server-Timing) и агрегаты по маршрутам для Prometheus.
+
+RequestMetricsMiddleware заводит на запрос RequestTimer: он же — обёртка
+connection.execute_wrapper, считающая SQL-запросы и их время. Фазы:
+
+* auth — аутентификация DRF (TimedTokenAuthentication);
+* db — все SQL-запросы запроса;
+* serialize — код view без SQL и аутентификации: в API это в основном
+  сериализаторы (ленивые queryset'ы вычисляются внутри них и уходят в db);
+* render — рендер ответа DRF после выхода из view;
+* total — весь запрос внутри middleware.
+
+Агрегаты копятся в памяти процесса, и раз в METRICS_FLUSH_INTERVAL секунд
+процесс переписывает свой файл в METRICS_DIR (os.replace, без блокировок:
+у каждого воркера gunicorn свой файл). /api/_metrics складывает файлы всех
+процессов; файлы завершившихся процессов под flock сливаются в archive.json,
+чтобы счётчики не обнулялись при перезапуске воркеров.
+"""
+import contextvars
+import fcntl
+import json
+import os
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from pathlib import Path
+
+from django.conf import settings
+from api.utils.replicas import PrimaryFallbackTokenAuthentication
+
+PREFIX = 'foodgram'
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5)
+QUERY_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100)
+PHASES = ('auth', 'db', 'serialize', 'render')
+METHODS = {'GET', 'HEAD', 'POST', 'PUT', 'PATCH', 'DELETE', 'OPTIONS'}
+ARCHIVE = 'archive.json'
+DEFAULT_FLUSH_INTERVAL = 1
+
+_timer = contextvars.ContextVar('request_timer', default=None)
+
+
+def current():
+    """Таймер текущего запроса или None вне RequestMetricsMiddleware."""
+    return _timer.get()
+
+
+class RequestTimer:
+    """Фазы одного запроса: [время, время SQL] на момент начала и итог."""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.queries = 0
+        self.db = 0.0
+        self.spans = {}
+        self._open = {}
+        self.total = None
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.db += time.perf_counter() - started
+            self.queries += 1
+
+    def start(self, name):
+        self._open[name] = (time.perf_counter(), self.db)
+
+    def stop(self, name):
+        if name not in self._open:
+            return
+        started, db = self._open.pop(name)
+        wall, sql = self.spans.get(name, (0.0, 0.0))
+        self.spans[name] = (
+            wall + time.perf_counter() - started, sql + self.db - db
+        )
+
+    @contextmanager
+    def phase(self, name):
+        self.start(name)
+        try:
+            yield
+        finally:
+            self.stop(name)
+
+    def finish(self):
+        for name in list(self._open):
+            self.stop(name)
+        self.total = time.perf_counter() - self.started
+
+    def phases(self):
+        """Секунды по фазам из PHASES."""
+        auth, auth_db = self.spans.get('auth', (0.0, 0.0))
+        view, view_db = self.spans.get('view', (0.0, 0.0))
+        return {
+            'auth': auth,
+            'db': self.db,
+            'serialize': max(0.0, view - auth - (view_db - auth_db)),
+            'render': self.spans.get('render', (0.0, 0.0))[0],
+        }
+
+    def server_timing(self):
+        parts = []
+        for name, seconds in self.phases().items():
+            part = f'{name};dur={seconds * 1000:.2f}'
+            if name == 'db':
+                part += f';desc="{self.queries} queries"'
+            parts.append(part)
+        parts.append(f'total;dur={self.total * 1000:.2f}')
+        return ', '.join(parts)
+
+
+class TimedTokenAuthentication(PrimaryFallbackTokenAuthentication):
+    """TokenAuthentication, время которой попадает в фазу auth."""
+
+    def authenticate(self, request):
+        timer = current()
+        if timer is None:
+            return super().authenticate(request)
+        with timer.phase('auth'):
+            return super().authenticate(request)
+
+
+@contextmanager
+def track(timer):
+    token = _timer.set(timer)
+    try:
+        yield timer
+    finally:
+        _timer.reset(token)
+
+
+def _empty_series():
+    return {
+        'count': 0,
+        'duration_sum': 0.0,
+        'duration_buckets': [0] * len(DURATION_BUCKETS),
+        'queries_sum': 0,
+        'queries_buckets': [0] * len(QUERY_BUCKETS),
+        'phases': dict.fromkeys(PHASES, 0.0),
+        'statuses': {},
+    }
+
+
+def _merge(into, series):
+    for key, value in series.items():
+        target = into.setdefault(key, _empty_series())
+        target['count'] += value['count']
+        target['duration_sum'] += value['duration_sum']
+        target['queries_sum'] += value['queries_sum']
+        for name in ('duration_buckets', 'queries_buckets'):
+            target[name] = [a + b for a, b in zip(target[name], value[name])]
+        phases, statuses = target['phases'], target['statuses']
+        for phase, seconds in value['phases'].items():
+            phases[phase] = phases.get(phase, 0.0) + seconds
+        for status, count in value['statuses'].items():
+            statuses[status] = statuses.get(status, 0) + count
+    return into
+
+
+class Registry:
+    """Агрегаты процесса по (маршрут, метод); сбрасываются в свой файл."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.series = {}
+        self.flushed = 0.0
+        self._pid = None
+        self._name = None
+
+    @property
+    def filename(self):
+        # После fork (gunicorn --preload) у воркера свой pid — и свой файл
+        if self._pid != os.getpid():
+            self._pid = os.getpid()
+            self._name = f'{self._pid}-{uuid.uuid4().hex[:8]}.json'
+            self.series = {}
+        return self._name
+
+    def observe(self, route, method, status, timer):
+        key = f'{route}|{method if method in METHODS else "OTHER"}'
+        with self.lock:
+            self.filename
+            series = self.series.setdefault(key, _empty_series())
+            series['count'] += 1
+            series['duration_sum'] += timer.total
+            series['queries_sum'] += timer.queries
+            for index, bound in enumerate(DURATION_BUCKETS):
+                if timer.total <= bound:
+                    series['duration_buckets'][index] += 1
+            for index, bound in enumerate(QUERY_BUCKETS):
+                if timer.queries <= bound:
+                    series['queries_buckets'][index] += 1
+            for phase, seconds in timer.phases().items():
+                series['phases'][phase] += seconds
+            status = f'{status // 100}xx'
+            series['statuses'][status] = series['statuses'].get(status, 0) + 1
+        self.flush()
+
+    def flush(self, force=False):
+        interval = getattr(
+            settings, 'METRICS_FLUSH_INTERVAL', DEFAULT_FLUSH_INTERVAL
+        )
+        with self.lock:
+            # Проверка и отметка под одной блокировкой: из потоков, закончивших
+            # запрос одновременно, файл пишет только один
+            now = time.monotonic()
+            if not force and now - self.flushed < interval:
+                return
+            self.flushed = now
+            name = self.filename
+            payload = json.dumps({'pid': self._pid, 'series': self.series})
+        directory = metrics_dir()
+        directory.mkdir(parents=True, exist_ok=True)
+        # Свой временный файл на вызов: collect() может писать параллельно
+        temporary = directory / f'.{name}.{uuid.uuid4().hex[:8]}.tmp'
+        try:
+            temporary.write_text(payload)
+            os.replace(temporary, directory / name)
+        finally:
+            temporary.unlink(missing_ok=True)
+
+    def reset(self):
+        with self.lock:
+            self.series = {}
+            self._pid = None
+
+
+REGISTRY = Registry()
+
+
+def metrics_dir():
+    default = Path(settings.BASE_DIR) / 'metrics'
+    return Path(getattr(settings, 'METRICS_DIR', default))
+
+
+def _alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def _read(path):
+    try:
+        return json.loads(path.read_text())
+    except (OSError, ValueError):
+        return None
+
+
+def collect():
+    """
+    Сумма агрегатов всех процессов; файлы завершившихся сливаются в
+    archive.json.
+    """
+    REGISTRY.flush(force=True)
+    directory = metrics_dir()
+    with open(directory / '.lock', 'w') as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        archive = _read(directory / ARCHIVE) or {'series': {}}
+        merged = _merge({}, archive['series'])
+        dead = []
+        for path in directory.glob('*.json'):
+            if path.name == ARCHIVE:
+                continue
+            data = _read(path)
+            if data is None:
+                continue
+            _merge(merged, data['series'])
+            if not _alive(data['pid']):
+                _merge(archive['series'], data['series'])
+                dead.append(path)
+        if dead:
+            temporary = directory / f'.{ARCHIVE}.tmp'
+            temporary.write_text(json.dumps(archive))
+            os.replace(temporary, directory / ARCHIVE)
+            for path in dead:
+                path.unlink()
+    return merged
+
+
+def _labels(**labels):
+    return ','.join(f'{name}="{value}"' for name, value in labels.items())
+
+
+def _histogram(lines, name, bounds, buckets, total, count, labels):
+    for bound, value in zip(bounds, buckets):
+        lines.append(f'{name}_bucket{{{_labels(**labels, le=bound)}}} {value}')
+    lines.append(f'{name}_bucket{{{_labels(**labels, le="+Inf")}}} {count}')
+    lines.append(f'{name}_sum{{{_labels(**labels)}}} {total}')
+    lines.append(f'{name}_count{{{_labels(**labels)}}} {count}')
+
+
+def render(series):
+    """Текстовый формат Prometheus 0.0.4."""
+    duration = f'{PREFIX}_request_duration_seconds'
+    queries = f'{PREFIX}_request_db_queries'
+    phases = f'{PREFIX}_request_phase_seconds_total'
+    requests = f'{PREFIX}_requests_total'
+    lines = [
+        f'# HELP {duration} Время обработки запроса.',
+        f'# TYPE {duration} histogram',
+    ]
+    for key, value in sorted(series.items()):
+        route, method = key.split('|')
+        _histogram(
+            lines, duration, DURATION_BUCKETS, value['duration_buckets'],
+            value['duration_sum'], value['count'],
+            {'route': route, 'method': method},
+        )
+    lines += [
+        f'# HELP {queries} SQL-запросов на запрос.',
+        f'# TYPE {queries} histogram',
+    ]
+    for key, value in sorted(series.items()):
+        route, method = key.split('|')
+        _histogram(
+            lines, queries, QUERY_BUCKETS, value['queries_buckets'],
+            value['queries_sum'], value['count'],
+            {'route': route, 'method': method},
+        )
+    lines += [
+        f'# HELP {phases} Суммарное время по фазам запроса.',
+        f'# TYPE {phases} counter',
+    ]
+    for key, value in sorted(series.items()):
+        route, method = key.split('|')
+        for phase, seconds in value['phases'].items():
+            labels = _labels(route=route, method=method, phase=phase)
+            lines.append(f'{phases}{{{labels}}} {seconds}')
+    lines += [
+        f'# HELP {requests} Запросы по классу статуса ответа.',
+        f'# TYPE {requests} counter',
+    ]
+    for key, value in sorted(series.items()):
+        route, method = key.split('|')
+        for status, count in sorted(value['statuses'].items()):
+            labels = _labels(route=route, method=method, status=status)
+            lines.append(f'{requests}{{{labels}}} {count}')
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,197 @@
+import base64
+import json
+from datetime import datetime
+
+from django.db import connection
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination, PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+from recipes import feed
+from recipes.models import Recipe
+
+
+class LimitPageNumberPagination(PageNumberPagination):
+    """
+    Постраничная выдача с размером страницы из параметра ?limit= (его шлёт
+    фронтенд).
+    """
+    page_size_query_param = 'limit'
+    max_page_size = 100
+
+
+def keyset(queryset, cursor, date_field='pub_date', pk_field='pk'):
+    """
+    Строки queryset после курсора (pub_date, pk, reverse) в порядке страницы.
+    """
+    reverse = False
+    if cursor is not None:
+        pub_date, pk, reverse = cursor
+        after, at = ('gt', 'gte') if reverse else ('lt', 'lte')
+        # pub_date >= p — условие диапазона по индексу, OR — уточнение на
+        # границе
+        queryset = queryset.filter(
+            Q(**{f'{date_field}__{at}': pub_date})
+            & (
+                Q(**{f'{date_field}__{after}': pub_date})
+                | Q(**{f'{pk_field}__{after}': pk})
+            )
+        )
+    if reverse:
+        return queryset.order_by(date_field, pk_field)
+    return queryset.order_by(f'-{date_field}', f'-{pk_field}')
+
+
+class RecipeKeysetPagination(BasePagination):
+    """
+    Курсорная (keyset) пагинация рецептов по (pub_date, id) по убыванию.
+
+    Вместо OFFSET и COUNT(*) страница начинается с условия по ключу
+    последней строки, поэтому глубина страницы не влияет на время ответа.
+    Курсор непрозрачен для клиента: base64 от JSON с ключом и направлением.
+    Включается параметром ?pagination=cursor, дальше клиент ходит по
+    ссылкам next/previous с ?cursor=.
+    """
+    cursor_query_param = 'cursor'
+    mode_query_param = 'pagination'
+    mode = 'cursor'
+    page_size_query_param = 'limit'
+    page_size = LimitPageNumberPagination.page_size
+    max_page_size = LimitPageNumberPagination.max_page_size
+    invalid_cursor_message = 'Некорректный курсор.'
+
+    @classmethod
+    def is_requested(cls, request):
+        return (
+            cls.cursor_query_param in request.query_params
+            or request.query_params.get(cls.mode_query_param) == cls.mode
+        )
+
+    def get_page_size(self, request):
+        try:
+            size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        return min(size, self.max_page_size) if size > 0 else self.page_size
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.base_url = request.build_absolute_uri()
+        page_size = self.get_page_size(request)
+        cursor = self.decode_cursor(request)
+        reverse = cursor is not None and cursor[2]
+        rows = self.page_rows(queryset, cursor, page_size + 1)
+
+        has_more = len(rows) > page_size
+        rows = rows[:page_size]
+        if reverse:
+            rows.reverse()
+        self.has_next = has_more if not reverse else True
+        self.has_previous = (
+            cursor is not None and (has_more if reverse else True)
+        )
+        self.page = rows
+        return rows
+
+    def page_rows(self, queryset, cursor, limit):
+        """До limit строк после курсора в порядке страницы."""
+        return list(keyset(queryset, cursor)[:limit])
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self.get_next_link(),
+            'previous': self.get_previous_link(),
+            'results': data,
+        })
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'required': ['results'],
+            'properties': {
+                'next': {
+                    'type': 'string', 'nullable': True, 'format': 'uri',
+                },
+                'previous': {
+                    'type': 'string', 'nullable': True, 'format': 'uri',
+                },
+                'results': schema,
+            },
+        }
+
+    def get_next_link(self):
+        if not self.has_next or not self.page:
+            return None
+        return self._link(self.page[-1], reverse=False)
+
+    def get_previous_link(self):
+        if not self.has_previous or not self.page:
+            return None
+        return self._link(self.page[0], reverse=True)
+
+    def _link(self, recipe, reverse):
+        url = remove_query_param(self.base_url, self.mode_query_param)
+        return replace_query_param(
+            url, self.cursor_query_param, self.encode_cursor(recipe, reverse)
+        )
+
+    @staticmethod
+    def encode_cursor(recipe, reverse=False):
+        payload = json.dumps(
+            [recipe.pub_date.isoformat(), recipe.pk, int(reverse)]
+        )
+        return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        try:
+            padded = encoded + '=' * (-len(encoded) % 4)
+            pub_date, pk, reverse = json.loads(
+                base64.urlsafe_b64decode(padded)
+            )
+            return datetime.fromisoformat(pub_date), int(pk), bool(reverse)
+        except (TypeError, ValueError):
+            raise NotFound(self.invalid_cursor_message)
+
+
+class FeedPagination(RecipeKeysetPagination):
+    """
+    Курсорная пагинация ленты подписок (recipes.feed). Ключи страницы
+    берутся из ленты пользователя и из рецептов популярных авторов, на
+    которых он подписан, и сливаются по (pub_date, id); рецепты для ответа
+    читаются одним запросом по id.
+    """
+
+    def page_rows(self, queryset, cursor, limit):
+        user = self.request.user
+        timeline = keyset(feed.timeline(user), cursor, pk_field='recipe_id')
+        keys = set(timeline.values_list('pub_date', 'recipe_id')[:limit])
+        keys.update(
+            self._pulled_keys(feed.pulled_authors(user), cursor, limit)
+        )
+        reverse = cursor is not None and cursor[2]
+        ids = [pk for _, pk in sorted(keys, reverse=not reverse)[:limit]]
+        recipes = queryset.in_bulk(ids)
+        return [recipes[pk] for pk in ids if pk in recipes]
+
+    @staticmethod
+    def _pulled_keys(authors, cursor, limit):
+        if not authors:
+            return []
+        recipes = keyset(Recipe.objects.all(), cursor).values_list(
+            'pub_date', 'pk'
+        )
+        if not connection.features.supports_slicing_ordering_in_compound:
+            return recipes.filter(author_id__in=authors)[:limit]
+        # Первые limit каждого автора по индексу (author, -pub_date) и UNION
+        # ALL: с author IN (...) планировщик идёт по общему индексу pub_date,
+        # пропуская рецепты остальных авторов, — на порядок дольше
+        parts = [
+            recipes.filter(author_id=author_id)[:limit]
+            for author_id in authors
+        ]
+        return parts[0].union(*parts[1:], all=True)
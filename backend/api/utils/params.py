@@ -0,0 +1,7 @@
+def get_positive_int(request, name):
+    """Положительное целое из query-параметра name или None."""
+    try:
+        value = int(request.query_params.get(name, ''))
+    except ValueError:
+        return None
+    return value if value > 0 else None
@@ -0,0 +1,274 @@
+"""
+Профили отдельных запросов: по запросу сотрудника и автоматически для
+медленных.
+
+Сотрудник (is_staff) включает профиль заголовком ``X-Profile: 1`` или
+параметром ``?_profile=1``: запрос выполняется под cProfile, ответ получает
+``X-Profile-Id``. При PROFILE_SLOW_MS > 0 доля PROFILE_SAMPLE_RATE всех
+запросов идёт под семплирующим профилировщиком (фоновый поток раз в
+PROFILE_SAMPLE_INTERVAL снимает стек потока запроса через
+sys._current_frames) — он почти бесплатен, а профиль сохраняется, только
+если запрос оказался медленнее порога.
+
+В обоих режимах записываются SQL-запросы (текст без параметров, время,
+стек вызова в коде проекта). Профили лежат в PROFILE_DIR: JSON с
+описанием и, для cProfile, .prof для pstats/snakeviz; хранятся последние
+PROFILE_KEEP. Смотреть — manage.py profiles list|show|diff.
+"""
+import cProfile
+import io
+import json
+import os
+import pstats
+import random
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+from datetime import datetime, timezone as dt_timezone
+from pathlib import Path
+
+from django.conf import settings
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.exceptions import AuthenticationFailed
+
+HEADER = 'X-Profile'
+QUERY_PARAM = '_profile'
+DEFAULT_KEEP = 200
+DEFAULT_SAMPLE_INTERVAL = 0.005
+STACK_DEPTH = 8
+TOP_FUNCTIONS = 60
+SITE_PACKAGES = f'{os.sep}site-packages{os.sep}'
+# Обвязка запроса, а не место вызова SQL
+SKIPPED_FILES = (
+    'manage.py', 'api/middleware.py', 'api/utils/metrics.py',
+    'api/utils/profiling.py',
+)
+
+
+def profile_dir():
+    default = Path(settings.BASE_DIR) / 'profiles'
+    return Path(getattr(settings, 'PROFILE_DIR', default))
+
+
+def is_requested(request):
+    return (
+        request.headers.get(HEADER) == '1'
+        or request.GET.get(QUERY_PARAM) == '1'
+    )
+
+
+def is_staff(request):
+    """
+    Сессия Django или токен DRF: view ещё не вызван, так что токен проверяем
+    сами.
+    """
+    user = getattr(request, 'user', None)
+    if user is not None and user.is_authenticated:
+        return user.is_staff
+    try:
+        result = TokenAuthentication().authenticate(request)
+    except AuthenticationFailed:
+        return False
+    return bool(result and result[0].is_staff)
+
+
+def should_sample():
+    threshold = getattr(settings, 'PROFILE_SLOW_MS', 0)
+    rate = getattr(settings, 'PROFILE_SAMPLE_RATE', 1.0)
+    return threshold > 0 and random.random() < rate
+
+
+def _project_root():
+    return str(Path(settings.BASE_DIR).resolve()) + os.sep
+
+
+def call_site(frame, root):
+    """
+    Кадры кода проекта (без библиотек и обвязки запроса), от вызывающего к
+    вызванному.
+    """
+    stack = []
+    while frame is not None and len(stack) < STACK_DEPTH:
+        filename = frame.f_code.co_filename
+        if filename.startswith(root) and SITE_PACKAGES not in filename:
+            relative = filename[len(root):].replace(os.sep, '/')
+            if relative not in SKIPPED_FILES:
+                stack.append(
+                    f'{relative}:{frame.f_lineno} in {frame.f_code.co_name}'
+                )
+        frame = frame.f_back
+    return stack[::-1]
+
+
+def folded(frame):
+    """Стек в формате flamegraph: корень;...;лист."""
+    names = []
+    while frame is not None:
+        filename = os.path.basename(frame.f_code.co_filename)
+        names.append(f'{filename}:{frame.f_code.co_name}')
+        frame = frame.f_back
+    return ';'.join(reversed(names))
+
+
+class StackSampler:
+    """
+    Один фоновый поток на процесс снимает стеки зарегистрированных потоков.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.targets = {}
+        self.pid = None
+
+    def start(self, thread_id):
+        counter = Counter()
+        with self.lock:
+            self.targets[thread_id] = counter
+            # После fork поток-семплер остаётся в родителе — заводим свой
+            if self.pid != os.getpid():
+                self.pid = os.getpid()
+                threading.Thread(
+                    target=self._run, name='profile-sampler', daemon=True
+                ).start()
+        return counter
+
+    def stop(self, thread_id):
+        with self.lock:
+            return self.targets.pop(thread_id, Counter())
+
+    def _run(self):
+        while True:
+            time.sleep(getattr(
+                settings, 'PROFILE_SAMPLE_INTERVAL', DEFAULT_SAMPLE_INTERVAL
+            ))
+            with self.lock:
+                if not self.targets:
+                    continue
+                frames = sys._current_frames()
+                for thread_id, counter in self.targets.items():
+                    frame = frames.get(thread_id)
+                    if frame is not None:
+                        counter[folded(frame)] += 1
+
+
+SAMPLER = StackSampler()
+
+
+class RequestProfile:
+    """Профиль одного запроса; сам же — обёртка connection.execute_wrapper."""
+
+    def __init__(self, request, mode):
+        self.id = uuid.uuid4().hex[:12]
+        self.request = request
+        self.mode = mode
+        self.root = _project_root()
+        self.queries = []
+        self.samples = None
+        self.profiler = cProfile.Profile() if mode == 'cprofile' else None
+        self.started = None
+        self.duration = None
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries.append({
+                'sql': sql,
+                'ms': round((time.perf_counter() - started) * 1000, 3),
+                'stack': call_site(sys._getframe(1), self.root),
+            })
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        if self.profiler is not None:
+            self.profiler.enable()
+        else:
+            self.thread_id = threading.get_ident()
+            self.samples = SAMPLER.start(self.thread_id)
+        return self
+
+    def __exit__(self, *exc_info):
+        if self.profiler is not None:
+            self.profiler.disable()
+        else:
+            self.samples = SAMPLER.stop(self.thread_id)
+        self.duration = time.perf_counter() - self.started
+
+    def _functions(self):
+        stats = pstats.Stats(self.profiler, stream=io.StringIO())
+        rows = [
+            {
+                'function': f'{filename}:{line}({name})',
+                'calls': calls,
+                'tottime': round(tottime, 6),
+                'cumtime': round(cumtime, 6),
+            }
+            for (filename, line, name), (_, calls, tottime, cumtime, _)
+            in stats.stats.items()
+        ]
+        rows.sort(key=lambda row: row['cumtime'], reverse=True)
+        return rows[:TOP_FUNCTIONS]
+
+    def save(self, response):
+        directory = profile_dir()
+        directory.mkdir(parents=True, exist_ok=True)
+        now = datetime.now(dt_timezone.utc)
+        user = getattr(self.request, 'user', None)
+        match = self.request.resolver_match
+        data = {
+            'id': self.id,
+            'created': now.isoformat(timespec='milliseconds'),
+            'mode': self.mode,
+            'method': self.request.method,
+            'path': self.request.get_full_path(),
+            'route': match.view_name if match else None,
+            'status': response.status_code,
+            'user': (
+                user.pk if user is not None and user.is_authenticated
+                else None
+            ),
+            'duration_ms': round(self.duration * 1000, 3),
+            'sql_ms': round(sum(query['ms'] for query in self.queries), 3),
+            'queries': self.queries,
+        }
+        stem = f'{now:%Y%m%dT%H%M%S%f}-{self.id}'
+        if self.profiler is not None:
+            data['functions'] = self._functions()
+            self.profiler.dump_stats(directory / f'{stem}.prof')
+        else:
+            data['samples'] = dict(self.samples.most_common())
+        temporary = directory / f'.{stem}.tmp'
+        temporary.write_text(json.dumps(data, ensure_ascii=False))
+        os.replace(temporary, directory / f'{stem}.json')
+        rotate(directory)
+        return data
+
+
+def rotate(directory):
+    """
+    Оставляет последние PROFILE_KEEP профилей (имена начинаются с времени).
+    """
+    keep = getattr(settings, 'PROFILE_KEEP', DEFAULT_KEEP)
+    paths = sorted(directory.glob('*.json'))
+    for path in paths[:max(0, len(paths) - keep)]:
+        path.unlink(missing_ok=True)
+        path.with_suffix('.prof').unlink(missing_ok=True)
+
+
+def stored(directory=None):
+    """Сохранённые профили, от старых к новым."""
+    return sorted((directory or profile_dir()).glob('*.json'))
+
+
+def load(profile_id, directory=None):
+    """Профиль по id или его началу; None, если не найден или неоднозначен."""
+    matches = [
+        path for path in stored(directory)
+        if path.stem.split('-', 1)[1].startswith(profile_id)
+    ]
+    if len(matches) != 1:
+        return None
+    return json.loads(matches[0].read_text())
@@ -0,0 +1,33 @@
+import json
+
+from rest_framework.renderers import BaseRenderer
+
+
+class _DownloadRenderer(BaseRenderer):
+    """
+    Рендерер только для согласования формата (?format= или Accept):
+    сами файлы отдаются потоком, минуя render(). Через него проходят
+    лишь ответы с ошибками — их отдаём как JSON.
+    """
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        return json.dumps(data, ensure_ascii=False).encode('utf-8')
+
+
+class PlainTextRenderer(_DownloadRenderer):
+    media_type = 'text/plain'
+    format = 'txt'
+
+
+class CSVRenderer(_DownloadRenderer):
+    media_type = 'text/csv'
+    format = 'csv'
+
+
+class PDFRenderer(_DownloadRenderer):
+    media_type = 'application/pdf'
+    format = 'pdf'
+    charset = None
@@ -0,0 +1,296 @@
+"""
+Чтение с реплик PostgreSQL с гарантией «читаю свои записи».
+
+ReplicaRoutingMiddleware отмечает запрос: безопасные методы (GET, HEAD,
+OPTIONS) читают с одной из READ_REPLICAS, остальные целиком идут в
+default. Вне запросов (команды, фоновые потоки, сигналы) реплики не
+используются вовсе — маршрутизация только по явному разрешению.
+
+Если запрос что-то записал, клиент (по заголовку Authorization или cookie
+сессии) на REPLICA_PIN_SECONDS закрепляется за основной базой: его следующие
+чтения увидят собственную запись, даже пока реплика догоняет. Закрепление
+хранится в кэше, поэтому кэш должен быть общим для всех воркеров (проверка
+check_pin_cache). Новый токен, которого реплика ещё не получила, ищется на
+основной базе (PrimaryFallbackTokenAuthentication).
+
+Здоровье реплик проверяется раз в REPLICA_CHECK_INTERVAL секунд на
+процесс: недоступная или отстающая больше REPLICA_MAX_LAG секунд
+реплика исключается до следующей проверки; нет здоровых — читаем с
+default. Ошибка соединения с репликой посреди запроса исключает её сразу.
+"""
+import contextvars
+import hashlib
+import logging
+import random
+import threading
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.core import checks
+from django.core.cache import DEFAULT_CACHE_ALIAS, cache
+from django.db import (
+    DEFAULT_DB_ALIAS, DatabaseError, InterfaceError, OperationalError,
+    connections,
+)
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.exceptions import AuthenticationFailed
+
+logger = logging.getLogger(__name__)
+
+PIN_PREFIX = 'replicas:pin'
+DEFAULT_PIN_SECONDS = 5
+DEFAULT_MAX_LAG = 10
+DEFAULT_CHECK_INTERVAL = 5
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+# Сессии читаются только с основной базы: свежий вход не должен теряться из-за
+# отставания
+PRIMARY_ONLY = {'sessions.session'}
+# Догнавшая реплика — 0; иначе время с последней применённой транзакции
+LAG_SQL = """
+    SELECT CASE
+        WHEN NOT pg_is_in_recovery() THEN 0
+        WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+        ELSE EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp())
+    END
+"""
+
+# Кэши, которые видит только свой процесс: закрепление, записанное одним
+# воркером, другой не увидит
+PROCESS_LOCAL_CACHES = {
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+}
+
+_state = contextvars.ContextVar('replica_routing', default=None)
+
+
+class RoutingState:
+    """
+    Маршрутизация одного запроса: можно ли читать с реплики, с какой и была ли
+    запись.
+    """
+
+    def __init__(self, use_replica):
+        self.use_replica = use_replica
+        self.alias = None
+        self.wrote = False
+
+
+def current():
+    return _state.get()
+
+
+@contextmanager
+def routing(state):
+    token = _state.set(state)
+    try:
+        yield state
+    finally:
+        _state.reset(token)
+
+
+@contextmanager
+def primary():
+    """Чтения внутри блока идут в default (запись по-прежнему отмечается)."""
+    state = _state.get()
+    if state is None or not state.use_replica:
+        yield
+        return
+    state.use_replica = False
+    try:
+        yield
+    finally:
+        state.use_replica = True
+
+
+def reading_replica():
+    state = _state.get()
+    return state is not None and state.use_replica
+
+
+def replication_lag(alias):
+    """
+    Отставание реплики в секундах; для баз кроме PostgreSQL — 0, если отвечает.
+    """
+    connection = connections[alias]
+    with connection.cursor() as cursor:
+        if connection.vendor != 'postgresql':
+            cursor.execute('SELECT 1')
+            return 0.0
+        cursor.execute(LAG_SQL)
+        return float(cursor.fetchone()[0] or 0)
+
+
+class ReplicaHealth:
+    """
+    Здоровые реплики процесса; проверка — не чаще REPLICA_CHECK_INTERVAL и
+    одним потоком.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.checked = None
+        self.healthy = []
+        self.lags = {}
+
+    def available(self):
+        interval = getattr(
+            settings, 'REPLICA_CHECK_INTERVAL', DEFAULT_CHECK_INTERVAL
+        )
+        if self.checked is None or time.monotonic() - self.checked >= interval:
+            # Пока один поток проверяет, остальные читают по прошлому
+            # результату
+            if self.lock.acquire(blocking=self.checked is None):
+                try:
+                    self.check()
+                finally:
+                    self.lock.release()
+        return self.healthy
+
+    def check(self):
+        max_lag = getattr(settings, 'REPLICA_MAX_LAG', DEFAULT_MAX_LAG)
+        healthy, lags = [], {}
+        for alias in settings.READ_REPLICAS:
+            try:
+                lags[alias] = replication_lag(alias)
+            except DatabaseError as error:
+                logger.warning('Реплика %s недоступна: %s', alias, error)
+                lags[alias] = None
+                continue
+            if lags[alias] <= max_lag:
+                healthy.append(alias)
+            else:
+                logger.warning(
+                    'Реплика %s отстаёт на %.1f с', alias, lags[alias]
+                )
+        self.healthy, self.lags = healthy, lags
+        self.checked = time.monotonic()
+        return lags
+
+    def mark_down(self, alias):
+        self.healthy = [
+            healthy for healthy in self.healthy if healthy != alias
+        ]
+
+    def reset(self):
+        self.checked = None
+        self.healthy, self.lags = [], {}
+
+
+HEALTH = ReplicaHealth()
+
+
+class ReplicaRouter:
+    """
+    DATABASE_ROUTERS: чтение — по состоянию запроса, запись и миграции —
+    default.
+    """
+
+    def db_for_read(self, model, **hints):
+        state = _state.get()
+        if (
+            state is None or not state.use_replica
+            or model._meta.label_lower in PRIMARY_ONLY
+        ):
+            return DEFAULT_DB_ALIAS
+        if state.alias is None:
+            # Одна реплика на запрос: все его чтения видят один и тот же момент
+            healthy = HEALTH.available()
+            state.alias = (
+                random.choice(healthy) if healthy else DEFAULT_DB_ALIAS
+            )
+        return state.alias
+
+    def db_for_write(self, model, **hints):
+        state = _state.get()
+        if state is not None:
+            state.wrote = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # На репликах те же данные, что и в default
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Схема приходит на реплики репликацией
+        return db == DEFAULT_DB_ALIAS
+
+
+def pin_key(request):
+    """
+    Ключ закрепления клиента: токен или сессия; анонимного клиента не
+    закрепляем.
+    """
+    credential = (
+        request.headers.get('Authorization')
+        or request.COOKIES.get(settings.SESSION_COOKIE_NAME)
+    )
+    if not credential:
+        return None
+    return f'{PIN_PREFIX}:{hashlib.md5(credential.encode()).hexdigest()}'
+
+
+def check_pin_cache(app_configs=None, **kwargs):
+    """Системная проверка: с репликами закрепления нужен общий кэш."""
+    backend = settings.CACHES[DEFAULT_CACHE_ALIAS]['BACKEND']
+    if (
+        not getattr(settings, 'READ_REPLICAS', None)
+        or backend not in PROCESS_LOCAL_CACHES
+    ):
+        return []
+    return [checks.Error(
+        f'READ_REPLICAS включены, а кэш {backend} виден только своему '
+        'процессу.',
+        hint=(
+            'Нужен общий для воркеров кэш (CACHE_BACKEND=file, Redis, '
+            'Memcached): иначе клиент, записавший через один воркер, через '
+            'другой читает с отстающей реплики.'
+        ),
+        obj='READ_REPLICAS',
+        id='api.E001',
+    )]
+
+
+def begin(request):
+    """Состояние маршрутизации запроса; None — реплики не настроены."""
+    if not getattr(settings, 'READ_REPLICAS', None):
+        return None
+    key = pin_key(request)
+    pinned = key is not None and cache.get(key) is not None
+    return RoutingState(
+        use_replica=request.method in SAFE_METHODS and not pinned
+    )
+
+
+def finish(request, state):
+    """После записи закрепляет клиента за основной базой."""
+    key = pin_key(request)
+    if state.wrote and key is not None:
+        cache.set(key, 1, timeout=getattr(
+            settings, 'REPLICA_PIN_SECONDS', DEFAULT_PIN_SECONDS
+        ))
+
+
+def replica_failed(state, exception):
+    """Ошибка соединения на реплике исключает её до следующей проверки."""
+    if state.alias not in (None, DEFAULT_DB_ALIAS) and isinstance(
+        exception, (OperationalError, InterfaceError)
+    ):
+        logger.warning('Ошибка на реплике %s: %s', state.alias, exception)
+        HEALTH.mark_down(state.alias)
+
+
+class PrimaryFallbackTokenAuthentication(TokenAuthentication):
+    """
+    Токен, которого ещё нет на отстающей реплике, ищется на основной базе.
+    """
+
+    def authenticate_credentials(self, key):
+        try:
+            return super().authenticate_credentials(key)
+        except AuthenticationFailed:
+            if not reading_replica():
+                raise
+            with primary():
+                return super().authenticate_credentials(key)
@@ -0,0 +1,280 @@
+"""
+Кэш готовых ответов на анонимные GET-запросы к рецептам.
+
+Анонимный ответ не зависит от зрителя (флаги избранного и корзины всегда
+false), поэтому его можно отдавать без ORM и сериализации. Ключ — путь,
+нормализованный query string и тип ответа после content negotiation.
+
+Инвалидация — по тегам с версиями: запись помнит версии своих тегов на
+момент сборки и считается живой, пока они не изменились. Теги:
+``recipe:<id>`` — для карточки рецепта, ``recipes`` — для любых списков;
+карточку при сборке дополнительно помечают ``author:<id>`` и
+``ingredient:<id>`` (add_tags). Версии меняют сигналы api.signals после
+коммита записи рецепта, его автора или ингредиентов.
+
+Промах собирает только один обработчик (блокировка через cache.add),
+остальные ждут его результата. Работает с любым бэкендом Django,
+в том числе locmem и file: для нескольких процессов нужен общий
+бэкенд (file), иначе у каждого процесса свой кэш и своя блокировка.
+"""
+import hashlib
+import time
+import uuid
+from urllib.parse import urlencode
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import caches
+from django.http import HttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import parse_http_date_safe
+
+from api.utils import replicas
+from recipes.models import RecipeIngredient
+
+PREFIX = 'response_cache'
+DEFAULT_TIMEOUT = 600
+LOCK_TIMEOUT = 10
+WAIT_TIMEOUT = 5
+WAIT_INTERVAL = 0.05
+STATS = ('hits', 'misses', 'waits', 'stale')
+# Заголовки, которые не переносим из сохранённого ответа
+SKIP_HEADERS = {'content-length', 'x-cache'}
+
+
+def get_cache():
+    return caches[getattr(settings, 'RESPONSE_CACHE_ALIAS', 'default')]
+
+
+def is_cacheable(request):
+    return (
+        request.method in ('GET', 'HEAD')
+        and not request.user.is_authenticated
+    )
+
+
+def make_key(request):
+    # DRF Request или HttpRequest асинхронного view
+    params = getattr(request, 'query_params', request.GET)
+    query = urlencode(sorted(
+        (name, value)
+        for name, values in params.lists()
+        for value in values if value != ''
+    ))
+    media_type = getattr(request, 'accepted_media_type', '') or ''
+    raw = '|'.join([request.path, query, media_type])
+    return f'{PREFIX}:entry:{hashlib.md5(raw.encode()).hexdigest()}'
+
+
+def _version_key(tag):
+    return f'{PREFIX}:tag:{tag}'
+
+
+def _new_version():
+    return uuid.uuid4().hex
+
+
+def tag_versions(tags):
+    """Текущие версии тегов; пропавшую (вытесненную) версию заводим заново."""
+    cache = get_cache()
+    keys = {_version_key(tag): tag for tag in tags}
+    versions = cache.get_many(keys)
+    for key in keys.keys() - versions.keys():
+        cache.add(key, _new_version(), timeout=None)
+        versions[key] = cache.get(key)
+    return {keys[key]: version for key, version in versions.items()}
+
+
+def invalidate(*tags):
+    """Делает устаревшими все ответы с любым из тегов."""
+    get_cache().set_many(
+        {_version_key(tag): _new_version() for tag in tags}, timeout=None
+    )
+
+
+def record(stat):
+    cache = get_cache()
+    key = f'{PREFIX}:stats:{stat}'
+    if not cache.add(key, 1, timeout=None):
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.set(key, 1, timeout=None)
+
+
+def stats():
+    cache = get_cache()
+    values = cache.get_many([f'{PREFIX}:stats:{stat}' for stat in STATS])
+    return {stat: values.get(f'{PREFIX}:stats:{stat}', 0) for stat in STATS}
+
+
+def reset_stats():
+    get_cache().delete_many([f'{PREFIX}:stats:{stat}' for stat in STATS])
+
+
+def _fresh(entry):
+    # Ключ записи — сам запрос, так что её теги включают теги поиска
+    return (
+        entry is not None
+        and entry['versions'] == tag_versions(entry['versions'])
+    )
+
+
+def _from_entry(request, entry):
+    """
+    Ответ из записи кэша, с учётом If-None-Match / If-Modified-Since клиента.
+    """
+    headers = entry['headers']
+    last_modified = parse_http_date_safe(headers.get('Last-Modified', ''))
+    response = get_conditional_response(
+        request, etag=headers.get('ETag'), last_modified=last_modified,
+    )
+    if response is None:
+        response = HttpResponse(entry['content'], status=entry['status'])
+    for name, value in headers.items():
+        response[name] = value
+    response['X-Cache'] = 'HIT'
+    return response
+
+
+def add_tags(request, get_tags):
+    """
+    Дополняет теги ответа, который сейчас собирает serve: get_tags()
+    вызывается только при сборке для кэша. Версии снимаются сразу, до чтения
+    данных, которые покрывают эти теги.
+    """
+    versions = getattr(request, '_response_cache_versions', None)
+    if versions is not None:
+        versions.update(tag_versions(get_tags()))
+
+
+def recipe_tags(recipe_id, author_id):
+    """
+    Теги автора и ингредиентов карточки рецепта: их правка меняет карточку,
+    но не трогает строку рецепта.
+    """
+    ingredient_ids = RecipeIngredient.objects.filter(
+        recipe_id=recipe_id
+    ).values_list('ingredient_id', flat=True)
+    return [
+        f'author:{author_id}', *(f'ingredient:{pk}' for pk in ingredient_ids)
+    ]
+
+
+def _lookup(request, tags):
+    """
+    Запись из кэша или право её собрать: (ответ, ключ, версии, владеем ли
+    блокировкой). Ответ не None — это попадание, собирать ничего не нужно.
+    """
+    cache = get_cache()
+    key = make_key(request)
+    entry = cache.get(key)
+    if _fresh(entry):
+        record('hits')
+        return _from_entry(request, entry), key, None, False
+    if entry is not None:
+        record('stale')
+
+    lock_key = f'{key}:lock'
+    owns_lock = cache.add(lock_key, 1, timeout=LOCK_TIMEOUT)
+    if not owns_lock:
+        # Ответ уже собирает другой обработчик — ждём его, а не повторяем
+        # работу
+        record('waits')
+        deadline = time.monotonic() + getattr(
+            settings, 'RESPONSE_CACHE_WAIT', WAIT_TIMEOUT
+        )
+        while time.monotonic() < deadline:
+            time.sleep(WAIT_INTERVAL)
+            entry = cache.get(key)
+            if _fresh(entry):
+                record('hits')
+                return _from_entry(request, entry), key, None, False
+            if not cache.get(lock_key):
+                break
+
+    record('misses')
+    # Версии снимаются до сборки (add_tags — до чтения своих данных): запись,
+    # изменившая данные во время сборки, сменит версию, и сохранённый ответ
+    # сразу окажется устаревшим
+    versions = request._response_cache_versions = tag_versions(tags)
+    return None, key, versions, owns_lock
+
+
+def _store(key, versions, owns_lock, rendered):
+    """
+    Сохраняет отрендеренный ответ (только 200) и снимает блокировку сборки.
+    """
+    cache = get_cache()
+    if rendered is not None and rendered.status_code == 200:
+        timeout = getattr(settings, 'RESPONSE_CACHE_TIMEOUT', DEFAULT_TIMEOUT)
+        cache.set(key, {
+            'versions': versions,
+            'status': rendered.status_code,
+            'content': rendered.content,
+            'headers': {
+                name: value for name, value in rendered.items()
+                if name.lower() not in SKIP_HEADERS
+            },
+        }, timeout=timeout)
+    if owns_lock:
+        cache.delete(f'{key}:lock')
+
+
+def serve(request, tags, build_response):
+    """
+    Отдаёт анонимный ответ из кэша или собирает его build_response()
+    и сохраняет после рендеринга. Запросы с пользователем проходят мимо.
+    """
+    if not is_cacheable(request):
+        return build_response()
+
+    response, key, versions, owns_lock = _lookup(request, tags)
+    if response is not None:
+        return response
+    try:
+        # Собранный ответ живёт до следующей инвалидации — собираем с основной
+        # базы, иначе отстающая реплика закэширует данные до записи
+        with replicas.primary():
+            response = build_response()
+    except Exception:
+        _store(key, versions, owns_lock, None)
+        raise
+    response['X-Cache'] = 'MISS'
+
+    if (
+        response.status_code != 200
+        or not hasattr(response, 'add_post_render_callback')
+    ):
+        _store(key, versions, owns_lock, None)
+        return response
+    response.add_post_render_callback(
+        lambda rendered: _store(key, versions, owns_lock, rendered)
+    )
+    return response
+
+
+async def aserve(request, tags, build_response):
+    """
+    serve для асинхронных view: build_response — корутина, возвращающая
+    готовый HttpResponse или None (тогда ничего не сохраняем и отдаём None).
+    Обращения к кэшу и ожидание чужой сборки идут в потоке запроса.
+    """
+    if not is_cacheable(request):
+        return await build_response()
+
+    response, key, versions, owns_lock = await sync_to_async(_lookup)(
+        request, tags
+    )
+    if response is not None:
+        return response
+    try:
+        with replicas.primary():
+            response = await build_response()
+    except Exception:
+        await sync_to_async(_store)(key, versions, owns_lock, None)
+        raise
+    if response is not None:
+        response['X-Cache'] = 'MISS'
+    await sync_to_async(_store)(key, versions, owns_lock, response)
+    return response
@@ -0,0 +1,119 @@
+"""
+Хранилище медиа с адресацией по содержимому.
+
+Имя файла — SHA-256 его содержимого: blobs/ab/cd/<sha256>.<ext>.
+Повторная загрузка той же картинки (фронтенд при редактировании рецепта
+присылает её заново) не создаёт новый файл, а возвращает имя уже
+существующего. Учёт файлов и ссылок на них — в api.models.MediaBlob,
+счётчики ссылок ведут сигналы api.signals, удаление — команда gc_media.
+"""
+import hashlib
+import os
+import uuid
+from collections import Counter
+
+from django.apps import apps
+from django.core.files.storage import FileSystemStorage
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.utils import timezone
+
+BLOB_DIR = 'blobs'
+TMP_DIR = 'blobs/tmp'
+
+
+def is_blob(name):
+    return (
+        bool(name) and name.startswith(f'{BLOB_DIR}/')
+        and not name.startswith(f'{TMP_DIR}/')
+    )
+
+
+class ContentAddressedStorage(FileSystemStorage):
+
+    def _save(self, name, content):
+        # Хэш считается по частям (content.chunks()), без второй копии файла в
+        # памяти
+        digest = hashlib.sha256()
+        size = 0
+        for chunk in content.chunks():
+            digest.update(chunk)
+            size += len(chunk)
+        content.seek(0)
+        sha256 = digest.hexdigest()
+        extension = os.path.splitext(name)[1].lower()
+        target = f'{BLOB_DIR}/{sha256[:2]}/{sha256[2:4]}/{sha256}{extension}'
+
+        # Сначала строка, потом файл: gc_media удаляет файл только вместе
+        # со строкой, так что файл, проверенный после регистрации, уже не
+        # пропадёт из-под свежей ссылки
+        self._register(target, sha256, size)
+        if not self.exists(target):
+            # Пишем во временный файл и атомарно переименовываем: параллельная
+            # загрузка того же содержимого перезапишет файл идентичным
+            temporary = super()._save(
+                f'{TMP_DIR}/{uuid.uuid4().hex}{extension}', content
+            )
+            os.makedirs(os.path.dirname(self.path(target)), exist_ok=True)
+            os.replace(self.path(temporary), self.path(target))
+        return target
+
+    @staticmethod
+    def _register(name, sha256, size):
+        from api.models import MediaBlob
+
+        updated = MediaBlob.objects.filter(name=name).update(
+            touched_at=timezone.now()
+        )
+        if updated:
+            return
+        try:
+            with transaction.atomic():
+                MediaBlob.objects.create(name=name, sha256=sha256, size=size)
+        except IntegrityError:
+            pass
+
+    def delete(self, name):
+        # Общие файлы удаляет только gc_media по счётчику ссылок
+        if not is_blob(name):
+            super().delete(name)
+
+    def purge(self, name):
+        """Физически удаляет файл (для gc_media)."""
+        super().delete(name)
+
+
+def change_refcounts(deltas):
+    """Прибавляет {name: delta} к счётчикам ссылок файлов хранилища."""
+    from api.models import MediaBlob
+
+    for name, delta in deltas.items():
+        if delta and is_blob(name):
+            MediaBlob.objects.filter(name=name).update(
+                refcount=F('refcount') + delta
+            )
+
+
+def recount_references(batch_size=1000, dry_run=False):
+    """
+    Пересчитывает счётчики ссылок по полям моделей (после массовых
+    операций в обход сигналов). Возвращает число исправленных файлов.
+    """
+    from api.models import MediaBlob
+    from api.utils import images
+
+    counted = Counter()
+    for label, fields in images.IMAGE_FIELDS.items():
+        rows = apps.get_model(label).objects.values_list(*fields)
+        for row in rows.iterator(chunk_size=batch_size):
+            counted.update(images.references(*row))
+
+    fixed = 0
+    blobs = MediaBlob.objects.only('pk', 'name', 'refcount')
+    for blob in blobs.iterator(chunk_size=batch_size):
+        expected = counted.get(blob.name, 0)
+        if blob.refcount != expected:
+            fixed += 1
+            if not dry_run:
+                MediaBlob.objects.filter(pk=blob.pk).update(refcount=expected)
+    return fixed
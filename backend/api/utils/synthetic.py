@@ -0,0 +1,50 @@
+"""
+Распределения для генерации синтетических данных (generate_dataset, бенчмарки).
+"""
+import math
+
+
+class Zipf:
+    """
+    Выбор индекса 0..n-1 с вероятностью ~ 1 / rank**s за O(1) времени и памяти.
+
+    Ранг берётся обратной функцией непрерывного распределения x**-s на [1,
+    n+1), поэтому таблица весов не нужна даже для десятков миллионов элементов.
+    Ранги перемешиваются умножением на взаимно простой с n шаг: популярные
+    элементы разбросаны по диапазону, а не собраны в его начале.
+    """
+
+    def __init__(self, n, s, rng):
+        if n < 1:
+            raise ValueError('Zipf: нужен хотя бы один элемент')
+        self.n, self.s, self.rng = n, s, rng
+        self._top = math.log(n + 1) if s == 1 else (n + 1) ** (1 - s) - 1
+        stride = int(n * 0.6180339887) | 1
+        while math.gcd(stride, n) != 1:
+            stride += 2
+        self._stride = stride
+
+    def rank(self):
+        """Ранг 0..n-1: 0 — самый популярный элемент."""
+        u = self.rng.random()
+        if self.s == 1:
+            x = math.exp(u * self._top)
+        else:
+            x = (u * self._top + 1) ** (1 / (1 - self.s))
+        return min(int(x), self.n) - 1
+
+    def __call__(self):
+        return self.rank() * self._stride % self.n
+
+    def sample(self, k, exclude=()):
+        """
+        До k различных индексов (меньше, если их не набралось за 4k попыток).
+        """
+        chosen = set()
+        for _ in range(4 * k):
+            if len(chosen) >= k:
+                break
+            index = self()
+            if index not in exclude:
+                chosen.add(index)
+        return chosen
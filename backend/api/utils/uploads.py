@@ -0,0 +1,129 @@
+"""
+Загрузка изображений без base64: multipart/form-data сразу во временный
+файл и загрузка по частям (ChunkedUpload) со ссылкой "upload:<id>".
+"""
+import os
+import tempfile
+import uuid
+
+from django.conf import settings
+from django.core.files import File
+from django.core.files.uploadhandler import TemporaryFileUploadHandler
+from django.db import transaction
+
+UPLOAD_REFERENCE_PREFIX = 'upload:'
+DEFAULT_MAX_SIZE = 10 * 1024 * 1024
+READ_CHUNK_SIZE = 64 * 1024
+
+
+class TemporaryFileUploadMixin:
+    """
+    Файлы из multipart/form-data пишутся на диск по мере чтения тела запроса, а
+    не копятся в памяти (по умолчанию Django держит в памяти файлы до 2,5 МБ).
+    """
+
+    def initialize_request(self, request, *args, **kwargs):
+        request.upload_handlers = [TemporaryFileUploadHandler(request)]
+        return super().initialize_request(request, *args, **kwargs)
+
+
+def max_size():
+    return getattr(settings, 'MAX_IMAGE_UPLOAD_SIZE', DEFAULT_MAX_SIZE)
+
+
+def upload_dir():
+    directory = getattr(
+        settings, 'CHUNKED_UPLOAD_DIR',
+        os.path.join(
+            settings.FILE_UPLOAD_TEMP_DIR or tempfile.gettempdir(),
+            'foodgram-uploads',
+        ),
+    )
+    os.makedirs(directory, exist_ok=True)
+    return directory
+
+
+def part_path(upload):
+    return os.path.join(upload_dir(), f'{upload.pk}.part')
+
+
+class ChunkTooLarge(ValueError):
+    pass
+
+
+class PartMissing(FileNotFoundError):
+    """Файла с уже полученными частями нет (почищен или другой диск)."""
+
+
+def append_chunk(upload, stream):
+    """
+    Дописывает тело запроса в файл загрузки с upload.offset, читая его
+    по частям. Возвращает число записанных байт; при превышении
+    заявленного размера часть отбрасывается целиком. Если файла с
+    полученными ранее частями нет, бросает PartMissing.
+    """
+    remaining = upload.size - upload.offset
+    written = 0
+    try:
+        target = open(part_path(upload), 'r+b' if upload.offset else 'wb')
+    except FileNotFoundError:
+        if not upload.offset:
+            raise
+        raise PartMissing(part_path(upload))
+    with target:
+        target.seek(upload.offset)
+        target.truncate()
+        while stream is not None:
+            chunk = stream.read(READ_CHUNK_SIZE)
+            if not chunk:
+                break
+            written += len(chunk)
+            if written > remaining:
+                target.seek(upload.offset)
+                target.truncate()
+                raise ChunkTooLarge(remaining)
+            target.write(chunk)
+    return written
+
+
+def find_upload(reference, user):
+    """Завершённая загрузка пользователя по ссылке "upload:<id>" или None."""
+    from api.models import ChunkedUpload
+
+    try:
+        upload_id = uuid.UUID(reference[len(UPLOAD_REFERENCE_PREFIX):])
+    except ValueError:
+        return None
+    upload = ChunkedUpload.objects.filter(pk=upload_id, user=user).first()
+    if upload is None or not upload.complete:
+        return None
+    return upload
+
+
+class UploadPartFile(File):
+    """
+    Файл загрузки; temporary_file_path позволяет Django и Pillow читать его с
+    диска.
+    """
+
+    def temporary_file_path(self):
+        return self.file.name
+
+
+def open_upload(upload):
+    return UploadPartFile(open(part_path(upload), 'rb'), name=upload.filename)
+
+
+def consume(upload):
+    """
+    Загрузка использована: удаляем её после коммита (при откате её можно
+    сослать снова).
+    """
+    transaction.on_commit(upload.delete)
+
+
+def remove_part(upload):
+    try:
+        os.remove(part_path(upload))
+    except FileNotFoundError:
+        pass
@@ -1,14 +1,35 @@
-from django.db.models import Sum
-from django.http import HttpResponse
+from django.db import IntegrityError, transaction
+from django.db.models import (
+    Count,
+    Exists,
+    Max,
+    OuterRef,
+    Prefetch,
+    Value,
+    BooleanField,
+)
+from django.conf import settings
+from django.http import (
+    Http404,
+    HttpResponse,
+    HttpResponseForbidden,
+    HttpResponseNotModified,
+    StreamingHttpResponse,
+)
+from django.utils.crypto import constant_time_compare
+from django.utils.http import parse_etags
 from django.urls import reverse
-from rest_framework import viewsets, permissions, status, generics
+from rest_framework import viewsets, permissions, status, generics, mixins
 from rest_framework.decorators import action
+from rest_framework.renderers import JSONRenderer
 from rest_framework.response import Response
-from rest_framework.pagination import PageNumberPagination
 from django_filters.rest_framework import DjangoFilterBackend
 from djoser.views import UserViewSet
 
-from recipes.models import Ingredient, Recipe, ShoppingCart, Favorite, RecipeIngredient
+from recipes import ingredient_index
+from recipes.ingredient_search import search_ingredients
+from recipes import shopping_list, similar_recipes
+from recipes.models import Ingredient, Recipe, ShoppingCart, Favorite
 from users.models import CustomUser, Follow
 from users.serializers import (
     UserSerializer,
@@ -23,14 +44,91 @@ from recipes.serializers import (
     RecipeFavoriteSerializer,
     FavoriteSerializer,
     ShoppingCartSerializer,
+    SimilarRecipeSerializer,
 )
 
+from api.models import ChunkedUpload
+from api.serializers import ChunkedUploadSerializer
+from api.utils import metrics, response_cache, uploads
 from api.utils.permissions import OwnerOrReadOnly
+from api.utils.conditional import conditional_response, viewer_parts
 from api.utils.filters import RecipeFilter
+from api.utils.pagination import (
+    FeedPagination,
+    LimitPageNumberPagination,
+    RecipeKeysetPagination,
+)
+from api.utils.params import get_positive_int
+from api.utils.renderers import CSVRenderer, PDFRenderer, PlainTextRenderer
+
+
+def _latest(*stamps):
+    return max((stamp for stamp in stamps if stamp is not None), default=None)
+
+
+def _create_unique(model, **fields):
+    """
+    Создаёт связь, если её ещё нет. Гонку двух одинаковых запросов решает
+    уникальный индекс: проигравший получает False, а не 500.
+    """
+    if model.objects.filter(**fields).exists():
+        return False
+    try:
+        with transaction.atomic():
+            model.objects.create(**fields)
+    except IntegrityError:
+        return False
+    return True
+
+
+@transaction.atomic
+def _delete_locked(model, **fields):
+    """
+    Удаляет связь под блокировкой строки: параллельное удаление той же
+    связи дождётся нас и ничего не найдёт, поэтому сигналы (и счётчики)
+    срабатывают ровно один раз.
+    """
+    objs = list(model.objects.select_for_update().filter(**fields))
+    for obj in objs:
+        obj.delete()
+    return bool(objs)
 
 
-class AvatarUpdateView(generics.UpdateAPIView):
-    """Обновление аватара текущего пользователя."""
+def annotate_for_reading(qs, user):
+    """
+    Готовит queryset для RecipeGetSerializer так, чтобы число запросов
+    не зависело от размера страницы: флаги пользователя user
+    считаются подзапросами Exists, автор и ингредиенты подгружаются заранее.
+    """
+    qs = qs.select_related('author').prefetch_related(
+        'ingredient_quantities__ingredient'
+    )
+    if not user.is_authenticated:
+        false = Value(False, output_field=BooleanField())
+        return qs.annotate(
+            is_favorited=false,
+            is_in_shopping_cart=false,
+            author_is_subscribed=false,
+        )
+    return qs.annotate(
+        is_favorited=Exists(
+            Favorite.objects.filter(user=user, recipe=OuterRef('pk'))
+        ),
+        is_in_shopping_cart=Exists(
+            ShoppingCart.objects.filter(user=user, recipe=OuterRef('pk'))
+        ),
+        author_is_subscribed=Exists(
+            Follow.objects.filter(subscriber=user, author=OuterRef('author'))
+        ),
+    )
+
+
+class AvatarUpdateView(uploads.TemporaryFileUploadMixin,
+                       generics.UpdateAPIView):
+    """
+    Обновление аватара текущего пользователя (base64, multipart или
+    upload:<id>).
+    """
     serializer_class = AvatarSerializer
     permission_classes = (permissions.IsAuthenticated,)
 
@@ -38,8 +136,83 @@ class AvatarUpdateView(generics.UpdateAPIView):
         return self.request.user
 
 
+class ChunkedUploadViewSet(mixins.CreateModelMixin,
+                           mixins.RetrieveModelMixin,
+                           mixins.DestroyModelMixin,
+                           viewsets.GenericViewSet):
+    """
+    Загрузка изображения по частям.
+
+    POST {"filename", "size"} создаёт загрузку; PATCH с заголовком
+    Upload-Offset и сырыми байтами в теле дописывает очередную часть;
+    GET показывает, сколько уже получено (для продолжения после обрыва).
+    Завершённую загрузку передают в image/avatar как "upload:<id>".
+    """
+    serializer_class = ChunkedUploadSerializer
+    permission_classes = (permissions.IsAuthenticated,)
+
+    def get_queryset(self):
+        return ChunkedUpload.objects.filter(user=self.request.user)
+
+    def perform_create(self, serializer):
+        serializer.save(user=self.request.user)
+
+    @transaction.atomic
+    def partial_update(self, request, *args, **kwargs):
+        upload = self.get_object()
+        # Части одной загрузки дописываются строго по очереди
+        upload = ChunkedUpload.objects.select_for_update().get(pk=upload.pk)
+        try:
+            offset = int(request.headers['Upload-Offset'])
+        except (KeyError, ValueError):
+            return Response(
+                {'detail': 'Нужен заголовок Upload-Offset.'},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        if offset != upload.offset:
+            response = Response(
+                {
+                    'detail': 'Смещение не совпадает с полученными данными.',
+                    'offset': upload.offset,
+                },
+                status=status.HTTP_409_CONFLICT,
+            )
+            response['Upload-Offset'] = upload.offset
+            return response
+        try:
+            # Тело читается из потока по частям, без request.data и парсеров
+            # DRF
+            upload.offset += uploads.append_chunk(upload, request.stream)
+        except uploads.ChunkTooLarge as error:
+            return Response(
+                {'detail': f'Часть больше оставшихся {error.args[0]} байт.'},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        except uploads.PartMissing:
+            # Полученные части потеряны — загрузка начинается заново с нуля
+            upload.offset = 0
+            upload.save(update_fields=['offset'])
+            response = Response(
+                {
+                    'detail': 'Полученные части потеряны, начните загрузку '
+                              'заново.',
+                    'offset': 0,
+                },
+                status=status.HTTP_409_CONFLICT,
+            )
+            response['Upload-Offset'] = 0
+            return response
+        upload.save(update_fields=['offset'])
+        response = Response(self.get_serializer(upload).data)
+        response['Upload-Offset'] = upload.offset
+        return response
+
+
 class IngredientViewSet(viewsets.ReadOnlyModelViewSet):
-    """Отдаёт список ингредиентов с опциональным поиском по началу названия."""
+    """
+    Отдаёт список ингредиентов: ?name= — поиск по началу названия,
+    ?search= — ранжированный поиск с подстрокой и опечатками.
+    """
     serializer_class = IngredientSerializer
     permission_classes = (permissions.AllowAny,)
     pagination_class = None  # Отключаем пагинацию
@@ -51,14 +224,104 @@ class IngredientViewSet(viewsets.ReadOnlyModelViewSet):
             qs = qs.filter(name__istartswith=query)
         return qs
 
+    def list(self, request, *args, **kwargs):
+        limit = get_positive_int(request, 'limit')
+        search = request.query_params.get("search", "").strip()
+        if search:
+            # Ранжированный поиск: начало названия, подстрока, нечёткие
+            # совпадения
+            return Response(search_ingredients(search, limit))
+        # Автодополнение обслуживается из префиксного индекса в памяти, без БД
+        query = request.query_params.get("name", "").strip()
+        return Response(ingredient_index.search(query, limit))
 
-class RecipeViewSet(viewsets.ModelViewSet):
+
+class RecipeViewSet(uploads.TemporaryFileUploadMixin, viewsets.ModelViewSet):
     """CRUD для рецептов с фильтрацией и дополнительными действиями."""
     queryset = Recipe.objects.all()
     permission_classes = (OwnerOrReadOnly, permissions.IsAuthenticatedOrReadOnly)
     filter_backends = (DjangoFilterBackend,)
     filterset_class = RecipeFilter
-    pagination_class = PageNumberPagination
+    pagination_class = LimitPageNumberPagination
+
+    @property
+    def paginator(self):
+        # Курсорная пагинация — по запросу клиента (?pagination=cursor /
+        # ?cursor=)
+        if (
+            not hasattr(self, '_paginator')
+            and RecipeKeysetPagination.is_requested(self.request)
+        ):
+            self._paginator = RecipeKeysetPagination()
+        return super().paginator
+
+    def list(self, request, *args, **kwargs):
+        return response_cache.serve(
+            request, ['recipes'],
+            lambda: self._conditional_list(request, *args, **kwargs)
+        )
+
+    def _conditional_list(self, request, *args, **kwargs):
+        # Валидаторы считаются одним агрегатом по отфильтрованной выборке,
+        # до пагинации и сериализации
+        recipes = self.filter_queryset(Recipe.objects.all())
+        stats = recipes.order_by().aggregate(
+            total=Count('pk'),
+            updated=Max('updated_at'),
+            authors_updated=Max('author__updated_at'),
+        )
+        viewer, _ = viewer_parts(request.user)
+        parts = [
+            'recipes', sorted(request.query_params.lists()),
+            stats['total'], stats['updated'], stats['authors_updated'],
+            *viewer,
+        ]
+        # Только ETag: удаление рецепта или выход его из выборки меняет
+        # число строк, но не максимум дат — Last-Modified дал бы ложный 304
+        return conditional_response(
+            request, parts, None,
+            lambda: super(RecipeViewSet, self).list(request, *args, **kwargs)
+        )
+
+    def retrieve(self, request, *args, **kwargs):
+        try:
+            tags = [f"recipe:{int(kwargs['pk'])}"]
+        except ValueError:
+            return super().retrieve(request, *args, **kwargs)
+        return response_cache.serve(
+            request, tags,
+            lambda: self._conditional_retrieve(request, *args, **kwargs)
+        )
+
+    def _conditional_retrieve(self, request, *args, **kwargs):
+        try:
+            row = (
+                Recipe.objects.filter(pk=int(kwargs['pk'])).values_list(
+                    'author_id', 'updated_at', 'author__updated_at'
+                ).first()
+            )
+        except ValueError:
+            row = None
+        if row is None:
+            return super().retrieve(request, *args, **kwargs)
+        author_id, *stamps = row
+        response_cache.add_tags(request, lambda: response_cache.recipe_tags(
+            kwargs['pk'], author_id
+        ))
+        viewer, viewer_modified = viewer_parts(request.user)
+        parts = ['recipe', kwargs['pk'], *stamps, *viewer]
+        return conditional_response(
+            request, parts, _latest(*stamps, viewer_modified),
+            lambda: super(RecipeViewSet, self).retrieve(
+                request, *args, **kwargs
+            )
+        )
+
+    def get_queryset(self):
+        qs = super().get_queryset()
+        if self.request.method not in permissions.SAFE_METHODS:
+            return qs
+        return annotate_for_reading(qs, self.request.user)
 
     def get_serializer_class(self):
         if self.request.method in permissions.SAFE_METHODS:
@@ -75,14 +338,12 @@ class RecipeViewSet(viewsets.ModelViewSet):
             return Response({"detail": "Рецепт не найден"}, status=status.HTTP_404_NOT_FOUND)
 
         if request.method == "POST":
-            if model.objects.filter(user=request.user, recipe=recipe).exists():
+            if not _create_unique(model, user=request.user, recipe=recipe):
                 return Response({"detail": "Рецепт уже добавлен"}, status=status.HTTP_400_BAD_REQUEST)
-            model.objects.create(user=request.user, recipe=recipe)
             data = return_serializer(recipe, context={"request": request}).data
             return Response(data, status=status.HTTP_201_CREATED)
 
-        deleted, _ = model.objects.filter(user=request.user, recipe=recipe).delete()
-        if not deleted:
+        if not _delete_locked(model, user=request.user, recipe=recipe):
             return Response({"detail": "Рецепт отсутствует"}, status=status.HTTP_400_BAD_REQUEST)
         return Response(status=status.HTTP_204_NO_CONTENT)
 
@@ -94,24 +355,43 @@ class RecipeViewSet(viewsets.ModelViewSet):
     def shopping_cart(self, request, pk=None):
         return self._modify_relation(request, pk, ShoppingCart, ShoppingCartSerializer, RecipeFavoriteSerializer)
 
-    @action(detail=False, methods=["get"], permission_classes=[permissions.IsAuthenticated])
+    @action(
+        detail=False,
+        methods=["get"],
+        permission_classes=[permissions.IsAuthenticated],
+        renderer_classes=[
+            PlainTextRenderer, CSVRenderer, JSONRenderer, PDFRenderer,
+        ],
+    )
     def download_shopping_cart(self, request):
-        """Генерирует и отдаёт список ингредиентов из корзины с суммарными количествами."""
-        recipe_ids = request.user.cart_items.values_list('recipe_id', flat=True)
-        ingredients = (
-            RecipeIngredient.objects.filter(recipe_id__in=recipe_ids)
-            .values('ingredient__name', 'ingredient__measurement_unit')
-            .annotate(total_amount=Sum('amount'))
-            .order_by('ingredient__name')
-        )
-
-        lines = [
-            f"{item['ingredient__name']} ({item['ingredient__measurement_unit']}) - {item['total_amount']}"
-            for item in ingredients
-        ]
-        content = "Список покупок:\n\n" + "\n".join(lines)
-        response = HttpResponse(content, content_type='text/plain')
-        response['Content-Disposition'] = 'attachment; filename="shopping_list.txt"'
+        """
+        Отдаёт потоком список ингредиентов из корзины с суммарными
+        количествами. Формат — ?format=txt|csv|json|pdf (или Accept), по
+        умолчанию txt. ETag строится из версии корзины, поэтому повторная
+        выгрузка неизменившейся корзины получает 304 без агрегации.
+        """
+        renderer = request.accepted_renderer
+        fmt = renderer.format
+        user = request.user
+        etag = f'"cart-{user.pk}-{user.cart_version}-{fmt}"'
+        cache_headers = {'ETag': etag, 'Cache-Control': 'private, no-cache'}
+
+        if_none_match = request.headers.get('If-None-Match')
+        if if_none_match and etag in parse_etags(if_none_match):
+            return HttpResponseNotModified(headers=cache_headers)
+
+        render, extension = shopping_list.FORMATS[fmt]
+        response = StreamingHttpResponse(
+            render(shopping_list.cart_ingredients(user)),
+            content_type=(
+                f'{renderer.media_type}; charset={renderer.charset}'
+                if renderer.charset else renderer.media_type
+            ),
+            headers=cache_headers,
+        )
+        response['Content-Disposition'] = (
+            f'attachment; filename="shopping_list.{extension}"'
+        )
         return response
 
     @action(
@@ -127,12 +407,73 @@ class RecipeViewSet(viewsets.ModelViewSet):
         )
         return Response({"link": url}, status=status.HTTP_200_OK)
 
+    @action(
+        detail=True,
+        methods=["get"],
+        permission_classes=[permissions.AllowAny],
+    )
+    def similar(self, request, pk=None):
+        """
+        Похожие по составу рецепты: заранее посчитанные соседи (см.
+        recipes.similar_recipes).
+        """
+        if not pk.isdigit():
+            raise Http404
+        recipes = list(similar_recipes.similar_to(pk))
+        # Проверка существования — только когда соседей нет
+        if not recipes and not Recipe.objects.filter(pk=pk).exists():
+            raise Http404
+        serializer = SimilarRecipeSerializer(
+            recipes, many=True, context={'request': request}
+        )
+        return Response(serializer.data)
+
+    @action(
+        detail=False,
+        methods=["get"],
+        permission_classes=[permissions.IsAuthenticated],
+    )
+    def feed(self, request):
+        """
+        Лента подписок: рецепты авторов, на которых подписан пользователь (см.
+        recipes.feed).
+        """
+        paginator = FeedPagination()
+        page = paginator.paginate_queryset(
+            self.get_queryset(), request, view=self
+        )
+        serializer = RecipeGetSerializer(
+            page, many=True, context=self.get_serializer_context()
+        )
+        return paginator.get_paginated_response(serializer.data)
+
 
 class CustomUserViewSet(UserViewSet):
     """Пользовательский ViewSet с поддержкой подписок."""
     queryset = CustomUser.objects.all()
     serializer_class = UserSerializer
     permission_classes = [permissions.AllowAny]
+    pagination_class = LimitPageNumberPagination
+
+    def retrieve(self, request, *args, **kwargs):
+        try:
+            updated_at = (
+                CustomUser.objects.filter(pk=int(kwargs['id']))
+                .values_list('updated_at', flat=True).first()
+            )
+        except (KeyError, ValueError):
+            # /users/me/ (djoser) приходит сюда без id в URL
+            updated_at = None
+        if updated_at is None:
+            return super().retrieve(request, *args, **kwargs)
+        viewer, viewer_modified = viewer_parts(request.user)
+        return conditional_response(
+            request, ['user', kwargs['id'], updated_at, *viewer],
+            _latest(updated_at, viewer_modified),
+            lambda: super(CustomUserViewSet, self).retrieve(
+                request, *args, **kwargs
+            )
+        )
 
     def _handle_subscription(self, request, author_id):
         author = CustomUser.objects.filter(pk=author_id).first()
@@ -142,14 +483,25 @@ class CustomUserViewSet(UserViewSet):
         if request.method == "POST":
             if request.user == author:
                 return Response({"detail": "Нельзя подписаться на себя"}, status=status.HTTP_400_BAD_REQUEST)
-            if Follow.objects.filter(subscriber=request.user, author=author).exists():
-                return Response({"detail": "Уже подписаны"}, status=status.HTTP_400_BAD_REQUEST)
-            Follow.objects.create(subscriber=request.user, author=author)
-            data = FollowReadSerializer(author, context={"request": request}).data
+            if not _create_unique(
+                Follow, subscriber=request.user, author=author
+            ):
+                return Response(
+                    {"detail": "Уже подписаны"},
+                    status=status.HTTP_400_BAD_REQUEST,
+                )
+            data = FollowReadSerializer(
+                author,
+                context={
+                    "request": request,
+                    "recipes_limit": get_positive_int(
+                        request, 'recipes_limit'
+                    ),
+                }
+            ).data
             return Response(data, status=status.HTTP_201_CREATED)
 
-        deleted, _ = Follow.objects.filter(subscriber=request.user, author=author).delete()
-        if not deleted:
+        if not _delete_locked(Follow, subscriber=request.user, author=author):
             return Response({"detail": "Подписка отсутствует"}, status=status.HTTP_400_BAD_REQUEST)
         return Response(status=status.HTTP_204_NO_CONTENT)
 
@@ -159,13 +511,45 @@ class CustomUserViewSet(UserViewSet):
 
     @action(detail=False, methods=["get"], permission_classes=[permissions.IsAuthenticated])
     def subscriptions(self, request):
-        authors = CustomUser.objects.filter(subscribers__subscriber=request.user)
+        recipes_limit = get_positive_int(request, 'recipes_limit')
+        recipes = Recipe.objects.only(
+            'id', 'name', 'image', 'image_variants', 'cooking_time', 'author'
+        )
+        if recipes_limit:
+            # Срез внутри Prefetch Django превращает в ROW_NUMBER() OVER
+            # (PARTITION BY author_id), так что лимит применяется в SQL.
+            recipes = recipes[:recipes_limit]
+        authors = (
+            CustomUser.objects.filter(subscribers__subscriber=request.user)
+            .annotate(is_subscribed=Value(True, output_field=BooleanField()))
+            .prefetch_related(Prefetch(
+                'recipes', queryset=recipes, to_attr='recipe_previews'
+            ))
+            .order_by('username')
+        )
         page = self.paginate_queryset(authors)
 
-        recipes_limit = request.query_params.get('recipes_limit')
         serializer = FollowReadSerializer(
             page,
             many=True,
             context={"request": request, "recipes_limit": recipes_limit}
         )
         return self.get_paginated_response(serializer.data)
+
+
+def metrics_view(request):
+    """
+    Агрегаты запросов всех процессов в текстовом формате Prometheus. Включается
+    METRICS_ENABLED; с METRICS_TOKEN требует Authorization: Bearer <токен>.
+    """
+    if not getattr(settings, 'METRICS_ENABLED', False):
+        raise Http404
+    token = getattr(settings, 'METRICS_TOKEN', '')
+    if token and not constant_time_compare(
+        request.headers.get('Authorization', ''), f'Bearer {token}'
+    ):
+        return HttpResponseForbidden()
+    return HttpResponse(
+        metrics.render(metrics.collect()),
+        content_type='text/plain; version=0.0.4; charset=utf-8',
+    )
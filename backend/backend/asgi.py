@@ -12,5 +12,7 @@ import os
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'backend.settings')
+# Под ASGI горячие GET-эндпоинты обслуживает api.async_views
+os.environ.setdefault('ASYNC_READ_PATH', 'true')
 
 application = get_asgi_application()
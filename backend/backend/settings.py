@@ -36,6 +36,7 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
     'rest_framework',
     'rest_framework.authtoken',
     'djoser',
@@ -46,11 +47,14 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'api.middleware.RequestMetricsMiddleware',
+    'api.middleware.ReplicaRoutingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'api.middleware.RequestProfilerMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -89,6 +93,98 @@ DATABASES = {
     }
 }
 
+# Локальный запуск тестов без PostgreSQL: DB_ENGINE=sqlite python manage.py test
+if os.getenv('DB_ENGINE') == 'sqlite':
+    DATABASES['default'] = {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': BASE_DIR / 'db.sqlite3',
+    }
+
+# Реплики только для чтения (api.utils.replicas): DB_REPLICA_HOSTS=host[:port],...
+# добавляет алиасы replica1..N с остальными настройками default. Без реплик
+# replica1 — тот же сервер, что default (нужен тестам маршрутизации), и
+# чтения с него не идут. Закрепление клиента после записи — REPLICA_PIN_SECONDS
+# (хранится в кэше: с репликами нужен общий кэш, CACHE_BACKEND=file),
+# реплика, отстающая больше REPLICA_MAX_LAG секунд, исключается
+REPLICA_HOSTS = [host.strip() for host in os.getenv('DB_REPLICA_HOSTS', '').split(',') if host.strip()]
+for index, address in enumerate(REPLICA_HOSTS, start=1):
+    host, _, port = address.partition(':')
+    DATABASES[f'replica{index}'] = {
+        **DATABASES['default'],
+        'HOST': host,
+        'PORT': port or DATABASES['default']['PORT'],
+        'TEST': {'MIRROR': 'default'},
+    }
+if not REPLICA_HOSTS:
+    DATABASES['replica1'] = {**DATABASES['default'], 'TEST': {'MIRROR': 'default'}}
+READ_REPLICAS = [f'replica{index}' for index in range(1, len(REPLICA_HOSTS) + 1)]
+DATABASE_ROUTERS = ['api.utils.replicas.ReplicaRouter']
+REPLICA_PIN_SECONDS = int(os.getenv('REPLICA_PIN_SECONDS', 5))
+REPLICA_MAX_LAG = float(os.getenv('REPLICA_MAX_LAG', 10))
+REPLICA_CHECK_INTERVAL = 5
+
+# Кэш: по умолчанию в памяти процесса; CACHE_BACKEND=file — общий для
+# всех воркеров каталог (кэш ответов и его блокировки видны всем процессам)
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'foodgram',
+    }
+}
+if os.getenv('CACHE_BACKEND') == 'file':
+    CACHES['default'] = {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.getenv('CACHE_LOCATION', BASE_DIR / 'cache'),
+    }
+
+# Кэш анонимных ответов рецептов (api.utils.response_cache), секунды
+RESPONSE_CACHE_TIMEOUT = int(os.getenv('RESPONSE_CACHE_TIMEOUT', 600))
+
+# Варианты загруженных изображений (api.utils.images): ширины уменьшенных
+# копий и фоновая обработка после коммита (False — сразу, в том же потоке)
+IMAGE_VARIANT_WIDTHS = (320, 640)
+IMAGE_VARIANTS_ASYNC = os.getenv('IMAGE_VARIANTS_ASYNC', 'true').lower() != 'false'
+IMAGE_WORKERS = int(os.getenv('IMAGE_WORKERS', 2))
+# Предельный размер изображения в загрузке по частям (/api/uploads/), байт
+MAX_IMAGE_UPLOAD_SIZE = 10 * 1024 * 1024
+
+# Лента подписок (recipes.feed): рецепт автора, у которого не больше
+# FEED_FANOUT_MAX_FOLLOWERS подписчиков, раскладывается по их лентам при
+# публикации, рецепты более популярных авторов подмешиваются при чтении.
+# Подписка добавляет в ленту FEED_BACKFILL последних рецептов автора.
+# Раскладка, заполнение и чистка — в фоне после коммита (False — сразу)
+FEED_FANOUT_MAX_FOLLOWERS = int(os.getenv('FEED_FANOUT_MAX_FOLLOWERS', 1000))
+FEED_BACKFILL = int(os.getenv('FEED_BACKFILL', 50))
+FEED_ASYNC = os.getenv('FEED_ASYNC', 'true').lower() != 'false'
+
+# Обновление похожих рецептов (recipes.similar_recipes) после смены состава —
+# в фоне после коммита (False — сразу, в том же потоке)
+SIMILAR_RECIPES_ASYNC = os.getenv('SIMILAR_RECIPES_ASYNC', 'true').lower() != 'false'
+
+# Замер фаз запроса (api.utils.metrics): заголовок Server-Timing и
+# агрегаты по маршрутам в Prometheus-формате на /api/_metrics (по умолчанию
+# выключен; METRICS_TOKEN — Bearer-токен для сборщика). Каждый процесс пишет
+# свои агрегаты в METRICS_DIR раз в METRICS_FLUSH_INTERVAL секунд
+SERVER_TIMING = os.getenv('SERVER_TIMING', 'true').lower() != 'false'
+METRICS_ENABLED = os.getenv('METRICS_ENABLED', 'false').lower() == 'true'
+METRICS_TOKEN = os.getenv('METRICS_TOKEN', '')
+METRICS_DIR = os.getenv('METRICS_DIR', BASE_DIR / 'metrics')
+METRICS_FLUSH_INTERVAL = 1
+
+# Профили запросов (api.utils.profiling): сотрудник включает cProfile
+# заголовком X-Profile: 1 или ?_profile=1; при PROFILE_SLOW_MS > 0 доля
+# PROFILE_SAMPLE_RATE запросов семплируется, и медленнее порога сохраняются.
+# В PROFILE_DIR хранятся последние PROFILE_KEEP профилей
+PROFILE_DIR = os.getenv('PROFILE_DIR', BASE_DIR / 'profiles')
+PROFILE_KEEP = int(os.getenv('PROFILE_KEEP', 200))
+PROFILE_SLOW_MS = float(os.getenv('PROFILE_SLOW_MS', 0))
+PROFILE_SAMPLE_RATE = float(os.getenv('PROFILE_SAMPLE_RATE', 1))
+PROFILE_SAMPLE_INTERVAL = 0.005
+
+# Асинхронный путь чтения горячих эндпоинтов (api.async_views): включает
+# backend/asgi.py, под WSGI маршруты остаются синхронными
+ASYNC_READ_PATH = os.getenv('ASYNC_READ_PATH', 'false').lower() == 'true'
+
 # Password validation
 # https://docs.djangoproject.com/en/3.2/ref/settings/#auth-password-validators
 
@@ -128,6 +224,17 @@ STATIC_ROOT = '/app/static'  # Абсолютный путь в контейне
 MEDIA_URL = '/media/'
 MEDIA_ROOT = '/app/media'    # Абсолютный путь в контейнере
 
+# Загрузки хранятся по хэшу содержимого, одинаковые файлы не дублируются
+# (api.utils.storage); неиспользуемые удаляет manage.py gc_media
+STORAGES = {
+    'default': {
+        'BACKEND': 'api.utils.storage.ContentAddressedStorage',
+    },
+    'staticfiles': {
+        'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage',
+    },
+}
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/3.2/ref/settings/#default-auto-field
 
@@ -145,7 +252,7 @@ REST_FRAMEWORK = {
     ],
 
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework.authentication.TokenAuthentication',
+        'api.utils.metrics.TimedTokenAuthentication',
     ],
 
     'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
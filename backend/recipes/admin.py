@@ -1,6 +1,10 @@
 from django.contrib import admin
 from users.models import Follow
-from .models import Ingredient, Recipe, RecipeIngredient, Favorite, ShoppingCart
+from . import similar_recipes
+from .models import (
+    Ingredient, Recipe, RecipeIngredient, Favorite, ShoppingCart,
+    ShoppingListItem,
+)
 
 
 @admin.register(Ingredient)
@@ -13,14 +17,10 @@ class IngredientAdmin(admin.ModelAdmin):
 @admin.register(Recipe)
 class RecipeAdmin(admin.ModelAdmin):
     """Админка для рецептов с отображением количества добавлений в избранное."""
-    list_display = ['id', 'name', 'author', 'favorites_total']
+    list_display = ['id', 'name', 'author', 'favorites_count']
+    list_select_related = ['author']
     search_fields = ['name', 'author__username']
-    readonly_fields = ['favorites_total']
-
-    def favorites_total(self, obj):
-        # Подсчитываем количество добавлений рецепта в избранное
-        return obj.favorited_by.count()
-    favorites_total.short_description = 'В избранном раз'
+    readonly_fields = ['favorites_count']
 
 
 @admin.register(RecipeIngredient)
@@ -29,6 +29,21 @@ class RecipeIngredientAdmin(admin.ModelAdmin):
     list_display = ['id', 'recipe', 'ingredient', 'amount']
     list_select_related = ['recipe', 'ingredient']
 
+    # Состав рецепта изменился — соседи по составу пересчитываются после
+    # коммита
+    def save_model(self, request, obj, form, change):
+        super().save_model(request, obj, form, change)
+        similar_recipes.schedule_refresh([obj.recipe_id])
+
+    def delete_model(self, request, obj):
+        super().delete_model(request, obj)
+        similar_recipes.schedule_refresh([obj.recipe_id])
+
+    def delete_queryset(self, request, queryset):
+        recipe_ids = list(queryset.values_list('recipe_id', flat=True))
+        super().delete_queryset(request, queryset)
+        similar_recipes.schedule_refresh(recipe_ids)
+
 
 @admin.register(Favorite)
 class FavoriteAdmin(admin.ModelAdmin):
@@ -46,6 +61,20 @@ class ShoppingCartAdmin(admin.ModelAdmin):
     list_select_related = ['user', 'recipe']
 
 
+@admin.register(ShoppingListItem)
+class ShoppingListItemAdmin(admin.ModelAdmin):
+    """Админка материализованного списка покупок (только просмотр)."""
+    list_display = ['user', 'ingredient', 'total_amount']
+    search_fields = ['user__username', 'ingredient__name']
+    list_select_related = ['user', 'ingredient']
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+
 @admin.register(Follow)
 class FollowAdmin(admin.ModelAdmin):
     """Админка для подписок с отображением дат создания."""
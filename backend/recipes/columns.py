@@ -0,0 +1,35 @@
+"""
+Столбцы, которые ведёт сам PostgreSQL и которых нет в состоянии моделей
+(recipes_recipe.search_vector — миграция 0010, ingredient_ids — 0011):
+Django не передаёт их в INSERT/UPDATE и не читает в обычных выборках,
+а в запросах на них ссылается TableColumn.
+"""
+from django.db.models import Expression
+
+
+class TableColumn(Expression):
+    """
+    Столбец базовой таблицы запроса; алиас таблицы определяется при разборе
+    запроса.
+    """
+
+    def __init__(self, column, output_field, alias=None):
+        super().__init__(output_field=output_field)
+        self.column = column
+        self.alias = alias
+
+    def _with_alias(self, alias):
+        clone = self.copy()
+        clone.alias = alias
+        return clone
+
+    def resolve_expression(self, query=None, allow_joins=True, reuse=None,
+                           summarize=False, for_save=False):
+        return self._with_alias(query.get_initial_alias())
+
+    def relabeled_clone(self, change_map):
+        return self._with_alias(change_map.get(self.alias, self.alias))
+
+    def as_sql(self, compiler, connection):
+        table = compiler.quote_name_unless_alias(self.alias)
+        return f'{table}.{connection.ops.quote_name(self.column)}', []
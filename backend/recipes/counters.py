@@ -0,0 +1,56 @@
+"""
+Денормализованные счётчики: Recipe.favorites_count, CustomUser.recipes_count
+и CustomUser.followers_count.
+
+Сигналы меняют их атомарным UPDATE ... SET x = x ± 1 в той же транзакции,
+что и вставку/удаление строки. Команда recount_counters сверяет их с
+COUNT(*) и исправляет расхождения пачками.
+"""
+import logging
+
+from django.db.models import Count, F, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+from recipes.models import Favorite, Recipe
+from users.models import CustomUser, Follow
+
+logger = logging.getLogger(__name__)
+
+
+def change(model, pk, field, delta):
+    rows = model.objects.filter(pk=pk)
+    if delta < 0:
+        # Поле беззнаковое: уменьшаем, только если есть из чего
+        rows = rows.filter(**{f'{field}__gte': -delta})
+    if rows.update(**{field: F(field) + delta}) or delta > 0:
+        return
+    # Ничего не обновили: строку удаляют каскадом (это нормально) или
+    # счётчик разошёлся со строками — удаление не роняем, но сообщаем
+    if model.objects.filter(pk=pk).exists():
+        logger.warning(
+            'Счётчик %s.%s у id=%s ушёл бы ниже нуля — расхождение, '
+            'нужен manage.py recount_counters', model.__name__, field, pk,
+        )
+
+
+def count_subquery(model, fk):
+    """COUNT(*) строк model, ссылающихся через fk на внешнюю строку."""
+    return Coalesce(
+        Subquery(
+            model.objects.filter(**{fk: OuterRef('pk')})
+            .order_by()
+            .values(fk)
+            .annotate(total=Count('pk'))
+            .values('total')
+        ),
+        0,
+    )
+
+
+# (модель со счётчиком, поле счётчика, считаемая модель, FK на модель со
+# счётчиком)
+COUNTERS = [
+    (Recipe, 'favorites_count', Favorite, 'recipe'),
+    (CustomUser, 'recipes_count', Recipe, 'author'),
+    (CustomUser, 'followers_count', Follow, 'author'),
+]
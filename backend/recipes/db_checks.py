@@ -0,0 +1,27 @@
+"""
+Проверки схемы PostgreSQL для миграций: планировщик должен использовать
+индексы, под которые написаны запросы (иначе миграция падает сразу, а не
+медленными запросами в проде).
+"""
+
+
+def check_plans(schema_editor, plan_checks):
+    """
+    Для каждой пары (запрос, имя индекса) из plan_checks убеждаемся, что
+    индекс есть в плане EXPLAIN.
+    """
+    with schema_editor.connection.cursor() as cursor:
+        # На маленькой таблице seq scan дешевле — запрещаем его на время
+        # проверки
+        cursor.execute('SET LOCAL enable_seqscan = off')
+        try:
+            for query, index_name in plan_checks:
+                cursor.execute(f'EXPLAIN {query}')
+                plan = '\n'.join(row[0] for row in cursor.fetchall())
+                if index_name not in plan:
+                    raise RuntimeError(
+                        f'Планировщик не использует {index_name} '
+                        f'для запроса:\n{query}\n{plan}'
+                    )
+        finally:
+            cursor.execute('RESET enable_seqscan')
@@ -0,0 +1,177 @@
+"""
+Лента подписок /api/recipes/feed/: рецепты авторов, на которых подписан
+пользователь, от новых к старым.
+
+Fan-out on write: опубликованный рецепт сразу раскладывается строками
+FeedEntry по лентам подписчиков автора, и лента читается по индексу
+(user, -pub_date) без соединения подписок с рецептами. У автора больше
+чем с FEED_FANOUT_MAX_FOLLOWERS подписчиков раскладка стоила бы тысяч
+строк на рецепт — его рецепты не раскладываются, а подмешиваются при
+чтении (pulled_authors): таких авторов у пользователя единицы, первые
+рецепты страницы каждого читаются по индексу (author, -pub_date) и
+сливаются с лентой по (pub_date, id) (api.utils.pagination.FeedPagination).
+
+Подписка добавляет в ленту FEED_BACKFILL последних рецептов автора,
+отписка убирает его рецепты. Автор, у которого подписчиков стало снова
+не больше порога, раскладывается заново (refill): иначе рецепты, вышедшие,
+пока он подмешивался при чтении, пропали бы из лент. Всё это выполняется
+в фоне после коммита одним потоком — подписка и отписка применяются в
+порядке событий.
+
+Очередь фоновых задач живёт в памяти процесса (api.utils.background):
+при штатной остановке она дорабатывается, а задачи убитого процесса
+теряются без следа в логе. Восстановление после этого и после массовой
+загрузки в обход сигналов — manage.py rebuild_feeds (load_test_data и
+generate_dataset вызывают её сами).
+"""
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, Window
+from django.db.models.functions import RowNumber
+
+from api.utils import background
+from api.utils.bulk import insert_batches
+from recipes.models import FeedEntry, Recipe
+from users.models import Follow
+
+
+def timeline(user):
+    """Разложенные по ленте user рецепты: (pub_date, recipe_id)."""
+    return FeedEntry.objects.filter(user=user)
+
+
+def pulled_authors(user):
+    """
+    Популярные авторы из подписок user — их рецепты в ленту не раскладываются.
+    """
+    return list(Follow.objects.filter(
+        subscriber=user,
+        author__followers_count__gt=settings.FEED_FANOUT_MAX_FOLLOWERS,
+    ).values_list('author_id', flat=True))
+
+
+def _subscribers(author_id):
+    return Follow.objects.filter(author_id=author_id).values_list(
+        'subscriber_id', flat=True
+    )
+
+
+def _entries(user_ids, recipes):
+    return (
+        FeedEntry(user_id=user_id, recipe_id=recipe_id, pub_date=pub_date)
+        for user_id in user_ids for recipe_id, pub_date in recipes
+    )
+
+
+def fan_out(recipe_id):
+    """Раскладывает новый рецепт по лентам подписчиков автора."""
+    recipe = (
+        Recipe.objects.filter(pk=recipe_id)
+        .values_list('author_id', 'pub_date', 'author__followers_count')
+        .first()
+    )
+    if recipe is None:
+        return
+    author_id, pub_date, followers = recipe
+    if followers > settings.FEED_FANOUT_MAX_FOLLOWERS:
+        return
+    FeedEntry.objects.bulk_create(
+        _entries(_subscribers(author_id), [(recipe_id, pub_date)]),
+        batch_size=1000, ignore_conflicts=True,
+    )
+
+
+def backfill(subscriber_id, author_id):
+    """Последние рецепты автора — в ленту нового подписчика."""
+    follow = (
+        Follow.objects.filter(subscriber_id=subscriber_id, author_id=author_id)
+        .values_list('author__followers_count', flat=True).first()
+    )
+    # Подписку уже отменили — заполнять нечего; популярный автор подмешивается
+    # при чтении
+    if follow is None or follow > settings.FEED_FANOUT_MAX_FOLLOWERS:
+        return
+    recent = (
+        Recipe.objects.filter(author_id=author_id).order_by('-pub_date', '-pk')
+        .values_list('pk', 'pub_date')[:settings.FEED_BACKFILL]
+    )
+    FeedEntry.objects.bulk_create(
+        _entries([subscriber_id], recent), ignore_conflicts=True
+    )
+
+
+def refill(author_id):
+    """
+    Автор снова раскладывается: его последние рецепты — в ленты всех
+    подписчиков (вышедшие, пока он подмешивался при чтении, там не лежат).
+    """
+    followers = (
+        Follow.objects.filter(author_id=author_id)
+        .values_list('author__followers_count', flat=True).first()
+    )
+    if followers is None or followers > settings.FEED_FANOUT_MAX_FOLLOWERS:
+        return
+    recent = list(
+        Recipe.objects.filter(author_id=author_id).order_by('-pub_date', '-pk')
+        .values_list('pk', 'pub_date')[:settings.FEED_BACKFILL]
+    )
+    FeedEntry.objects.bulk_create(
+        _entries(_subscribers(author_id), recent),
+        batch_size=1000, ignore_conflicts=True,
+    )
+
+
+def prune(subscriber_id, author_id):
+    """Убирает рецепты автора из ленты отписавшегося."""
+    if Follow.objects.filter(
+        subscriber_id=subscriber_id, author_id=author_id
+    ).exists():
+        return
+    FeedEntry.objects.filter(
+        user_id=subscriber_id, recipe__author_id=author_id
+    ).delete()
+
+
+def rebuild(batch_size=5000):
+    """
+    Пересобирает все ленты: каждому подписчику — FEED_BACKFILL последних
+    рецептов каждого нераскладываемого автора. Возвращает число строк.
+    """
+    recent = defaultdict(list)
+    for author_id, recipe_id, pub_date in (
+        Recipe.objects.filter(
+            author__followers_count__gt=0,
+            author__followers_count__lte=settings.FEED_FANOUT_MAX_FOLLOWERS,
+        )
+        .annotate(place=Window(
+            RowNumber(), partition_by=[F('author_id')],
+            order_by=[F('pub_date').desc(), F('pk').desc()],
+        ))
+        .filter(place__lte=settings.FEED_BACKFILL)
+        .values_list('author_id', 'pk', 'pub_date')
+    ):
+        recent[author_id].append((recipe_id, pub_date))
+    follows = (
+        Follow.objects.filter(author_id__in=recent).order_by()
+        .values_list('subscriber_id', 'author_id')
+    )
+    with transaction.atomic():
+        # У FeedEntry нет обратных связей — удаление одним DELETE без загрузки
+        # строк
+        FeedEntry.objects.all().delete()
+        return insert_batches(FeedEntry, (
+            FeedEntry(
+                user_id=subscriber_id, recipe_id=recipe_id, pub_date=pub_date
+            )
+            for subscriber_id, author_id
+            in follows.iterator(chunk_size=batch_size)
+            for recipe_id, pub_date in recent[author_id]
+        ), batch_size)
+
+
+def schedule(task, *args):
+    """Ставит fan_out/backfill/refill/prune в фон после коммита транзакции."""
+    # Один поток: задачи одного пользователя не обгоняют друг друга
+    background.run_after_commit('feed', task, *args, setting='FEED_ASYNC')
@@ -0,0 +1,129 @@
+"""
+Процессный префиксный индекс ингредиентов для автодополнения.
+
+Каталог хранится в памяти как отсортированный список названий в casefold,
+поиск по началу названия — два bisect. Индекс строится лениво и
+перестраивается, когда в кеше меняется версия каталога (её поднимают
+сигналы Ingredient и команда load_ingredients) или истекает
+INGREDIENT_INDEX_TTL секунд — на случай кеша, не общего для воркеров.
+"""
+import bisect
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+VERSION_KEY = 'recipes:ingredient_index_version'
+DEFAULT_TTL = 300
+
+
+class IngredientPrefixIndex:
+    """Неизменяемый индекс по строкам (id, name, measurement_unit)."""
+
+    def __init__(self, rows):
+        entries = sorted(
+            (name.casefold(), name, pk, unit) for pk, name, unit in rows
+        )
+        self._keys = [key for key, *_ in entries]
+        self._items = [
+            {'id': pk, 'name': name, 'measurement_unit': unit}
+            for _, name, pk, unit in entries
+        ]
+
+    def __len__(self):
+        return len(self._keys)
+
+    def search(self, prefix, limit=None):
+        """
+        Ингредиенты, чьё название начинается с prefix (без учёта регистра).
+        """
+        key = prefix.casefold()
+        if not key:
+            start, end = 0, len(self._keys)
+        else:
+            start = bisect.bisect_left(self._keys, key)
+            # Все строки с префиксом key лежат строго до key с увеличенным
+            # последним символом
+            upper = key[:-1] + chr(ord(key[-1]) + 1)
+            end = bisect.bisect_left(self._keys, upper, lo=start)
+        if limit is not None:
+            end = min(end, start + limit)
+        return self._items[start:end]
+
+    def rank(self, query, limit):
+        """Сначала совпадения по началу названия, затем по подстроке."""
+        key = query.casefold()
+        found = self.search(query, limit)
+        if len(found) >= limit or not key:
+            return found
+        seen = {item['id'] for item in found}
+        for item_key, item in zip(self._keys, self._items):
+            if key in item_key and item['id'] not in seen:
+                found.append(item)
+                if len(found) >= limit:
+                    break
+        return found
+
+
+_lock = threading.Lock()
+_index = None
+_index_version = None
+_built_at = 0.0
+
+
+def _current_version():
+    return cache.get(VERSION_KEY, 0)
+
+
+def build_index(queryset=None):
+    from recipes.models import Ingredient
+    if queryset is None:
+        queryset = Ingredient.objects.all()
+    return IngredientPrefixIndex(
+        queryset.order_by()
+        .values_list('id', 'name', 'measurement_unit').iterator()
+    )
+
+
+def get_index():
+    """
+    Актуальный индекс текущего процесса; при смене версии — перестраивает.
+    """
+    global _index, _index_version, _built_at
+    version = _current_version()
+    ttl = getattr(settings, 'INGREDIENT_INDEX_TTL', DEFAULT_TTL)
+    index = _index
+    if (index is not None and _index_version == version
+            and time.monotonic() - _built_at < ttl):
+        return index
+    with _lock:
+        if (_index is None or _index_version != version
+                or time.monotonic() - _built_at >= ttl):
+            _index = build_index()
+            _index_version = version
+            _built_at = time.monotonic()
+        return _index
+
+
+def search(prefix, limit=None):
+    return get_index().search(prefix, limit)
+
+
+def _bump_version():
+    try:
+        cache.incr(VERSION_KEY)
+    except ValueError:
+        cache.set(VERSION_KEY, 1, None)
+
+
+def invalidate():
+    """
+    Сбрасывает индекс во всех процессах, разделяющих кеш. Версия поднимается
+    после коммита: иначе другие процессы успели бы перестроить индекс по
+    старым данным и закрепить его под новой версией.
+    """
+    global _index
+    transaction.on_commit(_bump_version)
+    _index = None
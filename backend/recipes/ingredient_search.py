@@ -0,0 +1,49 @@
+"""
+Ранжированный поиск ингредиентов: сначала совпадения по началу названия,
+затем по подстроке, затем нечёткие (триграммы pg_trgm).
+
+На PostgreSQL запрос опирается на функциональные индексы по lower(name)
+из миграции 0003; на остальных СУБД используется префиксный индекс в
+памяти (без нечёткого поиска).
+"""
+from django.contrib.postgres.search import TrigramSimilarity
+from django.db import connection
+from django.db.models import Case, IntegerField, Q, Value, When
+from django.db.models.functions import Lower
+
+from recipes import ingredient_index
+from recipes.models import Ingredient
+
+DEFAULT_LIMIT = 20
+MAX_LIMIT = 100
+
+
+def search_ingredients(query, limit=None):
+    limit = min(limit or DEFAULT_LIMIT, MAX_LIMIT)
+    query = query.strip()
+    if connection.vendor != 'postgresql':
+        return ingredient_index.get_index().rank(query, limit)
+    return list(_postgres_queryset(query)[:limit])
+
+
+def _postgres_queryset(query):
+    term = query.lower()
+    return (
+        Ingredient.objects.annotate(name_lower=Lower('name'))
+        .filter(
+            Q(name_lower__startswith=term)
+            | Q(name_lower__contains=term)
+            | Q(name_lower__trigram_similar=term)
+        )
+        .annotate(
+            match_rank=Case(
+                When(name_lower__startswith=term, then=Value(0)),
+                When(name_lower__contains=term, then=Value(1)),
+                default=Value(2),
+                output_field=IntegerField(),
+            ),
+            similarity=TrigramSimilarity('name_lower', term),
+        )
+        .order_by('match_rank', '-similarity', 'name')
+        .values('id', 'name', 'measurement_unit')
+    )
@@ -0,0 +1,171 @@
+"""
+Фильтры рецептов по набору ингредиентов: все из набора, хотя бы один,
+ни одного из исключённых и «готовлю из того, что есть» — не больше K
+ингредиентов сверх кладовой.
+
+На PostgreSQL у recipes_recipe есть столбец ingredient_ids (миграция
+0011): отсортированные id ингредиентов массивом, его ведут триггеры на
+recipes_recipeingredient. Условия — операторы массивов под GIN-индексом:
+@> (все), && (хотя бы один), <@ (всё есть в кладовой) вместо соединения
+с RecipeIngredient и GROUP BY ... HAVING на каждый рецепт. При K > 0
+индекс отбирает рецепты, пересекающиеся с кладовой, и короткие (не
+длиннее K, индекс по cardinality), а недостающие считаются по массиву
+строки. Исключение (ни одного) быстрее антисоединением с RecipeIngredient.
+
+Время растёт с числом подходящих рецептов: кладовая с вездесущими
+ингредиентами (соль, вода) пересекается с большей частью рецептов, и все
+они читаются. Замер — manage.py bench_ingredient_sets.
+
+На остальных СУБД те же условия — подзапросами к RecipeIngredient.
+"""
+from django.contrib.postgres.fields import ArrayField
+from django.contrib.postgres.fields.array import (
+    ArrayContainedBy, ArrayContains, ArrayOverlap,
+)
+from django.db import connection
+from django.db.models import (
+    BigIntegerField, Count, Exists, Expression, Func, IntegerField, OuterRef,
+    Q, Subquery,
+)
+from django.db.models.functions import Coalesce
+from django.db.models.lookups import LessThanOrEqual
+
+from recipes.columns import TableColumn
+from recipes.models import RecipeIngredient
+
+COLUMN = 'ingredient_ids'
+INDEX = 'recipe_ingredient_ids_idx'
+
+
+def ingredient_ids():
+    return TableColumn(COLUMN, ArrayField(BigIntegerField()))
+
+
+class MissingCount(Expression):
+    """Сколько элементов массива ids нет в pantry."""
+    output_field = IntegerField()
+
+    def __init__(self, ids, pantry):
+        super().__init__()
+        self.ids = ids
+        self.pantry = pantry
+
+    def get_source_expressions(self):
+        return [self.ids]
+
+    def set_source_expressions(self, exprs):
+        self.ids, = exprs
+
+    def as_sql(self, compiler, connection):
+        # bigint[] как у столбца: сравнение integer с bigint на каждой строке
+        # заметно дороже
+        ids, params = compiler.compile(self.ids)
+        return (
+            f'(cardinality({ids}) - (SELECT count(*) '
+            f'FROM unnest({ids}) AS ingredient_id '
+            f'WHERE ingredient_id = ANY(%s::bigint[])))',
+            [*params, *params, self.pantry],
+        )
+
+
+class ArraySets:
+    """PostgreSQL: операторы над ingredient_ids под GIN-индексом."""
+
+    @staticmethod
+    def with_all(queryset, ids):
+        """Рецепты, в которых есть все ингредиенты ids."""
+        return queryset.filter(ArrayContains(ingredient_ids(), ids))
+
+    @staticmethod
+    def with_any(queryset, ids):
+        """Рецепты хотя бы с одним ингредиентом из ids."""
+        return queryset.filter(ArrayOverlap(ingredient_ids(), ids))
+
+    @staticmethod
+    def without(queryset, ids):
+        """Рецепты без ингредиентов из ids."""
+        # Отрицание GIN не обслуживает, а NOT (&&) читает массив каждой строки
+        # из широкой таблицы рецептов; антисоединение с индексом
+        # RecipeIngredient считает найденные по узкому индексу первичного ключа
+        # — в разы быстрее
+        return JoinSets.without(queryset, ids)
+
+    @staticmethod
+    def cookable(queryset, pantry, max_missing=0):
+        """
+        Рецепты, которым не хватает не больше max_missing ингредиентов из
+        кладовой pantry; при max_missing > 0 сначала те, где недостающих
+        меньше.
+        """
+        size = Func(
+            ingredient_ids(), function='cardinality',
+            output_field=IntegerField(),
+        )
+        # Рецепт длиннее кладовой плюс K не подходит заведомо: индекс по
+        # cardinality отсекает его до чтения строк (GIN для <@ и && отдаёт
+        # много лишнего)
+        queryset = queryset.filter(
+            LessThanOrEqual(size, len(pantry) + max_missing)
+        )
+        if not max_missing:
+            return queryset.filter(ArrayContainedBy(ingredient_ids(), pantry))
+        # Без общих с кладовой ингредиентов подходят только рецепты не длиннее
+        # K
+        missing = MissingCount(ingredient_ids(), pantry)
+        # Как и ранг поиска — только в условии и ORDER BY, без аннотации
+        return (
+            queryset.filter(
+                Q(ArrayOverlap(ingredient_ids(), pantry))
+                | Q(LessThanOrEqual(size, max_missing))
+            )
+            .filter(LessThanOrEqual(missing, max_missing))
+            .order_by(missing, '-pub_date', '-pk')
+        )
+
+
+class JoinSets:
+    """Остальные СУБД: те же условия подзапросами к RecipeIngredient."""
+
+    @staticmethod
+    def _uses(ids):
+        return RecipeIngredient.objects.filter(
+            recipe=OuterRef('pk'), ingredient_id__in=ids
+        )
+
+    @staticmethod
+    def with_all(queryset, ids):
+        found = (
+            RecipeIngredient.objects.filter(ingredient_id__in=ids)
+            .values('recipe_id').annotate(found=Count('pk'))
+            .filter(found=len(ids))
+        )
+        return queryset.filter(pk__in=found.values('recipe_id'))
+
+    @classmethod
+    def with_any(cls, queryset, ids):
+        return queryset.filter(Exists(cls._uses(ids)))
+
+    @classmethod
+    def without(cls, queryset, ids):
+        return queryset.exclude(Exists(cls._uses(ids)))
+
+    @staticmethod
+    def cookable(queryset, pantry, max_missing=0):
+        missing = Coalesce(
+            Subquery(
+                RecipeIngredient.objects.filter(recipe=OuterRef('pk'))
+                .exclude(ingredient_id__in=pantry)
+                .order_by().values('recipe').annotate(total=Count('pk'))
+                .values('total')
+            ),
+            0,
+        )
+        queryset = queryset.filter(LessThanOrEqual(missing, max_missing))
+        if not max_missing:
+            return queryset
+        return queryset.order_by(missing, '-pub_date', '-pk')
+
+
+def sets():
+    """Реализация фильтров для текущей СУБД."""
+    return ArraySets if connection.vendor == 'postgresql' else JoinSets
@@ -0,0 +1,126 @@
+import csv
+import random
+import statistics
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from recipes.ingredient_index import IngredientPrefixIndex
+from recipes.models import Ingredient
+
+
+class _Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = (
+        'Сравнивает поиск ингредиентов по началу названия: префиксный индекс '
+        'в памяти против name__istartswith в БД. Данные в БД вставляются '
+        'во временной транзакции и откатываются.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--csv', default='data/ingredients.csv')
+        parser.add_argument('--synthetic', type=int, default=1_000_000,
+                            help='Размер синтетического каталога '
+                                 '(0 — пропустить)')
+        parser.add_argument('--queries', type=int, default=200)
+        parser.add_argument('--limit', type=int, default=None)
+        parser.add_argument('--skip-orm', action='store_true',
+                            help='Не замерять путь через ORM')
+        parser.add_argument('--seed', type=int, default=42)
+
+    def handle(self, *args, **options):
+        rnd = random.Random(options['seed'])
+        datasets = [('csv', self._read_csv(options['csv']))]
+        if options['synthetic']:
+            synthetic = self._synthetic(
+                datasets[0][1], options['synthetic'], rnd
+            )
+            datasets.append(('synthetic', synthetic))
+
+        for label, rows in datasets:
+            prefixes = self._prefixes(rows, options['queries'], rnd)
+            self.stdout.write(self.style.WARNING(
+                f'⏱️  {label}: {len(rows)} строк, {len(prefixes)} запросов'
+            ))
+
+            started = time.perf_counter()
+            index = IngredientPrefixIndex(
+                (pk, name, unit) for pk, (name, unit) in enumerate(rows, 1)
+            )
+            built = (time.perf_counter() - started) * 1000
+            self.stdout.write(f'   построение индекса: {built:.1f} мс')
+            self._report('индекс', [
+                self._timed(index.search, prefix, options['limit'])
+                for prefix in prefixes
+            ])
+
+            if not options['skip_orm']:
+                self._report(
+                    'ORM', self._bench_orm(rows, prefixes, options['limit'])
+                )
+
+    def _bench_orm(self, rows, prefixes, limit):
+        timings = []
+        try:
+            with transaction.atomic():
+                Ingredient.objects.bulk_create(
+                    (
+                        Ingredient(name=name, measurement_unit=unit)
+                        for name, unit in rows
+                    ),
+                    batch_size=5000,
+                )
+                for prefix in prefixes:
+                    qs = Ingredient.objects.filter(
+                        name__istartswith=prefix
+                    ).values('id', 'name', 'measurement_unit')
+                    if limit:
+                        qs = qs[:limit]
+                    started = time.perf_counter()
+                    list(qs)
+                    timings.append(time.perf_counter() - started)
+                raise _Rollback
+        except _Rollback:
+            pass
+        return timings
+
+    @staticmethod
+    def _timed(func, *args):
+        started = time.perf_counter()
+        func(*args)
+        return time.perf_counter() - started
+
+    def _report(self, label, timings):
+        micros = sorted(t * 1_000_000 for t in timings)
+        p95 = micros[0]
+        if len(micros) > 1:
+            p95 = micros[int(len(micros) * 0.95) - 1]
+        self.stdout.write(self.style.SUCCESS(
+            f'   {label}: медиана {statistics.median(micros):.1f} мкс, '
+            f'p95 {p95:.1f} мкс, среднее {statistics.mean(micros):.1f} мкс'
+        ))
+
+    @staticmethod
+    def _read_csv(path):
+        with open(path, encoding='utf-8') as file:
+            return [
+                (row[0], row[1]) for row in csv.reader(file) if len(row) >= 2
+            ]
+
+    @staticmethod
+    def _synthetic(base, size, rnd):
+        return [
+            (f'{rnd.choice(base)[0]} {i}', rnd.choice(base)[1])
+            for i in range(size)
+        ]
+
+    @staticmethod
+    def _prefixes(rows, count, rnd):
+        return [
+            name[:rnd.randint(1, 4)]
+            for name, _ in (rnd.choice(rows) for _ in range(count))
+        ]
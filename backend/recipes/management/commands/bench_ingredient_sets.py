@@ -0,0 +1,119 @@
+import random
+import statistics
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from api.management.commands.bench_endpoints import percentile
+from recipes import ingredient_sets
+from recipes.models import Ingredient, Recipe, RecipeIngredient
+
+PANTRY_EXTRA = 4
+
+
+class Command(BaseCommand):
+    help = (
+        'Меряет фильтры рецептов по набору ингредиентов на текущих данных '
+        '(manage.py generate_dataset): число найденных и первая страница — '
+        'по массиву ingredient_ids с GIN-индексом и подзапросами '
+        'к RecipeIngredient.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--queries', type=int, default=30)
+        parser.add_argument('--limit', type=int, default=6)
+        parser.add_argument('--seed', type=int, default=42)
+
+    def handle(self, *args, **options):
+        total = Recipe.objects.count()
+        if not total:
+            raise CommandError(
+                '❌ В базе нет рецептов: manage.py generate_dataset'
+            )
+        cases = self._cases(options['queries'], random.Random(options['seed']))
+        self.stdout.write(self.style.WARNING(
+            f'⏱️  {total} рецептов, {options["queries"]} запросов на фильтр'
+        ))
+
+        implementations = [('подзапросы', ingredient_sets.JoinSets)]
+        if connection.vendor == 'postgresql':
+            implementations.insert(0, ('массивы', ingredient_sets.ArraySets))
+            self._explain(cases['все'][0])
+        else:
+            self.stdout.write(self.style.WARNING(
+                '⚠️  Не PostgreSQL: массив и GIN не замеряются'
+            ))
+        for label, calls in cases.items():
+            self.stdout.write(f'   {label}')
+            for name, implementation in implementations:
+                timings = [
+                    self._timed(implementation, call, options['limit'])
+                    for call in calls
+                ]
+                self._report(name, timings)
+
+    @staticmethod
+    def _cases(count, rnd):
+        """
+        Наборы из ингредиентов случайных рецептов: популярные ингредиенты
+        попадаются чаще.
+        """
+        ids = list(Recipe.objects.values_list('pk', flat=True))
+        catalog = list(Ingredient.objects.values_list('pk', flat=True))
+        recipes = {}
+        for recipe_id, ingredient_id in RecipeIngredient.objects.filter(
+            recipe_id__in=rnd.sample(ids, min(count, len(ids)))
+        ).values_list('recipe_id', 'ingredient_id'):
+            recipes.setdefault(recipe_id, []).append(ingredient_id)
+        recipes = [
+            sorted(found) for found in recipes.values() if len(found) >= 3
+        ]
+
+        def extra():
+            return rnd.sample(catalog, PANTRY_EXTRA)
+
+        return {
+            'все': [('with_all', rnd.sample(found, 2)) for found in recipes],
+            'хотя бы один': [
+                ('with_any', rnd.sample(found, 2)) for found in recipes
+            ],
+            'ни одного': [
+                ('without', rnd.sample(found, 1)) for found in recipes
+            ],
+            'кладовая': [
+                ('cookable', sorted({*found, *extra()}), 0)
+                for found in recipes
+            ],
+            'кладовая, не хватает ≤ 2': [
+                ('cookable', sorted({*found[2:], *extra()}), 2)
+                for found in recipes
+            ],
+        }
+
+    @staticmethod
+    def _timed(implementation, call, limit):
+        method, *args = call
+        queryset = getattr(implementation, method)(Recipe.objects.all(), *args)
+        started = time.perf_counter()
+        # Как страница списка: число найденных и первые limit
+        queryset.count()
+        list(queryset.values_list('pk', flat=True)[:limit])
+        return time.perf_counter() - started
+
+    def _explain(self, call):
+        method, *args = call
+        filter_ = getattr(ingredient_sets.ArraySets, method)
+        queryset = filter_(Recipe.objects.all(), *args)
+        used = ingredient_sets.INDEX in queryset.values('pk').explain()
+        style = self.style.SUCCESS if used else self.style.ERROR
+        index = 'GIN-индекс' if used else 'без индекса'
+        self.stdout.write(style(f'   план «все {args[0]}»: {index}'))
+
+    def _report(self, label, timings):
+        millis = [timing * 1000 for timing in timings]
+        self.stdout.write(self.style.SUCCESS(
+            f'      {label}: медиана {statistics.median(millis):.2f} мс, '
+            f'p95 {percentile(millis, 0.95):.2f} мс, '
+            f'максимум {max(millis):.2f} мс'
+        ))
@@ -0,0 +1,108 @@
+import statistics
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.test import Client
+from django.utils import timezone
+
+from api.utils.bulk import explicit_timestamps
+from api.utils.pagination import RecipeKeysetPagination
+from recipes.models import Recipe
+from users.models import CustomUser
+
+
+class _Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = (
+        'Сравнивает время страницы /api/recipes/ на разной глубине: '
+        '?page= (OFFSET + COUNT) против курсорной пагинации. '
+        'Тестовые рецепты вставляются во временной транзакции и откатываются.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=2_000_000)
+        parser.add_argument('--limit', type=int, default=6)
+        parser.add_argument('--repeat', type=int, default=5)
+        parser.add_argument('--batch-size', type=int, default=10_000)
+        parser.add_argument('--keep', action='store_true',
+                            help='Не откатывать вставленные рецепты')
+
+    def handle(self, *args, **options):
+        try:
+            with transaction.atomic():
+                self._seed(options['rows'], options['batch_size'])
+                self._bench(
+                    options['rows'], options['limit'], options['repeat']
+                )
+                if not options['keep']:
+                    raise _Rollback
+        except _Rollback:
+            self.stdout.write(
+                self.style.WARNING('↩️  Тестовые рецепты откатены')
+            )
+
+    def _seed(self, rows, batch_size):
+        self.stdout.write(self.style.WARNING(f'⏳ Вставка {rows} рецептов...'))
+        author, _ = CustomUser.objects.get_or_create(
+            username='bench-author',
+            defaults={
+                'email': 'bench-author@example.com',
+                'first_name': 'Bench',
+                'last_name': 'Author',
+            },
+        )
+        start = timezone.now() - timedelta(seconds=rows)
+        started = time.perf_counter()
+        # bulk_create с auto_now_add проставил бы всем один pub_date
+        with explicit_timestamps((Recipe, 'pub_date')):
+            for offset in range(0, rows, batch_size):
+                Recipe.objects.bulk_create([
+                    Recipe(
+                        author=author,
+                        name=f'Рецепт {i}',
+                        image='recipes/images/default.jpg',
+                        description='Описание',
+                        cooking_time=10,
+                        pub_date=start + timedelta(seconds=i),
+                    )
+                    for i in range(offset, min(offset + batch_size, rows))
+                ])
+        elapsed = time.perf_counter() - started
+        self.stdout.write(f'   вставлено за {elapsed:.1f} с')
+
+    def _bench(self, rows, limit, repeat):
+        client = Client(SERVER_NAME='localhost')
+        ordered = Recipe.objects.order_by('-pub_date', '-id')
+        for fraction in (0, 0.01, 0.1, 0.5, 0.99):
+            depth = int((rows - limit) * fraction)
+            page = depth // limit + 1
+            anchor = ordered[depth] if depth else None
+            cursor = None
+            if anchor:
+                cursor = RecipeKeysetPagination.encode_cursor(anchor)
+
+            page_url = f'/api/recipes/?limit={limit}&page={page}'
+            cursor_url = (
+                f'/api/recipes/?limit={limit}&cursor={cursor}' if cursor
+                else f'/api/recipes/?limit={limit}&pagination=cursor'
+            )
+            self.stdout.write(self.style.SUCCESS(
+                f'📄 глубина {depth}: '
+                f'page {self._timed(client, page_url, repeat):.1f} мс, '
+                f'cursor {self._timed(client, cursor_url, repeat):.1f} мс'
+            ))
+
+    @staticmethod
+    def _timed(client, url, repeat):
+        timings = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            response = client.get(url)
+            timings.append((time.perf_counter() - started) * 1000)
+            assert response.status_code == 200, (url, response.status_code)
+        return statistics.median(timings)
@@ -0,0 +1,104 @@
+import random
+import statistics
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+
+from api.management.commands.bench_endpoints import percentile
+from recipes import recipe_search
+from recipes.models import Recipe
+
+MIN_WORD = 3
+
+
+class Command(BaseCommand):
+    help = (
+        'Меряет поиск рецептов (?search=) на текущих данных '
+        '(manage.py generate_dataset): первая страница и число найденных '
+        'по tsvector с GIN-индексом, тот же запрос без индекса и наивный '
+        'icontains по названию и описанию.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--queries', type=int, default=50)
+        parser.add_argument('--limit', type=int, default=6)
+        parser.add_argument('--seed', type=int, default=42)
+
+    def handle(self, *args, **options):
+        total = Recipe.objects.count()
+        if not total:
+            raise CommandError(
+                '❌ В базе нет рецептов: manage.py generate_dataset'
+            )
+        terms = self._terms(options['queries'], random.Random(options['seed']))
+        self.stdout.write(self.style.WARNING(
+            f'⏱️  {total} рецептов, {len(terms)} запросов'
+        ))
+
+        methods = [('icontains', recipe_search._fallback, None)]
+        if connection.vendor == 'postgresql':
+            methods = [
+                ('GIN', recipe_search.search_recipes, None),
+                ('без индекса', recipe_search.search_recipes,
+                 'SET LOCAL enable_bitmapscan = off; '
+                 'SET LOCAL enable_indexscan = off'),
+                *methods,
+            ]
+            self._explain(terms[0])
+        else:
+            self.stdout.write(self.style.WARNING(
+                '⚠️  Не PostgreSQL: tsvector и GIN не замеряются'
+            ))
+        for label, search, setup in methods:
+            self._report(label, [
+                self._timed(search, term, options['limit'], setup)
+                for term in terms
+            ])
+
+    @staticmethod
+    def _terms(count, rnd):
+        """
+        Слова из названий случайных рецептов: и частые (тип блюда), и редкие
+        (ингредиент).
+        """
+        ids = list(Recipe.objects.values_list('pk', flat=True))
+        names = Recipe.objects.filter(
+            pk__in=rnd.sample(ids, min(count, len(ids)))
+        ).values_list('name', flat=True)
+        terms = []
+        for name in names:
+            words = [word.strip(':,.').lower() for word in name.split()]
+            words = [word for word in words if len(word) >= MIN_WORD]
+            if words:
+                terms.append(rnd.choice(words))
+        return terms
+
+    @staticmethod
+    def _timed(search, term, limit, setup):
+        queryset = search(Recipe.objects.all(), term)
+        with transaction.atomic():
+            if setup:
+                with connection.cursor() as cursor:
+                    cursor.execute(setup)
+            started = time.perf_counter()
+            # Как страница списка: число найденных и первые limit по
+            # релевантности
+            queryset.count()
+            list(queryset.values_list('pk', flat=True)[:limit])
+            return time.perf_counter() - started
+
+    def _explain(self, term):
+        queryset = recipe_search.search_recipes(Recipe.objects.all(), term)
+        used = recipe_search.INDEX in queryset.values('pk')[:1].explain()
+        style = self.style.SUCCESS if used else self.style.ERROR
+        index = 'GIN-индекс' if used else 'без индекса'
+        self.stdout.write(style(f'   план «{term}»: {index}'))
+
+    def _report(self, label, timings):
+        millis = [timing * 1000 for timing in timings]
+        self.stdout.write(self.style.SUCCESS(
+            f'   {label}: медиана {statistics.median(millis):.2f} мс, '
+            f'p95 {percentile(millis, 0.95):.2f} мс, '
+            f'максимум {max(millis):.2f} мс'
+        ))
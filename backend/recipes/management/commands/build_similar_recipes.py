@@ -0,0 +1,35 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from recipes import similar_recipes
+from recipes.models import Recipe
+
+
+class Command(BaseCommand):
+    help = (
+        'Пересобирает похожие рецепты: MinHash-подписи, корзины LSH и '
+        f'{similar_recipes.TOP_K} соседей каждого рецепта по коэффициенту '
+        'Жаккара ингредиентов. load_test_data и generate_dataset вызывают её '
+        'сами; вручную — после изменения констант recipes.similar_recipes.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=5000)
+
+    def handle(self, *args, **options):
+        if not Recipe.objects.exists():
+            raise CommandError('❌ В базе нет рецептов')
+        started = time.perf_counter()
+
+        def progress(message):
+            elapsed = time.perf_counter() - started
+            self.stdout.write(f'   {message} ({elapsed:.1f} с)')
+
+        recipes, pairs = similar_recipes.rebuild(
+            options['batch_size'], progress
+        )
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(
+            f'✅ {recipes} рецептов, {pairs} пар за {elapsed:.1f} с'
+        ))
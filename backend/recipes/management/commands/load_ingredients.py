@@ -1,28 +1,149 @@
-import json
-from django.core.management.base import BaseCommand
+import csv
+import os
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+
+from api.utils.bulk import iter_json_array
+from recipes import ingredient_index
 from recipes.models import Ingredient
 
 
+def read_json(path):
+    for item in iter_json_array(path):
+        yield item.get('name'), item.get('measurement_unit')
+
+
+def read_csv(path):
+    """
+    CSV без заголовка: «название,единица измерения» (заголовок name,…
+    пропускается).
+    """
+    with open(path, encoding='utf-8', newline='') as file:
+        for row in csv.reader(file):
+            if len(row) < 2 or row[0] == 'name':
+                continue
+            yield row[0], row[1]
+
+
+READERS = {'.json': read_json, '.csv': read_csv}
+
+
 class Command(BaseCommand):
-    help = 'Загружает ингредиенты из ingredients.json. Старые — удаляет.'
+    help = (
+        'Синхронизирует каталог ингредиентов с ingredients.json или '
+        'ingredients.csv: добавляет новые пачками INSERT ... ON CONFLICT '
+        'DO NOTHING по (name, measurement_unit), существующие и рецепты '
+        'не трогает. С --prune удаляет ингредиенты, которых нет в файле '
+        'и которые не используются ни в одном рецепте.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--file', default='data/ingredients.json',
+                            help='Файл каталога: .json (список объектов) '
+                                 'или .csv')
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--prune', action='store_true',
+                            help='Удалить отсутствующие в файле '
+                                 'ингредиенты без рецептов')
 
-    def handle(self, *args, **kwargs):
-        self.stdout.write(self.style.WARNING('⚠️  Удаление старых ингредиентов...'))
-        count_deleted, _ = Ingredient.objects.all().delete()
+    def handle(self, *args, **options):
+        path = options['file']
+        reader = READERS.get(os.path.splitext(path)[1].lower())
+        if reader is None:
+            raise CommandError(
+                f'❌ Неизвестный формат {path}: ожидается .json или .csv'
+            )
+        if not os.path.exists(path):
+            raise CommandError(f'❌ Нет файла {path}')
 
-        self.stdout.write(self.style.SUCCESS(f'🗑️ Удалено {count_deleted} ингредиентов'))
+        self.batch_size = options['batch_size']
+        self.counts = dict.fromkeys(
+            ('inserted', 'unchanged', 'pruned', 'skipped'), 0
+        )
+        # Ключи каталога из файла: для дедупликации и --prune
+        self.seen = set()
+        batch = []
+        with transaction.atomic():
+            for name, unit in reader(path):
+                if not name or not unit:
+                    self.counts['skipped'] += 1
+                    continue
+                if (name, unit) in self.seen:
+                    continue
+                self.seen.add((name, unit))
+                batch.append((name, unit))
+                if len(batch) >= self.batch_size:
+                    self._upsert(batch)
+                    batch = []
+            self._upsert(batch)
+            if options['prune']:
+                self._prune()
 
-        try:
-            with open('data/ingredients.json', encoding='utf-8') as file:
-                data = json.load(file)
+        if self.counts['inserted'] or self.counts['pruned']:
+            # Вставка в обход ORM не шлёт сигналы — сбрасываем индекс
+            # автодополнения явно
+            ingredient_index.invalidate()
+        self.stdout.write(self.style.SUCCESS(
+            '✅ Ингредиенты: добавлено {inserted}, без изменений {unchanged}, '
+            'удалено {pruned}, пропущено строк {skipped}'.format(**self.counts)
+        ))
 
-            ingredients = [
-                Ingredient(name=item['name'], measurement_unit=item['measurement_unit'])
-                for item in data if item.get('name') and item.get('measurement_unit')
-            ]
+    def _upsert(self, batch):
+        if not batch:
+            return
+        # Уже известные ключи не пишем вовсе: повторный запуск обходится одними
+        # SELECT
+        existing = set(
+            Ingredient.objects
+            .filter(name__in={name for name, _ in batch})
+            .values_list('name', 'measurement_unit')
+            .order_by()
+        )
+        inserted = self._insert([key for key in batch if key not in existing])
+        self.counts['inserted'] += inserted
+        self.counts['unchanged'] += len(batch) - inserted
 
-            Ingredient.objects.bulk_create(ingredients)
-            self.stdout.write(self.style.SUCCESS(f'✅ Загружено {len(ingredients)} ингредиентов'))
+    @staticmethod
+    def _insert(keys):
+        """
+        INSERT ... ON CONFLICT DO NOTHING — на случай параллельной вставки
+        того же ключа. Возвращает число действительно добавленных строк
+        (RETURNING): bulk_create(ignore_conflicts=True) пропущенные строки
+        не различает.
+        """
+        if not keys:
+            return 0
+        meta = Ingredient._meta
+        quote = connection.ops.quote_name
+        columns = ', '.join(
+            quote(meta.get_field(name).column)
+            for name in ('name', 'measurement_unit')
+        )
+        sql = (
+            f'INSERT INTO {quote(meta.db_table)} ({columns}) '
+            f"VALUES {', '.join(['(%s, %s)'] * len(keys))} "
+            f'ON CONFLICT ({columns}) DO NOTHING '
+            f'RETURNING {quote(meta.pk.column)}'
+        )
+        with connection.cursor() as cursor:
+            cursor.execute(sql, [value for key in keys for value in key])
+            return len(cursor.fetchall())
 
-        except Exception as error:
-            self.stderr.write(self.style.ERROR(f'❌ Ошибка: {error}'))
+    def _prune(self):
+        unused = (
+            Ingredient.objects.filter(recipe_quantities__isnull=True)
+            .values_list('id', 'name', 'measurement_unit')
+        )
+        stale = [
+            pk for pk, name, unit in unused.iterator()
+            if (name, unit) not in self.seen
+        ]
+        for start in range(0, len(stale), self.batch_size):
+            # Рецепты на эти ингредиенты не ссылаются, значит и списки покупок
+            # тоже
+            _, deleted = Ingredient.objects.filter(
+                id__in=stale[start:start + self.batch_size],
+                recipe_quantities__isnull=True,
+            ).delete()
+            self.counts['pruned'] += deleted.get(Ingredient._meta.label, 0)
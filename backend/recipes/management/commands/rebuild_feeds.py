@@ -0,0 +1,28 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from recipes import feed
+
+
+class Command(BaseCommand):
+    help = (
+        'Пересобирает ленты подписок: каждому подписчику — последние '
+        'FEED_BACKFILL рецептов авторов, у которых не больше '
+        'FEED_FANOUT_MAX_FOLLOWERS подписчиков. load_test_data и '
+        'generate_dataset вызывают её сами; вручную — после изменения этих '
+        'настроек и если процесс убили с задачами лент в очереди.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=5000)
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        rows = feed.rebuild(options['batch_size'])
+        limit = settings.FEED_FANOUT_MAX_FOLLOWERS
+        self.stdout.write(self.style.SUCCESS(
+            f'✅ {rows} строк лент за {time.perf_counter() - started:.1f} с '
+            f'(раскладка — до {limit} подписчиков)'
+        ))
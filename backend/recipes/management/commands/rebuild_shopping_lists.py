@@ -0,0 +1,63 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from recipes import shopping_list
+from recipes.models import ShoppingListItem
+
+
+class Command(BaseCommand):
+    help = (
+        'Пересобирает таблицу списков покупок из корзин '
+        'или (--verify) сверяет её с живой агрегацией.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--verify', action='store_true',
+                            help='Только сверить, ничего не меняя')
+        parser.add_argument('--user', type=int, action='append', dest='users',
+                            help='Ограничиться пользователем '
+                                 '(можно несколько раз)')
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        user_ids = options['users']
+
+        if options['verify']:
+            live = shopping_list.live_totals(user_ids)
+            stored = shopping_list.stored_totals(user_ids)
+            mismatched = {
+                key for key in live.keys() | stored.keys()
+                if live.get(key) != stored.get(key)
+            }
+            for user_id, ingredient_id in sorted(mismatched)[:20]:
+                key = (user_id, ingredient_id)
+                self.stdout.write(
+                    f'   user={user_id} ingredient={ingredient_id}: '
+                    f'в таблице {stored.get(key)}, по корзине {live.get(key)}'
+                )
+            if mismatched:
+                raise CommandError(f'❌ Расхождений: {len(mismatched)}')
+            self.stdout.write(
+                self.style.SUCCESS(f'✅ Совпадает ({len(live)} позиций)')
+            )
+            return
+
+        with transaction.atomic():
+            live = shopping_list.live_totals(user_ids)
+            items = ShoppingListItem.objects.all()
+            if user_ids:
+                items = items.filter(user_id__in=user_ids)
+            deleted, _ = items.delete()
+            ShoppingListItem.objects.bulk_create(
+                (
+                    ShoppingListItem(
+                        user_id=user_id, ingredient_id=ingredient_id,
+                        total_amount=total,
+                    )
+                    for (user_id, ingredient_id), total in live.items()
+                ),
+                batch_size=options['batch_size'],
+            )
+        self.stdout.write(self.style.SUCCESS(
+            f'✅ Удалено {deleted}, записано {len(live)} позиций'
+        ))
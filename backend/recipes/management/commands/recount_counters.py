@@ -0,0 +1,36 @@
+from django.core.management.base import BaseCommand
+
+from recipes.counters import COUNTERS, count_subquery
+
+
+class Command(BaseCommand):
+    help = (
+        'Сверяет денормализованные счётчики с COUNT(*) и исправляет '
+        'расхождения пачками.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        for model, field, counted_model, fk in COUNTERS:
+            expected = count_subquery(counted_model, fk)
+            pks = model.objects.order_by('pk').values_list('pk', flat=True)
+            fixed = 0
+            last_pk = 0
+            while True:
+                batch = list(pks.filter(pk__gt=last_pk)[:batch_size])
+                if not batch:
+                    break
+                last_pk = batch[-1]
+                # Обновляем только разошедшиеся строки — число обновлённых и
+                # есть дрейф
+                fixed += (
+                    model.objects.filter(pk__in=batch)
+                    .exclude(**{field: expected})
+                    .update(**{field: expected})
+                )
+            self.stdout.write(self.style.SUCCESS(
+                f'✅ {model.__name__}.{field}: исправлено {fixed}'
+            ))
@@ -0,0 +1,58 @@
+from django.contrib.postgres.indexes import GinIndex, OpClass
+from django.contrib.postgres.operations import TrigramExtension
+from django.db import migrations, models
+from django.db.models.functions import Lower
+
+from recipes.db_checks import check_plans
+
+# Индексы только для PostgreSQL: в состояние моделей не попадают, чтобы
+# SQLite (локальные тесты) не пытался создавать их при пересборке таблицы.
+SEARCH_INDEXES = [
+    models.Index(
+        OpClass(Lower('name'), name='text_pattern_ops'),
+        name='ingredient_name_lower_idx',
+    ),
+    GinIndex(
+        OpClass(Lower('name'), name='gin_trgm_ops'),
+        name='ingredient_name_trgm_idx',
+    ),
+]
+
+# Запросы, которые поиск ингредиентов отправляет в БД, и ожидаемый индекс
+PLAN_CHECKS = [
+    ("SELECT id FROM recipes_ingredient WHERE lower(name) LIKE 'абр%'",
+     'ingredient_name_lower_idx'),
+    ("SELECT id FROM recipes_ingredient WHERE lower(name) LIKE '%варенье%'",
+     'ingredient_name_trgm_idx'),
+    ("SELECT id FROM recipes_ingredient WHERE lower(name) % 'варене'",
+     'ingredient_name_trgm_idx'),
+]
+
+
+def create_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    Ingredient = apps.get_model('recipes', 'Ingredient')
+    for index in SEARCH_INDEXES:
+        schema_editor.add_index(Ingredient, index)
+    check_plans(schema_editor, PLAN_CHECKS)
+
+
+def drop_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    Ingredient = apps.get_model('recipes', 'Ingredient')
+    for index in SEARCH_INDEXES:
+        schema_editor.remove_index(Ingredient, index)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0002_initial'),
+    ]
+
+    operations = [
+        TrigramExtension(),
+        migrations.RunPython(create_indexes, drop_indexes),
+    ]
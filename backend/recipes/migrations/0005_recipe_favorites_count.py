@@ -0,0 +1,47 @@
+# Generated by Django 4.2.21 on 2026-10-18 01:23
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def count_subquery(model, fk):
+    return Coalesce(
+        Subquery(
+            model.objects.filter(**{fk: OuterRef('pk')})
+            .order_by()
+            .values(fk)
+            .annotate(total=Count('pk'))
+            .values('total')
+        ),
+        0,
+    )
+
+
+def fill_counters(apps, schema_editor):
+    Recipe = apps.get_model('recipes', 'Recipe')
+    Favorite = apps.get_model('recipes', 'Favorite')
+    CustomUser = apps.get_model('users', 'CustomUser')
+    Follow = apps.get_model('users', 'Follow')
+    Recipe.objects.update(favorites_count=count_subquery(Favorite, 'recipe'))
+    CustomUser.objects.update(
+        recipes_count=count_subquery(Recipe, 'author'),
+        followers_count=count_subquery(Follow, 'author'),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0004_shoppinglistitem'),
+        ('users', '0004_customuser_counters'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='favorites_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='В избранном раз'),
+        ),
+        migrations.RunPython(fill_counters, migrations.RunPython.noop),
+    ]
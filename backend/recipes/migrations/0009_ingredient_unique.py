@@ -0,0 +1,63 @@
+from django.db import migrations, models
+from django.db.models import Count, Min
+
+
+def merge_duplicates(apps, schema_editor):
+    """
+    Перед добавлением ограничения сливаем дубликаты (name, measurement_unit)
+    в ингредиент с наименьшим id, перенося на него ссылки рецептов и списков покупок.
+    Количества одного рецепта складываются, но не больше, чем вмещает поле.
+    """
+    Ingredient = apps.get_model('recipes', 'Ingredient')
+    RecipeIngredient = apps.get_model('recipes', 'RecipeIngredient')
+    ShoppingListItem = apps.get_model('recipes', 'ShoppingListItem')
+    groups = (
+        Ingredient.objects.values('name', 'measurement_unit')
+        .annotate(keep=Min('id'), total=Count('id'))
+        .filter(total__gt=1)
+        .order_by()
+    )
+    for group in groups:
+        duplicates = Ingredient.objects.filter(
+            name=group['name'], measurement_unit=group['measurement_unit'],
+        ).exclude(id=group['keep'])
+        for model, owner, amount in (
+            (RecipeIngredient, 'recipe_id', 'amount'),
+            (ShoppingListItem, 'user_id', 'total_amount'),
+        ):
+            _, limit = schema_editor.connection.ops.integer_field_range(
+                model._meta.get_field(amount).get_internal_type()
+            )
+            for row in model.objects.filter(ingredient__in=duplicates):
+                kept = model.objects.filter(
+                    ingredient_id=group['keep'], **{owner: getattr(row, owner)},
+                ).first()
+                if kept is None:
+                    row.ingredient_id = group['keep']
+                    row.save(update_fields=['ingredient'])
+                else:
+                    total = getattr(kept, amount) + getattr(row, amount)
+                    setattr(kept, amount, total if limit is None else min(total, limit))
+                    kept.save(update_fields=[amount])
+                    row.delete()
+        duplicates.delete()
+    if schema_editor.connection.vendor == 'postgresql':
+        # Внешние ключи в PostgreSQL DEFERRABLE INITIALLY DEFERRED: без
+        # немедленной проверки ALTER TABLE в той же транзакции падает
+        # с «pending trigger events»
+        schema_editor.execute('SET CONSTRAINTS ALL IMMEDIATE')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0008_recipe_image_variants'),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_duplicates, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='ingredient',
+            constraint=models.UniqueConstraint(fields=('name', 'measurement_unit'), name='unique_ingredient'),
+        ),
+    ]
@@ -0,0 +1,47 @@
+from django.db import migrations
+
+from recipes.db_checks import check_plans
+
+# Столбец и индекс только для PostgreSQL и вне состояния моделей (см. recipes.recipe_search):
+# генерируемый столбец пересчитывает сама СУБД, Django его не пишет.
+# ADD COLUMN ... STORED переписывает таблицу — на большой базе это блокировка на время миграции.
+ADD_COLUMN = """
+    ALTER TABLE recipes_recipe ADD COLUMN search_vector tsvector GENERATED ALWAYS AS (
+        setweight(to_tsvector('russian', coalesce(name, '')), 'A')
+        || setweight(to_tsvector('russian', coalesce(description, '')), 'B')
+    ) STORED
+"""
+CREATE_INDEX = 'CREATE INDEX recipe_search_vector_idx ON recipes_recipe USING gin (search_vector)'
+DROP_COLUMN = 'ALTER TABLE recipes_recipe DROP COLUMN search_vector'
+
+# Запрос, который поиск рецептов отправляет в БД, и ожидаемый индекс
+PLAN_CHECKS = [
+    ("SELECT id FROM recipes_recipe WHERE search_vector @@ websearch_to_tsquery('russian', 'пироги')",
+     'recipe_search_vector_idx'),
+]
+
+
+def create_column(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute(ADD_COLUMN)
+    schema_editor.execute(CREATE_INDEX)
+    check_plans(schema_editor, PLAN_CHECKS)
+
+
+def drop_column(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    # Индекс удаляется вместе со столбцом
+    schema_editor.execute(DROP_COLUMN)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0009_ingredient_unique'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_column, drop_column),
+    ]
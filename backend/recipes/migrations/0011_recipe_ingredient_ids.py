@@ -0,0 +1,111 @@
+from django.db import migrations
+
+from recipes.db_checks import check_plans
+
+# Отсортированные id ингредиентов рецепта одним массивом (см. recipes.ingredient_sets).
+# Только PostgreSQL и вне состояния моделей, как search_vector из 0010. Массив ведут
+# триггеры уровня оператора на recipes_recipeingredient: один UPDATE рецептов на
+# оператор, так что bulk_create загрузчиков, правка рецепта, админка и каскадное
+# удаление обновляют его одинаково.
+ADD_COLUMN = "ALTER TABLE recipes_recipe ADD COLUMN ingredient_ids bigint[] NOT NULL DEFAULT '{}'"
+CREATE_FUNCTIONS = """
+    CREATE FUNCTION recipes_refresh_ingredient_ids(recipe_ids bigint[]) RETURNS void
+    LANGUAGE sql AS $$
+        UPDATE recipes_recipe AS recipe SET ingredient_ids = ARRAY(
+            SELECT ingredient_id FROM recipes_recipeingredient
+            WHERE recipe_id = recipe.id ORDER BY ingredient_id
+        )
+        WHERE recipe.id = ANY(recipe_ids)
+    $$;
+
+    CREATE FUNCTION recipes_recipeingredient_changed() RETURNS trigger
+    LANGUAGE plpgsql AS $$
+    BEGIN
+        -- Переходные таблицы объявлены не у всех триггеров: каждая ветка ссылается только на свои
+        IF TG_OP = 'INSERT' THEN
+            PERFORM recipes_refresh_ingredient_ids(ARRAY(SELECT DISTINCT recipe_id FROM new_rows));
+        ELSIF TG_OP = 'DELETE' THEN
+            PERFORM recipes_refresh_ingredient_ids(ARRAY(SELECT DISTINCT recipe_id FROM old_rows));
+        ELSE
+            PERFORM recipes_refresh_ingredient_ids(ARRAY(
+                SELECT recipe_id FROM new_rows UNION SELECT recipe_id FROM old_rows
+            ));
+        END IF;
+        RETURN NULL;
+    END
+    $$;
+"""
+CREATE_TRIGGERS = """
+    CREATE TRIGGER recipeingredient_inserted AFTER INSERT ON recipes_recipeingredient
+        REFERENCING NEW TABLE AS new_rows
+        FOR EACH STATEMENT EXECUTE FUNCTION recipes_recipeingredient_changed();
+    CREATE TRIGGER recipeingredient_deleted AFTER DELETE ON recipes_recipeingredient
+        REFERENCING OLD TABLE AS old_rows
+        FOR EACH STATEMENT EXECUTE FUNCTION recipes_recipeingredient_changed();
+    CREATE TRIGGER recipeingredient_updated AFTER UPDATE ON recipes_recipeingredient
+        REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+        FOR EACH STATEMENT EXECUTE FUNCTION recipes_recipeingredient_changed();
+"""
+BACKFILL = """
+    UPDATE recipes_recipe AS recipe SET ingredient_ids = grouped.ids
+    FROM (
+        SELECT recipe_id, array_agg(ingredient_id ORDER BY ingredient_id) AS ids
+        FROM recipes_recipeingredient GROUP BY recipe_id
+    ) AS grouped
+    WHERE recipe.id = grouped.recipe_id
+"""
+CREATE_INDEXES = """
+    CREATE INDEX recipe_ingredient_ids_idx ON recipes_recipe USING gin (ingredient_ids);
+    CREATE INDEX recipe_ingredient_count_idx ON recipes_recipe (cardinality(ingredient_ids));
+"""
+DROP = """
+    DROP TRIGGER recipeingredient_inserted ON recipes_recipeingredient;
+    DROP TRIGGER recipeingredient_deleted ON recipes_recipeingredient;
+    DROP TRIGGER recipeingredient_updated ON recipes_recipeingredient;
+    DROP FUNCTION recipes_recipeingredient_changed();
+    DROP FUNCTION recipes_refresh_ingredient_ids(bigint[]);
+    ALTER TABLE recipes_recipe DROP COLUMN ingredient_ids;
+"""
+
+# Запросы, которые фильтры по ингредиентам отправляют в БД, и ожидаемый индекс
+PLAN_CHECKS = [
+    ("SELECT id FROM recipes_recipe WHERE ingredient_ids @> ARRAY[1, 2]::bigint[]",
+     'recipe_ingredient_ids_idx'),
+    ("SELECT id FROM recipes_recipe WHERE ingredient_ids && ARRAY[1, 2]::bigint[]",
+     'recipe_ingredient_ids_idx'),
+    ("SELECT id FROM recipes_recipe WHERE ingredient_ids <@ ARRAY[1, 2]::bigint[]",
+     'recipe_ingredient_ids_idx'),
+    ("SELECT id FROM recipes_recipe WHERE cardinality(ingredient_ids) <= 2",
+     'recipe_ingredient_count_idx'),
+]
+
+
+def create_column(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute(ADD_COLUMN)
+    # Индекс до заполнения: построенный после UPDATE в той же транзакции
+    # (indcheckxmin) планировщик в ней не использует, и проверка планов упадёт
+    schema_editor.execute(CREATE_INDEXES)
+    schema_editor.execute(BACKFILL)
+    schema_editor.execute(CREATE_FUNCTIONS)
+    schema_editor.execute(CREATE_TRIGGERS)
+    check_plans(schema_editor, PLAN_CHECKS)
+
+
+def drop_column(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    # Индексы удаляются вместе со столбцом
+    schema_editor.execute(DROP)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0010_recipe_search_vector'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_column, drop_column),
+    ]
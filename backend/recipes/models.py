@@ -15,6 +15,11 @@ class Ingredient(models.Model):
         ordering = ['name']
         verbose_name = 'Ингредиент'
         verbose_name_plural = 'Ингредиенты'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['name', 'measurement_unit'], name='unique_ingredient'
+            )
+        ]
 
     def __str__(self):
         return f"{self.name} ({self.measurement_unit})"
@@ -23,6 +28,10 @@ class Ingredient(models.Model):
 class Recipe(models.Model):
     name = models.CharField('Название', max_length=200)
     image = models.ImageField('Изображение', upload_to='recipes/images')
+    # Уменьшенные копии и WebP рядом с оригиналом (см. api.utils.images)
+    image_variants = models.JSONField(
+        'Варианты изображения', default=dict, blank=True, editable=False
+    )
     description = models.TextField('Описание', max_length=1000)
     author = models.ForeignKey(
         CustomUser,
@@ -41,11 +50,30 @@ class Recipe(models.Model):
         validators=[MinValueValidator(1, message=COOKING_TIME_ERROR)]
     )
     pub_date = models.DateTimeField('Дата публикации', auto_now_add=True)
+    updated_at = models.DateTimeField(
+        'Дата изменения', auto_now=True, db_index=True
+    )
+    # Денормализованный счётчик, ведётся сигналами (см. recipes.counters)
+    favorites_count = models.PositiveIntegerField(
+        'В избранном раз', default=0, editable=False
+    )
 
     class Meta:
         ordering = ['-pub_date']
         verbose_name = 'Рецепт'
         verbose_name_plural = 'Рецепты'
+        indexes = [
+            # Ключ курсорной пагинации ленты (RecipeKeysetPagination)
+            models.Index(
+                fields=['-pub_date', '-id'], name='recipe_pub_date_id_idx'
+            ),
+            # Последние рецепты автора: лента подписок (recipes.feed) и фильтр
+            # ?author=
+            models.Index(
+                fields=['author', '-pub_date', '-id'],
+                name='recipe_author_pub_date_idx',
+            ),
+        ]
 
     def __str__(self):
         return self.name
@@ -129,4 +157,140 @@ class ShoppingCart(models.Model):
         ]
 
     def __str__(self):
-        return f"{self.user.username} добавил {self.recipe.name} в корзину"
\ No newline at end of file
+        return f"{self.user.username} добавил {self.recipe.name} в корзину"
+
+
+class ShoppingListItem(models.Model):
+    """
+    Материализованный список покупок: сумма ингредиента по всем рецептам
+    из корзины пользователя. Поддерживается вместе с корзиной
+    (см. recipes.shopping_list), сверяется командой rebuild_shopping_lists.
+    """
+    user = models.ForeignKey(
+        CustomUser,
+        on_delete=models.CASCADE,
+        related_name='shopping_list_items',
+        verbose_name='Пользователь'
+    )
+    ingredient = models.ForeignKey(
+        Ingredient,
+        on_delete=models.CASCADE,
+        related_name='shopping_list_items',
+        verbose_name='Ингредиент'
+    )
+    total_amount = models.IntegerField('Суммарное количество')
+
+    class Meta:
+        verbose_name = 'Позиция списка покупок'
+        verbose_name_plural = 'Список покупок'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'ingredient'],
+                name='unique_shopping_list_item',
+            )
+        ]
+
+    def __str__(self):
+        return (
+            f"{self.user.username}: {self.ingredient.name} - "
+            f"{self.total_amount}"
+        )
+
+
+class SimilarRecipe(models.Model):
+    """
+    Заранее посчитанный сосед рецепта по составу: коэффициент Жаккара
+    множеств ингредиентов. Строит build_similar_recipes, при смене состава
+    обновляет recipes.similar_recipes.
+    """
+    recipe = models.ForeignKey(
+        Recipe,
+        on_delete=models.CASCADE,
+        related_name='similar_recipes',
+        verbose_name='Рецепт'
+    )
+    similar = models.ForeignKey(
+        Recipe,
+        on_delete=models.CASCADE,
+        related_name='similar_to',
+        verbose_name='Похожий рецепт'
+    )
+    score = models.FloatField('Сходство')
+
+    class Meta:
+        verbose_name = 'Похожий рецепт'
+        verbose_name_plural = 'Похожие рецепты'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['recipe', 'similar'], name='unique_similar_recipe'
+            )
+        ]
+
+    def __str__(self):
+        return f"{self.recipe_id} ~ {self.similar_id}: {self.score:.2f}"
+
+
+class RecipeMinHashBand(models.Model):
+    """
+    Полоса MinHash-подписи рецепта (корзина LSH), см. recipes.similar_recipes.
+    """
+    recipe = models.ForeignKey(
+        Recipe,
+        on_delete=models.CASCADE,
+        related_name='minhash_bands',
+        verbose_name='Рецепт'
+    )
+    key = models.BigIntegerField('Ключ полосы')
+
+    class Meta:
+        verbose_name = 'Полоса MinHash'
+        verbose_name_plural = 'Полосы MinHash'
+        indexes = [
+            models.Index(
+                fields=['key', '-recipe'], name='recipe_minhash_band_key_idx'
+            )
+        ]
+
+    def __str__(self):
+        return f"{self.recipe_id}: {self.key}"
+
+
+class FeedEntry(models.Model):
+    """
+    Рецепт в ленте подписок пользователя (fan-out on write): строки
+    добавляются при публикации рецепта и подписке, удаляются при отписке
+    (см. recipes.feed), пересобираются командой rebuild_feeds.
+    """
+    user = models.ForeignKey(
+        CustomUser,
+        on_delete=models.CASCADE,
+        related_name='feed_entries',
+        verbose_name='Пользователь'
+    )
+    recipe = models.ForeignKey(
+        Recipe,
+        on_delete=models.CASCADE,
+        related_name='feed_entries',
+        verbose_name='Рецепт'
+    )
+    # Копия Recipe.pub_date: лента читается по индексу без соединения с
+    # рецептами
+    pub_date = models.DateTimeField('Дата публикации')
+
+    class Meta:
+        verbose_name = 'Запись ленты'
+        verbose_name_plural = 'Ленты подписок'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'recipe'], name='unique_feed_entry'
+            )
+        ]
+        indexes = [
+            models.Index(
+                fields=['user', '-pub_date', '-recipe'],
+                name='feed_entry_timeline_idx',
+            )
+        ]
+
+    def __str__(self):
+        return f"{self.user_id}: {self.recipe_id}"
@@ -0,0 +1,64 @@
+"""
+Полнотекстовый поиск рецептов по названию и описанию (?search= в списке).
+
+На PostgreSQL у recipes_recipe есть генерируемый столбец search_vector
+(миграция 0010): tsvector конфигурации russian, название с весом A,
+описание с весом B. PostgreSQL пересчитывает его сам при любой вставке
+и изменении — и в save(), и в bulk_create()/update(). Условие @@
+обслуживает GIN-индекс по столбцу, выдача упорядочена по ts_rank.
+Запрос разбирается websearch_to_tsquery: слова через И, "фраза",
+or, -исключение.
+
+Как и индексы поиска ингредиентов, столбца нет в состоянии моделей
+(см. recipes.columns).
+
+На остальных СУБД каждое слово запроса ищется подстрокой в названии или
+описании, совпадения в названии выше (без стемминга; в SQLite регистр
+не учитывается только для латиницы).
+"""
+from django.contrib.postgres.search import (
+    SearchQuery, SearchRank, SearchVectorExact, SearchVectorField,
+)
+from django.db import connection
+from django.db.models import Case, IntegerField, Q, Value, When
+
+from recipes.columns import TableColumn
+
+CONFIG = 'russian'
+COLUMN = 'search_vector'
+INDEX = 'recipe_search_vector_idx'
+
+
+def search_document():
+    return TableColumn(COLUMN, SearchVectorField())
+
+
+def search_recipes(queryset, text):
+    """Рецепты queryset, подходящие под запрос text, от самых релевантных."""
+    text = text.strip()
+    if not text:
+        return queryset
+    if connection.vendor != 'postgresql':
+        return _fallback(queryset, text)
+    query = SearchQuery(text, config=CONFIG, search_type='websearch')
+    # Ранг — только в ORDER BY: агрегаты по выборке (валидаторы списка) его не
+    # считают
+    return queryset.filter(
+        SearchVectorExact(search_document(), query)
+    ).order_by(
+        SearchRank(search_document(), query).desc(), '-pub_date', '-pk'
+    )
+
+
+def _fallback(queryset, text):
+    for word in text.split():
+        queryset = queryset.filter(
+            Q(name__icontains=word) | Q(description__icontains=word)
+        )
+    return queryset.order_by(
+        Case(
+            When(name__icontains=text, then=Value(0)),
+            default=Value(1), output_field=IntegerField(),
+        ),
+        '-pub_date', '-pk',
+    )
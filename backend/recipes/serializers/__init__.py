@@ -5,7 +5,7 @@ from .ingredient import (
 )
 from .recipe import RecipeSerializer, RecipeGetSerializer
 from .favorite import (FavoriteSerializer, BaseFavoriteShoppingSerializer,
-                       RecipeFavoriteSerializer)
+                       RecipeFavoriteSerializer, SimilarRecipeSerializer)
 from .shopping_cart import ShoppingCartSerializer
 
 __all__ = [
@@ -15,6 +15,7 @@ __all__ = [
     'RecipeSerializer',
     'RecipeGetSerializer',
     'RecipeFavoriteSerializer',
+    'SimilarRecipeSerializer',
     'FavoriteSerializer',
     'BaseFavoriteShoppingSerializer',
     'ShoppingCartSerializer',
@@ -1,10 +1,22 @@
 from rest_framework import serializers
 from recipes.models import Favorite, Recipe
+from users.serializers.base import ImageVariantsField
 
 class RecipeFavoriteSerializer(serializers.ModelSerializer):
+    image_srcset = ImageVariantsField('image')
+
     class Meta:
         model = Recipe
-        fields = ('id', 'name', 'image', 'cooking_time')
+        fields = ('id', 'name', 'image', 'image_srcset', 'cooking_time')
+
+
+class SimilarRecipeSerializer(RecipeFavoriteSerializer):
+    """Краткий рецепт со сходством по составу (см. recipes.similar_recipes)."""
+    similarity = serializers.FloatField(read_only=True)
+
+    class Meta(RecipeFavoriteSerializer.Meta):
+        fields = (*RecipeFavoriteSerializer.Meta.fields, 'similarity')
+
 
 class BaseFavoriteShoppingSerializer(serializers.ModelSerializer):
     """Общий сериализатор для избранного и корзины."""
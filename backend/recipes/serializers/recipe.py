@@ -1,13 +1,18 @@
+import json
+
+from django.db import transaction
 from rest_framework import serializers
+from recipes import shopping_list, similar_recipes
 from recipes.models import Recipe, RecipeIngredient, ShoppingCart, Favorite
 from users.serializers.user import UserSerializer
-from users.serializers.base import Base64ImageField
+from users.serializers.base import Base64ImageField, ImageVariantsField
 from .ingredient import IngredientInRecipeReadSerializer, IngredientInRecipeWriteSerializer
 
 class RecipeGetSerializer(serializers.ModelSerializer):
     author = UserSerializer(read_only=True)
     ingredients = IngredientInRecipeReadSerializer(many=True, source='ingredient_quantities')
     image = Base64ImageField(required=False, allow_null=True)
+    image_srcset = ImageVariantsField('image')
     is_favorited = serializers.SerializerMethodField()
     is_in_shopping_cart = serializers.SerializerMethodField()
     text = serializers.CharField(source='description', read_only=True)
@@ -17,15 +22,27 @@ class RecipeGetSerializer(serializers.ModelSerializer):
         fields = (
             'id', 'author', 'ingredients',
             'is_favorited', 'is_in_shopping_cart',
-            'name', 'image', 'description', 'text', 'cooking_time',
+            'name', 'image', 'image_srcset', 'description', 'text',
+            'cooking_time',
         )
         read_only_fields = fields
 
+    def to_representation(self, instance):
+        # Флаг подписки на автора приходит аннотацией из
+        # RecipeViewSet.get_queryset
+        if hasattr(instance, 'author_is_subscribed'):
+            instance.author.is_subscribed = instance.author_is_subscribed
+        return super().to_representation(instance)
+
     def get_is_favorited(self, obj):
+        if hasattr(obj, 'is_favorited'):
+            return obj.is_favorited
         user = getattr(self.context.get('request'), 'user', None)
         return user.is_authenticated and Favorite.objects.filter(user=user, recipe=obj).exists()
 
     def get_is_in_shopping_cart(self, obj):
+        if hasattr(obj, 'is_in_shopping_cart'):
+            return obj.is_in_shopping_cart
         user = getattr(self.context.get('request'), 'user', None)
         return user.is_authenticated and ShoppingCart.objects.filter(user=user, recipe=obj).exists()
 
@@ -43,6 +60,20 @@ class RecipeSerializer(serializers.ModelSerializer):
             'image', 'description', 'text', 'cooking_time',
         )
 
+    def to_internal_value(self, data):
+        if hasattr(data, 'getlist'):
+            # multipart/form-data: изображение — файлом, ингредиенты —
+            # JSON-строкой
+            data = {key: data.get(key) for key in data}
+            if isinstance(data.get('ingredients'), str):
+                try:
+                    data['ingredients'] = json.loads(data['ingredients'])
+                except ValueError:
+                    raise serializers.ValidationError(
+                        {'ingredients': 'Ожидается JSON-массив.'}
+                    )
+        return super().to_internal_value(data)
+
     def validate(self, data):
         ingredients = data.get('ingredients', [])
         description = data.get('description') or data.get('text')
@@ -69,14 +100,25 @@ class RecipeSerializer(serializers.ModelSerializer):
         ingredients = validated_data.pop('ingredients')
         recipe = Recipe.objects.create(**validated_data)
         self._add_ingredients(recipe, ingredients)
+        similar_recipes.schedule_refresh([recipe.pk])
         return recipe
 
+    @transaction.atomic
     def update(self, instance, validated_data):
         ingredients = validated_data.pop('ingredients', None)
         recipe = super().update(instance, validated_data)
         if ingredients is not None:
-            RecipeIngredient.objects.filter(recipe=recipe).delete()
+            # Состав заменяется целиком в обход сигналов строк: разницу между
+            # старым и новым составом переносим в списки покупок одним вызовом
+            old_amounts = shopping_list.recipe_amounts(recipe.pk)
+            rows = RecipeIngredient.objects.filter(recipe=recipe)
+            rows._raw_delete(rows.db)
             self._add_ingredients(recipe, ingredients)
+            shopping_list.change_recipe_ingredients(
+                recipe.pk, old_amounts,
+                {i['id']: i['amount'] for i in ingredients}
+            )
+            similar_recipes.schedule_refresh([recipe.pk])
         return recipe
 
     def _add_ingredients(self, recipe, ingredients):
@@ -0,0 +1,259 @@
+"""
+Список покупок: материализованные суммы ингредиентов корзины,
+версия корзины для ETag и потоковая выгрузка в txt/csv/json/pdf.
+
+Таблица ShoppingListItem меняется в той же транзакции, что и корзина:
+сигналы (recipes.signals) на ShoppingCart, RecipeIngredient и Recipe
+вызывают add_recipe/remove_recipe, change_recipe_ingredients и
+remove_recipe_everywhere при любом сохранении и удалении — из API,
+админки, shell или каскадом. Сигналов не шлют bulk_create и удаление
+в обход ORM: замена состава в RecipeSerializer.update переносит разницу
+сама, одним вызовом, остальное чинит пересборка rebuild_shopping_lists.
+"""
+import csv
+import io
+import json
+from collections import Counter
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Case, F, IntegerField, Sum, Value, When
+from django.utils import timezone
+
+from recipes.models import RecipeIngredient, ShoppingCart, ShoppingListItem
+from users.models import CustomUser
+
+TITLE = 'Список покупок:'
+DEFAULT_PDF_FONT = '/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf'
+
+
+def bump_cart_version(users):
+    """Помечает списки покупок пользователей из queryset как изменившиеся."""
+    users.update(
+        cart_version=F('cart_version') + 1,
+        relations_updated_at=timezone.now(),
+    )
+
+
+def recipe_amounts(recipe_id):
+    """{ingredient_id: amount} для рецепта."""
+    return dict(
+        RecipeIngredient.objects.filter(recipe_id=recipe_id)
+        .order_by()
+        .values_list('ingredient_id', 'amount')
+    )
+
+
+def add_recipe(user_id, recipe_id):
+    apply_deltas([user_id], recipe_amounts(recipe_id))
+
+
+def remove_recipe(user_id, recipe_id):
+    amounts = recipe_amounts(recipe_id)
+    apply_deltas([user_id], {i: -a for i, a in amounts.items()})
+
+
+def _cart_user_ids(recipe_id):
+    return list(
+        CustomUser.objects.filter(cart_items__recipe_id=recipe_id)
+        .values_list('pk', flat=True)
+    )
+
+
+def remove_recipe_everywhere(recipe_id):
+    """
+    Вычитает рецепт из списков всех, у кого он в корзине (перед удалением
+    рецепта).
+    """
+    amounts = recipe_amounts(recipe_id)
+    apply_deltas(
+        _cart_user_ids(recipe_id), {i: -a for i, a in amounts.items()}
+    )
+
+
+def change_recipe_ingredients(recipe_id, old_amounts, new_amounts):
+    """
+    Переносит в списки покупок разницу между старым и новым составом рецепта.
+    """
+    deltas = Counter(new_amounts)
+    deltas.subtract(old_amounts)
+    user_ids = _cart_user_ids(recipe_id)
+    apply_deltas(user_ids, deltas)
+    if user_ids and any(deltas.values()):
+        bump_cart_version(CustomUser.objects.filter(pk__in=user_ids))
+
+
+@transaction.atomic
+def apply_deltas(user_ids, deltas):
+    """
+    Прибавляет deltas {ingredient_id: delta} к спискам покупок пользователей.
+    """
+    deltas = {
+        ingredient_id: delta for ingredient_id, delta in deltas.items()
+        if delta
+    }
+    if not user_ids or not deltas:
+        return
+    # Блокируем строки пользователей (в постоянном порядке — без
+    # взаимоблокировок), чтобы параллельные изменения одной корзины не вставили
+    # дубликаты позиций.
+    list(
+        CustomUser.objects.select_for_update()
+        .filter(pk__in=user_ids).order_by('pk').values_list('pk', flat=True)
+    )
+    items = ShoppingListItem.objects.filter(
+        user_id__in=user_ids, ingredient_id__in=deltas
+    )
+    items.update(total_amount=F('total_amount') + Case(
+        *[When(ingredient_id=i, then=Value(d)) for i, d in deltas.items()],
+        default=Value(0),
+        output_field=IntegerField(),
+    ))
+    existing = set(items.values_list('user_id', 'ingredient_id'))
+    ShoppingListItem.objects.bulk_create([
+        ShoppingListItem(
+            user_id=user_id, ingredient_id=ingredient_id, total_amount=delta
+        )
+        for user_id in user_ids
+        for ingredient_id, delta in deltas.items()
+        if delta > 0 and (user_id, ingredient_id) not in existing
+    ])
+    ShoppingListItem.objects.filter(
+        user_id__in=user_ids, total_amount__lte=0
+    ).delete()
+
+
+def live_totals(user_ids=None):
+    """
+    Эталонная агрегация по корзинам: {(user_id, ingredient_id): total}.
+    Используется для пересборки и сверки ShoppingListItem.
+    """
+    qs = ShoppingCart.objects.all()
+    if user_ids is not None:
+        qs = qs.filter(user_id__in=user_ids)
+    rows = (
+        qs.values_list('user_id', 'recipe__ingredient_quantities__ingredient')
+        .annotate(total=Sum('recipe__ingredient_quantities__amount'))
+        .order_by()
+    )
+    return {
+        (user_id, ingredient_id): total
+        for user_id, ingredient_id, total in rows.iterator()
+        if ingredient_id is not None
+    }
+
+
+def stored_totals(user_ids=None):
+    qs = ShoppingListItem.objects.all()
+    if user_ids is not None:
+        qs = qs.filter(user_id__in=user_ids)
+    rows = qs.values_list('user_id', 'ingredient_id', 'total_amount')
+    return {
+        (user_id, ingredient_id): total
+        for user_id, ingredient_id, total in rows.iterator()
+    }
+
+
+def cart_ingredients(user):
+    """
+    Список покупок пользователя: одно чтение по индексу (user, ingredient).
+    """
+    return (
+        ShoppingListItem.objects.filter(user=user)
+        .values(
+            'ingredient__name', 'ingredient__measurement_unit', 'total_amount'
+        )
+        .order_by('ingredient__name')
+        .iterator(chunk_size=500)
+    )
+
+
+def render_txt(rows):
+    yield f'{TITLE}\n\n'
+    separator = ''
+    for item in rows:
+        yield (
+            f"{separator}{item['ingredient__name']} "
+            f"({item['ingredient__measurement_unit']}) - "
+            f"{item['total_amount']}"
+        )
+        separator = '\n'
+
+
+class _Echo:
+    """Файлоподобный объект для csv.writer: возвращает строку вместо записи."""
+
+    def write(self, value):
+        return value
+
+
+def render_csv(rows):
+    writer = csv.writer(_Echo())
+    yield writer.writerow(['name', 'measurement_unit', 'amount'])
+    for item in rows:
+        yield writer.writerow([
+            item['ingredient__name'],
+            item['ingredient__measurement_unit'],
+            item['total_amount'],
+        ])
+
+
+def render_json(rows):
+    yield '['
+    separator = ''
+    for item in rows:
+        yield separator + json.dumps({
+            'name': item['ingredient__name'],
+            'measurement_unit': item['ingredient__measurement_unit'],
+            'amount': item['total_amount'],
+        }, ensure_ascii=False)
+        separator = ','
+    yield ']'
+
+
+def render_pdf(rows):
+    # PDF нельзя отдавать по частям до записи таблицы ссылок, поэтому документ
+    # собирается в памяти; его размер ограничен числом разных ингредиентов.
+    from reportlab.lib.pagesizes import A4
+    from reportlab.pdfbase import pdfmetrics
+    from reportlab.pdfbase.ttfonts import TTFont
+    from reportlab.pdfgen import canvas
+
+    font_name = 'ShoppingListFont'
+    if font_name not in pdfmetrics.getRegisteredFontNames():
+        font_path = getattr(
+            settings, 'SHOPPING_LIST_PDF_FONT', DEFAULT_PDF_FONT
+        )
+        pdfmetrics.registerFont(TTFont(font_name, font_path))
+
+    buffer = io.BytesIO()
+    pdf = canvas.Canvas(buffer, pagesize=A4)
+    width, height = A4
+    margin, line_height = 50, 16
+    y = height - margin
+    pdf.setFont(font_name, 14)
+    pdf.drawString(margin, y, TITLE)
+    y -= line_height * 2
+    pdf.setFont(font_name, 11)
+    for item in rows:
+        if y < margin:
+            pdf.showPage()
+            pdf.setFont(font_name, 11)
+            y = height - margin
+        pdf.drawString(margin, y, (
+            f"{item['ingredient__name']} "
+            f"({item['ingredient__measurement_unit']}) - "
+            f"{item['total_amount']}"
+        ))
+        y -= line_height
+    pdf.save()
+    yield buffer.getvalue()
+
+
+# формат -> (генератор, расширение файла)
+FORMATS = {
+    'txt': (render_txt, 'txt'),
+    'csv': (render_csv, 'csv'),
+    'json': (render_json, 'json'),
+    'pdf': (render_pdf, 'pdf'),
+}
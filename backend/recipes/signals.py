@@ -0,0 +1,220 @@
+from django.conf import settings
+from django.db.models.signals import (
+    post_delete, post_save, pre_delete, pre_save,
+)
+from django.dispatch import receiver
+from django.utils import timezone
+
+from recipes import (
+    counters, feed, ingredient_index, shopping_list, similar_recipes,
+)
+from recipes.models import (
+    Favorite, Ingredient, Recipe, RecipeIngredient, ShoppingCart,
+    SimilarRecipe,
+)
+from users.models import CustomUser, Follow
+
+
+@receiver([post_save, post_delete], sender=Ingredient)
+def invalidate_ingredient_index(sender, **kwargs):
+    """Любое изменение каталога делает префиксный индекс устаревшим."""
+    ingredient_index.invalidate()
+
+
+@receiver([post_save, post_delete], sender=ShoppingCart)
+def bump_cart_version_on_cart_change(sender, instance, **kwargs):
+    shopping_list.bump_cart_version(
+        CustomUser.objects.filter(pk=instance.user_id)
+    )
+
+
+def _deleted_directly(origin, model):
+    """
+    Удаление начато с самой строки model (или её queryset), а не каскадом:
+    при удалении рецепта его вычитает remove_recipe_everywhere, а строки
+    списков удалённых пользователя или ингредиента удаляются каскадом сами.
+    """
+    return isinstance(origin, model) or getattr(origin, 'model', None) is model
+
+
+@receiver(pre_save, sender=ShoppingCart)
+@receiver(pre_save, sender=RecipeIngredient)
+def remember_saved_row(sender, instance, **kwargs):
+    # Правка существующей строки (админка, shell): старое значение
+    # вычитается из списков покупок после сохранения
+    instance._saved_row = None
+    if instance.pk:
+        instance._saved_row = sender.objects.filter(pk=instance.pk).first()
+
+
+@receiver(post_save, sender=ShoppingCart)
+def shopping_list_on_cart_save(sender, instance, **kwargs):
+    old = instance._saved_row
+    if old is not None:
+        if (
+            (old.user_id, old.recipe_id)
+            == (instance.user_id, instance.recipe_id)
+        ):
+            return
+        shopping_list.remove_recipe(old.user_id, old.recipe_id)
+    shopping_list.add_recipe(instance.user_id, instance.recipe_id)
+
+
+@receiver(pre_delete, sender=ShoppingCart)
+def shopping_list_on_cart_delete(sender, instance, origin=None, **kwargs):
+    if _deleted_directly(origin, ShoppingCart):
+        shopping_list.remove_recipe(instance.user_id, instance.recipe_id)
+
+
+@receiver(post_save, sender=RecipeIngredient)
+def shopping_list_on_recipe_ingredient_save(sender, instance, **kwargs):
+    old = instance._saved_row
+    new_amounts = {instance.ingredient_id: instance.amount}
+    if old is not None and old.recipe_id != instance.recipe_id:
+        shopping_list.change_recipe_ingredients(
+            old.recipe_id, {old.ingredient_id: old.amount}, {}
+        )
+        old = None
+    old_amounts = {old.ingredient_id: old.amount} if old is not None else {}
+    shopping_list.change_recipe_ingredients(
+        instance.recipe_id, old_amounts, new_amounts
+    )
+
+
+@receiver(pre_delete, sender=RecipeIngredient)
+def shopping_list_on_recipe_ingredient_delete(sender, instance, origin=None,
+                                              **kwargs):
+    if _deleted_directly(origin, RecipeIngredient):
+        shopping_list.change_recipe_ingredients(
+            instance.recipe_id, {instance.ingredient_id: instance.amount}, {}
+        )
+
+
+@receiver(pre_delete, sender=Recipe)
+def shopping_list_on_recipe_delete(sender, instance, **kwargs):
+    shopping_list.remove_recipe_everywhere(instance.pk)
+
+
+@receiver(post_save, sender=Ingredient)
+@receiver(pre_delete, sender=Ingredient)
+def bump_cart_version_on_ingredient_change(sender, instance, **kwargs):
+    # Название или единица измерения попадают в список покупок
+    shopping_list.bump_cart_version(
+        CustomUser.objects.filter(cart_items__recipe__ingredients=instance)
+    )
+
+
+@receiver(post_save, sender=Ingredient)
+@receiver(pre_delete, sender=Ingredient)
+def touch_recipes_on_ingredient_change(sender, instance, **kwargs):
+    # ...и в ответы рецептов, а значит, и в их ETag/Last-Modified
+    Recipe.objects.filter(
+        ingredient_quantities__ingredient=instance
+    ).update(updated_at=timezone.now())
+
+
+@receiver(post_save, sender=RecipeIngredient)
+def touch_recipe_on_recipe_ingredient_save(sender, instance, **kwargs):
+    # Состав — часть ответа рецепта, а значит, и его ETag/Last-Modified
+    Recipe.objects.filter(pk=instance.recipe_id).update(
+        updated_at=timezone.now()
+    )
+
+
+@receiver(post_delete, sender=RecipeIngredient)
+def touch_recipe_on_recipe_ingredient_delete(sender, instance, origin=None,
+                                             **kwargs):
+    # При каскаде рецепт удалён или его уже тронул
+    # touch_recipes_on_ingredient_change
+    if _deleted_directly(origin, RecipeIngredient):
+        Recipe.objects.filter(pk=instance.recipe_id).update(
+            updated_at=timezone.now()
+        )
+
+
+@receiver([post_save, post_delete], sender=Favorite)
+def touch_relations_on_favorite(sender, instance, **kwargs):
+    CustomUser.objects.filter(pk=instance.user_id).update(
+        relations_updated_at=timezone.now()
+    )
+
+
+@receiver([post_save, post_delete], sender=Follow)
+def touch_relations_on_follow(sender, instance, **kwargs):
+    CustomUser.objects.filter(pk=instance.subscriber_id).update(
+        relations_updated_at=timezone.now()
+    )
+
+
+@receiver(post_save, sender=Favorite)
+def count_favorite_added(sender, instance, created, **kwargs):
+    if created:
+        counters.change(Recipe, instance.recipe_id, 'favorites_count', 1)
+
+
+@receiver(post_delete, sender=Favorite)
+def count_favorite_removed(sender, instance, **kwargs):
+    counters.change(Recipe, instance.recipe_id, 'favorites_count', -1)
+
+
+@receiver(post_save, sender=Recipe)
+def count_recipe_added(sender, instance, created, **kwargs):
+    if created:
+        counters.change(CustomUser, instance.author_id, 'recipes_count', 1)
+
+
+@receiver(post_delete, sender=Recipe)
+def count_recipe_removed(sender, instance, **kwargs):
+    counters.change(CustomUser, instance.author_id, 'recipes_count', -1)
+
+
+@receiver(pre_delete, sender=Recipe)
+def recompute_similar_on_recipe_delete(sender, instance, **kwargs):
+    # Пары с рецептом удалятся каскадом — списки, где он был, станут короче K
+    recipe_ids = list(
+        SimilarRecipe.objects.filter(similar=instance)
+        .values_list('recipe_id', flat=True)
+    )
+    if recipe_ids:
+        similar_recipes.schedule_recompute(recipe_ids)
+
+
+@receiver(post_save, sender=Follow)
+def count_follower_added(sender, instance, created, **kwargs):
+    if created:
+        counters.change(CustomUser, instance.author_id, 'followers_count', 1)
+
+
+@receiver(post_delete, sender=Follow)
+def count_follower_removed(sender, instance, **kwargs):
+    counters.change(CustomUser, instance.author_id, 'followers_count', -1)
+
+
+@receiver(post_save, sender=Recipe)
+def fan_out_recipe(sender, instance, created, **kwargs):
+    if created:
+        feed.schedule(feed.fan_out, instance.pk)
+
+
+@receiver(post_save, sender=Follow)
+def backfill_feed_on_follow(sender, instance, created, **kwargs):
+    if created:
+        feed.schedule(
+            feed.backfill, instance.subscriber_id, instance.author_id
+        )
+
+
+@receiver(post_delete, sender=Follow)
+def prune_feed_on_unfollow(sender, instance, **kwargs):
+    feed.schedule(feed.prune, instance.subscriber_id, instance.author_id)
+
+
+@receiver(post_delete, sender=Follow)
+def refill_feeds_below_fanout_limit(sender, instance, **kwargs):
+    # Счётчик уже уменьшен (count_follower_removed): ровно на пороге он
+    # оказывается, только опустившись сверху — автор снова раскладывается
+    if CustomUser.objects.filter(
+        pk=instance.author_id,
+        followers_count=settings.FEED_FANOUT_MAX_FOLLOWERS,
+    ).exists():
+        feed.schedule(feed.refill, instance.author_id)
@@ -0,0 +1,365 @@
+"""
+Похожие рецепты по составу: K соседей с наибольшим коэффициентом
+Жаккара множеств ингредиентов, заранее посчитанные в SimilarRecipe, —
+/api/recipes/{id}/similar/ читает до K строк по индексу.
+
+Попарно рецепты не сравниваются. MinHash-подпись рецепта — NUM_HASHES
+минимумов универсальных хешей (a·x + b) mod p по id его ингредиентов:
+значения у двух рецептов совпадают с вероятностью, равной их Жаккару.
+Подпись режется на BANDS полос по ROWS значений (LSH), рецепты с
+одинаковой полосой — кандидаты, для них Жаккар считается точно. Кандидатом
+рецепт становится с вероятностью 1 - (1 - J^ROWS)^BANDS: около 0,5 при
+J = 0,3, 0,8 при 0,4 и почти всегда при J от 0,5. Полоса из трёх значений
+реже сводит в одну корзину рецепты, у которых общие только соль и вода.
+
+Ключи полос хранятся в RecipeMinHashBand (индекс по ключу): после смены
+состава одного рецепта кандидаты находятся запросом, без пересборки всего
+(refresh). refresh и recompute выполняются после коммита в фоне одним
+потоком (SIMILAR_RECIPES_ASYNC), не задерживая ответ на сохранение рецепта.
+Из переполненной корзины (соль, вода, мука) берутся только
+MAX_BUCKET + 1 самых новых рецептов. Полная пересборка —
+manage.py build_similar_recipes; ключи зависят от констант модуля, после их
+изменения нужна пересборка.
+"""
+import hashlib
+import heapq
+import random
+from collections import defaultdict
+from functools import lru_cache
+
+from django.db import connection, transaction
+from django.db.models import F, Window
+from django.db.models.functions import RowNumber
+
+from api.utils import background
+from api.utils.bulk import insert_batches
+from recipes import ingredient_sets
+from recipes.models import (
+    Recipe, RecipeIngredient, RecipeMinHashBand, SimilarRecipe,
+)
+
+TOP_K = 10
+BANDS = 24
+ROWS = 3
+NUM_HASHES = BANDS * ROWS
+MAX_BUCKET = 100
+PRIME = (1 << 61) - 1
+SEED = 20240521
+
+_random = random.Random(SEED)
+COEFFICIENTS = [
+    (_random.randrange(1, PRIME), _random.randrange(PRIME))
+    for _ in range(NUM_HASHES)
+]
+
+
+@lru_cache(maxsize=None)
+def _ingredient_hashes(ingredient_id):
+    return tuple((a * ingredient_id + b) % PRIME for a, b in COEFFICIENTS)
+
+
+def signature(ingredient_ids):
+    """MinHash-подпись непустого множества ингредиентов."""
+    # Хеши ингредиента считаются один раз, минимумы по позициям — на уровне C
+    return tuple(map(min, zip(*map(_ingredient_hashes, ingredient_ids))))
+
+
+def band_keys(ingredient_ids):
+    """
+    Ключи полос подписи: знаковые 64 бита с номером полосы, одинаковые во всех
+    процессах.
+    """
+    if not ingredient_ids:
+        return []
+    values = signature(ingredient_ids)
+    keys = []
+    for band in range(BANDS):
+        rows = values[band * ROWS:(band + 1) * ROWS]
+        digest = hashlib.blake2b(repr((band, rows)).encode(), digest_size=8)
+        keys.append(int.from_bytes(digest.digest(), 'big', signed=True))
+    return keys
+
+
+def jaccard(first, second):
+    common = len(first & second)
+    return common / (len(first) + len(second) - common) if common else 0.0
+
+
+def _scores(recipe_id, ingredients, candidates, sets):
+    """
+    [(сходство, кандидат)]; объединение не строится — его размер
+    |A| + |B| - |A ∩ B|.
+    """
+    size = len(ingredients)
+    scores = []
+    for candidate in candidates:
+        other = sets.get(candidate)
+        if other is None or candidate == recipe_id:
+            continue
+        common = len(ingredients & other)
+        scores.append((common / (size + len(other) - common), candidate))
+    return scores
+
+
+def recipe_ingredients(recipe_ids=None):
+    """{recipe_id: frozenset(ingredient_id)} для рецептов с ингредиентами."""
+    if connection.vendor == 'postgresql':
+        # Массив ingredient_ids (миграция 0011): строка на рецепт, а не на
+        # ингредиент
+        recipes = Recipe.objects.order_by().annotate(
+            ids=ingredient_sets.ingredient_ids()
+        )
+        if recipe_ids is not None:
+            recipes = recipes.filter(pk__in=recipe_ids)
+        rows = recipes.values_list('pk', 'ids').iterator(chunk_size=10000)
+        return {recipe_id: frozenset(ids) for recipe_id, ids in rows if ids}
+    rows = RecipeIngredient.objects.order_by()
+    if recipe_ids is not None:
+        rows = rows.filter(recipe_id__in=recipe_ids)
+    sets = defaultdict(set)
+    rows = rows.values_list('recipe_id', 'ingredient_id')
+    for recipe_id, ingredient_id in rows.iterator(chunk_size=10000):
+        sets[recipe_id].add(ingredient_id)
+    return {recipe_id: frozenset(ids) for recipe_id, ids in sets.items()}
+
+
+def _nearest(scores):
+    """
+    TOP_K лучших из [(сходство, кандидат)]; при равном сходстве выше новые
+    рецепты.
+    """
+    return heapq.nlargest(TOP_K, scores)
+
+
+def _rows(lists):
+    return (
+        SimilarRecipe(recipe_id=recipe_id, similar_id=similar_id, score=score)
+        for recipe_id, nearest in lists.items()
+        for score, similar_id in nearest
+    )
+
+
+def rebuild(batch_size=5000, progress=None):
+    """
+    Пересобирает полосы и соседей всех рецептов в памяти. Возвращает (рецептов,
+    пар).
+    """
+    sets = recipe_ingredients()
+    keys = {recipe_id: band_keys(ids) for recipe_id, ids in sets.items()}
+    buckets = defaultdict(list)
+    for recipe_id in sorted(keys, reverse=True):
+        for key in keys[recipe_id]:
+            buckets[key].append(recipe_id)
+    if progress:
+        progress(f'подписи: {len(keys)} рецептов, {len(buckets)} корзин')
+
+    lists = {}
+    for recipe_id, ingredients in sets.items():
+        # То же правило, что и в _candidates: самые новые MAX_BUCKET + 1 из
+        # корзины
+        candidates = {
+            member for key in keys[recipe_id]
+            for member in buckets[key][:MAX_BUCKET + 1]
+        }
+        lists[recipe_id] = _nearest(
+            _scores(recipe_id, ingredients, candidates, sets)
+        )
+    if progress:
+        progress(f'соседи: {sum(map(len, lists.values()))} пар')
+
+    with transaction.atomic():
+        # У обеих моделей нет обратных связей — удаление одним DELETE без
+        # загрузки строк
+        RecipeMinHashBand.objects.all().delete()
+        SimilarRecipe.objects.all().delete()
+        insert_batches(RecipeMinHashBand, (
+            RecipeMinHashBand(recipe_id=recipe_id, key=key)
+            for recipe_id, recipe_keys in keys.items() for key in recipe_keys
+        ), batch_size)
+        insert_batches(SimilarRecipe, _rows(lists), batch_size)
+    return len(sets), sum(map(len, lists.values()))
+
+
+def _candidates(recipe_ids):
+    """{recipe_id: {кандидат}} по сохранённым полосам рецептов."""
+    keys = defaultdict(set)
+    bands = RecipeMinHashBand.objects.filter(recipe_id__in=recipe_ids)
+    for recipe_id, key in bands.values_list('recipe_id', 'key'):
+        keys[key].add(recipe_id)
+    if not keys:
+        return {}
+    # Окно вместо LIMIT на корзину: одним запросом для всех ключей
+    members = (
+        RecipeMinHashBand.objects.filter(key__in=keys)
+        .annotate(place=Window(
+            RowNumber(), partition_by=[F('key')],
+            order_by=F('recipe_id').desc(),
+        ))
+        .filter(place__lte=MAX_BUCKET + 1)
+        .values_list('key', 'recipe_id')
+    )
+    candidates = defaultdict(set)
+    for key, member in members:
+        for recipe_id in keys[key]:
+            candidates[recipe_id].add(member)
+    return candidates
+
+
+def _nearest_for(recipe_ids):
+    """
+    Соседи рецептов recipe_ids по сохранённым полосам и все посчитанные
+    сходства.
+    """
+    candidates = _candidates(recipe_ids)
+    sets = recipe_ingredients({
+        *recipe_ids,
+        *(member for found in candidates.values() for member in found),
+    })
+    lists, scores = {}, {}
+    for recipe_id in recipe_ids:
+        ingredients = sets.get(recipe_id)
+        if not ingredients:
+            lists[recipe_id] = []
+            continue
+        scores[recipe_id] = _scores(
+            recipe_id, ingredients, candidates.get(recipe_id, ()), sets
+        )
+        lists[recipe_id] = _nearest(scores[recipe_id])
+    return lists, scores
+
+
+def _store(lists):
+    """Заменяет списки соседей рецептов из lists."""
+    if not lists:
+        return
+    # Строки рецептов блокируются в постоянном порядке: параллельные пересчёты
+    # одних списков ждут друг друга и не вставляют дубликаты пар
+    list(
+        Recipe.objects.select_for_update().filter(pk__in=lists)
+        .order_by('pk').values_list('pk', flat=True)
+    )
+    SimilarRecipe.objects.filter(recipe_id__in=lists).delete()
+    SimilarRecipe.objects.bulk_create(_rows(lists))
+
+
+@transaction.atomic
+def recompute(recipe_ids):
+    """Пересчитывает списки соседей рецептов по сохранённым полосам."""
+    recipe_ids = set(
+        Recipe.objects.filter(pk__in=recipe_ids).values_list('pk', flat=True)
+    )
+    _store(_nearest_for(recipe_ids)[0])
+
+
+@transaction.atomic
+def refresh(recipe_ids):
+    """
+    Обновляет полосы и соседей рецептов recipe_ids после смены состава, а также
+    списки, где они были, и списки кандидатов, куда они теперь могут войти.
+    """
+    changed = set(
+        Recipe.objects.filter(pk__in=recipe_ids).values_list('pk', flat=True)
+    )
+    sets = recipe_ingredients(changed)
+    RecipeMinHashBand.objects.filter(recipe_id__in=changed).delete()
+    RecipeMinHashBand.objects.bulk_create(
+        RecipeMinHashBand(recipe_id=recipe_id, key=key)
+        for recipe_id, ids in sets.items() for key in band_keys(ids)
+    )
+    lists, scores = _nearest_for(changed)
+
+    # Сходства изменённых рецептов с чужими списками: с кандидатами — уже
+    # посчитаны, со списками, где рецепт был, но кандидатом им не стал, —
+    # заново. Рецепт входит и в список того, чья переполненная корзина его
+    # отсекла бы: такой список не хуже собранного полной пересборкой
+    fresh = defaultdict(dict)
+    for recipe_id in changed:
+        for score, candidate in scores.get(recipe_id, ()):
+            if candidate not in changed:
+                fresh[candidate][recipe_id] = score
+    pairs = (
+        SimilarRecipe.objects.filter(similar_id__in=changed)
+        .exclude(recipe_id__in=changed).values_list('recipe_id', 'similar_id')
+    )
+    missing = [
+        (recipe_id, similar_id) for recipe_id, similar_id in pairs
+        if similar_id not in fresh.get(recipe_id, ())
+    ]
+    others = {}
+    if missing:
+        others = recipe_ingredients({recipe_id for recipe_id, _ in missing})
+    for recipe_id, similar_id in missing:
+        fresh[recipe_id][similar_id] = jaccard(
+            others.get(recipe_id, frozenset()),
+            sets.get(similar_id, frozenset()),
+        )
+    current = defaultdict(list)
+    stored = SimilarRecipe.objects.filter(recipe_id__in=fresh).values_list(
+        'recipe_id', 'similar_id', 'score'
+    )
+    for recipe_id, similar_id, score in stored:
+        current[recipe_id].append((score, similar_id))
+
+    full = set()
+    for recipe_id, entered in fresh.items():
+        old = current.get(recipe_id, [])
+        # Полный список: рецепт, опустившийся ниже прежнего K-го места, мог
+        # уступить его тому, кого в списке нет, — такой список пересчитывается
+        # целиком
+        if len(old) >= TOP_K:
+            floor = min(old)[0]
+            if any(
+                similar_id in changed and entered.get(similar_id, 0) < floor
+                for _, similar_id in old
+            ):
+                full.add(recipe_id)
+                continue
+        kept = [
+            (score, similar_id) for score, similar_id in old
+            if similar_id not in changed
+        ]
+        nearest = _nearest(kept + [
+            (score, similar_id) for similar_id, score in entered.items()
+            if score
+        ])
+        if set(nearest) != set(old):
+            lists[recipe_id] = nearest
+    lists.update(_nearest_for(full)[0])
+    _store(lists)
+
+
+def _run_after_commit(function, recipe_ids):
+    # Один поток: пересчёты пересекающихся списков не перезаписывают друг
+    # друга. Ошибка только пишется в лог — рецепт уже сохранён, устаревших
+    # соседей исправит build_similar_recipes
+    background.run_after_commit(
+        'similar-recipes', function, recipe_ids,
+        setting='SIMILAR_RECIPES_ASYNC',
+    )
+
+
+def schedule_refresh(recipe_ids):
+    """
+    Обновление соседей после коммита транзакции, сменившей состав рецептов.
+    """
+    _run_after_commit(refresh, set(recipe_ids))
+
+
+def schedule_recompute(recipe_ids):
+    """
+    Пересчёт списков соседей после коммита (например, когда один из соседей
+    удалён).
+    """
+    _run_after_commit(recompute, set(recipe_ids))
+
+
+def similar_to(recipe_id):
+    """
+    Похожие рецепты со сходством (similarity): одно чтение по индексу пар.
+    """
+    return (
+        Recipe.objects.filter(similar_to__recipe_id=recipe_id)
+        .annotate(similarity=F('similar_to__score'))
+        .only('id', 'name', 'image', 'image_variants', 'cooking_time')
+        .order_by('-similarity', '-pk')
+    )
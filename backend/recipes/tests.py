@@ -1,3 +1,811 @@
-from django.test import TestCase
+import json
+import os
+import random
+import tempfile
+import threading
+from io import StringIO
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from django.core.cache import cache
+from django.core.management import CommandError, call_command
+from django.db import IntegrityError, connection, transaction
+from django.test import TestCase, TransactionTestCase, override_settings
+from rest_framework.test import APIClient, APITestCase
+
+from api.tests import make_recipe, make_user
+from recipes import ingredient_index, shopping_list
+from recipes.ingredient_index import IngredientPrefixIndex
+from recipes.management.commands.load_ingredients import Command
+from recipes.models import (
+    FeedEntry, Favorite, Ingredient, Recipe, RecipeIngredient, ShoppingCart,
+    ShoppingListItem,
+)
+from users.models import CustomUser, Follow
+
+
+class IngredientPrefixIndexTest(TestCase):
+    """Поиск по началу названия в индексе без учёта регистра."""
+
+    def setUp(self):
+        self.index = IngredientPrefixIndex([
+            (1, 'Абрикос', 'г'),
+            (2, 'абрикосовое варенье', 'г'),
+            (3, 'Авокадо', 'шт'),
+            (4, 'баклажан', 'шт'),
+        ])
+
+    def test_prefix_case_insensitive(self):
+        names = [item['name'] for item in self.index.search('АБР')]
+        self.assertEqual(names, ['Абрикос', 'абрикосовое варенье'])
+
+    def test_limit(self):
+        self.assertEqual(len(self.index.search('а', limit=2)), 2)
+
+    def test_empty_prefix_returns_all(self):
+        self.assertEqual(len(self.index.search('')), 4)
+
+    def test_no_match(self):
+        self.assertEqual(self.index.search('я'), [])
+
+
+class IngredientSearchEndpointTest(APITestCase):
+    """Эндпоинт отвечает из индекса и видит изменения каталога."""
+
+    def setUp(self):
+        ingredient_index.invalidate()
+        Ingredient.objects.create(name='соль', measurement_unit='г')
+        Ingredient.objects.create(name='сахар', measurement_unit='г')
+        Ingredient.objects.create(name='молоко', measurement_unit='мл')
+
+    def test_matches_orm(self):
+        # На SQLite istartswith не складывает регистр кириллицы, поэтому
+        # сравниваем с ORM на строчном префиксе; индекс отдельно проверен выше
+        response = self.client.get('/api/ingredients/', {'name': 'с'})
+        expected = list(
+            Ingredient.objects.filter(name__istartswith='с')
+            .values('id', 'name', 'measurement_unit')
+        )
+        self.assertEqual(
+            sorted(response.json(), key=lambda i: i['id']),
+            sorted(expected, key=lambda i: i['id'])
+        )
+
+    def test_no_queries_when_warm(self):
+        self.client.get('/api/ingredients/', {'name': 'с'})
+        with self.assertNumQueries(0):
+            self.client.get('/api/ingredients/', {'name': 'мо'})
+
+    def test_invalidated_on_change(self):
+        self.client.get('/api/ingredients/', {'name': 'с'})
+        Ingredient.objects.create(name='сметана', measurement_unit='г')
+        response = self.client.get('/api/ingredients/', {'name': 'см'})
+        self.assertEqual([i['name'] for i in response.json()], ['сметана'])
+        Ingredient.objects.filter(name='сметана').delete()
+        response = self.client.get('/api/ingredients/', {'name': 'см'})
+        self.assertEqual(response.json(), [])
+
+    def test_version_bumped_after_commit(self):
+        version = cache.get(ingredient_index.VERSION_KEY, 0)
+        with self.captureOnCommitCallbacks(execute=True):
+            Ingredient.objects.create(name='сметана', measurement_unit='г')
+            self.assertEqual(
+                cache.get(ingredient_index.VERSION_KEY, 0), version
+            )
+        self.assertEqual(
+            cache.get(ingredient_index.VERSION_KEY), version + 1
+        )
+
+    def test_limit_param(self):
+        response = self.client.get(
+            '/api/ingredients/', {'name': 'с', 'limit': 1}
+        )
+        self.assertEqual(len(response.json()), 1)
+
+
+class IngredientRankedSearchTest(APITestCase):
+    """?search= отдаёт сначала совпадения по началу, затем по подстроке."""
+
+    def setUp(self):
+        ingredient_index.invalidate()
+        for name in (
+            'абрикосовое варенье', 'варенье вишнёвое', 'малиновое варенье',
+            'вафли',
+        ):
+            Ingredient.objects.create(name=name, measurement_unit='г')
+
+    def test_prefix_before_substring(self):
+        response = self.client.get('/api/ingredients/', {'search': 'варенье'})
+        names = [i['name'] for i in response.json()]
+        self.assertEqual(names[0], 'варенье вишнёвое')
+        self.assertCountEqual(
+            names[1:], ['абрикосовое варенье', 'малиновое варенье']
+        )
+
+    def test_limit_caps_results(self):
+        response = self.client.get(
+            '/api/ingredients/', {'search': 'ва', 'limit': 2}
+        )
+        self.assertEqual(len(response.json()), 2)
+
+
+class RecipeSearchTest(APITestCase):
+    """
+    ?search= в списке рецептов: название и описание, совпадения в названии
+    выше.
+    """
+
+    def setUp(self):
+        # Анонимные списки отдаёт кэш ответов, а его версии меняет только
+        # коммит записи
+        cache.clear()
+        # Искомые слова не в начале: SQLite не складывает регистр кириллицы
+        author = make_user('cook')
+        self.in_name = make_recipe(author, [], name='Вишнёвый пирог с маком')
+        self.in_description = make_recipe(author, [], name='Десерт')
+        Recipe.objects.filter(pk=self.in_description.pk).update(
+            description='Сладкий пирог к чаю'
+        )
+        self.other = make_recipe(author, [], name='Борщ')
+
+    def names(self, query):
+        response = self.client.get('/api/recipes/', {'search': query})
+        self.assertEqual(response.status_code, 200)
+        return [recipe['name'] for recipe in response.json()['results']]
+
+    def test_name_ranked_above_description(self):
+        self.assertEqual(
+            self.names('пирог'), ['Вишнёвый пирог с маком', 'Десерт']
+        )
+
+    def test_all_words_required(self):
+        self.assertEqual(self.names('пирог маком'), ['Вишнёвый пирог с маком'])
+        self.assertEqual(self.names('пирог борщ'), [])
+
+    def test_follows_edits(self):
+        self.other.name = 'Борщ и пирог'
+        self.other.save()
+        self.assertIn('Борщ и пирог', self.names('пирог'))
+
+    def test_combines_with_filters(self):
+        other_author = make_user('baker')
+        make_recipe(other_author, [], name='Мясной пирог')
+        response = self.client.get(
+            '/api/recipes/', {'search': 'пирог', 'author': other_author.pk}
+        )
+        names = [recipe['name'] for recipe in response.json()['results']]
+        self.assertEqual(names, ['Мясной пирог'])
+
+
+class RecipeIngredientSetFilterTest(APITestCase):
+    """
+    Фильтры по набору ингредиентов: все, хотя бы один, ни одного, кладовая.
+    """
+
+    def setUp(self):
+        author = make_user('cook')
+        self.salt, self.flour, self.egg, self.milk, self.meat = (
+            Ingredient.objects.create(name=name, measurement_unit='г')
+            for name in ('соль', 'мука', 'яйцо', 'молоко', 'мясо')
+        )
+        self.pancakes = make_recipe(
+            author, [self.flour, self.egg, self.milk, self.salt], name='Блины'
+        )
+        self.omelette = make_recipe(
+            author, [self.egg, self.milk, self.salt], name='Омлет'
+        )
+        self.steak = make_recipe(author, [self.meat, self.salt], name='Стейк')
+
+    def names(self, **params):
+        query = {
+            key: (
+                ','.join(str(item.pk) for item in value)
+                if isinstance(value, tuple) else value
+            )
+            for key, value in params.items()
+        }
+        response = self.client.get('/api/recipes/', query)
+        self.assertEqual(response.status_code, 200)
+        return [recipe['name'] for recipe in response.json()['results']]
+
+    def test_all_any_none(self):
+        self.assertCountEqual(
+            self.names(ingredients=(self.egg, self.milk)), ['Блины', 'Омлет']
+        )
+        self.assertCountEqual(
+            self.names(ingredients=(self.egg, self.meat)), []
+        )
+        self.assertCountEqual(
+            self.names(ingredients_any=(self.flour, self.meat)),
+            ['Блины', 'Стейк'],
+        )
+        self.assertCountEqual(
+            self.names(ingredients_exclude=(self.flour,)), ['Омлет', 'Стейк']
+        )
+        self.assertCountEqual(
+            self.names(
+                ingredients=(self.salt,),
+                ingredients_exclude=(self.meat, self.flour),
+            ),
+            ['Омлет'],
+        )
+
+    def test_pantry(self):
+        pantry = (self.egg, self.milk, self.salt, self.meat)
+        self.assertCountEqual(self.names(pantry=pantry), ['Омлет', 'Стейк'])
+        # Сначала рецепты, которым не хватает меньше, при равенстве — новые
+        self.assertEqual(
+            self.names(pantry=(self.egg, self.milk, self.salt), max_missing=1),
+            ['Омлет', 'Стейк', 'Блины'],
+        )
+        self.assertEqual(self.names(pantry=(self.egg,), max_missing=1), [])
+
+    def test_follows_ingredient_changes(self):
+        RecipeIngredient.objects.filter(
+            recipe=self.steak, ingredient=self.salt
+        ).delete()
+        self.assertEqual(self.names(pantry=(self.meat,)), ['Стейк'])
+        RecipeIngredient.objects.filter(recipe=self.steak).update(
+            ingredient=self.egg
+        )
+        self.assertCountEqual(self.names(ingredients_any=(self.meat,)), [])
+        self.assertCountEqual(
+            self.names(ingredients=(self.egg,)), ['Блины', 'Омлет', 'Стейк']
+        )
+
+    def test_invalid_ids(self):
+        for params in (
+            {'ingredients': 'соль'},
+            {'pantry': '1,x'},
+            {'pantry': '1', 'max_missing': -1},
+        ):
+            response = self.client.get('/api/recipes/', params)
+            self.assertEqual(response.status_code, 400)
+
+
+@override_settings(IMAGE_VARIANTS_ASYNC=False, SIMILAR_RECIPES_ASYNC=False)
+class SimilarRecipesTest(APITestCase):
+    """
+    Похожие по составу рецепты: пересборка, обновление при смене состава,
+    удаление.
+    """
+
+    def setUp(self):
+        self.author = make_user('cook')
+        a, b, c, d, e, f, g, h = (
+            Ingredient.objects.create(
+                name=f'ингредиент {i}', measurement_unit='г'
+            )
+            for i in range(8)
+        )
+        self.soup_ingredients = [a, b, c, d, e]
+        self.soup = make_recipe(self.author, self.soup_ingredients, name='Суп')
+        self.stew = make_recipe(self.author, [a, b, c, d, f], name='Рагу')
+        self.borsch = make_recipe(self.author, [a, b, c, e, f], name='Борщ')
+        self.cake = make_recipe(self.author, [g, h], name='Торт')
+        self.cake_ingredients = [g, h]
+        call_command('build_similar_recipes', stdout=StringIO())
+
+    def similar(self, recipe):
+        response = self.client.get(f'/api/recipes/{recipe.pk}/similar/')
+        self.assertEqual(response.status_code, 200)
+        return [
+            (item['name'], round(item['similarity'], 2))
+            for item in response.json()
+        ]
+
+    def set_ingredients(self, recipe, ingredients):
+        self.client.force_authenticate(self.author)
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.patch(f'/api/recipes/{recipe.pk}/', {
+                'ingredients': [
+                    {'id': ingredient.pk, 'amount': 1}
+                    for ingredient in ingredients
+                ],
+                'text': 'Описание', 'cooking_time': 10,
+            }, format='json')
+        self.assertEqual(response.status_code, 200, response.content)
+
+    def test_endpoint(self):
+        # При равном сходстве выше новый рецепт
+        self.assertEqual(
+            self.similar(self.soup), [('Борщ', 0.67), ('Рагу', 0.67)]
+        )
+        self.assertEqual(self.similar(self.cake), [])
+        response = self.client.get(f'/api/recipes/{self.soup.pk}/similar/')
+        self.assertEqual(set(response.json()[0]), {
+            'id', 'name', 'image', 'image_srcset', 'cooking_time',
+            'similarity',
+        })
+        for path in (
+            '/api/recipes/999999/similar/', '/api/recipes/x/similar/'
+        ):
+            self.assertEqual(self.client.get(path).status_code, 404)
+
+    def test_follows_ingredient_changes(self):
+        self.set_ingredients(self.cake, self.soup_ingredients)
+        self.assertEqual(
+            self.similar(self.cake),
+            [('Суп', 1.0), ('Борщ', 0.67), ('Рагу', 0.67)],
+        )
+        self.assertEqual(self.similar(self.soup)[0], ('Торт', 1.0))
+        self.set_ingredients(self.cake, self.cake_ingredients)
+        self.assertEqual(self.similar(self.cake), [])
+        self.assertEqual(
+            self.similar(self.soup), [('Борщ', 0.67), ('Рагу', 0.67)]
+        )
+
+    def test_recipe_deleted(self):
+        self.client.force_authenticate(self.author)
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.delete(f'/api/recipes/{self.stew.pk}/')
+            self.assertEqual(response.status_code, 204)
+        self.assertEqual(self.similar(self.soup), [('Борщ', 0.67)])
+
+
+@override_settings(
+    FEED_ASYNC=False, IMAGE_VARIANTS_ASYNC=False, SIMILAR_RECIPES_ASYNC=False
+)
+class FeedTest(APITestCase):
+    """
+    Лента подписок: раскладка при публикации, подписка, отписка, популярные
+    авторы.
+    """
+
+    def setUp(self):
+        self.reader = make_user('reader')
+        self.cook = make_user('cook')
+        self.star = make_user('star')
+        self.old = make_recipe(self.cook, [], name='Старый')
+        self.client.force_authenticate(self.reader)
+
+    def feed(self, query='limit=10'):
+        response = self.client.get(f'/api/recipes/feed/?{query}')
+        self.assertEqual(response.status_code, 200, response.content)
+        return response.json()
+
+    def names(self, query='limit=10'):
+        return [item['name'] for item in self.feed(query)['results']]
+
+    def subscribe(self, author, method='post'):
+        with self.captureOnCommitCallbacks(execute=True):
+            response = getattr(self.client, method)(
+                f'/api/users/{author.pk}/subscribe/'
+            )
+        self.assertIn(response.status_code, (201, 204), response.content)
+
+    def publish(self, author, name):
+        with self.captureOnCommitCallbacks(execute=True):
+            return make_recipe(author, [], name=name)
+
+    def test_fan_out_backfill_and_prune(self):
+        self.subscribe(self.cook)
+        self.assertEqual(self.names(), ['Старый'])
+        self.publish(self.cook, 'Новый')
+        self.publish(self.star, 'Чужой')
+        self.assertEqual(self.names(), ['Новый', 'Старый'])
+        self.assertEqual(FeedEntry.objects.filter(user=self.reader).count(), 2)
+        self.subscribe(self.cook, 'delete')
+        self.assertEqual(self.names(), [])
+        self.assertFalse(FeedEntry.objects.exists())
+
+    @override_settings(FEED_FANOUT_MAX_FOLLOWERS=1)
+    def test_popular_author_pulled(self):
+        self.subscribe(self.cook)
+        self.subscribe(self.star)
+        Follow.objects.create(subscriber=self.cook, author=self.star)
+        self.star.refresh_from_db()
+        self.assertEqual(self.star.followers_count, 2)
+        self.publish(self.star, 'Звёздный')
+        self.publish(self.cook, 'Новый')
+        # Рецепты популярного автора не раскладываются, но в ленте есть
+        self.assertFalse(
+            FeedEntry.objects.filter(recipe__author=self.star).exists()
+        )
+        self.assertEqual(self.names(), ['Новый', 'Звёздный', 'Старый'])
+
+    @override_settings(FEED_FANOUT_MAX_FOLLOWERS=1)
+    def test_author_back_under_limit_refilled(self):
+        self.subscribe(self.star)
+        with self.captureOnCommitCallbacks(execute=True):
+            follow = Follow.objects.create(
+                subscriber=self.cook, author=self.star
+            )
+        self.publish(self.star, 'Звёздный')
+        self.assertFalse(
+            FeedEntry.objects.filter(recipe__author=self.star).exists()
+        )
+        with self.captureOnCommitCallbacks(execute=True):
+            follow.delete()
+        # Подписчик снова один: рецепт, вышедший при двух, разложен по ленте
+        self.assertTrue(FeedEntry.objects.filter(
+            user=self.reader, recipe__author=self.star
+        ).exists())
+        self.assertEqual(self.names(), ['Звёздный'])
+
+    @override_settings(FEED_FANOUT_MAX_FOLLOWERS=1)
+    def test_cursor_pagination(self):
+        self.subscribe(self.cook)
+        self.subscribe(self.star)
+        Follow.objects.create(subscriber=self.cook, author=self.star)
+        for index in range(4):
+            author = self.star if index % 2 else self.cook
+            self.publish(author, f'Рецепт {index}')
+        expected = ['Рецепт 3', 'Рецепт 2', 'Рецепт 1', 'Рецепт 0', 'Старый']
+
+        pages, query = [], 'limit=2'
+        while query:
+            page = self.feed(query)
+            pages.append([item['name'] for item in page['results']])
+            query = page['next'] and page['next'].split('?', 1)[1]
+        self.assertEqual(pages, [expected[:2], expected[2:4], expected[4:]])
+        previous = page['previous'].split('?', 1)[1]
+        self.assertEqual(self.names(previous), expected[2:4])
+
+    def test_rebuild(self):
+        self.subscribe(self.cook)
+        Recipe.objects.bulk_create([
+            Recipe(author=self.cook, name=f'Загруженный {index}',
+                   image='recipes/images/test.jpg',
+                   description='Описание', cooking_time=10)
+            for index in range(3)
+        ])
+        with override_settings(FEED_BACKFILL=2):
+            call_command('rebuild_feeds', stdout=StringIO())
+        self.assertEqual(len(self.names()), 2)
+
+    def test_anonymous(self):
+        self.client.force_authenticate(None)
+        response = self.client.get('/api/recipes/feed/')
+        self.assertEqual(response.status_code, 401)
+
+
+class ShoppingListTableTest(APITestCase):
+    """Материализованный список покупок всегда совпадает с живой агрегацией."""
+
+    def setUp(self):
+        self.user = make_user('buyer')
+        self.author = make_user('cook')
+        self.ingredients = [
+            Ingredient.objects.create(
+                name=f'ингредиент {i}', measurement_unit='г'
+            )
+            for i in range(5)
+        ]
+        self.recipes = [
+            make_recipe(
+                self.author, self.ingredients[i:i + 3], name=f'Рецепт {i}'
+            )
+            for i in range(3)
+        ]
+
+    def as_user(self, user):
+        self.client.force_authenticate(user)
+
+    def assert_consistent(self):
+        self.assertEqual(
+            shopping_list.stored_totals(), shopping_list.live_totals()
+        )
+        call_command('rebuild_shopping_lists', '--verify', stdout=StringIO())
+
+    def cart(self, method, recipe):
+        url = f'/api/recipes/{recipe.id}/shopping_cart/'
+        return getattr(self.client, method)(url)
+
+    def test_add_remove_sequence(self):
+        other = make_user('other')
+        for user in (self.user, other):
+            self.as_user(user)
+            for recipe in self.recipes:
+                self.assertEqual(self.cart('post', recipe).status_code, 201)
+                self.assert_consistent()
+        self.as_user(self.user)
+        for recipe in self.recipes[:2]:
+            self.assertEqual(self.cart('delete', recipe).status_code, 204)
+            self.assert_consistent()
+        self.assertEqual(self.cart('post', self.recipes[0]).status_code, 201)
+        self.assert_consistent()
+
+    def test_recipe_update_and_delete(self):
+        self.as_user(self.user)
+        self.cart('post', self.recipes[0])
+        self.cart('post', self.recipes[1])
+        self.as_user(self.author)
+        response = self.client.patch(
+            f'/api/recipes/{self.recipes[0].id}/',
+            {'ingredients': [
+                {'id': self.ingredients[0].id, 'amount': 7},
+                {'id': self.ingredients[4].id, 'amount': 2},
+            ], 'text': 'Описание', 'cooking_time': 5},
+            format='json'
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assert_consistent()
+        response = self.client.delete(f'/api/recipes/{self.recipes[1].id}/')
+        self.assertEqual(response.status_code, 204)
+        self.assert_consistent()
+
+    def test_recipe_update_applies_one_diff(self):
+        other = make_user('other')
+        for user in (self.user, other):
+            ShoppingCart.objects.create(user=user, recipe=self.recipes[0])
+        self.as_user(self.author)
+        apply_deltas = mock.patch.object(
+            shopping_list, 'apply_deltas', wraps=shopping_list.apply_deltas
+        )
+        with apply_deltas as applied:
+            response = self.client.patch(
+                f'/api/recipes/{self.recipes[0].id}/',
+                {'ingredients': [
+                    {'id': self.ingredients[0].id, 'amount': 7},
+                    {'id': self.ingredients[4].id, 'amount': 2},
+                ], 'text': 'Описание', 'cooking_time': 5},
+                format='json'
+            )
+        self.assertEqual(response.status_code, 200)
+        applied.assert_called_once()
+        self.assert_consistent()
+
+    def test_orm_changes(self):
+        # Админка, shell и каскады идут мимо API — таблица следует и за ними
+        other = make_user('other')
+        for user in (self.user, other):
+            for recipe in self.recipes:
+                ShoppingCart.objects.create(user=user, recipe=recipe)
+        self.assert_consistent()
+        row = RecipeIngredient.objects.filter(recipe=self.recipes[0]).first()
+        row.amount += 5
+        row.save()
+        self.assert_consistent()
+        row.ingredient = self.ingredients[4]
+        row.save()
+        self.assert_consistent()
+        RecipeIngredient.objects.filter(
+            recipe=self.recipes[1]
+        ).first().delete()
+        self.assert_consistent()
+        cart = ShoppingCart.objects.get(user=self.user, recipe=self.recipes[2])
+        cart.recipe = self.recipes[0]
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            cart.save()
+        ShoppingCart.objects.filter(
+            user=other, recipe=self.recipes[0]
+        ).delete()
+        self.assert_consistent()
+        self.recipes[1].delete()
+        self.assert_consistent()
+        self.author.delete()
+        self.assert_consistent()
+        self.assertFalse(ShoppingListItem.objects.exists())
+
+    def test_download_reads_table(self):
+        self.as_user(self.user)
+        self.cart('post', self.recipes[0])
+        ShoppingListItem.objects.filter(user=self.user).update(
+            total_amount=100
+        )
+        response = self.client.get(
+            '/api/recipes/download_shopping_cart/?format=json'
+        )
+        items = json.loads(b''.join(response.streaming_content))
+        amounts = {i['amount'] for i in items}
+        self.assertEqual(amounts, {100})
+
+    def test_rebuild_repairs_drift(self):
+        self.as_user(self.user)
+        self.cart('post', self.recipes[0])
+        ShoppingListItem.objects.filter(user=self.user).first().delete()
+        with self.assertRaises(CommandError):
+            call_command(
+                'rebuild_shopping_lists', '--verify', stdout=StringIO()
+            )
+        call_command('rebuild_shopping_lists', stdout=StringIO())
+        self.assert_consistent()
+
+
+class CountersTest(APITestCase):
+    """Счётчики меняются вместе со строками и чинятся recount_counters."""
+
+    def setUp(self):
+        self.author = make_user('cook')
+        self.reader = make_user('reader')
+        self.recipe = make_recipe(self.author, [], name='Рецепт')
+
+    def refresh(self):
+        self.author.refresh_from_db()
+        self.recipe.refresh_from_db()
+
+    def test_api_changes(self):
+        self.client.force_authenticate(self.reader)
+        self.client.post(f'/api/recipes/{self.recipe.id}/favorite/')
+        self.client.post(f'/api/users/{self.author.id}/subscribe/')
+        self.refresh()
+        self.assertEqual(self.recipe.favorites_count, 1)
+        self.assertEqual(self.author.followers_count, 1)
+        self.assertEqual(self.author.recipes_count, 1)
+        self.client.delete(f'/api/recipes/{self.recipe.id}/favorite/')
+        self.client.delete(f'/api/users/{self.author.id}/subscribe/')
+        self.recipe.delete()
+        self.author.refresh_from_db()
+        self.assertEqual(
+            (self.author.recipes_count, self.author.followers_count), (0, 0)
+        )
+
+    def test_duplicate_post_is_rejected(self):
+        self.client.force_authenticate(self.reader)
+        url = f'/api/recipes/{self.recipe.id}/favorite/'
+        self.assertEqual(self.client.post(url).status_code, 201)
+        self.assertEqual(self.client.post(url).status_code, 400)
+        self.refresh()
+        self.assertEqual(self.recipe.favorites_count, 1)
+
+    def test_drift_is_logged(self):
+        favorite = Favorite.objects.create(
+            user=self.reader, recipe=self.recipe
+        )
+        Recipe.objects.update(favorites_count=0)
+        with self.assertLogs('recipes.counters', 'WARNING'):
+            favorite.delete()
+        self.refresh()
+        self.assertEqual(self.recipe.favorites_count, 0)
+
+    def test_recount_repairs_drift(self):
+        Favorite.objects.create(user=self.reader, recipe=self.recipe)
+        Recipe.objects.update(favorites_count=42)
+        CustomUser.objects.update(recipes_count=0, followers_count=7)
+        call_command(
+            'recount_counters', '--batch-size', '1', stdout=StringIO()
+        )
+        self.refresh()
+        self.assertEqual(self.recipe.favorites_count, 1)
+        self.assertEqual(self.author.recipes_count, 1)
+        self.assertEqual(self.author.followers_count, 0)
+
+
+# Без фоновых потоков обработки картинок: они пережили бы очистку базы между
+# тестами. SQLite сериализует запись и отвечает "database is locked" — гонку
+# проверяет только PostgreSQL
+@skipUnless(
+    connection.vendor == 'postgresql',
+    'нужны параллельные транзакции PostgreSQL'
+)
+@override_settings(IMAGE_VARIANTS_ASYNC=False, SIMILAR_RECIPES_ASYNC=False)
+class CountersConcurrencyTest(TransactionTestCase):
+    """
+    Параллельные favorite/unfavorite из многих потоков не сбивают счётчик.
+    """
+
+    threads = 8
+    rounds = 15
+
+    def setUp(self):
+        author = make_user('cook')
+        self.recipe = make_recipe(author, [], name='Рецепт')
+        self.users = [make_user(f'user{i}') for i in range(4)]
+
+    def hammer(self, seed, statuses):
+        client = APIClient()
+        rnd = random.Random(seed)
+        url = f'/api/recipes/{self.recipe.id}/favorite/'
+        try:
+            for _ in range(self.rounds):
+                client.force_authenticate(rnd.choice(self.users))
+                method = getattr(client, rnd.choice(('post', 'delete')))
+                statuses.append(method(url).status_code)
+        finally:
+            connection.close()
+
+    def test_counter_matches_rows(self):
+        statuses = []
+        workers = [
+            threading.Thread(target=self.hammer, args=(seed, statuses))
+            for seed in range(self.threads)
+        ]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        # Каждый запрос отработал (исключение в потоке оставило бы его без
+        # ответа)
+        self.assertEqual(len(statuses), self.threads * self.rounds)
+        self.assertLessEqual(set(statuses), {201, 204, 400})
+        self.recipe.refresh_from_db()
+        self.assertEqual(
+            self.recipe.favorites_count,
+            Favorite.objects.filter(recipe=self.recipe).count()
+        )
+
+
+class LoadIngredientsTest(TestCase):
+    """
+    Синхронизация каталога: повторяемая, без удаления используемых
+    ингредиентов.
+    """
+
+    def setUp(self):
+        self.salt = Ingredient.objects.create(
+            name='соль', measurement_unit='г'
+        )
+        self.pepper = Ingredient.objects.create(
+            name='перец', measurement_unit='г'
+        )
+        self.obsolete = Ingredient.objects.create(
+            name='устаревший', measurement_unit='шт'
+        )
+        self.recipe = make_recipe(make_user('cook'), [self.salt, self.pepper])
+
+    def write(self, suffix, content):
+        handle, path = tempfile.mkstemp(suffix=suffix)
+        with os.fdopen(handle, 'w', encoding='utf-8') as file:
+            file.write(content)
+        self.addCleanup(os.remove, path)
+        return path
+
+    def sync(self, path, *args):
+        out = StringIO()
+        call_command(
+            'load_ingredients', '--file', path, '--batch-size', '2', *args,
+            stdout=out,
+        )
+        return out.getvalue()
+
+    def test_sync_is_idempotent_and_keeps_recipes(self):
+        path = self.write('.json', json.dumps([
+            {'name': 'соль', 'measurement_unit': 'г'},
+            {'name': 'сахар', 'measurement_unit': 'г'},
+            {'name': 'сахар', 'measurement_unit': 'г'},
+            {'name': 'мёд', 'measurement_unit': 'ст. л.'},
+            {'name': '', 'measurement_unit': 'г'},
+        ], ensure_ascii=False))
+        rows = RecipeIngredient.objects.values_list(
+            'id', 'ingredient_id', 'amount'
+        )
+        quantities = list(rows)
+
+        out = self.sync(path)
+        self.assertIn(
+            'добавлено 2, без изменений 1, удалено 0, пропущено строк 1', out
+        )
+        self.assertEqual(Ingredient.objects.filter(name='сахар').count(), 1)
+        self.assertTrue(
+            Ingredient.objects.filter(pk=self.obsolete.pk).exists()
+        )
+
+        with self.assertNumQueries(4):
+            # По SELECT на каждую из двух пачек и SAVEPOINT/RELEASE — никаких
+            # записей
+            out = self.sync(path)
+        self.assertIn('добавлено 0, без изменений 3', out)
+        self.assertEqual(list(rows.all()), quantities)
+
+    def test_parallel_insert_not_counted(self):
+        path = self.write('.csv', 'мука,г\nсахар,г\n')
+        insert = Command._insert
+
+        def parallel_loader(keys):
+            # Другой загрузчик успел вставить муку после нашего SELECT
+            Ingredient.objects.create(name='мука', measurement_unit='г')
+            return insert(keys)
+
+        with mock.patch.object(
+            Command, '_insert', staticmethod(parallel_loader)
+        ):
+            out = self.sync(path)
+        self.assertIn('добавлено 1, без изменений 1', out)
+        self.assertEqual(
+            Ingredient.objects.filter(name__in=['мука', 'сахар']).count(), 2
+        )
+
+    def test_prune_removes_only_unused(self):
+        path = self.write('.csv', 'соль,г\nмука,г\n')
+        out = self.sync(path, '--prune')
+        self.assertIn('добавлено 1, без изменений 1, удалено 1', out)
+        self.assertFalse(
+            Ingredient.objects.filter(pk=self.obsolete.pk).exists()
+        )
+        # Перца нет в файле, но он используется в рецепте
+        self.assertTrue(Ingredient.objects.filter(pk=self.pepper.pk).exists())
+        self.assertEqual(self.recipe.ingredient_quantities.count(), 2)
+
+    def test_unknown_format(self):
+        with self.assertRaises(CommandError):
+            self.sync(self.write('.xml', ''))
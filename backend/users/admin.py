@@ -7,7 +7,8 @@ from users.models import CustomUser
 class CustomUserAdmin(BaseUserAdmin):
     list_display = (
         'id', 'email', 'username',
-        'first_name', 'last_name', 'is_active'
+        'first_name', 'last_name', 'is_active',
+        'recipes_count', 'followers_count'
     )
     search_fields = ('username', 'email')
     ordering = ('id',)
\ No newline at end of file
@@ -0,0 +1,260 @@
+import random
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.contrib.auth.hashers import make_password
+from django.core.cache import cache
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+
+from api.utils import storage
+from api.utils.bulk import (
+    Progress, explicit_timestamps, flush_tables, reset_sequences,
+)
+from api.utils.synthetic import Zipf
+from recipes.models import (
+    Favorite, Ingredient, Recipe, RecipeIngredient, ShoppingCart,
+    ShoppingListItem,
+)
+from users.models import CustomUser, Follow
+
+DEFAULT_IMAGE = 'recipes/images/default.jpg'
+PASSWORD = 'SyntheticPass123!'
+# Все даты отсчитываются от фиксированной точки: набор не зависит от дня
+# запуска
+EPOCH = datetime(2024, 1, 1, tzinfo=dt_timezone.utc)
+MODELS = [
+    Follow, Favorite, ShoppingCart, ShoppingListItem, RecipeIngredient,
+    Recipe, CustomUser,
+]
+FIRST_NAMES = [
+    'Анна', 'Борис', 'Вера', 'Глеб', 'Дарья', 'Егор', 'Жанна', 'Илья',
+    'Кира', 'Лев',
+]
+LAST_NAMES = [
+    'Иванов', 'Смирнов', 'Кузнецов', 'Попов', 'Соколов', 'Лебедев',
+    'Козлов', 'Новиков',
+]
+DISHES = [
+    'Суп', 'Салат', 'Пирог', 'Рагу', 'Запеканка', 'Каша', 'Паста', 'Омлет',
+    'Соус', 'Десерт',
+]
+
+
+class Command(BaseCommand):
+    help = (
+        'Генерирует синтетический набор данных для нагрузочных замеров: '
+        'пользователи, подписки с распределением Ципфа, рецепты '
+        'с ингредиентами из каталога, избранное и корзины с «горячими» '
+        'рецептами. Один и тот же --seed даёт один и тот же набор. '
+        'Строки пишутся пачками bulk_create, каждая пачка — отдельной '
+        'транзакцией.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--recipes', type=int, default=10_000)
+        parser.add_argument('--users', type=int,
+                            help='По умолчанию — рецептов / 10')
+        parser.add_argument('--seed', type=int, default=1)
+        parser.add_argument('--zipf', type=float, default=1.1,
+                            help='Показатель распределения популярности '
+                                 'авторов, рецептов и ингредиентов')
+        parser.add_argument('--follows', type=float, default=20,
+                            help='Подписок на пользователя в среднем')
+        parser.add_argument('--favorites', type=float, default=10,
+                            help='Избранного на пользователя в среднем')
+        parser.add_argument('--cart', type=float, default=3,
+                            help='Рецептов в корзине в среднем')
+        parser.add_argument('--ingredients', type=float, default=8,
+                            help='Ингредиентов в рецепте в среднем')
+        parser.add_argument('--days', type=int, default=730,
+                            help='За сколько дней разбросаны публикации')
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument('--flush', action='store_true',
+                            help='Удалить пользователей и рецепты '
+                                 'перед генерацией')
+
+    def handle(self, *args, **options):
+        self.options = options
+        self.batch_size = options['batch_size']
+        self.n_recipes = options['recipes']
+        self.n_users = options['users'] or max(1, self.n_recipes // 10)
+        self.catalog = list(
+            Ingredient.objects.order_by('id').values_list('id', 'name')
+        )
+        if not self.catalog:
+            raise CommandError(
+                '❌ Каталог ингредиентов пуст: сначала manage.py '
+                'load_ingredients'
+            )
+
+        if options['flush']:
+            self.stdout.write(self.style.WARNING(
+                '⚠️  Удаление пользователей и рецептов...'
+            ))
+            flush_tables(MODELS)
+        elif CustomUser.objects.exists() or Recipe.objects.exists():
+            # Явные pk 1..N нужны для детерминированности — дописывать к чужим
+            # данным нельзя
+            raise CommandError(
+                '❌ В базе уже есть пользователи или рецепты: '
+                'запустите с --flush'
+            )
+
+        self.stdout.write(self.style.WARNING(
+            f'⏳ seed={options["seed"]}: {self.n_users} пользователей, '
+            f'{self.n_recipes} рецептов'
+        ))
+        self.progress = Progress(self.stdout)
+        timestamps = explicit_timestamps(
+            (Recipe, 'pub_date'), (Recipe, 'updated_at'),
+            (Follow, 'created_at'), (Favorite, 'added_at'),
+        )
+        with timestamps:
+            for model, rows in (
+                (CustomUser, self._users()),
+                (Follow, self._follows()),
+                (Recipe, self._recipes()),
+                (RecipeIngredient, self._recipe_ingredients()),
+                (Favorite, self._user_recipes(
+                    Favorite, 'favorites', options['favorites']
+                )),
+                (ShoppingCart, self._user_recipes(
+                    ShoppingCart, 'cart', options['cart']
+                )),
+            ):
+                self._insert(model, rows)
+        reset_sequences([
+            CustomUser, Follow, Recipe, RecipeIngredient, Favorite,
+            ShoppingCart,
+        ])
+
+        # bulk_create обходит сигналы: счётчики, списки покупок, похожие
+        # рецепты, ленты и ссылки на файлы — пересчётом
+        call_command('recount_counters', stdout=self.stdout)
+        call_command('rebuild_shopping_lists', stdout=self.stdout)
+        if self.n_recipes:
+            call_command('build_similar_recipes', stdout=self.stdout)
+        call_command('rebuild_feeds', stdout=self.stdout)
+        storage.recount_references(self.batch_size)
+        cache.clear()
+
+        elapsed = self.progress.elapsed()
+        self.stdout.write(self.style.SUCCESS(
+            f'✅ Сгенерировано {self.progress.total} строк за {elapsed:.1f} с '
+            f'({self.progress.total / elapsed:.0f} строк/с)'
+        ))
+
+    def _rng(self, phase):
+        # Свой генератор на каждую фазу: фазы не влияют друг на друга
+        return random.Random(f'{self.options["seed"]}:{phase}')
+
+    def _count(self, rng, mean, limit):
+        """
+        Число связей у пользователя: экспоненциальное, большинство — около
+        среднего и ниже.
+        """
+        return min(int(rng.expovariate(1 / mean)), limit) if mean > 0 else 0
+
+    def _insert(self, model, rows):
+        batch = []
+        for row in rows:
+            batch.append(row)
+            if len(batch) >= self.batch_size:
+                model.objects.bulk_create(batch)
+                self.progress.add(model._meta.label_lower, len(batch))
+                batch = []
+        if batch:
+            model.objects.bulk_create(batch)
+            self.progress.add(model._meta.label_lower, len(batch))
+
+    def _users(self):
+        rng = self._rng('users')
+        # Соль фиксирована: хэш пароля считается один раз и одинаков между
+        # запусками
+        password = make_password(
+            PASSWORD, salt=f'synthetic{self.options["seed"]}'
+        )
+        for pk in range(1, self.n_users + 1):
+            yield CustomUser(
+                pk=pk,
+                username=f'user{pk}',
+                email=f'user{pk}@example.com',
+                first_name=rng.choice(FIRST_NAMES),
+                last_name=rng.choice(LAST_NAMES),
+                password=password,
+                avatar=DEFAULT_IMAGE,
+                date_joined=EPOCH,
+            )
+
+    def _follows(self):
+        rng = self._rng('follows')
+        authors = Zipf(self.n_users, self.options['zipf'], rng)
+        span = self.options['days'] * 86400
+        pk = 0
+        for subscriber in range(1, self.n_users + 1):
+            count = self._count(rng, self.options['follows'], self.n_users - 1)
+            found = authors.sample(count, exclude={subscriber - 1})
+            for author in sorted(found):
+                pk += 1
+                yield Follow(
+                    pk=pk, subscriber_id=subscriber, author_id=author + 1,
+                    created_at=EPOCH + timedelta(seconds=rng.randrange(span)),
+                )
+
+    def _recipes(self):
+        rng = self._rng('recipes')
+        # Немногие авторы пишут большую часть рецептов
+        authors = Zipf(self.n_users, self.options['zipf'], rng)
+        span = timedelta(days=self.options['days'])
+        for pk in range(1, self.n_recipes + 1):
+            # Публикации идут по возрастанию id, как в живой базе
+            pub_date = EPOCH + span * (pk / self.n_recipes)
+            _, ingredient = rng.choice(self.catalog)
+            yield Recipe(
+                pk=pk,
+                name=f'{rng.choice(DISHES)}: {ingredient}'[:200],
+                description=(
+                    f'Синтетический рецепт №{pk}. '
+                    f'Главный ингредиент — {ingredient}.'
+                ),
+                author_id=authors() + 1,
+                cooking_time=rng.randint(5, 180),
+                image=DEFAULT_IMAGE,
+                pub_date=pub_date,
+                updated_at=pub_date,
+            )
+
+    def _recipe_ingredients(self):
+        rng = self._rng('recipe_ingredients')
+        # Соль и вода встречаются чаще шафрана: популярность ингредиентов тоже
+        # по Ципфу
+        popular = Zipf(len(self.catalog), self.options['zipf'], rng)
+        mean = self.options['ingredients']
+        pk = 0
+        for recipe in range(1, self.n_recipes + 1):
+            count = round(rng.gauss(mean, mean / 3))
+            count = max(1, min(count, 3 * round(mean), len(self.catalog)))
+            for index in sorted(popular.sample(count)):
+                pk += 1
+                yield RecipeIngredient(
+                    pk=pk, recipe_id=recipe,
+                    ingredient_id=self.catalog[index][0],
+                    amount=rng.randint(1, 500),
+                )
+
+    def _user_recipes(self, model, phase, mean):
+        rng = self._rng(phase)
+        # «Горячие» рецепты попадают в избранное и корзины намного чаще
+        # остальных
+        hot = Zipf(self.n_recipes, self.options['zipf'], rng)
+        extra = {'added_at': None} if model is Favorite else {}
+        span = self.options['days'] * 86400
+        pk = 0
+        for user in range(1, self.n_users + 1):
+            count = self._count(rng, mean, self.n_recipes)
+            for recipe in sorted(hot.sample(count)):
+                pk += 1
+                if extra:
+                    seconds = rng.randrange(span)
+                    extra['added_at'] = EPOCH + timedelta(seconds=seconds)
+                yield model(pk=pk, user_id=user, recipe_id=recipe + 1, **extra)
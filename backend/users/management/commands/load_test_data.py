@@ -1,136 +1,269 @@
-import json
+import os
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 from pathlib import Path
-from django.core.management.base import BaseCommand
-from django.core.files import File
+
 from django.contrib.auth.hashers import make_password
+from django.core.cache import cache
+from django.core.files import File
+from django.core.files.storage import default_storage
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from api.utils import storage
+from api.utils.bulk import (
+    Progress, explicit_timestamps, flush_tables, iter_json_array,
+    reset_sequences,
+)
+from recipes.models import (
+    Favorite, Ingredient, Recipe, RecipeIngredient, ShoppingCart,
+    ShoppingListItem,
+)
 from users.models import CustomUser, Follow
-from recipes.models import Ingredient, Recipe, RecipeIngredient, Favorite, ShoppingCart
+
+DEFAULT_IMAGE = 'recipes/images/default.jpg'
+# Порядок очистки: сначала зависимые таблицы
+MODELS_TO_CLEAR = [
+    Follow, Favorite, ShoppingCart, ShoppingListItem,
+    RecipeIngredient, Recipe,
+    CustomUser,
+]
+
+
+def _hash_passwords(passwords):
+    return [make_password(password) for password in passwords]
 
 
 class Command(BaseCommand):
-    help = 'Загружает тестовые данные из data/test_data.json, используя существующие ингредиенты.'
-
-    def handle(self, *args, **kwargs):
-        self.stdout.write(self.style.WARNING('⚠️  Удаление старых данных...'))
-
-        # Очистка таблиц в правильном порядке (чтобы избежать ошибок с FK)
-        models_to_clear = [
-            Follow, Favorite, ShoppingCart,
-            RecipeIngredient, Recipe,
-            CustomUser
-        ]
-        for model in models_to_clear:
-            count_deleted, _ = model.objects.all().delete()
-            self.stdout.write(self.style.SUCCESS(f'🗑️ {model.__name__}: удалено {count_deleted} записей'))
-
-        media_root = Path('media')  # Путь к папке media
-
-        try:
-            with open('data/test_data.json', encoding='utf-8') as file:
-                data = json.load(file)
-
-            users_map = {}
-            recipes_map = {}
-            ingredients_map = {ing.id: ing for ing in Ingredient.objects.all()}
-
-            # === 1. Пользователи ===
-            for item in data:
-                if item['model'] == 'users.customuser':
-                    fields = item['fields']
-                    raw_password = fields.get('password', '12345')
-                    user = CustomUser.objects.create(
-                        pk=item['pk'],
-                        email=fields['email'],
-                        username=fields['username'],
-                        first_name=fields.get('first_name', ''),
-                        last_name=fields.get('last_name', ''),
-                        avatar=fields.get('avatar', 'recipes/images/default.jpg'),
-                        is_staff=fields.get('is_staff', False),
-                        is_superuser=fields.get('is_superuser', False),
-                        is_active=fields.get('is_active', True),
-                        password=make_password(raw_password)
-                    )
-                    users_map[item['pk']] = user
-            self.stdout.write(self.style.SUCCESS(f'✅ Загружено {len(users_map)} пользователей'))
-
-            # === 2. Подписки ===
-            for item in data:
-                if item['model'] == 'users.follow':
-                    fields = item['fields']
-                    Follow.objects.create(
-                        pk=item['pk'],
-                        subscriber=users_map[fields['subscriber']],
-                        author=users_map[fields['author']],
-                        created_at=fields['created_at']
-                    )
-            self.stdout.write(self.style.SUCCESS('✅ Подписки загружены'))
-
-            # === 3. Рецепты ===
-            for item in data:
-                if item['model'] == 'recipes.recipe':
-                    fields = item['fields']
-                    recipe = Recipe(
-                        name=fields['name'],
-                        description=fields['description'],
-                        author=users_map[fields['author']],
-                        cooking_time=fields['cooking_time'],
-                        pub_date=fields['pub_date']
-                    )
-
-                    # Загрузка изображения
-                    image_file_path = media_root / fields.get('image', 'recipes/images/default.jpg')
-                    if image_file_path.exists():
-                        with open(image_file_path, 'rb') as f:
-                            recipe.image.save(image_file_path.name, File(f), save=False)
-                    else:
-                        recipe.image = 'recipes/images/default.jpg'
-
-                    recipe.save()
-                    recipes_map[item['pk']] = recipe
-            self.stdout.write(self.style.SUCCESS(f'✅ Загружено {len(recipes_map)} рецептов'))
-
-            # === 4. Состав рецептов ===
-            for item in data:
-                if item['model'] == 'recipes.recipeingredient':
-                    fields = item['fields']
-                    recipe = recipes_map[fields['recipe']]
-                    ingredient_name = next(
-                        ing['fields']['name'] for ing in data
-                        if ing['model'] == 'recipes.ingredient' and ing['pk'] == fields['ingredient']
-                    )
-                    try:
-                        ingredient = Ingredient.objects.get(name=ingredient_name)
-                    except Ingredient.DoesNotExist:
-                        self.stderr.write(self.style.ERROR(f'❌ Ингредиент "{ingredient_name}" не найден'))
-                        continue
-
-                    RecipeIngredient.objects.create(
-                        recipe=recipe,
-                        ingredient=ingredient,
-                        amount=fields['amount']
-                    )
-            self.stdout.write(self.style.SUCCESS('✅ Состав рецептов загружен'))
-
-            # === 5. Избранное ===
-            for item in data:
-                if item['model'] == 'recipes.favorite':
-                    fields = item['fields']
-                    Favorite.objects.create(
-                        user=users_map[fields['user']],
-                        recipe=recipes_map[fields['recipe']],
-                        added_at=fields.get('added_at')
-                    )
-            self.stdout.write(self.style.SUCCESS('✅ Избранное загружено'))
-
-            # === 6. Корзина ===
-            for item in data:
-                if item['model'] == 'recipes.shoppingcart':
-                    fields = item['fields']
-                    ShoppingCart.objects.create(
-                        user=users_map[fields['user']],
-                        recipe=recipes_map[fields['recipe']]
-                    )
-            self.stdout.write(self.style.SUCCESS('✅ Корзина загружена'))
-
-        except Exception as error:
-            self.stderr.write(self.style.ERROR(f'❌ Ошибка: {error}'))
+    help = (
+        'Загружает тестовые данные из data/test_data.json, используя '
+        'существующие ингредиенты. Файл читается потоково, строки '
+        'вставляются пачками bulk_create в одной транзакции.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--file', default='data/test_data.json')
+        parser.add_argument('--media-dir', default='media',
+                            help='Откуда копировать изображения из фикстуры')
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument('--hash-workers', type=int,
+                            default=os.cpu_count() or 1,
+                            help='Процессов для хэширования паролей')
+        parser.add_argument('--image-threads', type=int, default=8,
+                            help='Потоков для копирования изображений')
+        parser.add_argument('--reuse-password-hashes', action='store_true',
+                            help='Хэшировать каждый различный пароль '
+                                 'один раз (только для тестовых данных)')
+
+    def handle(self, *args, **options):
+        path = options['file']
+        if not os.path.exists(path):
+            raise CommandError(f'❌ Нет файла {path}')
+        self.batch_size = options['batch_size']
+        self.options = options
+
+        # Проход 1: ингредиенты фикстуры (для сопоставления по названию) и пути
+        # изображений
+        fixture_ingredients = {}
+        image_paths = set()
+        for item in iter_json_array(path):
+            fields = item['fields']
+            if item['model'] == 'recipes.ingredient':
+                fixture_ingredients[item['pk']] = fields['name']
+            elif item['model'] == 'recipes.recipe':
+                image_paths.add(fields.get('image') or DEFAULT_IMAGE)
+            elif item['model'] == 'users.customuser':
+                image_paths.add(fields.get('avatar') or DEFAULT_IMAGE)
+        ingredient_ids = dict(Ingredient.objects.values_list('name', 'id'))
+        self.ingredients = {
+            pk: ingredient_ids.get(name)
+            for pk, name in fixture_ingredients.items()
+        }
+        self.ingredient_names = fixture_ingredients
+        self.images = self._copy_images(
+            image_paths, Path(options['media_dir']), options['image_threads']
+        )
+
+        self.progress = Progress(self.stdout)
+        self.batches = {}
+        self.missing_ingredients = set()
+        timestamps = explicit_timestamps(
+            (Recipe, 'pub_date'), (Follow, 'created_at'),
+            (Favorite, 'added_at'),
+        )
+        hashers = ProcessPoolExecutor(max_workers=options['hash_workers'])
+        with hashers as self.hashers:
+            with transaction.atomic(), timestamps:
+                self.stdout.write(
+                    self.style.WARNING('⚠️  Удаление старых данных...')
+                )
+                flush_tables(MODELS_TO_CLEAR)
+
+                # Проход 2: строки идут пачками; внешние ключи в PostgreSQL и
+                # SQLite проверяются при коммите, так что порядок моделей в
+                # файле не важен
+                for item in iter_json_array(path):
+                    name = '_build_' + item['model'].replace('.', '_')
+                    build = getattr(self, name, None)
+                    if build is not None:
+                        row = build(item['pk'], item['fields'])
+                        if row is not None:
+                            self._add(row)
+                for model in list(self.batches):
+                    self._flush(model)
+
+                reset_sequences([
+                    CustomUser, Follow, Recipe, RecipeIngredient, Favorite,
+                    ShoppingCart,
+                ])
+                self._rebuild_derived()
+        # Ответы и индексы в кэше относятся к удалённым данным
+        cache.clear()
+
+        for name in sorted(self.missing_ingredients):
+            self.stderr.write(
+                self.style.ERROR(f'❌ Ингредиент "{name}" не найден')
+            )
+        elapsed = self.progress.elapsed()
+        self.stdout.write(self.style.SUCCESS(
+            f'✅ Загружено {self.progress.total} строк за {elapsed:.1f} с '
+            f'({self.progress.total / elapsed:.0f} строк/с). '
+            'Варианты изображений: manage.py backfill_image_variants'
+        ))
+
+    def _add(self, row):
+        batch = self.batches.setdefault(type(row), [])
+        batch.append(row)
+        if len(batch) >= self.batch_size:
+            self._flush(type(row))
+
+    def _flush(self, model):
+        rows = self.batches.pop(model, [])
+        if not rows:
+            return
+        if model is CustomUser:
+            self._hash(rows)
+        model.objects.bulk_create(rows, batch_size=self.batch_size)
+        self.progress.add(model._meta.label_lower, len(rows))
+
+    def _hash(self, users):
+        passwords = [user.password for user in users]
+        if self.options['reuse_password_hashes']:
+            distinct = sorted(set(passwords))
+            hashed = dict(zip(distinct, _hash_passwords(distinct)))
+            hashes = [hashed[password] for password in passwords]
+        else:
+            # PBKDF2 занимает CPU на сотни миллисекунд — раздаём пачки
+            # процессам
+            step = max(1, len(passwords) // (self.options['hash_workers'] * 4))
+            chunks = [
+                passwords[i:i + step] for i in range(0, len(passwords), step)
+            ]
+            hashes = [
+                h for chunk in self.hashers.map(_hash_passwords, chunks)
+                for h in chunk
+            ]
+        for user, password in zip(users, hashes):
+            user.password = password
+
+    def _copy_images(self, paths, media_dir, threads):
+        """
+        Копирует изображения в хранилище параллельно, по разу на каждый путь.
+        """
+        sources = sorted(
+            path for path in paths
+            if path != DEFAULT_IMAGE and (media_dir / path).is_file()
+        )
+
+        def copy(path):
+            try:
+                with open(media_dir / path, 'rb') as source:
+                    file = File(source, name=Path(path).name)
+                    return path, default_storage.save(path, file)
+            finally:
+                connection.close()
+
+        with ThreadPoolExecutor(max_workers=threads) as pool:
+            copied = dict(pool.map(copy, sources))
+        if sources:
+            self.stdout.write(self.style.SUCCESS(
+                f'🖼️  Скопировано изображений: {len(copied)}'
+            ))
+        return copied
+
+    def _image(self, path):
+        return self.images.get(path or DEFAULT_IMAGE, DEFAULT_IMAGE)
+
+    @staticmethod
+    def _datetime(value):
+        return parse_datetime(value) if value else timezone.now()
+
+    def _build_users_customuser(self, pk, fields):
+        return CustomUser(
+            pk=pk,
+            email=fields['email'],
+            username=fields['username'],
+            first_name=fields.get('first_name', ''),
+            last_name=fields.get('last_name', ''),
+            avatar=self._image(fields.get('avatar')),
+            is_staff=fields.get('is_staff', False),
+            is_superuser=fields.get('is_superuser', False),
+            is_active=fields.get('is_active', True),
+            # Хэшируется пачкой перед вставкой (_hash)
+            password=fields.get('password', '12345'),
+        )
+
+    def _build_users_follow(self, pk, fields):
+        return Follow(
+            pk=pk,
+            subscriber_id=fields['subscriber'],
+            author_id=fields['author'],
+            created_at=self._datetime(fields.get('created_at')),
+        )
+
+    def _build_recipes_recipe(self, pk, fields):
+        return Recipe(
+            pk=pk,
+            name=fields['name'],
+            description=fields['description'],
+            author_id=fields['author'],
+            cooking_time=fields['cooking_time'],
+            pub_date=self._datetime(fields.get('pub_date')),
+            image=self._image(fields.get('image')),
+        )
+
+    def _build_recipes_recipeingredient(self, pk, fields):
+        ingredient_id = self.ingredients.get(fields['ingredient'])
+        if ingredient_id is None:
+            self.missing_ingredients.add(self.ingredient_names.get(
+                fields['ingredient'], fields['ingredient']
+            ))
+            return None
+        return RecipeIngredient(
+            recipe_id=fields['recipe'],
+            ingredient_id=ingredient_id,
+            amount=fields['amount'],
+        )
+
+    def _build_recipes_favorite(self, pk, fields):
+        return Favorite(
+            user_id=fields['user'],
+            recipe_id=fields['recipe'],
+            added_at=self._datetime(fields.get('added_at')),
+        )
+
+    def _build_recipes_shoppingcart(self, pk, fields):
+        return ShoppingCart(user_id=fields['user'], recipe_id=fields['recipe'])
+
+    def _rebuild_derived(self):
+        """
+        bulk_create обходит сигналы: пересчитываем то, что они обычно ведут.
+        """
+        call_command('recount_counters', stdout=self.stdout)
+        call_command('rebuild_shopping_lists', stdout=self.stdout)
+        if Recipe.objects.exists():
+            call_command('build_similar_recipes', stdout=self.stdout)
+        call_command('rebuild_feeds', stdout=self.stdout)
+        storage.recount_references(self.batch_size)
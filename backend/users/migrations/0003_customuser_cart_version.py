@@ -0,0 +1,18 @@
+# Generated by Django 4.2.21 on 2026-10-18 01:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0002_alter_customuser_avatar'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='customuser',
+            name='cart_version',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Версия корзины'),
+        ),
+    ]
@@ -0,0 +1,30 @@
+from django.db import migrations, models
+from django.db.models import F
+import django.utils.timezone
+
+
+def fill_updated_at(apps, schema_editor):
+    CustomUser = apps.get_model('users', 'CustomUser')
+    CustomUser.objects.update(updated_at=F('date_joined'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0004_customuser_counters'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='customuser',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, default=django.utils.timezone.now, verbose_name='Дата изменения'),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name='customuser',
+            name='relations_updated_at',
+            field=models.DateTimeField(default=django.utils.timezone.now, editable=False, verbose_name='Дата изменения связей'),
+        ),
+        migrations.RunPython(fill_updated_at, migrations.RunPython.noop),
+    ]
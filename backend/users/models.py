@@ -1,4 +1,5 @@
 from django.db import models
+from django.utils import timezone
 from django.contrib.auth.models import AbstractUser, Group, Permission
 from django.utils.translation import gettext_lazy as _
 from users.validation import is_username_ok
@@ -29,6 +30,40 @@ class CustomUser(AbstractUser):
         null=True,
         default='recipes/images/default.jpg'
     )
+    # Уменьшенные копии и WebP рядом с оригиналом (см. api.utils.images)
+    avatar_variants = models.JSONField(
+        _('Варианты аватара'),
+        default=dict,
+        blank=True,
+        editable=False
+    )
+    updated_at = models.DateTimeField(_('Дата изменения'), auto_now=True)
+    # Время последнего изменения избранного, подписок или корзины пользователя:
+    # входит в ETag ответов, где есть
+    # is_favorited/is_subscribed/is_in_shopping_cart
+    relations_updated_at = models.DateTimeField(
+        _('Дата изменения связей'),
+        default=timezone.now,
+        editable=False
+    )
+    # Денормализованные счётчики, ведутся сигналами (см. recipes.counters)
+    recipes_count = models.PositiveIntegerField(
+        _('Рецептов'),
+        default=0,
+        editable=False
+    )
+    followers_count = models.PositiveIntegerField(
+        _('Подписчиков'),
+        default=0,
+        editable=False
+    )
+    # Растёт при каждом изменении содержимого корзины; из неё строится ETag
+    # списка покупок
+    cart_version = models.PositiveIntegerField(
+        _('Версия корзины'),
+        default=0,
+        editable=False
+    )
 
     groups = models.ManyToManyField(
         Group,
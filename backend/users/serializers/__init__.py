@@ -1,9 +1,10 @@
-from .base import Base64ImageField
+from .base import Base64ImageField, ImageVariantsField
 from .user import UserSerializer, AvatarSerializer
 from .follow import FollowSerializer, FollowReadSerializer
 
 __all__ = [
     'Base64ImageField',
+    'ImageVariantsField',
     'UserSerializer',
     'AvatarSerializer',
     'FollowSerializer',
@@ -3,11 +3,19 @@ import uuid
 from django.core.files.base import ContentFile
 from rest_framework import serializers
 
+from api.utils import images, uploads
+
 class Base64ImageField(serializers.ImageField):
-    """Поле для загрузки изображений в формате base64."""
+    """
+    Поле для загрузки изображений: base64 data URI, файл из multipart/form-data
+    или ссылка "upload:<id>" на загрузку по частям.
+    """
     ALLOWED_EXTENSIONS = ('jpg', 'jpeg', 'png')
 
     def to_internal_value(self, data):
+        prefix = uploads.UPLOAD_REFERENCE_PREFIX
+        if isinstance(data, str) and data.startswith(prefix):
+            return self._from_upload(data)
         if isinstance(data, str) and data.startswith('data:image'):
             try:
                 header, b64data = data.split(';base64,')
@@ -21,4 +29,56 @@ class Base64ImageField(serializers.ImageField):
                 data = ContentFile(decoded_file, name=file_name)
             except Exception:
                 raise serializers.ValidationError('Ошибка чтения изображения')
-        return super().to_internal_value(data)
+        file = super().to_internal_value(data)
+        return self._sanitize(file)
+
+    def _from_upload(self, reference):
+        request = self.context.get('request')
+        upload = uploads.find_upload(reference, getattr(request, 'user', None))
+        if upload is None:
+            raise serializers.ValidationError(
+                'Загрузка не найдена или ещё не завершена.'
+            )
+        file = super().to_internal_value(uploads.open_upload(upload))
+        sanitized = self._sanitize(file)
+        uploads.consume(upload)
+        return sanitized
+
+    def _sanitize(self, file):
+        # Сохраняем перекодированную копию без EXIF и прочих метаданных;
+        # временный файл multipart читается Pillow с диска, не целиком в память
+        try:
+            return images.sanitize(file, file.name)
+        except images.InvalidImage:
+            raise serializers.ValidationError('Ошибка чтения изображения')
+        finally:
+            file.close()
+
+
+class ImageVariantsField(serializers.Field):
+    """
+    Варианты изображения в виде карты MIME -> srcset, например
+    {"image/webp": "<url> 320w, <url> 640w", "image/jpeg": "..."}.
+    Пустая, пока варианты не построены.
+    """
+
+    def __init__(self, image_field, **kwargs):
+        self.image_field = image_field
+        kwargs['source'] = '*'
+        kwargs['read_only'] = True
+        super().__init__(**kwargs)
+
+    def to_representation(self, instance):
+        fieldfile = getattr(instance, self.image_field)
+        variants = images.current_variants(
+            getattr(instance, f'{self.image_field}_variants'), fieldfile
+        )
+        request = self.context.get('request')
+        srcset = {}
+        variants = sorted(variants, key=lambda variant: variant[1])
+        for name, width, mime in variants:
+            url = fieldfile.storage.url(name)
+            if request is not None:
+                url = request.build_absolute_uri(url)
+            srcset.setdefault(mime, []).append(f'{url} {width}w')
+        return {mime: ', '.join(items) for mime, items in srcset.items()}
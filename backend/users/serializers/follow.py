@@ -17,14 +17,18 @@ class FollowSerializer(serializers.ModelSerializer):
 
 class FollowReadSerializer(UserSerializer):
     recipes = serializers.SerializerMethodField()
-    recipes_count = serializers.SerializerMethodField()
+    recipes_count = serializers.IntegerField(read_only=True)
 
     class Meta(UserSerializer.Meta):
         fields = UserSerializer.Meta.fields + ('recipes', 'recipes_count')
 
     def get_recipes(self, obj):
         from recipes.serializers.favorite import RecipeFavoriteSerializer
-        return RecipeFavoriteSerializer(obj.recipes.all(), many=True).data
-
-    def get_recipes_count(self, obj):
-        return obj.recipes.count()
+        # recipe_previews — уже ограниченный список из prefetch во вьюсете
+        recipes = getattr(obj, 'recipe_previews', None)
+        if recipes is None:
+            recipes = obj.recipes.all()
+            limit = self.context.get('recipes_limit')
+            if limit:
+                recipes = recipes[:int(limit)]
+        return RecipeFavoriteSerializer(recipes, many=True).data
@@ -1,7 +1,7 @@
 from djoser.serializers import UserSerializer as DjoserUserSerializer
 from rest_framework import serializers
 from users.models import CustomUser, Follow
-from .base import Base64ImageField
+from .base import Base64ImageField, ImageVariantsField
 
 class AvatarSerializer(serializers.ModelSerializer):
     avatar = Base64ImageField()
@@ -12,6 +12,7 @@ class AvatarSerializer(serializers.ModelSerializer):
 
 class UserSerializer(DjoserUserSerializer):
     avatar = Base64ImageField(required=False)
+    avatar_srcset = ImageVariantsField('avatar')
     is_subscribed = serializers.SerializerMethodField()
 
     class Meta:
@@ -19,10 +20,12 @@ class UserSerializer(DjoserUserSerializer):
         fields = (
             'id', 'email', 'username',
             'first_name', 'last_name',
-            'is_subscribed', 'avatar',
+            'is_subscribed', 'avatar', 'avatar_srcset',
         )
 
     def get_is_subscribed(self, obj):
+        if hasattr(obj, 'is_subscribed'):
+            return obj.is_subscribed
         user = getattr(self.context.get('request'), 'user', None)
         return (
             user.is_authenticated and
@@ -1,3 +1,229 @@
+import json
+import os
+import tempfile
+from io import StringIO
+
+from django.core.management import CommandError, call_command
+from django.db.models import F, Sum
 from django.test import TestCase
 
-# Create your tests here.
+from api.tests import make_user
+from api.utils.bulk import iter_json_array
+from recipes.models import (
+    Favorite, Ingredient, Recipe, RecipeIngredient, ShoppingListItem,
+)
+from users.models import CustomUser, Follow
+
+
+def write_fixture(items):
+    handle, path = tempfile.mkstemp(suffix='.json')
+    with os.fdopen(handle, 'w', encoding='utf-8') as file:
+        json.dump(items, file, ensure_ascii=False, indent=2)
+    return path
+
+
+class IterJsonArrayTest(TestCase):
+    """Потоковое чтение JSON-массива кусками любого размера."""
+
+    def test_objects_split_across_chunks(self):
+        items = [
+            {'model': 'x', 'pk': i, 'fields': {'name': 'строка ' * i}}
+            for i in range(20)
+        ]
+        path = write_fixture(items)
+        self.addCleanup(os.remove, path)
+        for chunk_size in (1, 7, 1 << 20):
+            self.assertEqual(
+                list(iter_json_array(path, chunk_size=chunk_size)), items
+            )
+
+    def test_empty_and_broken(self):
+        path = write_fixture([])
+        self.addCleanup(os.remove, path)
+        self.assertEqual(list(iter_json_array(path)), [])
+        with open(path, 'w') as file:
+            file.write('[{"a": 1}, {"b":')
+        with self.assertRaises(ValueError):
+            list(iter_json_array(path, chunk_size=4))
+
+
+class LoadTestDataTest(TestCase):
+    """
+    load_test_data: пачки bulk_create, сопоставление ингредиентов, пересчёт
+    производных.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.salt = Ingredient.objects.create(name='соль', measurement_unit='г')
+        cls.flour = Ingredient.objects.create(
+            name='мука', measurement_unit='г'
+        )
+        make_user('old-user')
+
+    def fixture(self):
+        # Порядок моделей в файле произвольный: состав раньше рецептов и
+        # пользователей
+        return [
+            {'model': 'recipes.recipeingredient', 'pk': 1,
+             'fields': {'recipe': 10, 'ingredient': 101, 'amount': 5}},
+            {'model': 'recipes.recipeingredient', 'pk': 2,
+             'fields': {'recipe': 10, 'ingredient': 103, 'amount': 1}},
+            {'model': 'recipes.recipeingredient', 'pk': 3,
+             'fields': {'recipe': 11, 'ingredient': 102, 'amount': 200}},
+            {'model': 'recipes.ingredient', 'pk': 101,
+             'fields': {'name': 'соль', 'measurement_unit': 'г'}},
+            {'model': 'recipes.ingredient', 'pk': 102,
+             'fields': {'name': 'мука', 'measurement_unit': 'г'}},
+            {'model': 'recipes.ingredient', 'pk': 103,
+             'fields': {'name': 'шафран', 'measurement_unit': 'г'}},
+            {'model': 'recipes.recipe', 'pk': 10, 'fields': {
+                'name': 'Суп', 'image': 'recipes/images/missing.jpg',
+                'description': 'Варить', 'author': 1, 'cooking_time': 30,
+                'pub_date': '2025-08-13T12:15:00Z'}},
+            {'model': 'recipes.recipe', 'pk': 11, 'fields': {
+                'name': 'Хлеб', 'description': 'Печь', 'author': 1,
+                'cooking_time': 60, 'pub_date': '2025-08-14T08:00:00Z'}},
+            {'model': 'users.customuser', 'pk': 1, 'fields': {
+                'email': 'alice@example.com', 'username': 'alice',
+                'first_name': 'Alice', 'last_name': 'W',
+                'password': 'PastaCarbonara42!'}},
+            {'model': 'users.customuser', 'pk': 2, 'fields': {
+                'email': 'bob@example.com', 'username': 'bob',
+                'first_name': 'Bob', 'last_name': 'B',
+                'password': 'Borscht2025!'}},
+            {'model': 'users.follow', 'pk': 1,
+             'fields': {'subscriber': 2, 'author': 1,
+                        'created_at': '2025-08-13T12:00:00Z'}},
+            {'model': 'recipes.favorite', 'pk': 1,
+             'fields': {'user': 2, 'recipe': 10}},
+            {'model': 'recipes.shoppingcart', 'pk': 1,
+             'fields': {'user': 2, 'recipe': 11}},
+        ]
+
+    def load(self, *args):
+        path = write_fixture(self.fixture())
+        self.addCleanup(os.remove, path)
+        out, err = StringIO(), StringIO()
+        call_command(
+            'load_test_data', '--file', path, '--batch-size', '2', *args,
+            stdout=out, stderr=err,
+        )
+        return out.getvalue(), err.getvalue()
+
+    def test_loads_rows_and_derived_data(self):
+        out, err = self.load('--hash-workers', '1')
+        self.assertIn('шафран', err)
+        self.assertIn('строк/с', out)
+        self.assertFalse(
+            CustomUser.objects.filter(username='old-user').exists()
+        )
+
+        alice = CustomUser.objects.get(pk=1)
+        self.assertTrue(alice.check_password('PastaCarbonara42!'))
+        self.assertEqual(alice.recipes_count, 2)
+        self.assertEqual(alice.followers_count, 1)
+        self.assertEqual(
+            Follow.objects.get().created_at.isoformat(),
+            '2025-08-13T12:00:00+00:00',
+        )
+
+        soup = Recipe.objects.get(pk=10)
+        self.assertEqual(
+            soup.pub_date.isoformat(), '2025-08-13T12:15:00+00:00'
+        )
+        self.assertEqual(soup.image.name, 'recipes/images/default.jpg')
+        self.assertEqual(soup.favorites_count, 1)
+        self.assertEqual(
+            list(
+                RecipeIngredient.objects.filter(recipe=soup)
+                .values_list('ingredient', 'amount')
+            ),
+            [(self.salt.id, 5)],
+        )
+        self.assertEqual(
+            list(
+                ShoppingListItem.objects.filter(user_id=2)
+                .values_list('ingredient', 'total_amount')
+            ),
+            [(self.flour.id, 200)],
+        )
+        self.assertTrue(
+            Favorite.objects.filter(user_id=2, recipe_id=10).exists()
+        )
+
+    def test_reused_hashes_and_new_rows_after_load(self):
+        self.load('--reuse-password-hashes')
+        self.assertTrue(
+            CustomUser.objects.get(pk=2).check_password('Borscht2025!')
+        )
+        # Последовательности сдвинуты за явные pk из фикстуры
+        self.assertGreater(make_user('carol').pk, 2)
+
+
+class GenerateDatasetTest(TestCase):
+    """generate_dataset: один и тот же seed — один и тот же набор данных."""
+
+    @classmethod
+    def setUpTestData(cls):
+        Ingredient.objects.bulk_create(
+            Ingredient(name=f'ингредиент {i}', measurement_unit='г')
+            for i in range(30)
+        )
+
+    def generate(self, *args):
+        call_command(
+            'generate_dataset', '--recipes', '60', '--users', '12',
+            '--batch-size', '7', '--flush', *args, stdout=StringIO(),
+        )
+        return (
+            list(Follow.objects.order_by('id').values_list(
+                'subscriber', 'author', 'created_at'
+            )),
+            list(Recipe.objects.order_by('id').values_list(
+                'name', 'author', 'pub_date', 'favorites_count'
+            )),
+            list(RecipeIngredient.objects.order_by('id').values_list(
+                'recipe', 'ingredient', 'amount'
+            )),
+            list(
+                Favorite.objects.order_by('id').values_list('user', 'recipe')
+            ),
+        )
+
+    def test_deterministic_for_seed(self):
+        first = self.generate('--seed', '7')
+        self.assertEqual(self.generate('--seed', '7'), first)
+        self.assertNotEqual(self.generate('--seed', '8'), first)
+
+    def test_consistent_rows(self):
+        self.generate()
+        self.assertEqual(CustomUser.objects.count(), 12)
+        self.assertFalse(
+            Follow.objects.filter(subscriber=F('author')).exists()
+        )
+        self.assertFalse(
+            Recipe.objects.filter(ingredient_quantities__isnull=True).exists()
+        )
+        for user in CustomUser.objects.all():
+            self.assertEqual(user.recipes_count, user.recipes.count())
+        self.assertTrue(
+            CustomUser.objects.get(pk=1).check_password('SyntheticPass123!')
+        )
+        self.assertEqual(
+            sorted(ShoppingListItem.objects.values_list(
+                'user', 'ingredient', 'total_amount'
+            )),
+            sorted(
+                RecipeIngredient.objects.filter(recipe__in_carts__isnull=False)
+                .values_list('recipe__in_carts__user', 'ingredient')
+                .annotate(total=Sum('amount')).order_by()
+            ),
+        )
+
+    def test_refuses_to_append(self):
+        make_user('existing')
+        with self.assertRaises(CommandError):
+            call_command(
+                'generate_dataset', '--recipes', '5', stdout=StringIO()
+            )